@@ -59,6 +59,9 @@ class Settings(BaseSettings):
     MONGODB_MIN_POOL_SIZE: int = 10
     MONGODB_MAX_POOL_SIZE: int = 50
     MONGODB_TIMEOUT: int = 5000
+    # Sincronizar los índices de los modelos al arrancar cada worker (init_beanie).
+    # Con false (arranque rápido) los índices se gestionan con: python -m app.db.indexes
+    MONGO_SYNC_INDEXES_ON_STARTUP: bool = True
 
     # ════════════════════════════════════════════════════════════════════
     # AUTENTICACIÓN JWT
@@ -107,6 +110,21 @@ class Settings(BaseSettings):
     PDF_MARGIN: str = "20mm"
     PDF_DPI: int = 96
 
+    # Informes en streaming (ReportLab): filas por lote leído del cursor,
+    # lotes en cola hacia el hilo de render, tamaño de lote de Mongo e
+    # informes maquetándose a la vez por worker (los demás esperan turno)
+    REPORT_CHUNK_ROWS: int = 500
+    REPORT_QUEUE_CHUNKS: int = 8
+    REPORT_CURSOR_BATCH_SIZE: int = 1000
+    REPORT_MAX_CONCURRENT: int = 4
+
+    # Caché de PDFs de facturas (direccionada por contenido)
+    INVOICE_PDF_CACHE_BACKEND: str = "disk"  # disk, gridfs u off
+    INVOICE_PDF_CACHE_DIR: str = "uploads/invoices/cache"
+    INVOICE_PDF_CACHE_MAX_MB: int = 512  # Por encima se expulsan las de acceso más antiguo
+    INVOICE_PDF_CACHE_MAX_AGE_DAYS: int = 90  # Sin acceso en este tiempo se expulsan
+    INVOICE_PDF_CACHE_PURGE_INTERVAL: int = 3600  # Segundos (0 = sin purga periódica)
+
     # ════════════════════════════════════════════════════════════════════
     # ARCHIVOS Y UPLOADS
     # ════════════════════════════════════════════════════════════════════
@@ -114,6 +132,15 @@ class Settings(BaseSettings):
     MAX_UPLOAD_SIZE_MB: int = 50
     ALLOWED_EXTENSIONS: List[str] = [".csv", ".xlsx", ".xls", ".pdf", ".jpg", ".png"]
 
+    # Almacenamiento de ficheros de App 5 (tickets, facturas, logos):
+    # "local" (bajo STORAGE_LOCAL_ROOT) o "gridfs" (compartido entre hosts)
+    STORAGE_BACKEND: str = "local"
+    STORAGE_LOCAL_ROOT: str = "uploads"
+    STORAGE_GRIDFS_BUCKET: str = "files"
+    STORAGE_CHUNK_SIZE: int = 256 * 1024  # Bytes por trozo de lectura/escritura
+    # Validez de las URLs firmadas de imágenes de tickets (App 5, admin)
+    TICKET_IMAGE_URL_TTL: int = 3600  # Segundos
+
     # ════════════════════════════════════════════════════════════════════
     # TEMPLATES
     # ════════════════════════════════════════════════════════════════════
@@ -172,6 +199,106 @@ class Settings(BaseSettings):
     PACKAGE_NO_LENGTH: int = 25
     PACKAGE_NO_PREFIX: str = "99"
 
+    # ════════════════════════════════════════════════════════════════════
+    # RENDIMIENTO / ESCANEO
+    # ════════════════════════════════════════════════════════════════════
+    # Si True, un código ausente en scan_codes se da por desconocido sin
+    # consultas adicionales (activar tras ejecutar scripts/build_scan_codes.py)
+    SCAN_REGISTRY_AUTHORITATIVE: bool = False
+    BATCH_SCAN_MAX_CODES: int = 5000  # Códigos por petición en /search/batch-scan
+    EXPORT_CURSOR_BATCH_SIZE: int = 5000  # Documentos por lote en exportaciones en streaming
+
+    # Filtro de Bloom de IMEI/ICCID por worker (respuestas negativas sin MongoDB)
+    DEVICE_FILTER_ENABLED: bool = True
+    DEVICE_FILTER_FP_RATE: float = 0.01  # Tasa de falsos positivos objetivo
+    DEVICE_FILTER_MIN_CAPACITY: int = 100000
+    DEVICE_FILTER_GROWTH: float = 1.5  # Margen de crecimiento sobre los dispositivos actuales
+    DEVICE_FILTER_SYNC_INTERVAL: float = 2.0  # Segundos entre sincronizaciones incrementales
+    DEVICE_FILTER_METRIC_INTERVAL: int = 300  # Segundos entre registros de métricas
+
+    # Caché LRU de dispositivos por worker (IMEI y cartón)
+    DEVICE_CACHE_ENABLED: bool = True
+    DEVICE_CACHE_TTL: int = 30  # Segundos (cota de desfase con escrituras de otros workers)
+    DEVICE_CACHE_MAX_DEVICES: int = 10000
+    DEVICE_CACHE_MAX_CARTONS: int = 2000
+
+    # Importaciones masivas: operaciones por bulk_write
+    IMPORT_BULK_CHUNK_SIZE: int = 1000
+
+    # Reconciliación de contadores de pallets (segundos; 0 = desactivada)
+    PALLET_RECONCILE_INTERVAL: int = 21600
+    PALLET_RECONCILE_BATCH_SIZE: int = 200  # Pallets por agregación
+    PALLET_RECONCILE_PAUSE: float = 0.5  # Pausa entre lotes (baja prioridad)
+    PALLET_RECONCILE_FIX: bool = False  # Corregir automáticamente las desviaciones
+
+    # Etiquetas en lote: máximo de albaranes por petición
+    LABEL_BATCH_MAX_NOTES: int = 1000
+
+    # ════════════════════════════════════════════════════════════════════
+    # IMPRESIÓN ZPL (ZEBRA)
+    # ════════════════════════════════════════════════════════════════════
+    # Impresoras disponibles: "nombre=host:puerto" separadas por comas
+    # (ej: "muelle1=192.168.1.50:9100,muelle2=192.168.1.51")
+    PRINT_SPOOLER_PRINTERS: str = ""
+    PRINT_SPOOLER_CONCURRENCY: int = 1  # Conexiones simultáneas por impresora
+    PRINT_SPOOLER_BATCH_MAX_JOBS: int = 50  # Trabajos agrupados por conexión
+    PRINT_SPOOLER_TIMEOUT: float = 10.0  # Segundos por envío
+    PRINT_SPOOLER_MAX_ATTEMPTS: int = 3
+    PRINT_SPOOLER_RETRY_DELAY: float = 5.0  # Segundos (se multiplica por el nº de intento)
+    # Barrido periódico de trabajos de workers caídos: SENDING de más de dos
+    # timeouts y QUEUED/RETRYING sin cambios en PRINT_SPOOLER_ORPHAN_AFTER
+    PRINT_SPOOLER_SWEEP_INTERVAL: float = 60.0  # Segundos (0 = solo al arrancar)
+    PRINT_SPOOLER_ORPHAN_AFTER: float = 120.0  # Segundos
+
+    # ════════════════════════════════════════════════════════════════════
+    # OBSERVABILIDAD
+    # ════════════════════════════════════════════════════════════════════
+    # Métricas HTTP por ruta (formato Prometheus en /metrics)
+    METRICS_ENABLED: bool = True
+    METRICS_ROLLUP_INTERVAL: int = 300  # Segundos entre volcados a la colección metrics (0 = no)
+
+    # Monitorización de comandos de MongoDB (CommandListener de pymongo)
+    MONGO_COMMAND_MONITORING: bool = True
+    MONGO_SLOW_COMMAND_MS: int = 100  # Umbral para el registro de comandos lentos
+    MONGO_SLOW_COMMAND_BUFFER: int = 500  # Comandos lentos que se conservan por worker
+
+    # Telemetría del pool de conexiones (eventos CMAP) y avisos de saturación
+    MONGO_POOL_MONITORING: bool = True
+    MONGO_POOL_SATURATION_RATIO: float = 0.9  # Uso del pool a partir del cual se avisa
+    MONGO_POOL_WAIT_ALERT_MS: int = 100  # Espera de checkout a partir de la cual se avisa
+
+    # Salud del worker: comprobaciones en segundo plano (/health/ready lee la caché)
+    HEALTH_PROBE_INTERVAL: int = 15  # Segundos entre comprobaciones
+    HEALTH_CHECK_TIMEOUT: float = 3.0  # Tiempo máximo de cada comprobación
+    HEALTH_SLOW_PING_MS: int = 250  # Ping a MongoDB a partir del cual se marca degradado
+    HEALTH_MIN_FREE_DISK_MB: int = 1024  # Espacio libre mínimo en UPLOAD_DIR
+
+    # Vigilancia del event loop (lag y captura de la pila cuando se bloquea)
+    LOOP_WATCHDOG_ENABLED: bool = True
+    LOOP_WATCHDOG_INTERVAL: float = 0.1  # Segundos entre mediciones
+    LOOP_WATCHDOG_THRESHOLD_MS: int = 250  # Bloqueo a partir del cual se captura la pila
+    LOOP_WATCHDOG_BUFFER: int = 100  # Bloqueos que se conservan por worker
+
+    # Perfilado bajo demanda (cProfile) con token de admin en X-Profile-Token
+    PROFILE_ENABLED: bool = True
+    PROFILE_DIR: str = "/tmp/ose_profiles"
+    PROFILE_MAX_FILES: int = 50  # Perfiles que se conservan (se borran los más antiguos)
+    PROFILE_TOKEN_EXPIRE_MINUTES: int = 30
+
+    # Trazas por petición (spans de rutas, MongoDB, SMTP, PDF, OCR y pandas)
+    TRACING_ENABLED: bool = True
+    TRACE_SLOW_MS: int = 1000  # Se guardan las trazas a partir de esta duración
+    TRACE_SAMPLE_RATE: float = 0.0  # Fracción de las trazas rápidas que también se guarda
+    TRACE_MAX_SPANS: int = 500  # Spans por traza (el resto se cuenta como descartado)
+    TRACE_COLLECTION_MB: int = 64  # Tamaño de la colección limitada traces
+
+    # Diagnóstico de memoria (tracemalloc bajo demanda y pico de RSS en subidas)
+    MEMORY_TRACE_FRAMES: int = 10  # Profundidad de pila que guarda tracemalloc
+    MEMORY_TOP_LIMIT: int = 25  # Líneas (fichero:línea) por comparación
+    MEMORY_SNAPSHOT_BUFFER: int = 20  # Comparaciones que se conservan por worker
+    MEMORY_RSS_SAMPLE_INTERVAL: float = 0.05  # Segundos entre muestras de RSS
+    MEMORY_RSS_BUFFER: int = 200  # Mediciones de RSS que se conservan por worker
+
     @field_validator('CORS_ORIGINS', mode='before')
     @classmethod
     def parse_cors_origins(cls, v):
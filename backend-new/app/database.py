@@ -20,27 +20,63 @@ class Database:
     database = None
 
     @classmethod
-    async def connect(cls):
-        """Establece la conexión a MongoDB e inicializa Beanie"""
+    async def connect(cls, sincronizar_indices: Optional[bool] = None):
+        """
+        Establece la conexión a MongoDB e inicializa Beanie
+
+        Args:
+            sincronizar_indices: crear los índices de los modelos al iniciar
+                Beanie (por defecto MONGO_SYNC_INDEXES_ON_STARTUP). Sin ellos
+                el arranque no lanza createIndexes sobre colecciones grandes;
+                se gestionan aparte con python -m app.db.indexes
+        """
+        if sincronizar_indices is None:
+            sincronizar_indices = settings.MONGO_SYNC_INDEXES_ON_STARTUP
+
         try:
             logger.info(f"Conectando a MongoDB: {settings.MONGODB_DB_NAME}")
 
+            # Monitorización de comandos (comandos lentos y consultas por ruta)
+            listeners = []
+            if settings.MONGO_COMMAND_MONITORING:
+                from app.services.mongo_monitor_service import mongo_monitor
+                listeners.append(mongo_monitor.listener)
+
+            # Telemetría del pool de conexiones (en uso, esperas, vaciados)
+            if settings.MONGO_POOL_MONITORING:
+                from app.services.mongo_pool_service import mongo_pool
+                listeners.append(mongo_pool.listener)
+
             # Crear cliente MongoDB
             cls.client = AsyncIOMotorClient(
                 settings.MONGODB_URI,
                 minPoolSize=settings.MONGODB_MIN_POOL_SIZE,
                 maxPoolSize=settings.MONGODB_MAX_POOL_SIZE,
-                serverSelectionTimeoutMS=settings.MONGODB_TIMEOUT
+                serverSelectionTimeoutMS=settings.MONGODB_TIMEOUT,
+                event_listeners=listeners
             )
 
             # Obtener base de datos
             cls.database = cls.client[settings.MONGODB_DB_NAME]
 
+            # Colección limitada de trazas (se crea una vez, antes que los modelos)
+            if settings.TRACING_ENABLED:
+                from app.services.tracing_service import tracer
+                await tracer.asegurar_coleccion(cls.database)
+
             # Inicializar Beanie con todos los modelos
-            await init_beanie(
-                database=cls.database,
-                document_models=cls._get_document_models()
-            )
+            if sincronizar_indices:
+                await init_beanie(
+                    database=cls.database,
+                    document_models=cls._get_document_models()
+                )
+            else:
+                from app.db.indexes import InicializadorSinIndices
+                await InicializadorSinIndices(
+                    database=cls.database,
+                    document_models=cls._get_document_models()
+                )
+                logger.info("Índices no sincronizados al arrancar (MONGO_SYNC_INDEXES_ON_STARTUP=false)")
 
             # Verificar conexión
             await cls.client.admin.command('ping')
@@ -92,6 +128,9 @@ class Database:
         from app.models.series_notification import SeriesNotification
         from app.models.brand import Brand
         from app.models.delivery_note import DeliveryNote, DeliveryNoteSequence
+        from app.models.scan_code import ScanCode
+        from app.models.print_job import PrintJob
+        from app.models.pdf_cache_entry import PdfCacheEntry
 
         return [
             Device,
@@ -123,12 +162,16 @@ class Database:
             Brand,  # System: Marcas de dispositivos
             DeliveryNote,  # Albaranes con códigos EST912
             DeliveryNoteSequence,  # Contador de secuencia EST912
+            ScanCode,  # App 1: Registro de códigos escaneables (smart-scan)
+            PrintJob,  # Cola de impresión ZPL (Zebra)
+            PdfCacheEntry,  # App 5: Caché de PDFs de facturas
         ]
 
     @classmethod
     def get_database(cls):
         """Retorna la instancia de la base de datos"""
-        if not cls.database:
+        # Las bases de datos de Motor no admiten evaluación booleana
+        if cls.database is None:
             raise RuntimeError("Database not initialized. Call connect() first.")
         return cls.database
 
@@ -0,0 +1,4 @@
+"""
+OSE Platform - Database Tools
+Herramientas de mantenimiento de MongoDB (índices)
+"""
@@ -0,0 +1,569 @@
+"""
+OSE Platform - Gestión de índices de MongoDB
+Índices de los modelos gestionados fuera del arranque de los workers
+
+init_beanie crea los índices declarados en cada modelo (Settings.indexes e
+Indexed()) cada vez que arranca un worker: en colecciones grandes (devices,
+movimientos, system_logs) un índice nuevo se construye en mitad de un
+reinicio. Con MONGO_SYNC_INDEXES_ON_STARTUP=false los workers arrancan sin
+tocar los índices y se gestionan con este comando:
+
+    python -m app.db.indexes plan      # qué falta, qué choca y qué sobra (no modifica nada)
+    python -m app.db.indexes apply     # crea los que faltan (--drop: elimina los no declarados)
+    python -m app.db.indexes verify    # sale con código 1 si falta alguno (despliegue)
+    python -m app.db.indexes report    # $indexStats: índices sin uso y consultas sin índice
+
+El informe cruza $indexStats con el catálogo CONSULTAS (filtros y órdenes
+que lanzan los routers) y, desde /system/performance/indexes, con las
+formas de los comandos lentos del worker (mongo_monitor).
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+
+from beanie.odm.fields import IndexModelField
+from beanie.odm.utils.init import Initializer
+from beanie.odm.utils.pydantic import get_model_fields
+from beanie.odm.utils.typing import get_index_attributes
+from pymongo import IndexModel
+
+logger = logging.getLogger(__name__)
+
+# Resultado de cubrir una consulta con un índice
+CUBIERTA = "ok"
+PARCIAL = "partial"
+SIN_INDICE = "missing"
+
+_RANGO = {CUBIERTA: 2, PARCIAL: 1, SIN_INDICE: 0}
+
+# Operadores de un filtro que acotan por igualdad (el resto se tratan como rango)
+_OPERADORES_IGUALDAD = {"$eq", "$in"}
+
+
+class InicializadorSinIndices(Initializer):
+    """
+    init_beanie sin sincronizar índices (arranque rápido)
+
+    Beanie 1.24 no tiene opción para omitirlos: se sustituye el paso
+    init_indexes y el resto de la inicialización queda igual.
+    """
+
+    async def init_indexes(self, cls, allow_index_dropping: bool = False):
+        return None
+
+
+@dataclass(frozen=True)
+class Consulta:
+    """Patrón de consulta: campos por igualdad, orden y rango"""
+    coleccion: str
+    origen: str
+    igualdad: Tuple[str, ...] = ()
+    orden: Tuple[Tuple[str, int], ...] = ()
+    rango: Tuple[str, ...] = ()
+
+    def describir(self) -> str:
+        partes = []
+        if self.igualdad:
+            partes.append("eq(" + ", ".join(self.igualdad) + ")")
+        if self.orden:
+            partes.append("sort(" + ", ".join(f"{c}:{d}" for c, d in self.orden) + ")")
+        if self.rango:
+            partes.append("range(" + ", ".join(self.rango) + ")")
+        return " ".join(partes) or "all"
+
+
+# Consultas habituales de los routers y servicios (mantener al cambiar filtros u órdenes)
+CONSULTAS: List[Consulta] = [
+    # devices
+    Consulta("devices", "smart-scan / bulk upsert (imei $in)", igualdad=("imei",)),
+    Consulta("devices", "smart-scan (ccid $in)", igualdad=("ccid",)),
+    Consulta("devices", "smart-scan (lote)", igualdad=("lote",)),
+    Consulta("devices", "smart-scan / app1 export por pallets / reconciliación (pallet_id $in)", igualdad=("pallet_id",)),
+    Consulta("devices", "app6 reubicación (carton_id)", igualdad=("carton_id",)),
+    Consulta("devices", "contadores de pallets (pallet_id, carton_id)", igualdad=("pallet_id", "carton_id")),
+    Consulta("devices", "app1 listado por cliente y estado", igualdad=("cliente", "estado")),
+    Consulta("devices", "app1 pendientes de notificar", igualdad=("notificado", "cliente")),
+    Consulta("devices", "informe de producción", igualdad=("nro_orden",), orden=(("nro_orden", 1), ("lote", 1))),
+    Consulta("devices", "informe de cliente", igualdad=("cliente",), orden=(("cliente", 1), ("estado", 1))),
+    # device_events / movimientos
+    Consulta("device_events", "historial de un dispositivo", igualdad=("imei",), orden=(("timestamp", -1),)),
+    Consulta("movimientos", "movimientos de un producto", igualdad=("producto",), orden=(("fecha", -1),)),
+    # scan_codes
+    Consulta("scan_codes", "smart-scan (code $in)", igualdad=("code",)),
+    # pallets / delivery_notes
+    Consulta("pallets", "pallet por código", igualdad=("pallet_id",)),
+    Consulta("pallets", "pallet de un cartón", igualdad=("carton_ids",)),
+    Consulta("pallets", "pallets de un pedido", igualdad=("order_number",)),
+    Consulta("delivery_notes", "albarán por pallet", igualdad=("pallet_code",)),
+    Consulta("delivery_notes", "listado de albaranes", orden=(("created_at", -1),)),
+    Consulta("delivery_notes", "listado por estado", igualdad=("status",), orden=(("created_at", -1),)),
+    Consulta("delivery_notes", "etiquetas de un pedido", igualdad=("order_number",), orden=(("order_number", 1), ("pallet_number_in_order", 1))),
+    # system_logs
+    Consulta("system_logs", "visor de logs", orden=(("timestamp", -1),)),
+    Consulta("system_logs", "logs por nivel", igualdad=("level",), orden=(("timestamp", -1),)),
+    Consulta("system_logs", "logs por categoría", igualdad=("category",), orden=(("timestamp", -1),)),
+    Consulta("system_logs", "estadísticas y purga (timestamp)", rango=("timestamp",)),
+    # importaciones
+    Consulta("import_records", "historial de importaciones", orden=(("created_at", -1),)),
+    Consulta("import_jobs", "jobs por estado", igualdad=("status",), orden=(("created_at", -1),)),
+    Consulta("iccid_generations", "historial de generación de ICCID", orden=(("created_at", -1),)),
+    # impresión y facturas
+    Consulta("print_jobs", "cola de una impresora", igualdad=("printer", "status"), orden=(("created_at", 1),)),
+    Consulta("print_jobs", "trabajos de un lote", igualdad=("batch_id",), orden=(("created_at", 1),)),
+    Consulta("series_notifications", "historial de notificaciones", orden=(("fecha", -1),)),
+    Consulta("sales_tickets", "tickets por estado", igualdad=("status",)),
+    Consulta("invoices", "facturas por estado", igualdad=("status",)),
+    Consulta("invoices", "facturas del mes", rango=("invoice_date",)),
+    Consulta("pdf_cache", "caché de PDFs", igualdad=("key",)),
+]
+
+
+# ════════════════════════════════════════════════════════════════════
+# ÍNDICES DECLARADOS Y EXISTENTES
+# ════════════════════════════════════════════════════════════════════
+
+def indices_declarados(modelo) -> List[IndexModelField]:
+    """
+    Índices que init_beanie crearía para el modelo (Indexed() y Settings.indexes)
+
+    Mismo cálculo que Initializer.init_indexes (sin merge_indexes, que
+    ningún modelo usa). El modelo debe estar inicializado.
+    """
+    indices = [
+        IndexModelField(IndexModel([(campo.alias or nombre, atributos[0])], **atributos[1]))
+        for nombre, campo in get_model_fields(modelo).items()
+        if (atributos := get_index_attributes(campo)) is not None
+    ]
+    if modelo.get_settings().indexes:
+        indices = IndexModelField.merge_indexes(indices, modelo.get_settings().indexes)
+    return indices
+
+
+def campos_documento(modelo) -> Set[str]:
+    """Nombres con los que se guardan los campos del modelo (alias incluidos)"""
+    return {campo.alias or nombre for nombre, campo in get_model_fields(modelo).items()} | {"_id"}
+
+
+def _inexistentes(campos: Iterable[str], existentes: Set[str]) -> List[str]:
+    """Campos que no son del documento (de un campo anidado se mira la raíz)"""
+    return [
+        campo for campo in campos
+        if not campo.startswith("$") and campo.split(".")[0] not in existentes
+    ]
+
+
+def _claves(indice: IndexModelField) -> List[Tuple[str, Any]]:
+    return [(campo, int(d) if isinstance(d, (int, float)) else d) for campo, d in indice.index.document["key"].items()]
+
+
+def _opciones(indice: IndexModelField) -> Dict[str, Any]:
+    return {k: v for k, v in indice.options if k != "name"}
+
+
+def _a_dict(indice: IndexModelField) -> Dict[str, Any]:
+    return {"name": indice.name, "key": _claves(indice), **_opciones(indice)}
+
+
+async def planificar(modelo) -> Dict[str, Any]:
+    """
+    Compara los índices declarados del modelo con los de la colección
+
+    - missing: declarados que no existen (apply los crea)
+    - conflicts: existe uno con los mismos campos y otras opciones
+      (unique, sparse...): createIndexes fallaría, hay que eliminarlo antes
+    - extra: existen pero no están declarados (apply --drop los elimina)
+    - unknown_fields: declarados sobre campos que el modelo no guarda
+      (p. ej. el nombre Python de un campo con alias): nunca se usan
+    """
+    coleccion = modelo.get_motor_collection()
+    existentes = IndexModelField.from_motor_index_information(await coleccion.index_information())
+    declarados = indices_declarados(modelo)
+    campos = campos_documento(modelo)
+
+    faltan = IndexModelField.list_difference(declarados, existentes)
+    conflictos = [
+        (indice, otro) for indice in faltan
+        if (otro := IndexModelField.find_index_with_the_same_fields(existentes, indice)) is not None
+    ]
+    con_conflicto = [declarado for declarado, _ in conflictos]
+    faltan = [indice for indice in faltan if indice not in con_conflicto]
+    sobran = [
+        indice for indice in IndexModelField.list_difference(existentes, declarados)
+        if indice not in [existente for _, existente in conflictos]
+    ]
+
+    return {
+        "collection": coleccion.name,
+        "model": modelo.__name__,
+        "declared": len(declarados),
+        "existing": len(existentes),
+        "missing": [_a_dict(i) for i in faltan],
+        "conflicts": [{"declared": _a_dict(d), "existing": _a_dict(e)} for d, e in conflictos],
+        "extra": [_a_dict(i) for i in sobran],
+        "unknown_fields": [
+            {"name": i.name, "fields": inexistentes}
+            for i in declarados
+            if (inexistentes := _inexistentes((c for c, _ in _claves(i)), campos))
+        ],
+        # Para aplicar()
+        "_faltan": faltan,
+        "_conflictos": conflictos,
+        "_sobran": sobran,
+    }
+
+
+async def planificar_todo(modelos: List) -> List[Dict[str, Any]]:
+    return [await planificar(modelo) for modelo in modelos]
+
+
+def sin_internos(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """Plan sin los objetos IndexModelField (serializable)"""
+    return {k: v for k, v in plan.items() if not k.startswith("_")}
+
+
+async def aplicar(modelos: List, eliminar: bool = False) -> List[Dict[str, Any]]:
+    """
+    Crea los índices que faltan, colección a colección
+
+    Los índices de una colección se crean en un único createIndexes (una
+    pasada sobre los datos). Con eliminar=True se eliminan antes los no
+    declarados y los que chocan con uno declarado.
+    """
+    resultados = []
+    for modelo in modelos:
+        plan = await planificar(modelo)
+        coleccion = modelo.get_motor_collection()
+        resultado = {"collection": plan["collection"], "created": [], "dropped": [], "skipped": []}
+
+        if eliminar:
+            for indice in plan["_sobran"] + [e for _, e in plan["_conflictos"]]:
+                await coleccion.drop_index(indice.name)
+                resultado["dropped"].append(indice.name)
+            crear = plan["_faltan"] + [d for d, _ in plan["_conflictos"]]
+        else:
+            crear = plan["_faltan"]
+            resultado["skipped"] = [d.name for d, _ in plan["_conflictos"]]
+
+        if crear:
+            inicio = time.perf_counter()
+            resultado["created"] = await coleccion.create_indexes(IndexModelField.list_to_index_model(crear))
+            resultado["duration_s"] = round(time.perf_counter() - inicio, 2)
+            logger.info(
+                f"{plan['collection']}: {len(crear)} índices creados en {resultado['duration_s']}s "
+                f"({', '.join(resultado['created'])})"
+            )
+
+        if resultado["created"] or resultado["dropped"] or resultado["skipped"]:
+            resultados.append(resultado)
+    return resultados
+
+
+# ════════════════════════════════════════════════════════════════════
+# INFORME DE USO ($indexStats)
+# ════════════════════════════════════════════════════════════════════
+
+def evaluar(claves: List[Tuple[str, Any]], consulta: Consulta) -> str:
+    """
+    Cómo sirve un índice a una consulta (regla igualdad → orden → rango)
+
+    - ok: los campos de igualdad son el prefijo del índice, seguidos del
+      orden (en el mismo sentido o el inverso) y del campo de rango
+    - partial: el índice acota por parte del filtro, pero el resto se
+      filtra u ordena en memoria
+    - missing: el índice no sirve a la consulta
+    """
+    campos = [c for c, _ in claves]
+    iguales = 0
+    while iguales < len(campos) and campos[iguales] in consulta.igualdad:
+        iguales += 1
+    completo = iguales == len(consulta.igualdad)
+    posicion = iguales
+
+    # Ordenar por un campo fijado por igualdad no cuesta nada
+    orden = [(c, d) for c, d in consulta.orden if c not in consulta.igualdad]
+    orden_ok = True
+    if orden:
+        tramo = claves[posicion:posicion + len(orden)]
+        inverso = [(c, -d) for c, d in orden]
+        orden_ok = completo and tramo in (orden, inverso)
+        if orden_ok:
+            posicion += len(orden)
+
+    rango_ok = not consulta.rango or (
+        completo and orden_ok and posicion < len(campos) and campos[posicion] in consulta.rango
+    )
+
+    if completo and orden_ok and rango_ok:
+        return CUBIERTA
+    primeros = set(consulta.rango) | ({orden[0][0]} if orden else set())
+    if iguales or (campos and campos[0] in primeros):
+        return PARCIAL
+    return SIN_INDICE
+
+
+def mejor_indice(indices: Dict[str, List[Tuple[str, Any]]], consulta: Consulta) -> Tuple[str, Optional[str]]:
+    """Mejor resultado entre los índices de la colección (y cuál lo da)"""
+    mejor: Tuple[str, Optional[str]] = (SIN_INDICE, None)
+    for nombre, claves in indices.items():
+        resultado = evaluar(claves, consulta)
+        if _RANGO[resultado] > _RANGO[mejor[0]]:
+            mejor = (resultado, nombre)
+    return mejor
+
+
+def consulta_desde_filtro(coleccion: str, filtro: Any, origen: str) -> Optional[Consulta]:
+    """
+    Patrón de consulta a partir de la forma de un filtro (mongo_monitor)
+
+    Solo se consideran los campos del nivel superior: $or/$and y demás
+    operadores lógicos no se analizan. De un aggregate se toma el $match
+    inicial del pipeline.
+    """
+    if isinstance(filtro, list):
+        filtro = filtro[0].get("$match") if filtro and isinstance(filtro[0], dict) else None
+    if not isinstance(filtro, dict):
+        return None
+    igualdad, rango = [], []
+    for campo, valor in filtro.items():
+        if campo.startswith("$"):
+            continue
+        if isinstance(valor, dict) and not set(valor) <= _OPERADORES_IGUALDAD:
+            rango.append(campo)
+        else:
+            igualdad.append(campo)
+    if not igualdad and not rango:
+        return None
+    return Consulta(coleccion, origen, igualdad=tuple(igualdad), rango=tuple(rango[:1]))
+
+
+def _redundante(claves: List[Tuple[str, Any]], opciones: Dict[str, Any], otros: Dict[str, Tuple[List, Dict]]) -> Optional[str]:
+    """Índice cuyas claves son prefijo de otro índice (sin opciones especiales)"""
+    if opciones:
+        return None
+    for nombre, (otras_claves, otras_opciones) in otros.items():
+        if len(otras_claves) > len(claves) and otras_claves[:len(claves)] == claves and not otras_opciones:
+            return nombre
+    return None
+
+
+async def informe_coleccion(modelo, consultas: List[Consulta]) -> Dict[str, Any]:
+    """
+    Uso de cada índice ($indexStats) y cobertura de las consultas de la colección
+
+    Si el servidor no admite $indexStats los índices salen con ops None.
+    """
+    coleccion = modelo.get_motor_collection()
+    informacion = await coleccion.index_information()
+
+    uso: Dict[str, Dict[str, Any]] = {}
+    try:
+        async for estadistica in coleccion.aggregate([{"$indexStats": {}}]):
+            accesos = estadistica.get("accesses", {})
+            fila = uso.setdefault(estadistica["name"], {"ops": 0, "since": accesos.get("since")})
+            # En un replica set llega una fila por host
+            fila["ops"] += int(accesos.get("ops", 0))
+            if accesos.get("since") and (fila["since"] is None or accesos["since"] < fila["since"]):
+                fila["since"] = accesos["since"]
+    except Exception as e:
+        logger.debug(f"$indexStats no disponible en {coleccion.name}: {e}")
+
+    indices = {
+        nombre: (
+            [(c, int(d) if isinstance(d, (int, float)) else d) for c, d in detalle["key"]],
+            {k: v for k, v in detalle.items() if k not in ("key", "v", "ns")}
+        )
+        for nombre, detalle in informacion.items()
+    }
+    declarados = {i.name: _claves(i) for i in indices_declarados(modelo)}
+    campos = campos_documento(modelo)
+
+    filas = []
+    for nombre, (claves, opciones) in indices.items():
+        estadistica = uso.get(nombre)
+        filas.append({
+            "name": nombre,
+            "key": claves,
+            "ops": estadistica["ops"] if estadistica else None,
+            "since": estadistica["since"] if estadistica else None,
+            # _id_ y los únicos mantienen restricciones aunque no se lean
+            "unused": bool(estadistica) and estadistica["ops"] == 0 and nombre != "_id_" and not opciones.get("unique"),
+            "redundant_with": _redundante(claves, opciones, {n: v for n, v in indices.items() if n != nombre}),
+            "declared": nombre in declarados or nombre == "_id_"
+        })
+
+    existentes = {nombre: claves for nombre, (claves, _) in indices.items()}
+    cobertura = []
+    for consulta in consultas:
+        resultado, indice = mejor_indice(existentes, consulta)
+        fila = {
+            "origin": consulta.origen,
+            "query": consulta.describir(),
+            "status": resultado,
+            "index": indice
+        }
+        if resultado != CUBIERTA:
+            # ¿Lo resolvería un índice declarado pendiente de crear?
+            pendiente, nombre = mejor_indice(declarados, consulta)
+            if _RANGO[pendiente] > _RANGO[resultado]:
+                fila["fixed_by_apply"] = nombre
+        inexistentes = _inexistentes(
+            consulta.igualdad + tuple(c for c, _ in consulta.orden) + consulta.rango, campos
+        )
+        if inexistentes:
+            # Filtra por un campo que ningún documento tiene: cubierta o no, no encuentra nada
+            fila["unknown_fields"] = inexistentes
+        cobertura.append(fila)
+
+    return {
+        "collection": coleccion.name,
+        "indexes": sorted(filas, key=lambda f: (f["ops"] is None, f["ops"] or 0)),
+        "queries": cobertura,
+        "unknown_fields": [
+            {"name": nombre, "fields": inexistentes}
+            for nombre, claves in declarados.items()
+            if (inexistentes := _inexistentes((c for c, _ in claves), campos))
+        ]
+    }
+
+
+async def informe(modelos: List, consultas_extra: Optional[List[Consulta]] = None) -> Dict[str, Any]:
+    """
+    Informe de índices sin uso y consultas sin índice
+
+    Los contadores de $indexStats se reinician al reiniciar mongod: mirar
+    "since" antes de eliminar un índice sin uso. unknown_fields lista los
+    índices declarados y las consultas sobre campos que el modelo no guarda.
+    """
+    consultas = CONSULTAS + (consultas_extra or [])
+    colecciones = []
+    for modelo in modelos:
+        nombre = modelo.get_collection_name()
+        colecciones.append(await informe_coleccion(modelo, [c for c in consultas if c.coleccion == nombre]))
+
+    if all(i["ops"] is None for c in colecciones for i in c["indexes"]):
+        logger.warning("$indexStats no disponible: el informe no incluye el uso de los índices")
+
+    return {
+        "unused": [
+            {"collection": c["collection"], "name": i["name"], "key": i["key"], "since": i["since"]}
+            for c in colecciones for i in c["indexes"] if i["unused"]
+        ],
+        "redundant": [
+            {"collection": c["collection"], "name": i["name"], "covered_by": i["redundant_with"]}
+            for c in colecciones for i in c["indexes"] if i["redundant_with"]
+        ],
+        "uncovered_queries": [
+            {"collection": c["collection"], **q}
+            for c in colecciones for q in c["queries"] if q["status"] != CUBIERTA
+        ],
+        "unknown_fields": [
+            {"collection": c["collection"], "index": i["name"], "fields": i["fields"]}
+            for c in colecciones for i in c["unknown_fields"]
+        ] + [
+            {"collection": c["collection"], "query": q["query"], "origin": q["origin"], "fields": q["unknown_fields"]}
+            for c in colecciones for q in c["queries"] if q.get("unknown_fields")
+        ],
+        "collections": colecciones
+    }
+
+
+# ════════════════════════════════════════════════════════════════════
+# LÍNEA DE COMANDOS
+# ════════════════════════════════════════════════════════════════════
+
+def _texto_plan(planes: List[Dict[str, Any]]) -> str:
+    lineas = []
+    for plan in planes:
+        if not (plan["missing"] or plan["conflicts"] or plan["extra"] or plan["unknown_fields"]):
+            continue
+        lineas.append(f"{plan['collection']} ({plan['model']})")
+        lineas += [f"  + {i['name']}  {i['key']}" for i in plan["missing"]]
+        lineas += [
+            f"  ! {c['declared']['name']}  choca con {c['existing']['name']} {c['existing']}"
+            for c in plan["conflicts"]
+        ]
+        lineas += [f"  - {i['name']}  {i['key']}  (no declarado)" for i in plan["extra"]]
+        lineas += [
+            f"  ? {i['name']}  campos que el modelo no guarda: {', '.join(i['fields'])}"
+            for i in plan["unknown_fields"]
+        ]
+    return "\n".join(lineas) or "Índices al día"
+
+
+def _texto_informe(resultado: Dict[str, Any]) -> str:
+    lineas = ["Índices sin uso (desde el último reinicio de mongod):"]
+    lineas += [f"  {i['collection']}.{i['name']}  {i['key']}  desde {i['since']}" for i in resultado["unused"]] or ["  ninguno"]
+    lineas.append("Índices redundantes (prefijo de otro):")
+    lineas += [f"  {i['collection']}.{i['name']}  cubierto por {i['covered_by']}" for i in resultado["redundant"]] or ["  ninguno"]
+    lineas.append("Consultas sin índice adecuado:")
+    lineas += [
+        f"  [{q['status']}] {q['collection']}: {q['query']}  ({q['origin']})"
+        + (f"  índice: {q['index']}" if q["index"] else "")
+        + (f"  -> apply crea {q['fixed_by_apply']}" if q.get("fixed_by_apply") else "")
+        for q in resultado["uncovered_queries"]
+    ] or ["  ninguna"]
+    lineas.append("Índices y consultas sobre campos que el modelo no guarda:")
+    lineas += [
+        f"  {i['collection']}: " + (f"índice {i['index']}" if "index" in i else f"{i['query']} ({i['origin']})")
+        + f"  campos: {', '.join(i['fields'])}"
+        for i in resultado["unknown_fields"]
+    ] or ["  ninguno"]
+    return "\n".join(lineas)
+
+
+async def _ejecutar(args) -> int:
+    from app.database import Database
+
+    # Sin sincronizar: el comando decide qué índices se crean
+    await Database.connect(sincronizar_indices=False)
+    try:
+        modelos = [
+            m for m in Database._get_document_models()
+            if not args.collection or m.get_collection_name() in args.collection
+        ]
+
+        if args.modo == "plan" or args.modo == "verify":
+            planes = await planificar_todo(modelos)
+            pendientes = sum(len(p["missing"]) + len(p["conflicts"]) for p in planes)
+            salida: Any = [sin_internos(p) for p in planes]
+            texto = _texto_plan(planes)
+            codigo = 1 if args.modo == "verify" and pendientes else 0
+        elif args.modo == "apply":
+            salida = await aplicar(modelos, eliminar=args.drop)
+            texto = "\n".join(
+                f"{r['collection']}: creados {r['created'] or '-'}, eliminados {r['dropped'] or '-'}"
+                + (f", omitidos por conflicto {r['skipped']} (usar --drop)" if r["skipped"] else "")
+                for r in salida
+            ) or "Nada que aplicar"
+            codigo = 0
+        else:
+            salida = await informe(modelos)
+            texto = _texto_informe(salida)
+            codigo = 0
+
+        print(json.dumps(salida, indent=2, default=str, ensure_ascii=False) if args.json else texto)
+        return codigo
+    finally:
+        await Database.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.db.indexes", description="Gestión de índices de MongoDB")
+    parser.add_argument("modo", choices=["plan", "apply", "verify", "report"])
+    parser.add_argument("--collection", action="append", help="Limitar a una colección (repetible)")
+    parser.add_argument("--drop", action="store_true", help="apply: eliminar índices no declarados o en conflicto")
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    return asyncio.run(_ejecutar(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""
+OSE Platform - Metrics Middleware
+Mide cada petición HTTP y la registra en http_metrics por plantilla de ruta
+"""
+
+import time
+
+from app.config import settings
+from app.services.metrics_service import http_metrics
+from app.utils.request_context import ContextoPeticion, peticion_actual
+
+# Rutas que no se miden (el propio scrape de Prometheus)
+RUTAS_EXCLUIDAS = {"/metrics"}
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI de métricas
+
+    La ruta se toma de scope["route"], que FastAPI rellena al resolver el
+    endpoint: se agrega por plantilla (/devices/{imei}) y no por URL, así
+    el número de series no crece con los parámetros.
+
+    También fija el contexto de la petición (app.utils.request_context)
+    para que los comandos de MongoDB se atribuyan a su ruta.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in RUTAS_EXCLUIDAS:
+            await self.app(scope, receive, send)
+            return
+
+        contexto = ContextoPeticion(scope)
+        token = peticion_actual.set(contexto)
+
+        if not settings.METRICS_ENABLED:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                peticion_actual.reset(token)
+            return
+
+        estado = 500
+        bytes_entrada = 0
+        bytes_salida = 0
+
+        async def receive_medido():
+            nonlocal bytes_entrada
+            mensaje = await receive()
+            if mensaje["type"] == "http.request":
+                bytes_entrada += len(mensaje.get("body", b""))
+            return mensaje
+
+        async def send_medido(mensaje):
+            nonlocal estado, bytes_salida
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+            elif mensaje["type"] == "http.response.body":
+                bytes_salida += len(mensaje.get("body", b""))
+            await send(mensaje)
+
+        http_metrics.en_curso += 1
+        try:
+            await self.app(scope, receive_medido, send_medido)
+        finally:
+            http_metrics.en_curso -= 1
+            peticion_actual.reset(token)
+            tags = getattr(scope.get("route"), "tags", None)
+            http_metrics.observar(
+                metodo=contexto.metodo,
+                ruta=contexto.ruta,
+                grupo=str(tags[0]) if tags else "other",
+                estado=estado,
+                duracion=time.perf_counter() - contexto.inicio,
+                bytes_entrada=bytes_entrada,
+                bytes_salida=bytes_salida,
+                consultas=contexto.consultas
+            )
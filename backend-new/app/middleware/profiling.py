@@ -0,0 +1,80 @@
+"""
+OSE Platform - Profiling Middleware
+Ejecuta bajo cProfile las peticiones que llevan un token de perfilado
+"""
+
+from datetime import datetime
+from urllib.parse import parse_qs
+import time
+import uuid
+
+from app.config import settings
+from app.services.profiling_service import profiler
+from app.utils.request_context import contexto_actual
+
+CABECERA = b"x-profile-token"
+PARAMETRO = "profile_token"
+
+
+def _token(scope) -> str:
+    for nombre, valor in scope.get("headers") or []:
+        if nombre == CABECERA:
+            return valor.decode("latin-1")
+    query = scope.get("query_string") or b""
+    if PARAMETRO.encode() in query:
+        valores = parse_qs(query.decode("latin-1")).get(PARAMETRO)
+        if valores:
+            return valores[0]
+    return ""
+
+
+class ProfilingMiddleware:
+    """
+    Middleware ASGI de perfilado bajo demanda
+
+    Sin token la petición pasa tal cual. Con un token válido se perfila y
+    la respuesta lleva X-Profile-Id con el id para descargar el perfil.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.PROFILE_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        token = _token(scope)
+        payload = profiler.token_valido(token) if token else None
+        perfil = profiler.empezar() if payload else None
+        if perfil is None:
+            await self.app(scope, receive, send)
+            return
+
+        contexto = contexto_actual()
+        request_id = contexto.request_id if contexto else uuid.uuid4().hex[:16]
+        estado = 500
+
+        async def send_perfilado(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+                mensaje["headers"] = list(mensaje.get("headers", [])) + [
+                    (b"x-profile-id", request_id.encode())
+                ]
+            await send(mensaje)
+
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_perfilado)
+        finally:
+            await profiler.terminar(perfil, {
+                "request_id": request_id,
+                "timestamp": datetime.utcnow().isoformat(),
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": contexto.ruta if contexto else None,
+                "status": estado,
+                "duration_ms": round((time.perf_counter() - inicio) * 1000, 1),
+                "requested_by": payload.get("sub")
+            })
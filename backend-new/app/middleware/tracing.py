@@ -0,0 +1,67 @@
+"""
+OSE Platform - Tracing Middleware
+Abre el span raíz de cada petición y guarda las trazas lentas
+"""
+
+import time
+
+from app.config import settings
+from app.services.tracing_service import tracer, span_actual
+from app.utils.request_context import contexto_actual
+
+
+class TracingMiddleware:
+    """
+    Middleware ASGI de trazas
+
+    El span raíz se crea al entrar y se renombra al terminar con la
+    plantilla de ruta (scope["route"]). El id de la traza es el request id
+    del contexto de la petición, el mismo de los comandos lentos y de los
+    bloqueos del event loop.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        contexto = contexto_actual()
+        if contexto is None:
+            await self.app(scope, receive, send)
+            return
+
+        raiz = tracer.raiz(contexto.request_id, f"{scope['method']} {scope['path']}")
+        # El reloj de la traza empieza con la petición (incluye los middlewares externos)
+        raiz.traza.inicio = raiz.inicio = min(raiz.inicio, contexto.inicio)
+        estado = 500
+
+        async def send_trazado(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+                mensaje["headers"] = list(mensaje.get("headers", [])) + [
+                    (b"x-trace-id", contexto.request_id.encode())
+                ]
+            await send(mensaje)
+
+        token = span_actual.set(raiz)
+        try:
+            await self.app(scope, receive, send_trazado)
+        except BaseException as e:
+            raiz.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            raiz.terminar(time.perf_counter())
+            span_actual.reset(token)
+            raiz.nombre = f"{contexto.metodo} {contexto.ruta}"
+            raiz.atributos.update({
+                "method": contexto.metodo,
+                "route": contexto.ruta,
+                "path": scope["path"],
+                "status": estado
+            })
+            if tracer.debe_guardar(raiz):
+                tracer.guardar_en_segundo_plano(raiz)
@@ -0,0 +1,68 @@
+"""
+OSE Platform - Upload Limit Middleware
+Corta las subidas multipart que superan MAX_UPLOAD_SIZE_MB antes de leerlas
+
+FastAPI parsea el formulario completo antes de llamar al endpoint, así que
+el límite de upload_service solo actúa sobre lo ya recibido. Aquí se
+rechaza la petición por su Content-Length sin leer el cuerpo, y si no lo
+trae (chunked) se cuentan los bytes según llegan.
+"""
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+
+from app.config import settings
+
+# Margen para las cabeceras multipart y los campos que acompañan al fichero
+MARGEN_MULTIPART = 1024 * 1024
+
+
+class UploadLimitMiddleware:
+    """Middleware ASGI: 413 para cuerpos multipart mayores que el límite"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/"):
+            await self.app(scope, receive, send)
+            return
+
+        limite = settings.MAX_UPLOAD_SIZE_MB * 1024 * 1024 + MARGEN_MULTIPART
+        detalle = f"El archivo excede el tamaño máximo de {settings.MAX_UPLOAD_SIZE_MB}MB"
+
+        try:
+            declarado = int(headers.get(b"content-length", b"-1"))
+        except ValueError:
+            declarado = -1
+
+        if declarado > limite:
+            respuesta = JSONResponse(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                content={"detail": detalle},
+                headers={"Connection": "close"}
+            )
+            await respuesta(scope, receive, send)
+            return
+
+        recibido = 0
+
+        async def receive_limitado():
+            nonlocal recibido
+            mensaje = await receive()
+            if mensaje["type"] == "http.request":
+                recibido += len(mensaje.get("body", b""))
+                if recibido > limite:
+                    # FastAPI deja pasar HTTPException al parsear el cuerpo
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=detalle
+                    )
+            return mensaje
+
+        await self.app(scope, receive_limitado, send)
@@ -24,6 +24,9 @@ from .invoice import Invoice, InvoiceStatus
 from .invoice_config import InvoiceConfig
 from .series_notification import SeriesNotification
 from .pallet import Pallet
+from .scan_code import ScanCode, ScanCodeType
+from .print_job import PrintJob, PrintJobStatus
+from .pdf_cache_entry import PdfCacheEntry
 
 __all__ = [
     # Models
@@ -48,6 +51,9 @@ __all__ = [
     "InvoiceConfig",
     "SeriesNotification",
     "Pallet",
+    "ScanCode",
+    "PrintJob",
+    "PdfCacheEntry",
 
     # Enums
     "EstadoDispositivo",
@@ -74,4 +80,6 @@ __all__ = [
     "JobStatus",
     "SalesTicketStatus",
     "InvoiceStatus",
+    "ScanCodeType",
+    "PrintJobStatus",
 ]
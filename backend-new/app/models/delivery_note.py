@@ -3,11 +3,12 @@ OSE Platform - Modelo Albarán/Delivery Note
 Modelo para gestión de albaranes con códigos de palet EST912
 """
 
-from beanie import Document
+from beanie import Document, after_event, Insert
 from pydantic import Field
 from typing import List, Optional
 from datetime import datetime
 from bson import ObjectId
+import logging
 
 
 class DeliveryNoteSequence(Document):
@@ -260,6 +261,20 @@ class DeliveryNote(Document):
 
         return f"EST912{sequence_str}"
 
+    # ════════════════════════════════════════════════════════════════════
+    # EVENTOS
+    # ════════════════════════════════════════════════════════════════════
+
+    @after_event(Insert)
+    async def register_scan_code(self):
+        """Registra el código EST912 en scan_codes para el smart-scan"""
+        from app.models.scan_code import ScanCode
+
+        try:
+            await ScanCode.registrar_albaran(self.pallet_code, self.id)
+        except Exception as e:
+            logging.error(f"Error registrando código {self.pallet_code} en scan_codes: {e}")
+
     # ════════════════════════════════════════════════════════════════════
     # MÉTODOS DE INSTANCIA
     # ════════════════════════════════════════════════════════════════════
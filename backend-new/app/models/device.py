@@ -4,11 +4,12 @@ Modelo principal para gestión de dispositivos IoT/GPS
 CORREGIDO según documentación oficial
 """
 
-from beanie import Document
-from pydantic import Field, validator
-from typing import Optional, Dict, Any
+from beanie import Document, PydanticObjectId, after_event, Insert, Replace, Update, Delete
+from pydantic import BaseModel, Field, validator
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 from enum import Enum
+import logging
 
 
 class EstadoDispositivo(str, Enum):
@@ -317,17 +318,19 @@ class Device(Document):
             "nro_orden",
             "estado",
             "cliente",
-            "package_no",
             "notificado",
             "fecha_creacion",
             "operador",  # Nuevo: búsqueda por operador
             "iin_prefix",  # Nuevo: búsqueda por IIN
+            "lote",  # Búsqueda por lote (smart-scan)
+            "carton_id",  # Cartón (package_no se guarda con su alias carton_id)
             [("imei", 1), ("estado", 1)],
             [("nro_orden", 1), ("lote", 1)],
             [("cliente", 1), ("estado", 1)],
             [("notificado", 1), ("cliente", 1)],
             [("operador", 1), ("estado", 1)],  # Nuevo: dispositivos por operador
-            [("iin_prefix", 1), ("operador", 1)]  # Nuevo: análisis por IIN
+            [("iin_prefix", 1), ("operador", 1)],  # Nuevo: análisis por IIN
+            [("pallet_id", 1), ("carton_id", 1)]  # Jerarquía: por pallet y por pallet+cartón
         ]
 
     # ════════════════════════════════════════════════════════════════════
@@ -379,6 +382,46 @@ class Device(Document):
 
         return datetime.utcnow() < fecha_fin
 
+    # ════════════════════════════════════════════════════════════════════
+    # EVENTOS
+    # ════════════════════════════════════════════════════════════════════
+
+    @after_event(Insert, Replace, Update)
+    async def registrar_codigos_escaneables(self):
+        """Mantiene el registro scan_codes tras cada escritura del dispositivo"""
+        from app.models.scan_code import ScanCode
+
+        try:
+            await ScanCode.registrar_dispositivo(self)
+        except Exception as e:
+            # El registro es un índice auxiliar: nunca debe romper la escritura
+            logging.error(f"Error registrando códigos escaneables de {self.imei}: {e}")
+
+    @after_event(Delete)
+    async def desregistrar_codigos_escaneables(self):
+        """Elimina del registro scan_codes los códigos que apuntaban al dispositivo"""
+        from app.models.scan_code import ScanCode
+
+        try:
+            await ScanCode.desregistrar_dispositivo(self)
+            await ScanCode.podar_agrupaciones([self.package_no], [self.pallet_id])
+        except Exception as e:
+            logging.error(f"Error eliminando códigos escaneables de {self.imei}: {e}")
+
+    @after_event(Insert, Replace, Update)
+    def actualizar_filtro_existencia(self):
+        """Añade el IMEI/ICCID al filtro de existencia de este worker"""
+        from app.services.device_filter_service import device_filter
+
+        device_filter.registrar(self.imei, self.ccid)
+
+    @after_event(Insert, Replace, Update, Delete)
+    def invalidar_cache(self):
+        """Invalidación write-through de la caché de dispositivos"""
+        from app.services.device_cache_service import device_cache
+
+        device_cache.invalidar(imei=self.imei, carton_id=self.package_no)
+
     # ════════════════════════════════════════════════════════════════════
     # MÉTODOS
     # ════════════════════════════════════════════════════════════════════
@@ -470,14 +513,83 @@ class Device(Document):
     # ════════════════════════════════════════════════════════════════════
 
     @staticmethod
-    async def buscar_por_imei(imei: str) -> Optional["Device"]:
-        """Busca un dispositivo por IMEI"""
-        return await Device.find_one(Device.imei == imei.strip())
+    async def buscar_por_imei(
+        imei: str,
+        use_filter: bool = False,
+        use_cache: bool = True
+    ) -> Optional["Device"]:
+        """
+        Busca un dispositivo por IMEI
+
+        Con use_filter=True los IMEI que el filtro de existencia descarta no
+        llegan a MongoDB. Solo para consultas de lectura (escaneo,
+        validación): el filtro de cada worker se sincroniza con retraso y un
+        "no existe" erróneo en una escritura crearía duplicados.
+
+        Los llamadores que modifican y guardan el dispositivo deben pasar
+        use_cache=False: la copia cacheada puede no incluir la escritura de
+        otro worker y save() la sobrescribiría entera.
+        """
+        from app.services.device_filter_service import device_filter
+        from app.services.device_cache_service import device_cache
+
+        imei = imei.strip()
+
+        if use_cache:
+            device = device_cache.obtener_dispositivo(imei)
+            if device is not None:
+                return device
+
+        if use_filter and not await device_filter.puede_existir_imei(imei):
+            return None
+
+        generacion = device_cache.generacion
+        device = await Device.find_one(Device.imei == imei)
+        if use_filter:
+            device_filter.confirmar(device is not None)
+        # Una lectura para escritura no se cachea: el llamador va a modificar la instancia
+        if use_cache:
+            device_cache.guardar_dispositivo(device, generacion)
+        return device
+
+    @staticmethod
+    async def buscar_por_ccid(ccid: str, use_filter: bool = False) -> Optional["Device"]:
+        """
+        Busca un dispositivo por CCID
+
+        Con use_filter=True los ICCID que el filtro de existencia descarta no
+        llegan a MongoDB (solo consultas de lectura, como buscar_por_imei).
+        """
+        from app.services.device_filter_service import device_filter
+
+        if use_filter and not await device_filter.puede_existir_ccid(ccid):
+            return None
+
+        device = await Device.find_one(Device.ccid == ccid.strip())
+        if use_filter:
+            device_filter.confirmar(device is not None)
+        return device
 
     @staticmethod
-    async def buscar_por_ccid(ccid: str) -> Optional["Device"]:
-        """Busca un dispositivo por CCID"""
-        return await Device.find_one(Device.ccid == ccid.strip())
+    async def buscar_vistas_por_carton(carton_id: str) -> List["DeviceScanView"]:
+        """
+        Vistas proyectadas de los dispositivos de un cartón
+
+        Servidas desde la caché de dispositivos cuando el cartón se ha
+        escaneado recientemente.
+        """
+        from app.services.device_cache_service import device_cache
+
+        carton_id = carton_id.strip()
+
+        vistas = device_cache.obtener_carton(carton_id)
+        if vistas is not None:
+            return vistas
+
+        generacion = device_cache.generacion
+        vistas = await Device.find(Device.package_no == carton_id).project(DeviceScanView).to_list()
+        device_cache.guardar_carton(carton_id, vistas, generacion)
+        return vistas
 
     @staticmethod
     async def buscar_por_paquete(package_no: str):
@@ -488,3 +600,24 @@ class Device(Document):
     async def buscar_por_orden(nro_orden: str):
         """Busca todos los dispositivos de una orden de producción"""
         return await Device.find(Device.nro_orden == nro_orden.strip()).to_list()
+
+
+class DeviceScanView(BaseModel):
+    """
+    Vista proyectada de Device para escaneo y picking
+
+    Solo los campos que usan las búsquedas por cartón (App 1 y App 6),
+    para cachear cartones completos con poca memoria.
+    """
+
+    id: Optional[PydanticObjectId] = Field(None, alias="_id")
+    imei: str
+    ccid: Optional[str] = None
+    package_no: Optional[str] = Field(None, alias="carton_id")
+    pallet_id: Optional[str] = None
+    lote: Optional[int] = None
+    marca: Optional[str] = None
+    nro_referencia: Optional[str] = None
+    estado: Optional[EstadoDispositivo] = None
+    notificado: bool = False
+    cliente_nombre: Optional[str] = None
@@ -79,6 +79,11 @@ class ImportJob(Document):
         description="Tamaño del archivo en bytes"
     )
 
+    file_sha256: Optional[str] = Field(
+        default=None,
+        description="SHA-256 del archivo (calculado al recibirlo)"
+    )
+
     file_path: Optional[str] = Field(
         default=None,
         description="Ruta donde se guardó el archivo"
@@ -197,6 +202,11 @@ class ImportJob(Document):
         description="Fecha de finalización"
     )
 
+    peak_rss_mb: Optional[float] = Field(
+        default=None,
+        description="Pico de RSS del worker durante la importación (MB sobre el inicial)"
+    )
+
     # ════════════════════════════════════════════════════════════════════
     # METADATA
     # ════════════════════════════════════════════════════════════════════
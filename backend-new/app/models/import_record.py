@@ -48,6 +48,11 @@ class ImportRecord(Document):
         description="Tamaño del archivo en bytes"
     )
 
+    file_sha256: Optional[str] = Field(
+        default=None,
+        description="SHA-256 del archivo (calculado al recibirlo)"
+    )
+
     # ════════════════════════════════════════════════════════════════════
     # RESULTADOS DE LA IMPORTACIÓN
     # ════════════════════════════════════════════════════════════════════
@@ -101,6 +106,11 @@ class ImportRecord(Document):
         description="Tiempo de procesamiento en segundos"
     )
 
+    peak_rss_mb: Optional[float] = Field(
+        default=None,
+        description="Pico de RSS del worker durante la importación (MB sobre el inicial)"
+    )
+
     imported_by: Optional[str] = Field(
         default=None,
         description="ID del empleado que realizó la importación",
@@ -79,6 +79,10 @@ class InvoiceConfig(Document):
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     last_modified_by: Optional[str] = Field(None, description="ID del último usuario que modificó")
 
+    # Versión de la configuración: cambia con cada modificación que afecta al
+    # PDF (datos, logo, plantilla) e invalida la caché de PDFs de facturas
+    config_version: int = Field(default=1, description="Versión de la configuración")
+
     # Metadata
     metadata: Dict[str, Any] = Field(default_factory=dict)
 
@@ -115,8 +119,9 @@ class InvoiceConfig(Document):
     async def update_company_info(self, data: Dict[str, Any]):
         """Actualiza información de la empresa"""
         for key, value in data.items():
-            if hasattr(self, key):
+            if hasattr(self, key) and key != "config_version":
                 setattr(self, key, value)
 
+        self.config_version += 1
         self.updated_at = datetime.utcnow()
         await self.save()
@@ -6,7 +6,7 @@ Modelo para almacenar métricas y KPIs agregados
 from beanie import Document
 from pydantic import Field
 from typing import Optional, Dict, Any
-from datetime import datetime, date
+from datetime import datetime, date, time
 from enum import Enum
 
 
@@ -186,6 +186,10 @@ class Metric(Document):
             [("metric_type", 1), ("metric_date", -1)],
             [("production_line", 1), ("metric_date", -1)]
         ]
+        # BSON no admite date: se guarda como datetime a las 00:00
+        bson_encoders = {
+            date: lambda d: d if isinstance(d, datetime) else datetime.combine(d, time.min)
+        }
 
     # ════════════════════════════════════════════════════════════════════
     # MÉTODOS ESTÁTICOS
@@ -235,13 +239,18 @@ class Metric(Document):
         unit: Optional[str] = None,
         **kwargs
     ) -> "Metric":
-        """Registra o actualiza una métrica"""
+        """
+        Registra o actualiza una métrica
+
+        La métrica se identifica por tipo, período, fecha y los campos de
+        contexto indicados (incluidas las dimensiones, si se pasan).
+        """
         # Buscar si ya existe
         existing = await Metric.get_metric(
             metric_type=metric_type,
             date_value=date_value,
             period=period,
-            **{k: v for k, v in kwargs.items() if k in ["production_order", "production_line", "operator", "customer_id"]}
+            **{k: v for k, v in kwargs.items() if k in ["metric_name", "production_order", "production_line", "operator", "customer_id", "dimensions"]}
         )
 
         if existing:
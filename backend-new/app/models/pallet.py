@@ -198,22 +198,19 @@ class Pallet(Document):
         """
         from app.models.device import Device
 
-        # Contar cartones únicos
-        devices = await Device.find(Device.pallet_id == self.pallet_id).to_list()
-        unique_cartons = set()
-        device_count = 0
-
-        for device in devices:
-            if device.package_no:  # package_no = carton_id
-                unique_cartons.add(device.package_no)
-            device_count += 1
-
-        self.carton_count = len(unique_cartons)
-        self.device_count = device_count
-        self.carton_ids = list(unique_cartons)
-        self.fecha_modificacion = datetime.utcnow()
-
-        await self.save()
+        # Dispositivos por cartón (carton_id es el nombre en MongoDB de package_no)
+        grupos = await Device.find(Device.pallet_id == self.pallet_id).aggregate([
+            {"$group": {"_id": "$carton_id", "n": {"$sum": 1}}}
+        ]).to_list()
+        unique_cartons = sorted(grupo["_id"] for grupo in grupos if grupo["_id"])
+
+        # $set solo de los contadores, sin reescribir el resto del documento
+        await self.set({
+            Pallet.carton_count: len(unique_cartons),
+            Pallet.device_count: sum(grupo["n"] for grupo in grupos),
+            Pallet.carton_ids: unique_cartons,
+            Pallet.fecha_modificacion: datetime.utcnow()
+        })
 
     async def marcar_como_verificado(self, operador: Optional[str] = None):
         """Marca el pallet como verificado"""
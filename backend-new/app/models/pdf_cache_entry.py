@@ -0,0 +1,69 @@
+"""
+OSE Platform - PDF Cache Entry Model
+Índice de la caché de PDFs de facturas (direccionada por contenido)
+"""
+
+from beanie import Document
+from pydantic import Field
+from pymongo import IndexModel
+from typing import Optional
+from datetime import datetime
+
+
+class PdfCacheEntry(Document):
+    """
+    Entrada de la caché de PDFs
+
+    La clave es el hash de plantilla, versión de plantilla, versión de la
+    configuración de facturación y datos normalizados de la factura. El PDF
+    se guarda en disco o en GridFS; aquí solo se lleva el índice para servir
+    aciertos y aplicar la política de expulsión.
+    """
+
+    key: str = Field(
+        ...,
+        description="Hash SHA-256 del contenido que determina el PDF"
+    )
+
+    backend: str = Field(
+        ...,
+        description="Almacenamiento del PDF (disk, gridfs)"
+    )
+
+    size: int = Field(
+        default=0,
+        description="Tamaño del PDF en bytes"
+    )
+
+    template_name: Optional[str] = Field(
+        default=None,
+        description="Plantilla con la que se renderizó"
+    )
+
+    invoice_number: Optional[str] = Field(
+        default=None,
+        description="Factura de origen (informativo)"
+    )
+
+    hits: int = Field(
+        default=0,
+        description="Veces que se ha servido desde la caché"
+    )
+
+    created_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        description="Fecha de renderizado"
+    )
+
+    last_access: datetime = Field(
+        default_factory=datetime.utcnow,
+        description="Último acceso (para expulsar las menos usadas)"
+    )
+
+    class Settings:
+        name = "pdf_cache"
+        indexes = [
+            # Única: varios workers hacen upsert por clave a la vez
+            IndexModel([("key", 1)], unique=True),
+            "last_access"
+        ]
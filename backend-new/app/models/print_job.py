@@ -0,0 +1,132 @@
+"""
+OSE Platform - Print Job Model
+Trabajos de impresión ZPL enviados a impresoras Zebra por el spooler
+"""
+
+from beanie import Document
+from pydantic import Field
+from typing import Optional, List
+from datetime import datetime
+from enum import Enum
+
+
+class PrintJobStatus(str, Enum):
+    """Estados de un trabajo de impresión"""
+    QUEUED = "queued"  # En cola
+    SENDING = "sending"  # Enviándose a la impresora
+    RETRYING = "retrying"  # Falló el envío, pendiente de reintento
+    COMPLETED = "completed"  # Entregado a la impresora
+    FAILED = "failed"  # Agotados los reintentos
+    CANCELLED = "cancelled"  # Cancelado antes de enviarse
+
+
+class PrintJob(Document):
+    """
+    Trabajo de impresión ZPL
+
+    El spooler agrupa los trabajos en cola de una misma impresora y los
+    envía por una única conexión TCP (puerto 9100).
+    """
+
+    # ════════════════════════════════════════════════════════════════════
+    # DESTINO Y CONTENIDO
+    # ════════════════════════════════════════════════════════════════════
+
+    printer: str = Field(
+        ...,
+        description="Nombre de la impresora configurada (PRINT_SPOOLER_PRINTERS)",
+        index=True
+    )
+
+    zpl: str = Field(
+        ...,
+        description="Código ZPL a enviar"
+    )
+
+    labels: int = Field(
+        default=1,
+        description="Número de etiquetas (^XA ... ^XZ) del trabajo"
+    )
+
+    documento_referencia: Optional[str] = Field(
+        default=None,
+        description="Documento de origen (código de palet del albarán, etc.)",
+        index=True
+    )
+
+    # ════════════════════════════════════════════════════════════════════
+    # ESTADO
+    # ════════════════════════════════════════════════════════════════════
+
+    status: PrintJobStatus = Field(
+        default=PrintJobStatus.QUEUED,
+        description="Estado del trabajo",
+        index=True
+    )
+
+    attempts: int = Field(
+        default=0,
+        description="Intentos de envío realizados"
+    )
+
+    errors: List[str] = Field(
+        default_factory=list,
+        description="Errores de los intentos fallidos"
+    )
+
+    batch_id: Optional[str] = Field(
+        default=None,
+        description="Envío (conexión) en el que se agrupó el trabajo"
+    )
+
+    # ════════════════════════════════════════════════════════════════════
+    # AUDITORÍA
+    # ════════════════════════════════════════════════════════════════════
+
+    created_by: Optional[str] = Field(
+        default=None,
+        description="Usuario que lanzó la impresión"
+    )
+
+    created_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        description="Fecha de creación",
+        index=True
+    )
+
+    sent_at: Optional[datetime] = Field(
+        default=None,
+        description="Fecha de entrega a la impresora"
+    )
+
+    updated_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        description="Última actualización"
+    )
+
+    class Settings:
+        name = "print_jobs"
+        indexes = [
+            "printer",
+            "status",
+            "documento_referencia",
+            "created_at",
+            [("printer", 1), ("status", 1), ("created_at", 1)]
+        ]
+
+    def to_dict(self) -> dict:
+        """Convierte el trabajo a diccionario para API responses (sin el ZPL)"""
+        return {
+            "id": str(self.id) if self.id else None,
+            "printer": self.printer,
+            "labels": self.labels,
+            "documento_referencia": self.documento_referencia,
+            "status": self.status,
+            "attempts": self.attempts,
+            "errors": self.errors,
+            "batch_id": self.batch_id,
+            "created_by": self.created_by,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "sent_at": self.sent_at.isoformat() if self.sent_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
@@ -0,0 +1,271 @@
+"""
+OSE Platform - Modelo ScanCode
+Registro unificado de códigos escaneables (IMEI, ICCID, cartón, palet, lote, EST912)
+Permite resolver un código escaneado con una única búsqueda indexada
+"""
+
+from beanie import Document
+from pydantic import Field
+from pymongo import IndexModel, UpdateOne
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from datetime import datetime
+from enum import Enum
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ScanCodeType(str, Enum):
+    """Tipos de código escaneable"""
+    IMEI = "imei"
+    ICCID = "iccid"
+    CARTON = "carton"  # package_no / carton_id
+    PALLET = "pallet"  # pallet_id
+    LOTE = "lote"
+    DELIVERY_NOTE = "delivery_note"  # Código de palet EST912 del albarán
+
+
+# Prioridad cuando un mismo código está registrado con varios tipos
+PRIORIDAD_TIPOS: List[ScanCodeType] = [
+    ScanCodeType.IMEI,
+    ScanCodeType.ICCID,
+    ScanCodeType.CARTON,
+    ScanCodeType.PALLET,
+    ScanCodeType.DELIVERY_NOTE,
+    ScanCodeType.LOTE,
+]
+
+# Tipos que identifican un único documento (target_ids = [id])
+TIPOS_UNITARIOS = {ScanCodeType.IMEI, ScanCodeType.ICCID, ScanCodeType.DELIVERY_NOTE}
+
+# Entrada de registro: (código, tipo, id destino opcional)
+EntradaScanCode = Tuple[str, ScanCodeType, Optional[str]]
+
+
+class ScanCode(Document):
+    """
+    Índice de códigos escaneables
+
+    Cada documento asocia un código con su tipo y los IDs destino.
+    Para IMEI/ICCID el destino es el device_id, para EST912 el id del albarán.
+    Para cartón, palet y lote el propio código es la clave de agrupación
+    y el conjunto de dispositivos se obtiene con una consulta indexada.
+    """
+
+    code: str = Field(
+        ...,
+        description="Código escaneable normalizado",
+        index=True
+    )
+
+    code_type: ScanCodeType = Field(
+        ...,
+        description="Tipo de código"
+    )
+
+    target_ids: List[str] = Field(
+        default_factory=list,
+        description="IDs de los documentos destino (device_id, delivery_note_id)"
+    )
+
+    fecha_actualizacion: datetime = Field(
+        default_factory=datetime.utcnow,
+        description="Última vez que se registró el código"
+    )
+
+    class Settings:
+        name = "scan_codes"
+        indexes = [
+            IndexModel([("code", 1), ("code_type", 1)], unique=True),
+            IndexModel([("code_type", 1), ("fecha_actualizacion", 1)]),
+        ]
+
+    # ════════════════════════════════════════════════════════════════════
+    # REGISTRO
+    # ════════════════════════════════════════════════════════════════════
+
+    @staticmethod
+    def entradas_dispositivo(device: Any) -> List[EntradaScanCode]:
+        """
+        Obtiene los códigos escaneables de un dispositivo
+
+        Acepta una instancia de Device o un documento crudo de MongoDB
+        """
+        if isinstance(device, dict):
+            device_id = device.get("_id")
+            imei = device.get("imei")
+            ccid = device.get("ccid")
+            carton = device.get("carton_id") or device.get("package_no")
+            pallet_id = device.get("pallet_id")
+            lote = device.get("lote")
+        else:
+            device_id = device.id
+            imei = device.imei
+            ccid = device.ccid
+            carton = device.package_no
+            pallet_id = device.pallet_id
+            lote = device.lote
+
+        device_id = str(device_id) if device_id else None
+        entradas: List[EntradaScanCode] = []
+
+        if imei:
+            entradas.append((str(imei).strip(), ScanCodeType.IMEI, device_id))
+        if ccid:
+            entradas.append((str(ccid).strip(), ScanCodeType.ICCID, device_id))
+        if carton:
+            entradas.append((str(carton).strip(), ScanCodeType.CARTON, None))
+        if pallet_id:
+            entradas.append((str(pallet_id).strip(), ScanCodeType.PALLET, None))
+        if lote is not None and str(lote).strip():
+            entradas.append((str(lote).strip(), ScanCodeType.LOTE, None))
+
+        return entradas
+
+    @staticmethod
+    def _operacion(code: str, code_type: ScanCodeType, target_id: Optional[str]) -> UpdateOne:
+        """Construye el upsert de una entrada del registro"""
+        update: Dict[str, Any] = {"$set": {"fecha_actualizacion": datetime.utcnow()}}
+
+        if target_id:
+            if code_type in TIPOS_UNITARIOS:
+                update["$set"]["target_ids"] = [target_id]
+            else:
+                update["$addToSet"] = {"target_ids": target_id}
+        else:
+            update["$setOnInsert"] = {"target_ids": []}
+
+        return UpdateOne(
+            {"code": code, "code_type": code_type.value},
+            update,
+            upsert=True
+        )
+
+    @classmethod
+    async def registrar(cls, entradas: Iterable[EntradaScanCode]) -> int:
+        """
+        Registra (upsert) un conjunto de códigos en una sola operación bulk
+
+        Returns:
+            int: Número de entradas enviadas
+        """
+        # Deduplicar manteniendo el último target_id de cada código
+        unicas: Dict[Tuple[str, ScanCodeType], Optional[str]] = {}
+        for code, code_type, target_id in entradas:
+            if code:
+                unicas[(code, code_type)] = target_id
+
+        if not unicas:
+            return 0
+
+        operaciones = [
+            cls._operacion(code, code_type, target_id)
+            for (code, code_type), target_id in unicas.items()
+        ]
+
+        await cls.get_motor_collection().bulk_write(operaciones, ordered=False)
+        return len(operaciones)
+
+    @classmethod
+    async def registrar_dispositivo(cls, device: Any) -> int:
+        """Registra todos los códigos escaneables de un dispositivo"""
+        return await cls.registrar(cls.entradas_dispositivo(device))
+
+    @classmethod
+    async def registrar_dispositivos(cls, devices: Iterable[Any]) -> int:
+        """Registra los códigos de varios dispositivos en una sola operación"""
+        entradas: List[EntradaScanCode] = []
+        for device in devices:
+            entradas.extend(cls.entradas_dispositivo(device))
+        return await cls.registrar(entradas)
+
+    @classmethod
+    async def desregistrar_dispositivo(cls, device: Any) -> int:
+        """
+        Elimina el dispositivo de sus entradas IMEI/ICCID (tras borrarlo)
+
+        Las entradas de cartón, palet y lote se podan con podar_agrupaciones.
+        """
+        entradas = [
+            (code, code_type) for code, code_type, target_id in cls.entradas_dispositivo(device)
+            if code_type in TIPOS_UNITARIOS and target_id
+        ]
+        if not entradas:
+            return 0
+
+        device_id = str(device["_id"] if isinstance(device, dict) else device.id)
+        resultado = await cls.get_motor_collection().delete_many({
+            "$or": [{"code": code, "code_type": code_type.value} for code, code_type in entradas],
+            "target_ids": [device_id]
+        })
+        return resultado.deleted_count
+
+    @classmethod
+    async def podar_agrupaciones(
+        cls,
+        cartones: Iterable[str] = (),
+        pallets: Iterable[str] = ()
+    ) -> int:
+        """
+        Elimina las entradas de cartón/palet que ya no tienen dispositivos
+
+        Se llama tras reubicar o borrar dispositivos. Las entradas
+        registradas después de empezar la comprobación no se tocan, para no
+        borrar un cartón que otro worker acaba de llenar.
+        """
+        from app.models.device import Device
+
+        inicio = datetime.utcnow()
+        coleccion = Device.get_motor_collection()
+        borrados = 0
+
+        for code_type, campo, codigos in (
+            (ScanCodeType.CARTON, "carton_id", {c for c in cartones if c}),
+            (ScanCodeType.PALLET, "pallet_id", {p for p in pallets if p}),
+        ):
+            if not codigos:
+                continue
+            ocupados = set(await coleccion.distinct(campo, {campo: {"$in": list(codigos)}}))
+            vacios = [c for c in codigos if c not in ocupados]
+            if vacios:
+                resultado = await cls.get_motor_collection().delete_many({
+                    "code": {"$in": vacios},
+                    "code_type": code_type.value,
+                    "fecha_actualizacion": {"$lt": inicio}
+                })
+                borrados += resultado.deleted_count
+
+        return borrados
+
+    @classmethod
+    async def registrar_albaran(cls, pallet_code: str, delivery_note_id: Any) -> int:
+        """Registra el código EST912 de un albarán"""
+        return await cls.registrar([
+            (pallet_code.strip(), ScanCodeType.DELIVERY_NOTE, str(delivery_note_id))
+        ])
+
+    # ════════════════════════════════════════════════════════════════════
+    # RESOLUCIÓN
+    # ════════════════════════════════════════════════════════════════════
+
+    @classmethod
+    async def candidatos(cls, code: str) -> List["ScanCode"]:
+        """
+        Entradas de un código escaneado ordenadas por PRIORIDAD_TIPOS
+
+        Una sola búsqueda indexada. El llamador prueba cada entrada en orden:
+        una entrada obsoleta (dispositivo borrado o cartón vaciado) no debe
+        ocultar un registro válido de menor prioridad.
+        """
+        registros = await cls.find({"code": code.strip()}).to_list()
+        return sorted(registros, key=lambda r: PRIORIDAD_TIPOS.index(r.code_type))
+
+    @classmethod
+    async def resolver(cls, code: str) -> Optional["ScanCode"]:
+        """
+        Entrada de mayor prioridad de un código escaneado
+
+        Si el código está registrado con varios tipos se aplica PRIORIDAD_TIPOS.
+        """
+        registros = await cls.candidatos(code)
+        return registros[0] if registros else None
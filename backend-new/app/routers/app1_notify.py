@@ -4,14 +4,18 @@ Router para notificación de dispositivos a clientes
 Incluye exportación por lotes de pallets
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File, Request
 from fastapi.responses import StreamingResponse
-from typing import List, Optional
+from beanie.operators import In
+from pydantic import ValidationError
+from typing import Dict, List, Optional
+from collections import defaultdict
 from datetime import datetime
 import logging
+import json
 import csv
 import io
-import pandas as pd
+import zlib
 
 from app.schemas.app1 import (
     NotificarSeriesRequest,
@@ -24,16 +28,22 @@ from app.schemas.app1 import (
     ValidateBulkRequest,
     ValidateBulkResponse,
     SendNotificationRequest,
-    SendNotificationResponse
+    SendNotificationResponse,
+    BatchScanRequest
 )
-from app.models.device import Device, EstadoDispositivo
+from app.models.device import Device, DeviceScanView, EstadoDispositivo
 from app.models.device_event import DeviceEvent
 from app.models.movimiento import Movimiento, TipoMovimiento
 from app.models.customer import Customer
 from app.models.employee import Employee
 from app.models.series_notification import SeriesNotification
+from app.models.scan_code import ScanCode, ScanCodeType, PRIORIDAD_TIPOS
+from app.models.delivery_note import DeliveryNote
 from app.dependencies.auth import get_current_active_user
 from app.services.mail_service import mail_service
+from app.services.device_cache_service import device_cache
+from app.services.upload_service import recibir_upload, leer_dataframe
+from app.services.memory_service import medir_memoria, memoria
 from app.config import settings
 
 logger = logging.getLogger(__name__)
@@ -86,7 +96,7 @@ async def notificar_series(
     for imei in request.series:
         try:
             # Buscar dispositivo por IMEI
-            device = await Device.buscar_por_imei(imei)
+            device = await Device.buscar_por_imei(imei, use_cache=False)
 
             if not device:
                 errores.append(f"Dispositivo no encontrado: {imei}")
@@ -257,7 +267,7 @@ async def obtener_dispositivo(
 
     Requiere autenticación.
     """
-    device = await Device.buscar_por_imei(imei)
+    device = await Device.buscar_por_imei(imei, use_filter=True)
 
     if not device:
         raise HTTPException(
@@ -291,7 +301,7 @@ async def obtener_historial_dispositivo(
 
     Requiere autenticación.
     """
-    device = await Device.buscar_por_imei(imei)
+    device = await Device.buscar_por_imei(imei, use_filter=True)
 
     if not device:
         raise HTTPException(
@@ -483,7 +493,7 @@ async def validate_bulk_series(
 
         # Buscar dispositivo
         try:
-            device = await Device.buscar_por_imei(imei_clean)
+            device = await Device.buscar_por_imei(imei_clean, use_filter=True)
 
             if not device:
                 resultados.append({
@@ -660,7 +670,7 @@ async def send_notification(
                 # Procesar cada IMEI
                 for serial in request.serials:
                     try:
-                        device = await Device.buscar_por_imei(serial.imei)
+                        device = await Device.buscar_por_imei(serial.imei, use_cache=False)
 
                         if device:
                             # Permitir reenvío incluso si ya estaba notificado
@@ -965,6 +975,124 @@ async def get_history(
 # ENDPOINTS DE BÚSQUEDA JERÁRQUICA (LOTE/CARTÓN/PALET)
 # ════════════════════════════════════════════════════════════════════
 
+def _filtro_lote(lote: str) -> dict:
+    """
+    Filtro indexado por lote
+
+    Device.lote es entero, pero los datos migrados pueden guardarlo como texto,
+    así que se buscan ambas representaciones.
+    """
+    lote = lote.strip()
+    if lote.isdigit():
+        return {"lote": {"$in": [int(lote), lote]}}
+    return {"lote": lote}
+
+
+def _serial_dispositivo(device: Device) -> dict:
+    """Formato de serie (IMEI/ICCID) usado por las búsquedas de escaneo"""
+    return {
+        "imei": device.imei,
+        "iccid": device.ccid or "",
+        "package_no": device.package_no or "",
+        "pallet_id": device.pallet_id or "",
+        "notificado": device.notificado,
+        "cliente_nombre": device.cliente_nombre if device.notificado else None
+    }
+
+
+def _respuesta_lote(location: str, devices: List[Device]) -> dict:
+    """Respuesta de búsqueda por lote a partir de sus dispositivos"""
+    if not devices:
+        return {
+            "success": False,
+            "message": f"No se encontraron dispositivos para el lote: {location}",
+            "count": 0,
+            "serials": []
+        }
+
+    # Formatear como serials
+    serials = [_serial_dispositivo(device) for device in devices]
+
+    return {
+        "success": True,
+        "type": "lote",
+        "identifier": location,
+        "count": len(serials),
+        "serials": serials,
+        "message": f"Se encontraron {len(serials)} dispositivo(s) en el lote {location}"
+    }
+
+
+def _respuesta_carton(carton_id: str, devices: List[Device]) -> dict:
+    """Respuesta de búsqueda por cartón a partir de sus dispositivos"""
+    if not devices:
+        return {
+            "success": False,
+            "message": f"No se encontraron dispositivos para el cartón: {carton_id}",
+            "count": 0,
+            "serials": []
+        }
+
+    # Formatear como serials
+    serials = []
+    pallet_id = None
+    lote = None
+
+    for device in devices:
+        if not pallet_id and device.pallet_id:
+            pallet_id = device.pallet_id
+        if not lote and device.lote:
+            lote = device.lote
+
+        serials.append(_serial_dispositivo(device))
+
+    return {
+        "success": True,
+        "type": "carton",
+        "identifier": carton_id,
+        "pallet_id": pallet_id,
+        "lote": lote,
+        "count": len(serials),
+        "serials": serials,
+        "message": f"Se encontraron {len(serials)} dispositivo(s) en el cartón {carton_id}"
+    }
+
+
+def _respuesta_pallet(pallet_id: str, devices: List[Device]) -> dict:
+    """Respuesta de búsqueda por palet a partir de sus dispositivos"""
+    if not devices:
+        return {
+            "success": False,
+            "message": f"No se encontraron dispositivos para el palet: {pallet_id}",
+            "count": 0,
+            "serials": []
+        }
+
+    # Formatear como serials y contar cartones únicos
+    serials = []
+    cartons = set()
+    lote = None
+
+    for device in devices:
+        if device.package_no:
+            cartons.add(device.package_no)
+        if not lote and device.lote:
+            lote = device.lote
+
+        serials.append(_serial_dispositivo(device))
+
+    return {
+        "success": True,
+        "type": "pallet",
+        "identifier": pallet_id,
+        "lote": lote,
+        "carton_count": len(cartons),
+        "count": len(serials),
+        "serials": serials,
+        "message": f"Se encontraron {len(serials)} dispositivo(s) en {len(cartons)} cartón(es) del palet {pallet_id}"
+    }
+
+
 @router.get("/search/by-location/{location}")
 async def search_by_location(
     location: str,
@@ -980,38 +1108,9 @@ async def search_by_location(
     """
     try:
         # Buscar dispositivos por location/lote
-        devices = await Device.find(
-            Device.lote == location
-        ).to_list()
-
-        if not devices:
-            return {
-                "success": False,
-                "message": f"No se encontraron dispositivos para el lote: {location}",
-                "count": 0,
-                "serials": []
-            }
+        devices = await Device.find(_filtro_lote(location)).to_list()
 
-        # Formatear como serials
-        serials = []
-        for device in devices:
-            serials.append({
-                "imei": device.imei,
-                "iccid": device.ccid or "",
-                "package_no": device.package_no or "",
-                "pallet_id": device.pallet_id or "",
-                "notificado": device.notificado,
-                "cliente_nombre": device.cliente_nombre if device.notificado else None
-            })
-
-        return {
-            "success": True,
-            "type": "lote",
-            "identifier": location,
-            "count": len(serials),
-            "serials": serials,
-            "message": f"Se encontraron {len(serials)} dispositivo(s) en el lote {location}"
-        }
+        return _respuesta_lote(location, devices)
 
     except Exception as e:
         logger.error(f"Error buscando por lote {location}: {e}")
@@ -1036,48 +1135,9 @@ async def search_by_carton(
     """
     try:
         # Buscar dispositivos por package_no (carton_id)
-        devices = await Device.find(
-            Device.package_no == carton_id
-        ).to_list()
-
-        if not devices:
-            return {
-                "success": False,
-                "message": f"No se encontraron dispositivos para el cartón: {carton_id}",
-                "count": 0,
-                "serials": []
-            }
-
-        # Formatear como serials
-        serials = []
-        pallet_id = None
-        lote = None
+        devices = await Device.buscar_vistas_por_carton(carton_id)
 
-        for device in devices:
-            if not pallet_id and device.pallet_id:
-                pallet_id = device.pallet_id
-            if not lote and device.lote:
-                lote = device.lote
-
-            serials.append({
-                "imei": device.imei,
-                "iccid": device.ccid or "",
-                "package_no": device.package_no or "",
-                "pallet_id": device.pallet_id or "",
-                "notificado": device.notificado,
-                "cliente_nombre": device.cliente_nombre if device.notificado else None
-            })
-
-        return {
-            "success": True,
-            "type": "carton",
-            "identifier": carton_id,
-            "pallet_id": pallet_id,
-            "lote": lote,
-            "count": len(serials),
-            "serials": serials,
-            "message": f"Se encontraron {len(serials)} dispositivo(s) en el cartón {carton_id}"
-        }
+        return _respuesta_carton(carton_id, devices)
 
     except Exception as e:
         logger.error(f"Error buscando por cartón {carton_id}: {e}")
@@ -1106,44 +1166,7 @@ async def search_by_pallet(
             Device.pallet_id == pallet_id
         ).to_list()
 
-        if not devices:
-            return {
-                "success": False,
-                "message": f"No se encontraron dispositivos para el palet: {pallet_id}",
-                "count": 0,
-                "serials": []
-            }
-
-        # Formatear como serials y contar cartones únicos
-        serials = []
-        cartons = set()
-        lote = None
-
-        for device in devices:
-            if device.package_no:
-                cartons.add(device.package_no)
-            if not lote and device.lote:
-                lote = device.lote
-
-            serials.append({
-                "imei": device.imei,
-                "iccid": device.ccid or "",
-                "package_no": device.package_no or "",
-                "pallet_id": device.pallet_id or "",
-                "notificado": device.notificado,
-                "cliente_nombre": device.cliente_nombre if device.notificado else None
-            })
-
-        return {
-            "success": True,
-            "type": "pallet",
-            "identifier": pallet_id,
-            "lote": lote,
-            "carton_count": len(cartons),
-            "count": len(serials),
-            "serials": serials,
-            "message": f"Se encontraron {len(serials)} dispositivo(s) en {len(cartons)} cartón(es) del palet {pallet_id}"
-        }
+        return _respuesta_pallet(pallet_id, devices)
 
     except Exception as e:
         logger.error(f"Error buscando por palet {pallet_id}: {e}")
@@ -1153,6 +1176,85 @@ async def search_by_pallet(
         )
 
 
+def _scan_dispositivo(device: Device, code_type: str, code: str) -> dict:
+    """Respuesta de smart-scan para un único dispositivo (IMEI/ICCID)"""
+    return {
+        "success": True,
+        "type": code_type,
+        "identifier": code,
+        "count": 1,
+        "serials": [_serial_dispositivo(device)],
+        "message": f"Dispositivo encontrado por {code_type.upper()}"
+    }
+
+
+def _scan_albaran(delivery_note: DeliveryNote, code: str) -> dict:
+    """Respuesta de smart-scan para un código EST912 de albarán"""
+    return {
+        "success": True,
+        "type": "delivery_note",
+        "identifier": code,
+        "count": 0,
+        "serials": [],
+        "delivery_note": delivery_note.to_dict(),
+        "message": f"Albarán {delivery_note.delivery_note_number} encontrado"
+    }
+
+
+def _scan_no_encontrado(code: str) -> dict:
+    """Respuesta de smart-scan para un código desconocido"""
+    return {
+        "success": False,
+        "type": "unknown",
+        "identifier": code,
+        "count": 0,
+        "serials": [],
+        "message": f"No se encontraron dispositivos para el código: {code}"
+    }
+
+
+async def _resolver_registro_scan(
+    registro: ScanCode,
+    code: str,
+    current_user: Employee
+) -> Optional[dict]:
+    """
+    Obtiene el resultado de smart-scan a partir de una entrada de scan_codes
+
+    Retorna None si la entrada apunta a un documento que ya no existe o a
+    un cartón/palet/lote sin dispositivos, para que el llamador pruebe la
+    siguiente entrada o la detección heurística.
+    """
+    if registro.code_type in (ScanCodeType.IMEI, ScanCodeType.ICCID):
+        if not registro.target_ids:
+            return None
+        device = await Device.get(registro.target_ids[0])
+        if not device:
+            return None
+        return _scan_dispositivo(device, registro.code_type.value, code)
+
+    results = None
+    if registro.code_type == ScanCodeType.CARTON:
+        results = await search_by_carton(code, current_user)
+    elif registro.code_type == ScanCodeType.PALLET:
+        results = await search_by_pallet(code, current_user)
+    elif registro.code_type == ScanCodeType.LOTE:
+        results = await search_by_location(code, current_user)
+
+    if results is not None:
+        return results if results.get("success") else None
+
+    if registro.code_type == ScanCodeType.DELIVERY_NOTE:
+        if not registro.target_ids:
+            return None
+        delivery_note = await DeliveryNote.get(registro.target_ids[0])
+        if not delivery_note:
+            return None
+        return _scan_albaran(delivery_note, code)
+
+    return None
+
+
 @router.post("/search/smart-scan")
 async def smart_scan_code(
     code: str = Query(..., description="Código escaneado (QR/Barcode)"),
@@ -1161,7 +1263,8 @@ async def smart_scan_code(
     """
     Búsqueda inteligente por código escaneado
 
-    Detecta automáticamente si el código es:
+    Resuelve primero el código en el registro scan_codes (una búsqueda
+    indexada). Si no está registrado, detecta automáticamente si el código es:
     - LOTE/Location
     - Cartón (package_no) - típicamente 25 dígitos empezando con 99
     - Pallet ID - típicamente empieza con T
@@ -1181,71 +1284,47 @@ async def smart_scan_code(
                 detail="El código no puede estar vacío"
             )
 
-        # Detectar tipo de código
-        code_type = None
+        # 1. Resolución directa por el registro scan_codes (una búsqueda indexada);
+        #    una entrada obsoleta cede el paso a la siguiente por prioridad
+        for registro in await ScanCode.candidatos(code):
+            results = await _resolver_registro_scan(registro, code, current_user)
+            if results:
+                return results
+
+        if settings.SCAN_REGISTRY_AUTHORITATIVE:
+            return _scan_no_encontrado(code)
+
+        # 2. Detección heurística para códigos aún no registrados
         results = None
 
-        # 1. Verificar si es un IMEI (15 dígitos)
+        # 2.1 Verificar si es un IMEI (15 dígitos)
         if len(code) == 15 and code.isdigit():
-            code_type = "imei"
-            device = await Device.buscar_por_imei(code)
+            device = await Device.buscar_por_imei(code, use_filter=True)
             if device:
-                results = {
-                    "success": True,
-                    "type": "imei",
-                    "identifier": code,
-                    "count": 1,
-                    "serials": [{
-                        "imei": device.imei,
-                        "iccid": device.ccid or "",
-                        "package_no": device.package_no or "",
-                        "pallet_id": device.pallet_id or "",
-                        "notificado": device.notificado,
-                        "cliente_nombre": device.cliente_nombre if device.notificado else None
-                    }],
-                    "message": f"Dispositivo encontrado por IMEI"
-                }
-
-        # 2. Verificar si es un ICCID (19-22 caracteres)
+                results = _scan_dispositivo(device, "imei", code)
+
+        # 2.2 Verificar si es un ICCID (19-22 caracteres)
         elif len(code) >= 19 and len(code) <= 22:
-            code_type = "iccid"
-            device = await Device.find_one(Device.ccid == code)
+            device = await Device.buscar_por_ccid(code, use_filter=True)
             if device:
-                results = {
-                    "success": True,
-                    "type": "iccid",
-                    "identifier": code,
-                    "count": 1,
-                    "serials": [{
-                        "imei": device.imei,
-                        "iccid": device.ccid or "",
-                        "package_no": device.package_no or "",
-                        "pallet_id": device.pallet_id or "",
-                        "notificado": device.notificado,
-                        "cliente_nombre": device.cliente_nombre if device.notificado else None
-                    }],
-                    "message": f"Dispositivo encontrado por ICCID"
-                }
-
-        # 3. Verificar si es un package_no/cartón (típicamente 25 dígitos empezando con 99)
+                results = _scan_dispositivo(device, "iccid", code)
+
+        # 2.3 Verificar si es un package_no/cartón (típicamente 25 dígitos empezando con 99)
         elif len(code) == 25 and code.startswith("99"):
-            code_type = "carton"
             return await search_by_carton(code, current_user)
 
-        # 4. Verificar si es un pallet_id (empieza con T)
+        # 2.4 Verificar si es un pallet_id (empieza con T)
         elif code.startswith("T") and len(code) > 10:
-            code_type = "pallet"
             return await search_by_pallet(code, current_user)
 
-        # 5. Si no coincide con patrones conocidos, buscar como lote
+        # 2.5 Si no coincide con patrones conocidos, buscar como lote
         else:
-            code_type = "lote"
             return await search_by_location(code, current_user)
 
         # Si llegamos aquí y no encontramos resultados, intentar buscar en todos los tipos
         if not results:
             # Intentar como lote
-            lote_devices = await Device.find(Device.lote == code).limit(1).to_list()
+            lote_devices = await Device.find(_filtro_lote(code)).limit(1).to_list()
             if lote_devices:
                 return await search_by_location(code, current_user)
 
@@ -1259,14 +1338,7 @@ async def smart_scan_code(
             if pallet_devices:
                 return await search_by_pallet(code, current_user)
 
-            return {
-                "success": False,
-                "type": "unknown",
-                "identifier": code,
-                "count": 0,
-                "serials": [],
-                "message": f"No se encontraron dispositivos para el código: {code}"
-            }
+            return _scan_no_encontrado(code)
 
         return results
 
@@ -1280,9 +1352,359 @@ async def smart_scan_code(
         )
 
 
+# ════════════════════════════════════════════════════════════════════
+# ESCANEO EN LOTE (MÚLTIPLES CÓDIGOS)
+# ════════════════════════════════════════════════════════════════════
+
+def _clasificar_codigo(code: str) -> str:
+    """Detección heurística del tipo de código (mismos patrones que smart-scan)"""
+    if len(code) == 15 and code.isdigit():
+        return ScanCodeType.IMEI.value
+    if 19 <= len(code) <= 22:
+        return ScanCodeType.ICCID.value
+    if len(code) == 25 and code.startswith("99"):
+        return ScanCodeType.CARTON.value
+    if code.startswith("T") and len(code) > 10:
+        return ScanCodeType.PALLET.value
+    return ScanCodeType.LOTE.value
+
+
+def _codigo_ndjson(linea: bytes) -> Optional[str]:
+    """
+    Extrae el código de una línea NDJSON
+
+    Acepta "codigo", {"code": "codigo"} o el código sin comillas
+    tal y como lo emiten algunos escáneres.
+    """
+    texto = linea.decode("utf-8").strip()
+    if not texto:
+        return None
+
+    try:
+        valor = json.loads(texto)
+    except json.JSONDecodeError:
+        return texto
+
+    if isinstance(valor, dict):
+        valor = valor.get("code")
+
+    return str(valor) if valor is not None else None
+
+
+async def _leer_codigos_batch(request: Request) -> List[str]:
+    """Lee los códigos del cuerpo (lista JSON, {"codes": [...]} o NDJSON)"""
+    content_type = request.headers.get("content-type", "")
+    codes: List[str] = []
+
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lineas, buffer = buffer.split(b"\n")
+            for linea in lineas:
+                code = _codigo_ndjson(linea)
+                if code:
+                    codes.append(code)
+
+        code = _codigo_ndjson(buffer)
+        if code:
+            codes.append(code)
+    else:
+        payload = await request.json()
+        if isinstance(payload, dict):
+            payload = payload.get("codes", [])
+        if not isinstance(payload, list):
+            raise ValueError("Se esperaba una lista de códigos")
+        codes = [str(code) for code in payload if code is not None]
+
+    return BatchScanRequest(codes=codes).codes
+
+
+def _agrupar_por(devices: List[Device], campo: str) -> Dict[str, List[Device]]:
+    """Agrupa dispositivos por el valor (texto) de un campo"""
+    grupos: Dict[str, List[Device]] = defaultdict(list)
+    for device in devices:
+        valor = getattr(device, campo)
+        if valor is not None:
+            grupos[str(valor)].append(device)
+    return grupos
+
+
+async def _resolver_grupo_scan(code_type: str, codes: List[str]) -> Dict[str, dict]:
+    """
+    Resuelve todos los códigos de un mismo tipo con una única consulta $in
+
+    Retorna solo los códigos encontrados, con la misma respuesta que
+    el endpoint de búsqueda individual correspondiente.
+    """
+    resultados: Dict[str, dict] = {}
+
+    if code_type == ScanCodeType.IMEI.value:
+        devices = await Device.find(In(Device.imei, codes)).to_list()
+        for device in devices:
+            resultados[device.imei] = _scan_dispositivo(device, code_type, device.imei)
+
+    elif code_type == ScanCodeType.ICCID.value:
+        devices = await Device.find(In(Device.ccid, codes)).to_list()
+        for device in devices:
+            resultados[device.ccid] = _scan_dispositivo(device, code_type, device.ccid)
+
+    elif code_type == ScanCodeType.CARTON.value:
+        # Cartones escaneados recientemente se sirven desde la caché
+        pendientes = []
+        for carton_id in codes:
+            vistas = device_cache.obtener_carton(carton_id)
+            if vistas is not None:
+                resultados[carton_id] = _respuesta_carton(carton_id, vistas)
+            else:
+                pendientes.append(carton_id)
+
+        if pendientes:
+            generacion = device_cache.generacion
+            devices = await Device.find(In(Device.package_no, pendientes)).project(DeviceScanView).to_list()
+            for carton_id, grupo in _agrupar_por(devices, "package_no").items():
+                device_cache.guardar_carton(carton_id, grupo, generacion)
+                resultados[carton_id] = _respuesta_carton(carton_id, grupo)
+
+    elif code_type == ScanCodeType.PALLET.value:
+        devices = await Device.find(In(Device.pallet_id, codes)).to_list()
+        for pallet_id, grupo in _agrupar_por(devices, "pallet_id").items():
+            resultados[pallet_id] = _respuesta_pallet(pallet_id, grupo)
+
+    elif code_type == ScanCodeType.LOTE.value:
+        # Lote entero o texto (datos migrados), igual que _filtro_lote
+        valores = []
+        codigos_por_lote: Dict[str, set] = defaultdict(set)
+        for code in codes:
+            valores.append(code)
+            codigos_por_lote[code].add(code)
+            if code.isdigit():
+                valores.append(int(code))
+                codigos_por_lote[str(int(code))].add(code)
+
+        devices = await Device.find({"lote": {"$in": valores}}).to_list()
+        devices_por_codigo: Dict[str, List[Device]] = defaultdict(list)
+        for lote, grupo in _agrupar_por(devices, "lote").items():
+            for code in codigos_por_lote.get(lote, ()):
+                devices_por_codigo[code].extend(grupo)
+
+        for code, grupo in devices_por_codigo.items():
+            resultados[code] = _respuesta_lote(code, grupo)
+
+    elif code_type == ScanCodeType.DELIVERY_NOTE.value:
+        delivery_notes = await DeliveryNote.find(In(DeliveryNote.pallet_code, codes)).to_list()
+        for delivery_note in delivery_notes:
+            resultados[delivery_note.pallet_code] = _scan_albaran(delivery_note, delivery_note.pallet_code)
+
+    return resultados
+
+
+async def _batch_scan(codes: List[str]) -> Dict[str, dict]:
+    """
+    Resuelve un conjunto de códigos únicos agrupando las consultas por tipo
+
+    1. Una consulta a scan_codes para todos los códigos
+    2. Clasificación heurística de los no registrados
+    3. Una consulta $in por tipo
+    4. Para los no registrados sin resultado, reintento como lote/cartón/palet
+       (una consulta por tipo), igual que el fallback de smart-scan
+    """
+    # 1. Registro scan_codes (una sola consulta indexada)
+    registros = await ScanCode.find(In(ScanCode.code, codes)).to_list()
+    registros.sort(key=lambda r: PRIORIDAD_TIPOS.index(r.code_type))
+    candidatos: Dict[str, List[str]] = defaultdict(list)
+    for registro in registros:
+        candidatos[registro.code].append(registro.code_type.value)
+
+    no_registrados = [code for code in codes if code not in candidatos]
+    tipos: Dict[str, str] = {}
+    if not settings.SCAN_REGISTRY_AUTHORITATIVE:
+        for code in no_registrados:
+            tipos[code] = _clasificar_codigo(code)
+
+    # 2. Agrupar por tipo → una consulta por tipo. Los registrados se prueban
+    #    por prioridad: una entrada obsoleta pasa a la siguiente en otra ronda
+    resultados: Dict[str, dict] = {}
+    ronda = 0
+    while True:
+        grupos: Dict[str, List[str]] = defaultdict(list)
+        for code, tipos_registrados in candidatos.items():
+            if code not in resultados and ronda < len(tipos_registrados):
+                grupos[tipos_registrados[ronda]].append(code)
+        if ronda == 0:
+            for code, code_type in tipos.items():
+                grupos[code_type].append(code)
+        if not grupos:
+            break
+
+        for code_type, codigos in grupos.items():
+            resultados.update(await _resolver_grupo_scan(code_type, codigos))
+        ronda += 1
+
+    # 3. Fallback para códigos no registrados que no coincidieron con su tipo
+    if not settings.SCAN_REGISTRY_AUTHORITATIVE:
+        for code_type in (ScanCodeType.LOTE.value, ScanCodeType.CARTON.value, ScanCodeType.PALLET.value):
+            pendientes = [
+                code for code in no_registrados
+                if code not in resultados and tipos[code] != code_type
+            ]
+            if pendientes:
+                resultados.update(await _resolver_grupo_scan(code_type, pendientes))
+
+    return resultados
+
+
+@router.post("/search/batch-scan")
+async def batch_scan_codes(
+    request: Request,
+    current_user: Employee = Depends(get_current_active_user)
+):
+    """
+    Búsqueda en lote de códigos escaneados
+
+    Sustituye N llamadas a /search/smart-scan por una sola petición.
+    Acepta en el cuerpo:
+    - Lista JSON: ["codigo1", "codigo2", ...]
+    - Objeto JSON: {"codes": ["codigo1", ...]}
+    - NDJSON (Content-Type: application/x-ndjson): un código por línea
+
+    Los códigos se deduplican y se resuelven con una consulta $in por tipo.
+    Los resultados se devuelven por código de entrada, con el mismo formato
+    que search_by_carton / search_by_pallet.
+
+    Requiere autenticación.
+    """
+    try:
+        try:
+            codes = await _leer_codigos_batch(request)
+        except (ValueError, ValidationError) as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Cuerpo de la petición inválido: {str(e)}"
+            )
+
+        # Deduplicar manteniendo el orden de escaneo
+        unicos = list(dict.fromkeys(code.strip() for code in codes if code.strip()))
+
+        if not unicos:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No se recibió ningún código"
+            )
+
+        if len(unicos) > settings.BATCH_SCAN_MAX_CODES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Máximo {settings.BATCH_SCAN_MAX_CODES} códigos por petición"
+            )
+
+        encontrados = await _batch_scan(unicos)
+
+        results = {}
+        dispositivos = set()
+        for code in unicos:
+            result = encontrados.get(code) or _scan_no_encontrado(code)
+            results[code] = result
+            for serial in result.get("serials", []):
+                dispositivos.add(serial["imei"])
+
+        found = sum(1 for result in results.values() if result["success"])
+
+        return {
+            "success": True,
+            "total": len(unicos),
+            "duplicates": len(codes) - len(unicos),
+            "found": found,
+            "not_found": len(unicos) - found,
+            "unique_devices": len(dispositivos),
+            "results": results
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error en batch scan: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error procesando códigos: {str(e)}"
+        )
+
+
+# Campos exportados: (columna CSV, campo en MongoDB)
+COLUMNAS_EXPORT_PALLETS = [
+    ("IMEI", "imei"),
+    ("ICCID", "ccid"),
+    ("MARCA", "marca"),
+    ("OPERADOR", "operador"),
+    ("NUMERO_PALET", "pallet_id"),
+]
+
+
+async def _stream_csv_pallets(filtro: dict, comprimir: bool = False):
+    """
+    Genera el CSV de exportación por bloques a medida que llegan del cursor
+
+    Usa un cursor Motor crudo con proyección (sin instanciar documentos Beanie)
+    y emite un bloque por cada lote del cursor, opcionalmente comprimido en gzip.
+    """
+    proyeccion = {campo: 1 for _, campo in COLUMNAS_EXPORT_PALLETS}
+    proyeccion["_id"] = 0
+
+    cursor = Device.get_motor_collection().find(
+        filtro,
+        proyeccion,
+        batch_size=settings.EXPORT_CURSOR_BATCH_SIZE
+    )
+
+    # wbits=31 → formato gzip
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31) if comprimir else None
+
+    def _bloque(texto: str) -> bytes:
+        data = texto.encode("utf-8")
+        return compresor.compress(data) if compresor else data
+
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow([columna for columna, _ in COLUMNAS_EXPORT_PALLETS])
+    total = 0
+
+    try:
+        while True:
+            docs = await cursor.to_list(length=settings.EXPORT_CURSOR_BATCH_SIZE)
+            if not docs:
+                break
+
+            for doc in docs:
+                writer.writerow([doc.get(campo) or '' for _, campo in COLUMNAS_EXPORT_PALLETS])
+            total += len(docs)
+
+            chunk = _bloque(output.getvalue())
+            output.seek(0)
+            output.truncate(0)
+            if chunk:
+                yield chunk
+
+        # Cabecera sin datos (no debería ocurrir tras la comprobación previa)
+        if output.tell():
+            chunk = _bloque(output.getvalue())
+            if chunk:
+                yield chunk
+
+        if compresor:
+            yield compresor.flush()
+
+        memoria.registrar_filas(total)
+        logger.info(f"Exportación por pallets completada: {total} dispositivos")
+
+    finally:
+        await cursor.close()
+
+
 @router.post("/export-by-pallets")
+@medir_memoria("app1.export_by_pallets", rss=True)
 async def export_devices_by_pallets(
     file: UploadFile = File(..., description="Archivo con lista de pallets (txt, csv, o xlsx)"),
+    gzip: bool = Query(False, description="Comprimir la respuesta (Content-Encoding: gzip)"),
     current_user: Employee = Depends(get_current_active_user)
 ):
     """
@@ -1299,41 +1721,45 @@ async def export_devices_by_pallets(
     - TXT: un pallet por línea
     - CSV: primera columna con pallets
     - XLSX: primera columna con pallets
+
+    El CSV se genera en streaming desde un cursor proyectado, sin cargar
+    todos los dispositivos en memoria. Con gzip=true se envía comprimido.
     """
     try:
         logger.info(f"Usuario {current_user.username} exportando dispositivos por lote de pallets")
 
-        # Leer archivo
-        content = await file.read()
         pallet_codes = []
 
         # Detectar tipo de archivo y extraer pallets
         filename = file.filename.lower()
 
-        if filename.endswith('.txt'):
-            # Archivo TXT: un pallet por línea
-            lines = content.decode('utf-8').split('\n')
-            pallet_codes = [line.strip() for line in lines if line.strip()]
-
-        elif filename.endswith('.csv'):
-            # Archivo CSV: primera columna
-            lines = content.decode('utf-8').split('\n')
-            for line in lines:
-                if line.strip():
-                    parts = line.split(',')
-                    if parts[0].strip():
-                        pallet_codes.append(parts[0].strip())
-
-        elif filename.endswith(('.xlsx', '.xls')):
-            # Archivo Excel: primera columna
-            df = pd.read_excel(io.BytesIO(content))
-            pallet_codes = df.iloc[:, 0].dropna().astype(str).str.strip().tolist()
-        else:
+        if not filename.endswith(('.txt', '.csv', '.xlsx', '.xls')):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Formato de archivo no soportado. Use .txt, .csv o .xlsx"
             )
 
+        # Recibir el archivo por trozos a disco (límite MAX_UPLOAD_SIZE_MB) y leerlo desde ahí
+        async with recibir_upload(file) as subida:
+            if filename.endswith('.txt'):
+                # Archivo TXT: un pallet por línea
+                async for line in subida.lineas():
+                    if line.strip():
+                        pallet_codes.append(line.strip())
+
+            elif filename.endswith('.csv'):
+                # Archivo CSV: primera columna
+                async for line in subida.lineas():
+                    if line.strip():
+                        parts = line.split(',')
+                        if parts[0].strip():
+                            pallet_codes.append(parts[0].strip())
+
+            else:
+                # Archivo Excel: primera columna
+                df = await leer_dataframe(subida.path, subida.extension)
+                pallet_codes = df.iloc[:, 0].dropna().astype(str).str.strip().tolist()
+
         if not pallet_codes:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -1342,45 +1768,29 @@ async def export_devices_by_pallets(
 
         logger.info(f"Se leyeron {len(pallet_codes)} códigos de pallet del archivo")
 
-        # Buscar dispositivos con esos pallets
-        devices = await Device.find(
-            {"pallet_id": {"$in": pallet_codes}}
-        ).to_list()
+        filtro = {"pallet_id": {"$in": list(dict.fromkeys(pallet_codes))}}
+
+        # Comprobar que hay resultados antes de empezar el streaming (el 404
+        # no puede enviarse una vez iniciada la respuesta)
+        existe = await Device.get_motor_collection().find_one(filtro, {"_id": 1})
 
-        if not devices:
+        if not existe:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"No se encontraron dispositivos para los {len(pallet_codes)} pallets proporcionados"
             )
 
-        logger.info(f"Se encontraron {len(devices)} dispositivos")
-
-        # Crear CSV en memoria
-        output = io.StringIO()
-        writer = csv.writer(output)
-
-        # Escribir encabezados
-        writer.writerow(['IMEI', 'ICCID', 'MARCA', 'OPERADOR', 'NUMERO_PALET'])
-
-        # Escribir datos
-        for device in devices:
-            writer.writerow([
-                device.imei or '',
-                device.ccid or '',
-                device.marca or '',
-                device.operador or '',
-                device.pallet_id or ''
-            ])
-
-        # Preparar respuesta
-        output.seek(0)
+        headers = {
+            "Content-Disposition": f"attachment; filename=dispositivos_pallets_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        }
+        if gzip:
+            headers["Content-Encoding"] = "gzip"
+            headers["Vary"] = "Accept-Encoding"
 
         return StreamingResponse(
-            iter([output.getvalue()]),
+            _stream_csv_pallets(filtro, comprimir=gzip),
             media_type="text/csv",
-            headers={
-                "Content-Disposition": f"attachment; filename=dispositivos_pallets_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-            }
+            headers=headers
         )
 
     except HTTPException:
@@ -5,11 +5,9 @@ Importación masiva de dispositivos desde Excel/CSV
 
 from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, status, Request
 from fastapi.responses import JSONResponse
-from typing import List, Dict, Any, Optional
+from typing import TYPE_CHECKING, List, Dict, Any, Optional
 from datetime import datetime
 import time
-import pandas as pd
-import numpy as np
 import io
 import re
 
@@ -18,6 +16,9 @@ from app.dependencies.auth import get_current_active_user as get_current_employe
 from app.models.employee import Employee
 from app.models.transform_template import TransformTemplate, DestinationType
 from app.models.iccid_generation import ICCIDGenerationBatch
+from app.services.device_bulk_service import device_bulk_service
+from app.services.upload_service import recibir_upload, leer_dataframe
+from app.services.memory_service import medir_memoria, memoria
 from app.utils.iccid_utils import (
     generate_iccid_range,
     generate_iccid_count,
@@ -25,6 +26,10 @@ from app.utils.iccid_utils import (
     luhn_is_valid
 )
 
+if TYPE_CHECKING:
+    # pandas y numpy se importan dentro de los endpoints que leen ficheros
+    import pandas as pd
+
 router = APIRouter(
     prefix="/app2",
     tags=["App2 - Import Data"]
@@ -130,6 +135,7 @@ COLUMN_MAPPING = {
     'num_palet': 'num_palet',
     'pallet': 'num_palet',
     'palet': 'num_palet',
+    'pallet_id': 'pallet_id',
 
     'num_deposito': 'num_deposito',
     'deposito': 'num_deposito',
@@ -150,7 +156,7 @@ COLUMN_MAPPING = {
 }
 
 
-def normalize_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+def normalize_dataframe(df: "pd.DataFrame") -> "pd.DataFrame":
     """Normaliza los nombres de columnas del DataFrame"""
     # Normalizar nombres de columnas
     df.columns = [normalize_column_name(col) for col in df.columns]
@@ -161,11 +167,24 @@ def normalize_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+async def actualizar_contadores_pallets(devices: List[Device], import_record: ImportRecord):
+    """Suma los dispositivos importados a los contadores de sus pallets ($inc/$addToSet)"""
+    try:
+        await device_bulk_service.ajustar_contadores_pallets([
+            ((None, None), (device.pallet_id, device.package_no))
+            for device in devices
+            if device.pallet_id
+        ])
+    except Exception as e:
+        import_record.add_warning(0, 'pallet_id', f"No se pudieron actualizar los contadores de pallets: {e}")
+
+
 # ════════════════════════════════════════════════════════════════════
 # ENDPOINTS
 # ════════════════════════════════════════════════════════════════════
 
 @router.post("/upload", status_code=status.HTTP_200_OK)
+@medir_memoria("app2.upload", rss=True)
 async def upload_and_import_file(
     file: UploadFile = File(...),
     brand: Optional[str] = None,
@@ -189,12 +208,16 @@ async def upload_and_import_file(
     - codigo_innerbox: Código de caja intermedia (opcional)
     - codigo_unitario: Código unitario/QR (opcional)
     - num_palet: Número de palet (opcional)
+    - pallet_id: Pallet del dispositivo (opcional, actualiza sus contadores)
     - marca: Marca del dispositivo (opcional)
     - cliente: Cliente asignado (opcional)
     - num_deposito: Número de depósito (opcional)
     - ubicacion_actual: Ubicación física (opcional)
     """
 
+    import numpy as np
+    import pandas as pd
+
     start_time = time.time()
 
     # Validar tipo de archivo
@@ -205,40 +228,30 @@ async def upload_and_import_file(
             detail="Tipo de archivo no soportado. Use .xlsx, .xls o .csv"
         )
 
-    # Leer contenido del archivo
-    try:
-        contents = await file.read()
-        file_size = len(contents)
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Error leyendo el archivo: {str(e)}"
+    # Recibir el archivo por trozos a disco (límite de tamaño y SHA-256 al vuelo)
+    async with recibir_upload(file) as subida:
+        # Crear registro de importación
+        import_record = ImportRecord(
+            filename=file.filename,
+            file_type=filename.split('.')[-1],
+            file_size=subida.size,
+            file_sha256=subida.sha256,
+            status=ImportStatus.PROCESSING,
+            imported_by=str(current_user.id),
+            imported_by_name=current_user.name,
+            ip_address=request.client.host if request else None
         )
+        await import_record.insert()
 
-    # Crear registro de importación
-    import_record = ImportRecord(
-        filename=file.filename,
-        file_type=filename.split('.')[-1],
-        file_size=file_size,
-        status=ImportStatus.PROCESSING,
-        imported_by=str(current_user.id),
-        imported_by_name=current_user.name,
-        ip_address=request.client.host if request else None
-    )
-    await import_record.insert()
-
-    # Parsear archivo
-    try:
-        if filename.endswith('.csv'):
-            df = pd.read_csv(io.BytesIO(contents))
-        else:
-            df = pd.read_excel(io.BytesIO(contents))
-    except Exception as e:
-        await import_record.mark_failed(f"Error parseando el archivo: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Error parseando el archivo: {str(e)}"
-        )
+        # Parsear archivo desde disco (fuera del event loop)
+        try:
+            df = await leer_dataframe(subida.path, 'csv' if filename.endswith('.csv') else 'excel')
+        except Exception as e:
+            await import_record.mark_failed(f"Error parseando el archivo: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Error parseando el archivo: {str(e)}"
+            )
 
     # Normalizar DataFrame
     df = normalize_dataframe(df)
@@ -297,7 +310,7 @@ async def upload_and_import_file(
                     iccid = None
 
             # Verificar si el dispositivo ya existe
-            existing_device = await Device.buscar_por_imei(imei)
+            existing_device = await Device.buscar_por_imei(imei, use_cache=False)
             if existing_device:
                 # Si existe y se especificó una marca, actualizar la marca del dispositivo
                 if brand:
@@ -335,7 +348,7 @@ async def upload_and_import_file(
             # Campos opcionales
             optional_fields = [
                 'package_no', 'nro_orden', 'lote', 'codigo_innerbox',
-                'codigo_unitario', 'num_palet', 'marca', 'cliente',
+                'codigo_unitario', 'num_palet', 'pallet_id', 'marca', 'cliente',
                 'num_deposito', 'ubicacion_actual'
             ]
 
@@ -397,6 +410,8 @@ async def upload_and_import_file(
         except Exception as e:
             import_record.add_error(row_number, 'general', str(e))
 
+    await actualizar_contadores_pallets(devices_created, import_record)
+
     # Preparar resumen
     import_record.summary = {
         'ordenes_unicas': len(summary_data['ordenes']),
@@ -413,6 +428,7 @@ async def upload_and_import_file(
 
     # Marcar como completado
     processing_time = time.time() - start_time
+    import_record.peak_rss_mb = memoria.registrar_filas(import_record.total_rows)
     await import_record.mark_completed(processing_time)
 
     return {
@@ -630,6 +646,7 @@ async def generate_iccid_range_endpoint(
 
 
 @router.post("/generate-iccid-csv", status_code=status.HTTP_200_OK)
+@medir_memoria("app2.generate_iccid_csv")
 async def generate_iccid_csv_endpoint(
     batches: List[Dict[str, str]],
     current_user: Employee = Depends(get_current_employee)
@@ -643,6 +660,8 @@ async def generate_iccid_csv_endpoint(
     **Returns:**
     - CSV content como string
     """
+    import pandas as pd
+
     try:
         all_rows = []
         batch_summary = []
@@ -1089,6 +1108,7 @@ async def delete_import_template(
 
 
 @router.post("/upload-with-template", status_code=status.HTTP_200_OK)
+@medir_memoria("app2.upload_with_template", rss=True)
 async def upload_with_template(
     file: UploadFile = File(...),
     template_id: str = None,
@@ -1108,6 +1128,9 @@ async def upload_with_template(
     - brand: Marca del dispositivo (opcional). Si se especifica, sobrescribe la marca de la plantilla
     """
 
+    import numpy as np
+    import pandas as pd
+
     start_time = time.time()
 
     # Buscar plantilla
@@ -1138,50 +1161,45 @@ async def upload_with_template(
             detail=f"Tipo de archivo no soportado por esta plantilla. Tipos permitidos: {', '.join(template.file_types)}"
         )
 
-    # Leer contenido del archivo
-    try:
-        contents = await file.read()
-        file_size = len(contents)
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Error leyendo el archivo: {str(e)}"
+    # Recibir el archivo por trozos a disco (límite de tamaño y SHA-256 al vuelo)
+    async with recibir_upload(file) as subida:
+        # Crear registro de importación
+        import_record = ImportRecord(
+            filename=file.filename,
+            file_type=file_extension,
+            file_size=subida.size,
+            file_sha256=subida.sha256,
+            status=ImportStatus.PROCESSING,
+            imported_by=str(current_user.id),
+            imported_by_name=current_user.name,
+            ip_address=request.client.host if request else None,
+            notes=f"Importado usando plantilla: {template.name}"
         )
+        await import_record.insert()
 
-    # Crear registro de importación
-    import_record = ImportRecord(
-        filename=file.filename,
-        file_type=file_extension,
-        file_size=file_size,
-        status=ImportStatus.PROCESSING,
-        imported_by=str(current_user.id),
-        imported_by_name=current_user.name,
-        ip_address=request.client.host if request else None,
-        notes=f"Importado usando plantilla: {template.name}"
-    )
-    await import_record.insert()
-
-    # Parsear archivo según configuración de la plantilla
-    try:
-        if file_extension == 'csv':
-            df = pd.read_csv(
-                io.BytesIO(contents),
-                encoding=template.encoding,
-                delimiter=template.delimiter,
-                skiprows=template.skip_rows
-            )
-        else:  # xlsx o xls
-            df = pd.read_excel(
-                io.BytesIO(contents),
-                sheet_name=template.sheet_name if template.sheet_name else 0,
-                skiprows=template.skip_rows
+        # Parsear archivo según configuración de la plantilla (fuera del event loop)
+        try:
+            if file_extension == 'csv':
+                df = await leer_dataframe(
+                    subida.path,
+                    file_extension,
+                    encoding=template.encoding,
+                    delimiter=template.delimiter,
+                    skiprows=template.skip_rows
+                )
+            else:  # xlsx o xls
+                df = await leer_dataframe(
+                    subida.path,
+                    file_extension,
+                    sheet_name=template.sheet_name if template.sheet_name else 0,
+                    skiprows=template.skip_rows
+                )
+        except Exception as e:
+            await import_record.mark_failed(f"Error parseando el archivo: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Error parseando el archivo: {str(e)}"
             )
-    except Exception as e:
-        await import_record.mark_failed(f"Error parseando el archivo: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Error parseando el archivo: {str(e)}"
-        )
 
     # Actualizar total de filas
     import_record.total_rows = len(df)
@@ -1235,7 +1253,7 @@ async def upload_with_template(
                     iccid = None
 
             # Verificar si el dispositivo ya existe
-            existing_device = await Device.buscar_por_imei(imei)
+            existing_device = await Device.buscar_por_imei(imei, use_cache=False)
             if existing_device:
                 # Si existe y se especificó una marca, actualizar la marca del dispositivo
                 if brand:
@@ -1350,6 +1368,8 @@ async def upload_with_template(
         except Exception as e:
             import_record.add_error(row_number, 'general', str(e))
 
+    await actualizar_contadores_pallets(devices_created, import_record)
+
     # Incrementar contador de uso de la plantilla
     await template.increment_usage()
 
@@ -1370,6 +1390,7 @@ async def upload_with_template(
 
     # Marcar como completado
     processing_time = time.time() - start_time
+    import_record.peak_rss_mb = memoria.registrar_filas(import_record.total_rows)
     await import_record.mark_completed(processing_time)
 
     return {
@@ -77,7 +77,7 @@ async def create_ticket(
     """
     try:
         # Buscar dispositivo
-        device = await Device.buscar_por_imei(ticket_data.device_imei)
+        device = await Device.buscar_por_imei(ticket_data.device_imei, use_cache=False)
         if not device:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -664,7 +664,7 @@ async def bulk_import_rma(
                     continue
 
                 # Find device
-                device = await Device.buscar_por_imei(imei)
+                device = await Device.buscar_por_imei(imei, use_cache=False)
                 if not device:
                     results["errors"].append({
                         "row": idx,
@@ -753,7 +753,7 @@ async def bulk_create_rma(
                     continue
 
                 # Find device
-                device = await Device.buscar_por_imei(imei)
+                device = await Device.buscar_por_imei(imei, use_cache=False)
                 if not device:
                     results["errors"].append({
                         "imei": imei,
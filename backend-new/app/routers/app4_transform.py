@@ -8,12 +8,13 @@ from fastapi.responses import JSONResponse
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 from pydantic import BaseModel
-import pandas as pd
-import io
 
 from app.models import TransformTemplate, ImportJob, DestinationType, JobStatus, Device, InventoryItem, Customer
 from app.dependencies.auth import get_current_active_user as get_current_employee
 from app.models.employee import Employee
+from app.services.upload_service import recibir_upload, leer_dataframe
+from app.services.memory_service import medir_memoria, memoria
+from app.config import settings
 
 router = APIRouter(
     prefix="/app4",
@@ -176,6 +177,7 @@ async def get_template(
 # ════════════════════════════════════════════════════════════════════
 
 @router.post("/transformar", status_code=status.HTTP_200_OK)
+@medir_memoria("app4.transformar", rss=True)
 async def transform_file(
     file: UploadFile = File(...),
     template_id: Optional[str] = None,
@@ -186,14 +188,6 @@ async def transform_file(
     Devuelve una vista previa de los datos transformados
     """
     try:
-        # Validar tamaño (50MB max)
-        content = await file.read()
-        if len(content) > 50 * 1024 * 1024:
-            raise HTTPException(
-                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail="El archivo excede el tamaño máximo de 50MB"
-            )
-
         # Obtener plantilla si se especificó
         template = None
         if template_id:
@@ -207,16 +201,16 @@ async def transform_file(
         # Procesar archivo según tipo
         file_ext = file.filename.split('.')[-1].lower()
 
-        if file_ext == 'csv':
-            df = pd.read_csv(io.BytesIO(content))
-        elif file_ext in ['xlsx', 'xls']:
-            df = pd.read_excel(io.BytesIO(content))
-        else:
+        if file_ext not in ['csv', 'xlsx', 'xls']:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Tipo de archivo no soportado: {file_ext}"
             )
 
+        # Recibir por trozos a disco (corta al superar MAX_UPLOAD_SIZE_MB) y parsear desde ahí
+        async with recibir_upload(file) as subida:
+            df = await leer_dataframe(subida.path, file_ext)
+
         # Transformar datos si hay plantilla
         if template:
             # Aplicar mapeo
@@ -235,6 +229,7 @@ async def transform_file(
 
         # Vista previa (primeros 10 registros)
         preview = records[:10]
+        memoria.registrar_filas(len(records))
 
         return {
             "success": True,
@@ -255,6 +250,7 @@ async def transform_file(
 
 
 @router.post("/importar/{destination}", status_code=status.HTTP_201_CREATED)
+@medir_memoria("app4.importar", rss=True)
 async def import_file(
     destination: DestinationType,
     file: UploadFile = File(...),
@@ -280,36 +276,15 @@ async def import_file(
         )
         await job.save()
 
-        # Leer archivo
-        content = await file.read()
-        job.file_size = len(content)
-
-        # Validar tamaño
-        if len(content) > 50 * 1024 * 1024:
-            job.status = JobStatus.FAILED
-            await job.add_error(0, "file", "Archivo excede 50MB")
-            await job.save()
-            raise HTTPException(
-                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail="El archivo excede el tamaño máximo de 50MB"
-            )
-
         # Obtener plantilla
         template = None
         if template_id:
             template = await TransformTemplate.get(template_id)
             job.template_name = template.name if template else None
 
-        await job.start_processing()
-
-        # Procesar archivo
         file_ext = file.filename.split('.')[-1].lower()
 
-        if file_ext == 'csv':
-            df = pd.read_csv(io.BytesIO(content))
-        elif file_ext in ['xlsx', 'xls']:
-            df = pd.read_excel(io.BytesIO(content))
-        else:
+        if file_ext not in ['csv', 'xlsx', 'xls']:
             job.status = JobStatus.FAILED
             await job.add_error(0, "file", f"Tipo no soportado: {file_ext}")
             await job.save()
@@ -318,6 +293,22 @@ async def import_file(
                 detail=f"Tipo de archivo no soportado: {file_ext}"
             )
 
+        # Recibir por trozos a disco (corta al superar MAX_UPLOAD_SIZE_MB)
+        try:
+            async with recibir_upload(file) as subida:
+                job.file_size = subida.size
+                job.file_sha256 = subida.sha256
+                await job.start_processing()
+
+                # Procesar archivo
+                df = await leer_dataframe(subida.path, file_ext)
+        except HTTPException as e:
+            if e.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE:
+                job.status = JobStatus.FAILED
+                await job.add_error(0, "file", f"Archivo excede {settings.MAX_UPLOAD_SIZE_MB}MB")
+                await job.save()
+            raise
+
         job.total_rows = len(df)
         await job.save()
 
@@ -337,6 +328,7 @@ async def import_file(
         # Nota: La importación real a la BD requiere lógica específica por destino
         # Por ahora solo se crea el job y se procesa el archivo
 
+        job.peak_rss_mb = memoria.registrar_filas(job.total_rows)
         await job.complete(success=True)
 
         return {
@@ -3,15 +3,19 @@ OSE Platform - App 5: Sistema de Facturación de Tickets
 Router para gestión de tickets de venta y generación de facturas
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query, Body
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query, Body, Request
+from fastapi.responses import StreamingResponse
+from beanie import PydanticObjectId
+from bson import ObjectId
 from typing import List, Optional
 from datetime import datetime
+from hashlib import sha256
 from pathlib import Path
+import hmac
 import logging
 import os
-import shutil
 import base64
+import time
 
 from app.models.sales_ticket import SalesTicket, TicketStatus as SalesTicketStatus
 from app.models.invoice import Invoice, InvoiceStatus
@@ -19,7 +23,9 @@ from app.models.invoice_config import InvoiceConfig
 from app.models.employee import Employee
 from app.dependencies.auth import get_current_active_user
 from app.services.ocr_service import ocr_service
-from app.services.pdf_service import pdf_service
+from app.services.pdf_service import pdf_service, weasyprint_disponible
+from app.services.storage_service import storage, respuesta_descarga
+from app.services.upload_service import trozos_upload
 from app.config import settings
 from app.schemas.app5 import TicketCreate, TicketResponse
 
@@ -30,6 +36,51 @@ router_public = APIRouter(prefix="/public", tags=["App 5: Facturación (Público
 router_admin = APIRouter(prefix="/app5", tags=["App 5: Facturación (Admin)"])
 
 
+# ════════════════════════════════════════════════════════════════════════
+# ALMACENAMIENTO DE FICHEROS
+# ════════════════════════════════════════════════════════════════════════
+
+async def _guardar_imagen_ticket(file: UploadFile, email: str) -> tuple:
+    """Guarda la imagen subida en el almacén. Returns: (filename, StoredObject)"""
+    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    file_extension = Path(file.filename).suffix if file.filename else ".jpg"
+    filename = f"ticket_{email}_{timestamp}{file_extension}"
+
+    stored = await storage.save(f"tickets/{filename}", trozos_upload(file), file.content_type)
+    logger.info(f"Ticket image stored: tickets/{filename} ({stored.size} bytes)")
+    return filename, stored
+
+
+def _firma_imagen(ticket_id: str, expira: int) -> str:
+    return hmac.new(
+        settings.SECRET_KEY.encode("utf-8"),
+        f"ticket-image:{ticket_id}:{expira}".encode("utf-8"),
+        sha256
+    ).hexdigest()
+
+
+def _url_imagen_firmada(ticket: SalesTicket) -> Optional[str]:
+    """URL temporal (TICKET_IMAGE_URL_TTL) de la imagen del ticket, o None si no tiene"""
+    if not ticket.image_filename:
+        return None
+    expira = int(time.time()) + settings.TICKET_IMAGE_URL_TTL
+    return f"/public/tickets/{ticket.id}/image?expires={expira}&signature={_firma_imagen(str(ticket.id), expira)}"
+
+
+def _ticket_admin(ticket: SalesTicket) -> dict:
+    """Ticket para los endpoints admin, con la URL firmada de su imagen"""
+    datos = ticket.dict()
+    datos["image_url"] = _url_imagen_firmada(ticket)
+    return datos
+
+
+async def _guardar_pdf_factura(invoice: Invoice, pdf_bytes: bytes) -> str:
+    """Guarda el PDF de la factura en el almacén. Returns: nombre del fichero"""
+    pdf_filename = f"invoice_{invoice.invoice_number}.pdf"
+    await storage.save(f"invoices/{pdf_filename}", pdf_bytes, "application/pdf")
+    return pdf_filename
+
+
 # ════════════════════════════════════════════════════════════════════════
 # ENDPOINTS PÚBLICOS (Sin autenticación)
 # ════════════════════════════════════════════════════════════════════════
@@ -61,21 +112,9 @@ async def scan_ticket_image(
                 detail="El archivo debe ser una imagen (JPG, PNG)"
             )
 
-        # Crear directorio de uploads si no existe
-        upload_dir = Path("uploads/tickets")
-        upload_dir.mkdir(parents=True, exist_ok=True)
-
-        # Generar nombre único para el archivo
+        # Guardar archivo en el almacén (disco o GridFS)
+        filename, stored = await _guardar_imagen_ticket(file, email)
         timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-        file_extension = Path(file.filename).suffix if file.filename else ".jpg"
-        filename = f"ticket_{email}_{timestamp}{file_extension}"
-        file_path = upload_dir / filename
-
-        # Guardar archivo
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        logger.info(f"Ticket image uploaded: {file_path}")
 
         # Obtener configuración
         config = await InvoiceConfig.get_config()
@@ -85,19 +124,23 @@ async def scan_ticket_image(
         extracted_data = {}
 
         if config.ocr_enabled:
-            ocr_result = await ocr_service.process_ticket_image(str(file_path))
+            async with storage.local_path(f"tickets/{filename}") as image_path:
+                ocr_result = await ocr_service.process_ticket_image(image_path)
             extracted_data = ocr_result.get("extracted_data", {})
 
-        # Crear ticket con estado PROCESSING
+        # Crear ticket con estado PROCESSING (el ID se fija antes para la URL de la imagen)
+        ticket_id = PydanticObjectId()
         ticket = SalesTicket(
+            id=ticket_id,
             ticket_number=extracted_data.get("ticket_number", f"TEMP-{timestamp}"),
-            image_url=f"/uploads/tickets/{filename}",
+            image_url=f"/public/tickets/{ticket_id}/image",
             image_filename=filename,
             customer_email=email,
             status=SalesTicketStatus.PROCESSING if config.ocr_enabled else SalesTicketStatus.PENDING,
             ocr_confidence=ocr_result.get("confidence", 0.0) if ocr_result else None,
             ocr_raw_text=ocr_result.get("raw_text", "") if ocr_result else None,
-            manual_entry=not config.ocr_enabled
+            manual_entry=not config.ocr_enabled,
+            metadata={"image_sha256": stored.sha256}
         )
 
         # Si hay datos extraídos, añadirlos
@@ -369,22 +412,16 @@ async def generate_invoice_from_tickets(
 
         await invoice.save()
 
-        # Generar PDF
+        # Generar PDF (queda en la caché para las descargas)
         invoice_data = invoice.dict()
-        pdf_bytes = pdf_service.generate_invoice_pdf(invoice_data)
+        pdf_bytes = await pdf_service.get_invoice_pdf(invoice_data, config.config_version)
 
         # Guardar PDF
-        pdf_dir = Path("uploads/invoices")
-        pdf_dir.mkdir(parents=True, exist_ok=True)
-        pdf_filename = f"invoice_{invoice_number}.pdf"
-        pdf_path = pdf_dir / pdf_filename
-
-        with open(pdf_path, "wb") as f:
-            f.write(pdf_bytes)
+        pdf_filename = await _guardar_pdf_factura(invoice, pdf_bytes)
 
         # Actualizar factura con PDF
         invoice.mark_as_generated(
-            pdf_url=f"/uploads/invoices/{pdf_filename}",
+            pdf_url=f"/public/tickets/download/{invoice.id}",
             pdf_filename=pdf_filename
         )
         await invoice.save()
@@ -489,26 +526,16 @@ async def upload_image_to_ticket(
                 detail="El archivo debe ser una imagen (JPG, PNG)"
             )
 
-        # Crear directorio de uploads si no existe
-        upload_dir = Path("uploads/tickets")
-        upload_dir.mkdir(parents=True, exist_ok=True)
-
-        # Generar nombre único para el archivo
-        timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-        file_extension = Path(file.filename).suffix if file.filename else ".jpg"
-        filename = f"ticket_{ticket.customer_email}_{timestamp}{file_extension}"
-        file_path = upload_dir / filename
-
-        # Guardar archivo
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Guardar archivo en el almacén (disco o GridFS)
+        filename, stored = await _guardar_imagen_ticket(file, ticket.customer_email)
 
         # Actualizar ticket con la imagen
-        ticket.image_url = f"/uploads/tickets/{filename}"
+        ticket.image_url = f"/public/tickets/{ticket.id}/image"
         ticket.image_filename = filename
+        ticket.metadata["image_sha256"] = stored.sha256
         await ticket.save()
 
-        logger.info(f"Image uploaded to ticket {ticket_id}: {file_path}")
+        logger.info(f"Image uploaded to ticket {ticket_id}: {filename}")
 
         return {
             "success": True,
@@ -525,13 +552,93 @@ async def upload_image_to_ticket(
         )
 
 
+@router_public.get("/tickets/{ticket_id}/image")
+async def get_ticket_image(
+    ticket_id: str,
+    request: Request,
+    expires: int = Query(0),
+    signature: str = Query("")
+):
+    """
+    **[URL FIRMADA] Imagen de un ticket**
+
+    Solo con la URL firmada que devuelven los endpoints admin del ticket
+    (image_url), válida TICKET_IMAGE_URL_TTL segundos: así la abre un <img>
+    del panel sin cabecera de autenticación.
+
+    Sirve la imagen desde el almacén (disco o GridFS).
+    Soporta Range y GET condicional (ETag / Last-Modified).
+    """
+    try:
+        if not ObjectId.is_valid(ticket_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Imagen no encontrada"
+            )
+
+        if expires < time.time() or not hmac.compare_digest(signature, _firma_imagen(ticket_id, expires)):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Enlace de imagen no válido o caducado"
+            )
+
+        ticket = await SalesTicket.get(ObjectId(ticket_id))
+
+        if not ticket or not ticket.image_filename:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Imagen no encontrada"
+            )
+
+        respuesta = await respuesta_descarga(request, storage, f"tickets/{ticket.image_filename}")
+        if respuesta is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Imagen no encontrada"
+            )
+
+        return respuesta
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error serving ticket image: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al obtener la imagen: {str(e)}"
+        )
+
+
+@router_public.get("/logo")
+async def get_company_logo(request: Request):
+    """
+    **[PÚBLICO] Logo de la empresa**
+
+    Logo configurado en la facturación (para portales y plantillas).
+    """
+    config = await InvoiceConfig.get_config()
+
+    respuesta = None
+    if config.company_logo_filename:
+        respuesta = await respuesta_descarga(request, storage, f"logos/{config.company_logo_filename}")
+
+    if respuesta is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Logo no configurado"
+        )
+
+    return respuesta
+
+
 @router_public.get("/tickets/download/{invoice_id}")
-async def download_invoice_pdf(invoice_id: str):
+async def download_invoice_pdf(invoice_id: str, request: Request):
     """
     **[PÚBLICO] Descargar PDF de factura**
 
     Descarga el PDF de una factura.
     No requiere autenticación (la seguridad es por oscuridad del ID).
+    Soporta Range y GET condicional (ETag / Last-Modified).
     """
     try:
         # Buscar factura
@@ -549,20 +656,26 @@ async def download_invoice_pdf(invoice_id: str):
                 detail="PDF no disponible"
             )
 
-        # Ruta del PDF
-        pdf_path = Path("uploads/invoices") / invoice.pdf_filename
+        key = f"invoices/{invoice.pdf_filename}"
+        respuesta = await respuesta_descarga(request, storage, key, invoice.pdf_filename, attachment=True)
 
-        if not pdf_path.exists():
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Archivo PDF no encontrado"
-            )
+        if respuesta is None:
+            # PDF perdido (p. ej. otro host antes de usar GridFS): se regenera
+            # a través de la caché por contenido y se vuelve a guardar. Sin
+            # WeasyPrint saldría el texto de aviso, que no debe quedar
+            # guardado como la factura
+            if not weasyprint_disponible():
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="PDF no disponible temporalmente"
+                )
 
-        return FileResponse(
-            path=str(pdf_path),
-            media_type="application/pdf",
-            filename=invoice.pdf_filename
-        )
+            config = await InvoiceConfig.get_config()
+            pdf_bytes = await pdf_service.get_invoice_pdf(invoice.dict(), config.config_version)
+            await storage.save(key, pdf_bytes, "application/pdf")
+            respuesta = await respuesta_descarga(request, storage, key, invoice.pdf_filename, attachment=True)
+
+        return respuesta
 
     except HTTPException:
         raise
@@ -712,7 +825,7 @@ async def get_ticket_detail(
 
         return {
             "success": True,
-            "ticket": ticket.dict()
+            "ticket": _ticket_admin(ticket)
         }
 
     except HTTPException:
@@ -765,7 +878,7 @@ async def update_ticket(
 
         return {
             "success": True,
-            "ticket": ticket.dict()
+            "ticket": _ticket_admin(ticket)
         }
 
     except HTTPException:
@@ -847,15 +960,16 @@ async def process_ticket_ocr(
             )
 
         # Procesar OCR
-        image_path = Path("uploads/tickets") / ticket.image_filename
+        key = f"tickets/{ticket.image_filename}"
 
-        if not image_path.exists():
+        if not await storage.stat(key):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Imagen no encontrada"
             )
 
-        ocr_result = await ocr_service.process_ticket_image(str(image_path))
+        async with storage.local_path(key) as image_path:
+            ocr_result = await ocr_service.process_ticket_image(image_path)
         extracted_data = ocr_result.get("extracted_data", {})
 
         # Actualizar ticket
@@ -880,7 +994,7 @@ async def process_ticket_ocr(
 
         return {
             "success": True,
-            "ticket": ticket.dict(),
+            "ticket": _ticket_admin(ticket),
             "ocr_result": ocr_result
         }
 
@@ -1006,21 +1120,16 @@ async def regenerate_invoice_pdf(
                 detail="Factura no encontrada"
             )
 
-        # Generar nuevo PDF
+        # Generar nuevo PDF: si nada de lo que se pinta ha cambiado sale de la caché
+        config = await InvoiceConfig.get_config()
         invoice_data = invoice.dict()
-        pdf_bytes = pdf_service.generate_invoice_pdf(invoice_data)
+        pdf_bytes = await pdf_service.get_invoice_pdf(invoice_data, config.config_version)
 
         # Guardar PDF
-        pdf_dir = Path("uploads/invoices")
-        pdf_dir.mkdir(parents=True, exist_ok=True)
-        pdf_filename = f"invoice_{invoice.invoice_number}.pdf"
-        pdf_path = pdf_dir / pdf_filename
-
-        with open(pdf_path, "wb") as f:
-            f.write(pdf_bytes)
+        pdf_filename = await _guardar_pdf_factura(invoice, pdf_bytes)
 
         # Actualizar factura
-        invoice.pdf_url = f"/uploads/invoices/{pdf_filename}"
+        invoice.pdf_url = f"/public/tickets/download/{invoice.id}"
         invoice.pdf_filename = pdf_filename
         invoice.updated_at = datetime.utcnow()
 
@@ -1206,21 +1315,19 @@ async def upload_company_logo(
                 detail="El archivo debe ser una imagen"
             )
 
-        # Crear directorio
-        upload_dir = Path("uploads/logos")
-        upload_dir.mkdir(parents=True, exist_ok=True)
-
-        # Guardar archivo
+        # Guardar archivo en el almacén
         filename = f"company_logo{Path(file.filename).suffix if file.filename else '.png'}"
-        file_path = upload_dir / filename
-
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        await storage.save(f"logos/{filename}", trozos_upload(file), file.content_type)
 
         # Actualizar configuración
         config = await InvoiceConfig.get_config()
-        config.company_logo_url = f"/uploads/logos/{filename}"
+        if config.company_logo_filename and config.company_logo_filename != filename:
+            await storage.delete(f"logos/{config.company_logo_filename}")
+        config.company_logo_url = "/public/logo"
         config.company_logo_filename = filename
+        # El fichero se sobrescribe con el mismo nombre: nueva versión para la caché de PDFs
+        config.config_version += 1
+        config.updated_at = datetime.utcnow()
         await config.save()
 
         return {
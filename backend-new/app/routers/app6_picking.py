@@ -7,20 +7,28 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from bson import ObjectId
+import asyncio
 import logging
 import re
 import uuid
-import qrcode
-from io import BytesIO, StringIO
+from io import BytesIO
 import base64
 import csv
-import pandas as pd
+import time
+from beanie.odm.utils.dump import get_dict
+from beanie.operators import In
+from pymongo import UpdateOne
 
 from app.models.pallet import Pallet
 from app.models.package import Package
-from app.models.device import Device
+from app.models.device import Device, DeviceScanView
 from app.models.employee import Employee
+from app.models.movimiento import Movimiento, TipoMovimiento
+from app.schemas.app6 import RelocationRequest
 from app.dependencies.auth import get_current_active_user
+from app.services.device_bulk_service import device_bulk_service
+from app.services.pallet_reconcile_service import pallet_reconcile
+from app.services.upload_service import recibir_upload
 from app.config import settings
 
 logger = logging.getLogger(__name__)
@@ -604,6 +612,89 @@ async def enviar_notificacion_cliente(
 # PICKING JERÁRQUICO (PALLET → CARTON → DEVICE)
 # ════════════════════════════════════════════════════════════════════════
 
+def _leer_filas_csv(ruta, encoding: str):
+    """Itera las filas de un CSV recibido sin cargarlo entero en memoria"""
+    with open(ruta, encoding=encoding, newline="") as texto:
+        yield from enumerate(csv.DictReader(texto), start=2)  # Fila 1 = cabecera
+
+
+def _fase_validacion(ruta, encoding: str, stats: Dict[str, Any]):
+    """
+    Fase 1: lectura en streaming y validación de filas
+
+    Síncrona (csv): se ejecuta en un hilo para no bloquear el event loop.
+
+    Returns:
+        (dispositivos por IMEI, agregados por pallet)
+    """
+    dispositivos: Dict[str, Dict[str, Any]] = {}
+    pallets_dict: Dict[str, Dict[str, Any]] = {}
+
+    for row_num, row in _leer_filas_csv(ruta, encoding):
+        stats["total_rows"] += 1
+
+        # Extraer y validar campos requeridos
+        imei = (row.get('imei') or '').strip()
+        iccid = (row.get('iccid') or row.get('ccid') or '').strip()
+        carton_id = (row.get('carton_id') or row.get('package_no') or row.get('batch') or '').strip()
+        pallet_id = (row.get('pallet_id') or '').strip()
+        order_number = (row.get('order_number') or '').strip()
+        product_model = (row.get('product_model') or '').strip()
+        product_reference = (row.get('product_reference') or '').strip()
+
+        # Validaciones básicas
+        if not imei or len(imei) != 15 or not imei.isdigit():
+            stats["errors"].append(f"Fila {row_num}: IMEI inválido '{imei}'")
+            stats["devices_skipped"] += 1
+            continue
+
+        if iccid and (len(iccid) < 19 or len(iccid) > 22):
+            stats["errors"].append(f"Fila {row_num}: ICCID inválido '{iccid}'")
+            stats["devices_skipped"] += 1
+            continue
+
+        if imei in dispositivos:
+            stats["duplicate_rows"] += 1
+
+        # Solo se actualizan los campos informados (nombres de MongoDB)
+        campos: Dict[str, Any] = {}
+        if iccid:
+            campos["ccid"] = iccid
+        if carton_id:
+            campos["carton_id"] = carton_id
+        if pallet_id:
+            campos["pallet_id"] = pallet_id
+        if order_number:
+            campos["nro_orden"] = order_number
+        if product_model:
+            campos["marca"] = product_model
+        if product_reference:
+            campos["nro_referencia"] = product_reference
+
+        dispositivos[imei] = campos
+
+        # Trackear pallet para crear registro después
+        if pallet_id and order_number and pallet_id not in pallets_dict:
+            pallets_dict[pallet_id] = {
+                "pallet_id": pallet_id,
+                "order_number": order_number,
+                "cartons": set(),
+                "imeis": set(),
+                "product_model": product_model or None,
+                "product_reference": product_reference or None
+            }
+
+    # Agregados por pallet sobre la última fila de cada IMEI
+    for imei, campos in dispositivos.items():
+        pallet_data = pallets_dict.get(campos.get("pallet_id"))
+        if pallet_data:
+            if campos.get("carton_id"):
+                pallet_data["cartons"].add(campos["carton_id"])
+            pallet_data["imeis"].add(imei)
+
+    return dispositivos, pallets_dict
+
+
 @router.post("/hierarchy/import")
 async def importar_picking_jerarquico(
     file: UploadFile = File(..., description="Archivo CSV con datos de picking"),
@@ -625,6 +716,12 @@ async def importar_picking_jerarquico(
     Crea:
     - Registros de Device con pallet_id y carton_id
     - Registros de Pallet con estadísticas
+
+    Importación en dos fases:
+    1. Lectura en streaming y validación, acumulando agregados por pallet/cartón
+    2. Upserts de dispositivos por IMEI con bulk_write en bloques, upserts de
+       Pallet y ajuste atómico de sus contadores ($addToSet/$pull/$inc según
+       los dispositivos que entran o salen de cada pallet)
     """
     try:
         # Validar que sea un archivo CSV
@@ -634,148 +731,120 @@ async def importar_picking_jerarquico(
                 detail="El archivo debe ser un CSV (.csv)"
             )
 
-        # Leer el contenido del archivo
-        contents = await file.read()
-
-        try:
-            # Intentar decodificar como UTF-8
-            csv_text = contents.decode('utf-8')
-        except UnicodeDecodeError:
-            # Si falla, intentar con latin-1
-            csv_text = contents.decode('latin-1')
-
-        # Parsear CSV
-        csv_file = StringIO(csv_text)
-        csv_reader = csv.DictReader(csv_file)
-
-        # Estadísticas de importación
-        stats = {
-            "total_rows": 0,
-            "devices_created": 0,
-            "devices_updated": 0,
-            "devices_skipped": 0,
-            "pallets_created": 0,
-            "errors": []
-        }
+        inicio = time.perf_counter()
 
-        # Diccionarios para tracking
-        pallets_dict: Dict[str, Dict[str, Any]] = {}
-        devices_batch = []
-
-        # Procesar cada fila del CSV
-        for row_num, row in enumerate(csv_reader, start=2):  # Start=2 because row 1 is header
-            stats["total_rows"] += 1
+        # ── FASE 1: lectura y validación ─────────────────────────────────
+        def _nuevas_stats():
+            return {
+                "total_rows": 0,
+                "devices_created": 0,
+                "devices_updated": 0,
+                "devices_skipped": 0,
+                "duplicate_rows": 0,
+                "pallets_created": 0,
+                "pallets_updated": 0,
+                "errors": []
+            }
 
-            try:
-                # Extraer y validar campos requeridos
-                imei = row.get('imei', '').strip()
-                iccid = row.get('iccid', row.get('ccid', '')).strip()
-                carton_id = row.get('carton_id', row.get('package_no', row.get('batch', ''))).strip()
-                pallet_id = row.get('pallet_id', '').strip()
-                order_number = row.get('order_number', '').strip()
-
-                # Validaciones básicas
-                if not imei or len(imei) != 15 or not imei.isdigit():
-                    stats["errors"].append(f"Fila {row_num}: IMEI inválido '{imei}'")
-                    stats["devices_skipped"] += 1
-                    continue
-
-                if iccid and (len(iccid) < 19 or len(iccid) > 22):
-                    stats["errors"].append(f"Fila {row_num}: ICCID inválido '{iccid}'")
-                    stats["devices_skipped"] += 1
-                    continue
-
-                # Verificar si el dispositivo ya existe
-                existing_device = await Device.find_one(Device.imei == imei)
-
-                if existing_device:
-                    # Actualizar dispositivo existente
-                    existing_device.ccid = iccid if iccid else existing_device.ccid
-                    existing_device.package_no = carton_id if carton_id else existing_device.package_no
-                    existing_device.pallet_id = pallet_id if pallet_id else existing_device.pallet_id
-                    existing_device.nro_orden = order_number if order_number else existing_device.nro_orden
-                    existing_device.marca = row.get('product_model', existing_device.marca)
-                    existing_device.nro_referencia = row.get('product_reference', existing_device.nro_referencia)
-                    existing_device.fecha_actualizacion = datetime.utcnow()
-
-                    await existing_device.save()
-                    stats["devices_updated"] += 1
+        stats = _nuevas_stats()
 
-                else:
-                    # Crear nuevo dispositivo
-                    new_device = Device(
-                        imei=imei,
-                        ccid=iccid if iccid else None,
-                        package_no=carton_id if carton_id else None,
-                        pallet_id=pallet_id if pallet_id else None,
-                        nro_orden=order_number if order_number else None,
-                        marca=row.get('product_model', None),
-                        nro_referencia=row.get('product_reference', None),
-                        sku=row.get('sku', None),
-                        estado="en_produccion",
-                        creado_por=current_user.email
-                    )
-
-                    await new_device.insert()
-                    stats["devices_created"] += 1
-
-                # Trackear pallet para crear registro después
-                if pallet_id and order_number:
-                    if pallet_id not in pallets_dict:
-                        pallets_dict[pallet_id] = {
-                            "pallet_id": pallet_id,
-                            "order_number": order_number,
-                            "cartons": set(),
-                            "device_count": 0,
-                            "product_model": row.get('product_model'),
-                            "product_reference": row.get('product_reference')
-                        }
-
-                    if carton_id:
-                        pallets_dict[pallet_id]["cartons"].add(carton_id)
-                    pallets_dict[pallet_id]["device_count"] += 1
-
-            except Exception as row_error:
-                stats["errors"].append(f"Fila {row_num}: {str(row_error)}")
-                stats["devices_skipped"] += 1
-                logger.error(f"Error procesando fila {row_num}: {row_error}")
-
-        # Crear o actualizar registros de Pallet
-        for pallet_id, pallet_data in pallets_dict.items():
+        # Recibir el archivo por trozos a disco (límite MAX_UPLOAD_SIZE_MB y SHA-256 al vuelo)
+        async with recibir_upload(file) as subida:
             try:
-                existing_pallet = await Pallet.find_one(Pallet.pallet_id == pallet_id)
+                # Intentar decodificar como UTF-8
+                dispositivos, pallets_dict = await asyncio.to_thread(
+                    _fase_validacion, subida.path, 'utf-8-sig', stats
+                )
+            except UnicodeDecodeError:
+                # Si falla, intentar con latin-1
+                stats = _nuevas_stats()
+                dispositivos, pallets_dict = await asyncio.to_thread(
+                    _fase_validacion, subida.path, 'latin-1', stats
+                )
+            archivo_sha256 = subida.sha256
 
-                if existing_pallet:
-                    # Actualizar pallet existente
-                    existing_pallet.carton_ids = list(pallet_data["cartons"])
-                    existing_pallet.carton_count = len(pallet_data["cartons"])
-                    existing_pallet.device_count = pallet_data["device_count"]
-                    existing_pallet.fecha_modificacion = datetime.utcnow()
-                    await existing_pallet.save()
+        fin_validacion = time.perf_counter()
 
-                else:
-                    # Crear nuevo pallet
-                    new_pallet = Pallet(
-                        pallet_id=pallet_id,
-                        order_number=pallet_data["order_number"],
-                        carton_ids=list(pallet_data["cartons"]),
-                        carton_count=len(pallet_data["cartons"]),
-                        device_count=pallet_data["device_count"],
-                        devices_per_carton=pallet_data["device_count"] // len(pallet_data["cartons"]) if pallet_data["cartons"] else 0,
-                        product_model=pallet_data["product_model"],
-                        product_reference=pallet_data["product_reference"],
-                        estado="preparado",
-                        creado_por=current_user.email
-                    )
-
-                    await new_pallet.insert()
-                    stats["pallets_created"] += 1
+        # ── FASE 2a: upsert masivo de dispositivos ───────────────────────
+        previos: Dict[str, Dict[str, Any]] = {}
+        if dispositivos:
+            valores_insercion = device_bulk_service.valores_por_defecto(
+                estado="en_produccion",
+                creado_por=current_user.email
+            )
+            creados, actualizados, previos = await device_bulk_service.upsert_por_imei(
+                dispositivos,
+                valores_insercion
+            )
+            stats["devices_created"] = creados
+            stats["devices_updated"] = actualizados
+
+        # ── FASE 2b: upsert de pallets y ajuste de contadores ────────────
+        if pallets_dict:
+            ahora = datetime.utcnow()
+            operaciones = []
+
+            pallet_ids = list(pallets_dict.keys())
+            for pallet_id in pallet_ids:
+                pallet_data = pallets_dict[pallet_id]
+                cartons = sorted(pallet_data["cartons"])
+
+                valores_insercion = get_dict(Pallet(
+                    pallet_id=pallet_id,
+                    order_number=pallet_data["order_number"],
+                    devices_per_carton=len(pallet_data["imeis"]) // len(cartons) if cartons else 0,
+                    product_model=pallet_data["product_model"],
+                    product_reference=pallet_data["product_reference"],
+                    estado="preparado",
+                    creado_por=current_user.email
+                ), to_db=True)
+                for campo in ("pallet_id", "fecha_modificacion"):
+                    valores_insercion.pop(campo, None)
+
+                # Los contadores no se tocan aquí: se ajustan después por deltas
+                operaciones.append(UpdateOne(
+                    {"pallet_id": pallet_id},
+                    {
+                        "$set": {"fecha_modificacion": ahora},
+                        "$setOnInsert": valores_insercion
+                    },
+                    upsert=True
+                ))
 
+            try:
+                resultado = await Pallet.get_motor_collection().bulk_write(operaciones, ordered=False)
+                stats["pallets_created"] = resultado.upserted_count
+                stats["pallets_updated"] = resultado.matched_count
+
+                traslados = []
+                for imei, campos in dispositivos.items():
+                    previo = previos.get(imei, {})
+                    traslados.append((
+                        (previo.get("pallet_id"), previo.get("carton_id")),
+                        (campos.get("pallet_id", previo.get("pallet_id")), campos.get("carton_id", previo.get("carton_id")))
+                    ))
+                await device_bulk_service.ajustar_contadores_pallets(traslados)
+
+                # Los pallets nuevos se cuentan desde cero (puede haber dispositivos
+                # que ya los referenciaban antes de crearlos)
+                if resultado.upserted_ids:
+                    await pallet_reconcile.recalcular([pallet_ids[i] for i in resultado.upserted_ids])
             except Exception as pallet_error:
-                stats["errors"].append(f"Error creando pallet {pallet_id}: {str(pallet_error)}")
-                logger.error(f"Error creando pallet {pallet_id}: {pallet_error}")
-
-        logger.info(f"Importación completada por {current_user.email}: {stats['devices_created']} creados, {stats['devices_updated']} actualizados")
+                stats["errors"].append(f"Error actualizando pallets: {str(pallet_error)}")
+                logger.error(f"Error actualizando pallets: {pallet_error}")
+
+        # ── Rendimiento ──────────────────────────────────────────────────
+        duracion = time.perf_counter() - inicio
+        stats["duration_seconds"] = round(duracion, 3)
+        stats["validation_seconds"] = round(fin_validacion - inicio, 3)
+        stats["write_seconds"] = round(duracion - (fin_validacion - inicio), 3)
+        stats["rows_per_second"] = round(stats["total_rows"] / duracion, 1) if duracion > 0 else 0
+
+        logger.info(
+            f"Importación completada por {current_user.email}: {stats['devices_created']} creados, "
+            f"{stats['devices_updated']} actualizados ({stats['rows_per_second']} filas/s, "
+            f"sha256 {archivo_sha256})"
+        )
 
         return {
             "success": True,
@@ -797,12 +866,20 @@ async def importar_picking_jerarquico(
 @router.get("/hierarchy/pallets/{pallet_id}")
 async def obtener_pallet_jerarquico(
     pallet_id: str,
+    expand: Optional[str] = Query(
+        None,
+        description="Cartones a desplegar con sus dispositivos (IDs separados por comas, o 'all')"
+    ),
     current_user: Employee = Depends(get_current_active_user)
 ):
     """
     **Obtener pallet con jerarquía completa**
 
-    Retorna el pallet con la lista de cartones y estadísticas
+    Retorna el pallet con la lista de cartones y estadísticas.
+
+    Los cartones y sus recuentos se calculan con una agregación ($match + $group),
+    sin cargar los dispositivos. La lista de dispositivos (IMEI/ICCID) solo se
+    incluye en los cartones indicados en `expand`.
     """
     try:
         pallet = await Pallet.find_one(Pallet.pallet_id == pallet_id)
@@ -813,29 +890,47 @@ async def obtener_pallet_jerarquico(
                 detail=f"Pallet {pallet_id} no encontrado"
             )
 
-        # Obtener cartones únicos del pallet
-        devices = await Device.find(Device.pallet_id == pallet_id).to_list()
-
-        cartons_dict = {}
-        for device in devices:
-            if device.package_no:  # package_no = carton_id
-                if device.package_no not in cartons_dict:
-                    cartons_dict[device.package_no] = []
-                cartons_dict[device.package_no].append({
-                    "imei": device.imei,
-                    "ccid": device.ccid,
-                    "estado": device.estado.value if hasattr(device.estado, 'value') else device.estado
-                })
+        # Cartones del pallet con su número de dispositivos
+        # (carton_id es el nombre en MongoDB de Device.package_no)
+        grupos = await Device.find(Device.pallet_id == pallet_id).aggregate([
+            {"$group": {"_id": "$carton_id", "device_count": {"$sum": 1}}},
+            {"$sort": {"_id": 1}}
+        ]).to_list()
 
+        device_count = sum(grupo["device_count"] for grupo in grupos)
         cartons_list = [
             {
-                "carton_id": carton_id,
-                "device_count": len(devices_in_carton),
-                "devices": devices_in_carton
+                "carton_id": grupo["_id"],
+                "device_count": grupo["device_count"]
             }
-            for carton_id, devices_in_carton in cartons_dict.items()
+            for grupo in grupos
+            if grupo["_id"]
         ]
 
+        # Desplegar dispositivos solo de los cartones solicitados
+        if expand:
+            if expand.strip().lower() == "all":
+                expandir = [carton["carton_id"] for carton in cartons_list]
+            else:
+                expandir = [c.strip() for c in expand.split(",") if c.strip()]
+
+            vistas = await Device.find(
+                Device.pallet_id == pallet_id,
+                In(Device.package_no, expandir)
+            ).project(DeviceScanView).to_list()
+
+            devices_por_carton: Dict[str, List[Dict[str, Any]]] = {}
+            for vista in vistas:
+                devices_por_carton.setdefault(vista.package_no, []).append({
+                    "imei": vista.imei,
+                    "ccid": vista.ccid,
+                    "estado": vista.estado.value if hasattr(vista.estado, 'value') else vista.estado
+                })
+
+            for carton in cartons_list:
+                if carton["carton_id"] in devices_por_carton:
+                    carton["devices"] = devices_por_carton[carton["carton_id"]]
+
         return {
             "pallet": pallet,
             "cartons": cartons_list,
@@ -843,7 +938,7 @@ async def obtener_pallet_jerarquico(
                 "pallet_id": pallet.pallet_id,
                 "order_number": pallet.order_number,
                 "carton_count": len(cartons_list),
-                "device_count": len(devices),
+                "device_count": device_count,
                 "estado": pallet.estado
             }
         }
@@ -869,7 +964,7 @@ async def obtener_carton_jerarquico(
     Retorna todos los dispositivos (IMEI + ICCID) dentro del cartón
     """
     try:
-        devices = await Device.find(Device.package_no == carton_id).to_list()
+        devices = await Device.buscar_vistas_por_carton(carton_id)
 
         if not devices:
             raise HTTPException(
@@ -932,9 +1027,9 @@ async def buscar_dispositivo_jerarquico(
         device = None
 
         if imei:
-            device = await Device.find_one(Device.imei == imei.strip())
+            device = await Device.buscar_por_imei(imei, use_filter=True)
         elif iccid:
-            device = await Device.find_one(Device.ccid == iccid.strip())
+            device = await Device.buscar_por_ccid(iccid, use_filter=True)
 
         if not device:
             raise HTTPException(
@@ -991,37 +1086,43 @@ async def obtener_orden_jerarquica(
     Retorna todos los pallets de una orden con estadísticas
     """
     try:
-        pallets = await Pallet.find(Pallet.order_number == order_number).to_list()
-
-        if not pallets:
+        # Totales y resumen de pallets en una sola agregación (sin carton_ids)
+        resultado = await Pallet.find(Pallet.order_number == order_number).aggregate([
+            {"$sort": {"fecha_creacion": 1}},
+            {"$group": {
+                "_id": None,
+                "pallet_count": {"$sum": 1},
+                "total_cartons": {"$sum": "$carton_count"},
+                "total_devices": {"$sum": "$device_count"},
+                "product_model": {"$first": "$product_model"},
+                "product_reference": {"$first": "$product_reference"},
+                "pallets": {"$push": {
+                    "pallet_id": "$pallet_id",
+                    "carton_count": "$carton_count",
+                    "device_count": "$device_count",
+                    "estado": "$estado",
+                    "ubicacion": "$ubicacion",
+                    "fecha_creacion": "$fecha_creacion"
+                }}
+            }}
+        ]).to_list()
+
+        if not resultado:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Orden {order_number} no encontrada o sin pallets"
             )
 
-        pallets_summary = [
-            {
-                "pallet_id": pallet.pallet_id,
-                "carton_count": pallet.carton_count,
-                "device_count": pallet.device_count,
-                "estado": pallet.estado,
-                "ubicacion": pallet.ubicacion,
-                "fecha_creacion": pallet.fecha_creacion
-            }
-            for pallet in pallets
-        ]
-
-        total_cartons = sum(p.carton_count for p in pallets)
-        total_devices = sum(p.device_count for p in pallets)
+        orden = resultado[0]
 
         return {
             "order_number": order_number,
-            "pallet_count": len(pallets),
-            "total_cartons": total_cartons,
-            "total_devices": total_devices,
-            "pallets": pallets_summary,
-            "product_model": pallets[0].product_model if pallets else None,
-            "product_reference": pallets[0].product_reference if pallets else None
+            "pallet_count": orden["pallet_count"],
+            "total_cartons": orden["total_cartons"],
+            "total_devices": orden["total_devices"],
+            "pallets": orden["pallets"],
+            "product_model": orden.get("product_model"),
+            "product_reference": orden.get("product_reference")
         }
 
     except HTTPException:
@@ -1034,6 +1135,153 @@ async def obtener_orden_jerarquica(
         )
 
 
+def _describir_ubicacion(pallet_id: Optional[str], carton_id: Optional[str]) -> str:
+    """Texto de ubicación jerárquica para los movimientos"""
+    return f"Pallet {pallet_id or '-'} / Cartón {carton_id or '-'}"
+
+
+@router.post("/hierarchy/relocate")
+async def reubicar_dispositivos(
+    request: RelocationRequest,
+    current_user: Employee = Depends(get_current_active_user)
+):
+    """
+    **Reubicar dispositivos entre cartones y pallets**
+
+    Mueve en una sola operación una lista de IMEIs, un cartón o un pallet
+    completo a otro cartón y/o pallet (re-paletizado, división de cartones,
+    consolidación de envíos).
+
+    - Los dispositivos se actualizan con un único update_many
+    - Los contadores de los pallets se ajustan con $inc/$addToSet/$pull
+    - Se registra un movimiento de transferencia por cada ubicación de origen
+    """
+    try:
+        origen = request.source
+        destino_req = request.target
+
+        origenes = [v for v in (origen.imeis, origen.carton_id, origen.pallet_id) if v]
+        if len(origenes) != 1:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Debe indicar exactamente un origen: imeis, carton_id o pallet_id"
+            )
+
+        if not destino_req.carton_id and not destino_req.pallet_id:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Debe indicar carton_id y/o pallet_id de destino"
+            )
+
+        # Filtro del origen (nombres de MongoDB: package_no → carton_id)
+        if origen.imeis:
+            filtro = {"imei": {"$in": [imei.strip() for imei in origen.imeis if imei.strip()]}}
+        elif origen.carton_id:
+            filtro = {"carton_id": origen.carton_id}
+        else:
+            filtro = {"pallet_id": origen.pallet_id}
+
+        # Resolver destino
+        destino: Dict[str, Any] = {}
+        pallet_destino = None
+
+        if destino_req.pallet_id:
+            pallet_destino = await Pallet.find_one(Pallet.pallet_id == destino_req.pallet_id)
+            if not pallet_destino:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Pallet destino {destino_req.pallet_id} no encontrado"
+                )
+            destino["pallet_id"] = destino_req.pallet_id
+
+        if destino_req.carton_id:
+            destino["carton_id"] = destino_req.carton_id
+
+            # Un cartón existente arrastra su pallet
+            if not pallet_destino:
+                en_carton = await Device.get_motor_collection().find_one(
+                    {"carton_id": destino_req.carton_id, "pallet_id": {"$ne": None}},
+                    {"pallet_id": 1}
+                )
+                if en_carton:
+                    destino["pallet_id"] = en_carton["pallet_id"]
+                else:
+                    pallet_destino = await Pallet.find_one(Pallet.carton_ids == destino_req.carton_id)
+                    if not pallet_destino:
+                        raise HTTPException(
+                            status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"El cartón {destino_req.carton_id} no existe: indique pallet_id de destino"
+                        )
+                    destino["pallet_id"] = pallet_destino.pallet_id
+
+        movidos, pallets_actualizados = await device_bulk_service.reubicar(filtro, destino)
+
+        if not movidos:
+            existe = await Device.get_motor_collection().find_one(filtro, {"_id": 1})
+            if not existe:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="No se encontraron dispositivos en el origen"
+                )
+
+        # Un movimiento de transferencia por ubicación de origen
+        relocation_id = f"REL-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6].upper()}"
+        grupos: Dict[tuple, List[Dict[str, Any]]] = {}
+        for doc in movidos:
+            grupos.setdefault((doc.get("pallet_id"), doc.get("carton_id")), []).append(doc)
+
+        movimientos = []
+        for (pallet_origen, carton_origen), docs in grupos.items():
+            pallet_final = destino.get("pallet_id", pallet_origen)
+            carton_final = destino.get("carton_id", carton_origen)
+            movimientos.append(Movimiento(
+                tipo=TipoMovimiento.TRANSFERENCIA,
+                imei=docs[0]["imei"] if len(docs) == 1 else None,
+                ccid=docs[0].get("ccid") if len(docs) == 1 else None,
+                cantidad=len(docs),
+                ubicacion_origen=_describir_ubicacion(pallet_origen, carton_origen),
+                ubicacion_destino=_describir_ubicacion(pallet_final, carton_final),
+                documento_referencia=relocation_id,
+                usuario=str(current_user.id),
+                usuario_nombre=current_user.full_name,
+                origen="app6",
+                detalles=request.notas or f"Reubicación de {len(docs)} dispositivos",
+                metadata={
+                    "pallet_origen": pallet_origen,
+                    "carton_origen": carton_origen,
+                    "pallet_destino": pallet_final,
+                    "carton_destino": carton_final,
+                    "imeis": [doc["imei"] for doc in docs]
+                }
+            ))
+
+        if movimientos:
+            await Movimiento.insert_many(movimientos)
+
+        logger.info(
+            f"Reubicación {relocation_id}: {len(movidos)} dispositivos → "
+            f"{_describir_ubicacion(destino.get('pallet_id'), destino.get('carton_id'))}"
+        )
+
+        return {
+            "success": True,
+            "relocation_id": relocation_id,
+            "devices_moved": len(movidos),
+            "pallets_updated": pallets_actualizados,
+            "movements": len(movimientos),
+            "target": destino
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error reubicando dispositivos: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error en reubicación: {str(e)}"
+        )
+
+
 # ════════════════════════════════════════════════════════════════════════
 # UTILIDADES
 # ════════════════════════════════════════════════════════════════════════
@@ -16,6 +16,7 @@ from app.models.iccid_batch import ICCIDBatch
 from app.dependencies.auth import get_current_active_user
 from app.utils.iccid_analyzer import analyze_iccid, get_available_iin_profiles
 from app.utils.iccid_utils import generate_iccid_range
+from app.services.memory_service import medir_memoria
 
 
 router = APIRouter(
@@ -56,6 +57,7 @@ class AnalyzeICCIDRequest(BaseModel):
 # ═══════════════════════════════════════════════════════════════════════════
 
 @router.post("/batches/generate")
+@medir_memoria("app8.generate_batch")
 async def generate_iccid_batch(
     request: GenerateICCIDBatchRequest,
     current_user: Employee = Depends(get_current_active_user)
@@ -276,6 +278,7 @@ async def get_iccid_batch_details(
 
 
 @router.get("/batches/{batch_id}/csv")
+@medir_memoria("app8.batch_csv")
 async def download_iccid_batch_csv(
     batch_id: str,
     current_user: Employee = Depends(get_current_active_user)
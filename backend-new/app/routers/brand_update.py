@@ -7,7 +7,6 @@ from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
 from fastapi.responses import JSONResponse
 from beanie import PydanticObjectId
 from typing import List, Dict
-import pandas as pd
 import io
 from datetime import datetime
 
@@ -38,6 +37,8 @@ async def upload_brand_file(
     - errors: Lista de errores
     """
 
+    import pandas as pd
+
     # Verificar extensión del archivo
     if not file.filename.endswith(('.xlsx', '.xls', '.csv')):
         raise HTTPException(
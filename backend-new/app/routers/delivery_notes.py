@@ -5,13 +5,14 @@ Gestión de albaranes con códigos de palet EST912
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Body
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, timedelta
 from bson import ObjectId
 import logging
 
 from app.models.delivery_note import DeliveryNote, DeliveryNoteSequence
 from app.models.employee import Employee
 from app.dependencies.auth import get_current_active_user
+from app.config import settings
 
 logger = logging.getLogger(__name__)
 
@@ -583,6 +584,279 @@ async def generate_zpl_label(
         )
 
 
+async def _albaranes_para_etiquetas(
+    ids: Optional[List[str]],
+    fecha: Optional[str],
+    order_number: Optional[str],
+    status_filter: Optional[str]
+):
+    """Consulta de albaranes para la impresión en lote (valida filtros y límite)"""
+    query = {}
+
+    if ids:
+        invalidos = [i for i in ids if not ObjectId.is_valid(i)]
+        if invalidos:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"IDs de albarán inválidos: {', '.join(invalidos[:10])}"
+            )
+        query["_id"] = {"$in": [ObjectId(i) for i in ids]}
+
+    if fecha:
+        try:
+            dia = datetime.fromisoformat(fecha)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Fecha inválida (formato YYYY-MM-DD)"
+            )
+        query["created_at"] = {"$gte": dia, "$lt": dia + timedelta(days=1)}
+
+    if order_number:
+        query["order_number"] = order_number
+
+    if not query:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Indique ids, fecha u order_number"
+        )
+
+    if status_filter:
+        query["status"] = status_filter
+
+    total = await DeliveryNote.find(query).count()
+
+    if total == 0:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No se encontraron albaranes"
+        )
+
+    if total > settings.LABEL_BATCH_MAX_NOTES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Demasiados albaranes ({total}); máximo {settings.LABEL_BATCH_MAX_NOTES} por lote"
+        )
+
+    return DeliveryNote.find(query).sort("+order_number", "+pallet_number_in_order", "+created_at")
+
+
+def _etiquetas_de(delivery_note: DeliveryNote, copies: Optional[int]):
+    """Datos de etiqueta repetidos tantas veces como copias"""
+    datos = delivery_note.to_dict()
+    return [datos] * (copies or delivery_note.labels_to_print or 1)
+
+
+@router.get("/labels/batch/pdf", status_code=status.HTTP_200_OK)
+async def generate_pdf_labels_batch(
+    ids: Optional[List[str]] = Query(None, description="IDs de albaranes"),
+    fecha: Optional[str] = Query(None, description="Albaranes creados en el día (YYYY-MM-DD)"),
+    order_number: Optional[str] = Query(None, description="Albaranes de un pedido"),
+    status_filter: Optional[str] = Query(None, description="Filtrar por estado"),
+    copies: Optional[int] = Query(None, ge=1, le=100, description="Copias por albarán (por defecto, labels_to_print)"),
+    label_size: str = Query("A6", description="Tamaño: 100x150, 100x100, A6"),
+    layout: str = Query("nup", description="nup (varias por folio A4) o page (una por página)"),
+    current_user: Employee = Depends(get_current_active_user)
+):
+    """
+    **Generar en un único PDF las etiquetas de varios albaranes**
+
+    Los códigos de barras se dibujan como vectores (Code128 de ReportLab)
+    y se cachean por código, sin generar una imagen por etiqueta.
+    """
+    try:
+        from app.services.label_generator import LabelGenerator
+        from fastapi.concurrency import run_in_threadpool
+        from fastapi.responses import Response
+
+        if layout not in ("nup", "page"):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="layout debe ser 'nup' o 'page'"
+            )
+
+        consulta = await _albaranes_para_etiquetas(ids, fecha, order_number, status_filter)
+
+        etiquetas = []
+        albaranes = 0
+        async for delivery_note in consulta:
+            etiquetas.extend(_etiquetas_de(delivery_note, copies))
+            albaranes += 1
+
+        # El render es CPU: fuera del event loop
+        pdf_data = await run_in_threadpool(
+            LabelGenerator.generate_pdf_labels_batch,
+            etiquetas,
+            label_size,
+            layout
+        )
+
+        logger.info(f"PDF en lote generado: {albaranes} albaranes, {len(etiquetas)} etiquetas")
+
+        return Response(
+            content=pdf_data,
+            media_type="application/pdf",
+            headers={
+                "Content-Disposition": f'attachment; filename="etiquetas_{datetime.utcnow().strftime("%Y%m%d_%H%M%S")}.pdf"'
+            }
+        )
+
+    except ImportError as e:
+        logger.error(f"Error importando dependencias: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Librerías de generación de PDF no disponibles. Instalar: pip install reportlab"
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error generando PDF en lote: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al generar PDF: {str(e)}"
+        )
+
+
+@router.get("/labels/batch/zpl", status_code=status.HTTP_200_OK)
+async def generate_zpl_labels_batch(
+    ids: Optional[List[str]] = Query(None, description="IDs de albaranes"),
+    fecha: Optional[str] = Query(None, description="Albaranes creados en el día (YYYY-MM-DD)"),
+    order_number: Optional[str] = Query(None, description="Albaranes de un pedido"),
+    status_filter: Optional[str] = Query(None, description="Filtrar por estado"),
+    copies: Optional[int] = Query(None, ge=1, le=100, description="Copias por albarán (por defecto, labels_to_print)"),
+    dpi: int = Query(203, description="DPI impresora (203 o 300)"),
+    label_width: int = Query(100, description="Ancho etiqueta (mm)"),
+    label_height: int = Query(150, description="Alto etiqueta (mm)"),
+    current_user: Employee = Depends(get_current_active_user)
+):
+    """
+    **Generar en streaming el ZPL de varios albaranes**
+
+    Devuelve un único fichero .zpl con todas las etiquetas (^XA ... ^XZ
+    consecutivos), listo para enviar a la impresora Zebra.
+    """
+    try:
+        from app.services.label_generator import LabelGenerator
+        from fastapi.responses import StreamingResponse
+
+        consulta = await _albaranes_para_etiquetas(ids, fecha, order_number, status_filter)
+
+        async def _stream_zpl():
+            async for delivery_note in consulta:
+                for zpl in LabelGenerator.iter_zpl_labels(
+                    _etiquetas_de(delivery_note, copies),
+                    dpi=dpi,
+                    label_width=label_width,
+                    label_height=label_height
+                ):
+                    yield zpl
+
+        return StreamingResponse(
+            _stream_zpl(),
+            media_type="text/plain; charset=utf-8",
+            headers={
+                "Content-Disposition": f'attachment; filename="etiquetas_{datetime.utcnow().strftime("%Y%m%d_%H%M%S")}.zpl"'
+            }
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error generando ZPL en lote: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al generar ZPL: {str(e)}"
+        )
+
+
+@router.post("/labels/batch/print", status_code=status.HTTP_202_ACCEPTED)
+async def print_labels_batch(
+    printer: str = Query(..., description="Impresora Zebra configurada"),
+    ids: Optional[List[str]] = Query(None, description="IDs de albaranes"),
+    fecha: Optional[str] = Query(None, description="Albaranes creados en el día (YYYY-MM-DD)"),
+    order_number: Optional[str] = Query(None, description="Albaranes de un pedido"),
+    status_filter: Optional[str] = Query(None, description="Filtrar por estado"),
+    copies: Optional[int] = Query(None, ge=1, le=100, description="Copias por albarán (por defecto, labels_to_print)"),
+    dpi: int = Query(203, description="DPI impresora (203 o 300)"),
+    label_width: int = Query(100, description="Ancho etiqueta (mm)"),
+    label_height: int = Query(150, description="Alto etiqueta (mm)"),
+    current_user: Employee = Depends(get_current_active_user)
+):
+    """
+    **Enviar a una impresora Zebra las etiquetas de varios albaranes**
+
+    Crea un trabajo de impresión por albarán en la cola de la impresora;
+    el spooler los agrupa y los envía por TCP (puerto 9100).
+    El estado se consulta en /printing/jobs.
+    """
+    try:
+        from app.services.label_generator import LabelGenerator
+        from app.services.print_spooler_service import print_spooler
+
+        consulta = await _albaranes_para_etiquetas(ids, fecha, order_number, status_filter)
+
+        trabajos = []
+        async for delivery_note in consulta:
+            zpl = "".join(LabelGenerator.iter_zpl_labels(
+                _etiquetas_de(delivery_note, copies),
+                dpi=dpi,
+                label_width=label_width,
+                label_height=label_height
+            ))
+            trabajos.append((zpl, delivery_note.pallet_code))
+
+        jobs = await print_spooler.encolar(printer, trabajos, created_by=current_user.email)
+
+        logger.info(f"{len(jobs)} trabajos de impresión encolados en {printer}")
+
+        return {
+            "success": True,
+            "printer": printer,
+            "jobs": [job.to_dict() for job in jobs]
+        }
+
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error encolando impresión: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al encolar impresión: {str(e)}"
+        )
+
+
+@router.post("/{delivery_note_id}/label/print", status_code=status.HTTP_202_ACCEPTED)
+async def print_label(
+    delivery_note_id: str,
+    printer: str = Query(..., description="Impresora Zebra configurada"),
+    copies: Optional[int] = Query(None, ge=1, le=100, description="Copias (por defecto, labels_to_print)"),
+    dpi: int = Query(203, description="DPI impresora (203 o 300)"),
+    label_width: int = Query(100, description="Ancho etiqueta (mm)"),
+    label_height: int = Query(150, description="Alto etiqueta (mm)"),
+    current_user: Employee = Depends(get_current_active_user)
+):
+    """
+    **Enviar a una impresora Zebra las etiquetas de un albarán**
+    """
+    return await print_labels_batch(
+        printer=printer,
+        ids=[delivery_note_id],
+        fecha=None,
+        order_number=None,
+        status_filter=None,
+        copies=copies,
+        dpi=dpi,
+        label_width=label_width,
+        label_height=label_height,
+        current_user=current_user
+    )
+
+
 @router.get("/{delivery_note_id}/label/preview", status_code=status.HTTP_200_OK)
 async def generate_html_preview(
     delivery_note_id: str,
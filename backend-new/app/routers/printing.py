@@ -0,0 +1,181 @@
+"""
+OSE Platform - Printing Router
+Cola de impresión ZPL para impresoras Zebra (TCP 9100)
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Body, status
+from typing import Optional
+from bson import ObjectId
+import logging
+
+from app.models.print_job import PrintJob, PrintJobStatus
+from app.models.employee import Employee
+from app.dependencies.auth import get_current_active_user
+from app.services.print_spooler_service import print_spooler
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/printing", tags=["Printing / Impresión"])
+
+
+async def _obtener_trabajo(job_id: str) -> PrintJob:
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="ID de trabajo inválido"
+        )
+
+    job = await PrintJob.get(ObjectId(job_id))
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Trabajo de impresión no encontrado"
+        )
+    return job
+
+
+@router.get("/printers", response_model=dict)
+async def list_printers(
+    current_user: Employee = Depends(get_current_active_user)
+):
+    """
+    Impresoras configuradas y estado de sus colas en este worker
+    """
+    return {
+        "success": True,
+        "printers": print_spooler.stats()
+    }
+
+
+@router.post("/jobs", status_code=status.HTTP_201_CREATED)
+async def submit_print_job(
+    printer: str = Query(..., description="Nombre de la impresora"),
+    zpl: str = Body(..., embed=True, description="Código ZPL (una o varias etiquetas ^XA ... ^XZ)"),
+    documento_referencia: Optional[str] = Query(None, description="Documento de origen"),
+    current_user: Employee = Depends(get_current_active_user)
+):
+    """
+    Encola un trabajo ZPL en una impresora
+    """
+    try:
+        if "^XA" not in zpl:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="El contenido no es ZPL (falta ^XA)"
+            )
+
+        jobs = await print_spooler.encolar(
+            printer,
+            [(zpl, documento_referencia)],
+            created_by=current_user.email
+        )
+
+        return {
+            "success": True,
+            "job": jobs[0].to_dict()
+        }
+
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+
+@router.get("/jobs", response_model=dict)
+async def list_print_jobs(
+    printer: Optional[str] = Query(None, description="Filtrar por impresora"),
+    status_filter: Optional[PrintJobStatus] = Query(None, description="Filtrar por estado"),
+    documento_referencia: Optional[str] = Query(None, description="Filtrar por documento"),
+    limit: int = Query(50, ge=1, le=500),
+    skip: int = Query(0, ge=0),
+    current_user: Employee = Depends(get_current_active_user)
+):
+    """
+    Lista los trabajos de impresión más recientes
+    """
+    query = {}
+    if printer:
+        query["printer"] = printer
+    if status_filter:
+        query["status"] = status_filter.value
+    if documento_referencia:
+        query["documento_referencia"] = documento_referencia
+
+    jobs = await PrintJob.find(query).sort("-created_at").skip(skip).limit(limit).to_list()
+    total = await PrintJob.find(query).count()
+
+    return {
+        "success": True,
+        "count": len(jobs),
+        "total": total,
+        "jobs": [job.to_dict() for job in jobs]
+    }
+
+
+@router.get("/jobs/{job_id}", response_model=dict)
+async def get_print_job(
+    job_id: str,
+    current_user: Employee = Depends(get_current_active_user)
+):
+    """
+    Estado de un trabajo de impresión
+    """
+    job = await _obtener_trabajo(job_id)
+
+    return {
+        "success": True,
+        "job": job.to_dict()
+    }
+
+
+@router.post("/jobs/{job_id}/retry", response_model=dict)
+async def retry_print_job(
+    job_id: str,
+    current_user: Employee = Depends(get_current_active_user)
+):
+    """
+    Vuelve a encolar un trabajo fallido o cancelado
+    """
+    job = await _obtener_trabajo(job_id)
+
+    try:
+        reencolado = await print_spooler.reintentar(job)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    if not reencolado:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"El trabajo está en estado '{job.status}' y no se puede reintentar"
+        )
+
+    return {
+        "success": True,
+        "job": job.to_dict()
+    }
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=dict)
+async def cancel_print_job(
+    job_id: str,
+    current_user: Employee = Depends(get_current_active_user)
+):
+    """
+    Cancela un trabajo que todavía no se ha enviado a la impresora
+    """
+    job = await _obtener_trabajo(job_id)
+
+    if not await print_spooler.cancelar(job):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"El trabajo está en estado '{job.status}' y no se puede cancelar"
+        )
+
+    return {
+        "success": True,
+        "message": "Trabajo cancelado"
+    }
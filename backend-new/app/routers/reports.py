@@ -0,0 +1,162 @@
+"""
+OSE Platform - Reports Router
+Informes PDF de producción, clientes y calidad (ReportLab en streaming)
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
+from typing import Optional
+from datetime import datetime
+from pathlib import Path
+from bson import ObjectId
+import logging
+import os
+import tempfile
+
+from app.models.customer import Customer
+from app.models.employee import Employee
+from app.models.production_order import ProductionOrder
+from app.dependencies.auth import get_current_active_user
+from app.config import settings
+from app.services.pdf_service import pdf_service
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/reports", tags=["Reports / Informes"])
+
+
+def _fichero_temporal():
+    """
+    Fichero temporal para el PDF del informe
+
+    El informe se escribe a disco según se maqueta y se sirve desde ahí,
+    así un informe de miles de páginas no pasa entero por memoria.
+    """
+    directorio = Path(settings.UPLOAD_DIR) / "reports"
+    directorio.mkdir(parents=True, exist_ok=True)
+    return tempfile.NamedTemporaryFile(suffix=".pdf", dir=directorio, delete=False)
+
+
+def _respuesta_pdf(ruta: str, filename: str) -> FileResponse:
+    # El fichero temporal se borra cuando termina el envío
+    return FileResponse(
+        path=ruta,
+        media_type="application/pdf",
+        filename=filename,
+        background=BackgroundTask(os.unlink, ruta)
+    )
+
+
+async def _generar(generador, filename: str, **kwargs) -> FileResponse:
+    fichero = _fichero_temporal()
+    try:
+        with fichero:
+            await generador(destino=fichero, **kwargs)
+    except BaseException:
+        os.unlink(fichero.name)
+        raise
+    return _respuesta_pdf(fichero.name, filename)
+
+
+@router.get("/production/{order_number}")
+async def production_report(
+    order_number: str,
+    current_user: Employee = Depends(get_current_active_user)
+):
+    """
+    Reporte de producción de una orden con todos sus dispositivos
+    """
+    try:
+        order = await ProductionOrder.find_one(ProductionOrder.order_number == order_number)
+
+        return await _generar(
+            pdf_service.generate_production_report,
+            f"reporte_produccion_{order_number}.pdf",
+            order_number=order_number,
+            order=order
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error generating production report: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al generar el reporte de producción: {str(e)}"
+        )
+
+
+@router.get("/customers/{customer_id}")
+async def customer_report(
+    customer_id: str,
+    current_user: Employee = Depends(get_current_active_user)
+):
+    """
+    Reporte de un cliente con sus dispositivos
+    """
+    try:
+        if not ObjectId.is_valid(customer_id):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="ID de cliente inválido"
+            )
+
+        customer = await Customer.get(ObjectId(customer_id))
+        if not customer:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Cliente no encontrado: {customer_id}"
+            )
+
+        return await _generar(
+            pdf_service.generate_customer_report,
+            f"reporte_cliente_{customer.customer_code}.pdf",
+            customer=customer
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error generating customer report: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al generar el reporte de cliente: {str(e)}"
+        )
+
+
+@router.get("/quality")
+async def quality_report(
+    production_order: Optional[str] = Query(None, description="Filtrar por orden de producción"),
+    production_line: Optional[int] = Query(None, description="Filtrar por línea"),
+    date_from: Optional[datetime] = Query(None, description="Inspecciones desde"),
+    date_to: Optional[datetime] = Query(None, description="Inspecciones hasta"),
+    current_user: Employee = Depends(get_current_active_user)
+):
+    """
+    Reporte de control de calidad (una fila por inspección)
+    """
+    try:
+        if not (production_order or production_line is not None or date_from or date_to):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Indica al menos un filtro (orden, línea o fechas)"
+            )
+
+        return await _generar(
+            pdf_service.generate_quality_report,
+            "reporte_calidad.pdf",
+            production_order=production_order,
+            production_line=production_line,
+            date_from=date_from,
+            date_to=date_to
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error generating quality report: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al generar el reporte de calidad: {str(e)}"
+        )
@@ -0,0 +1,587 @@
+"""
+OSE Platform - System Performance Router
+Diagnóstico de rendimiento del worker (cachés y filtros en memoria)
+"""
+
+from typing import Optional
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import FileResponse
+
+from app.models.employee import Employee
+from app.dependencies.auth import require_admin
+from app.services.device_cache_service import device_cache
+from app.services.device_filter_service import device_filter
+from app.services.pallet_reconcile_service import pallet_reconcile
+from app.services.pdf_cache_service import pdf_cache
+from app.services.mongo_monitor_service import mongo_monitor
+from app.services.loop_watchdog_service import loop_watchdog
+from app.services.profiling_service import profiler, ORDENES
+from app.services.tracing_service import tracer
+from app.services.memory_service import memoria
+from app.utils.security import create_profile_token
+from app.utils import import_profile
+from app.config import settings
+
+router = APIRouter(prefix="/system/performance", tags=["System Performance"])
+
+
+@router.get("/caches", response_model=dict)
+async def get_cache_stats(
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Estado de las cachés en memoria de este worker
+
+    - device_cache: aciertos/fallos de la caché LRU por IMEI y por cartón
+    - device_filter: filtro de existencia de IMEI/ICCID y su tasa de falsos positivos
+
+    Requiere permisos de administrador
+    """
+    return {
+        "device_cache": device_cache.stats(),
+        "device_filter": device_filter.stats()
+    }
+
+
+@router.post("/caches/clear", response_model=dict)
+async def clear_caches(
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Vacía la caché de dispositivos de este worker
+
+    Requiere permisos de administrador
+    """
+    device_cache.invalidar_todo()
+
+    return {
+        "success": True,
+        "message": "Caché de dispositivos vaciada"
+    }
+
+
+@router.get("/pallets/reconcile", response_model=dict)
+async def get_pallet_reconcile_report(
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Último informe de reconciliación de contadores de pallets de este worker
+
+    Requiere permisos de administrador
+    """
+    return {
+        "report": pallet_reconcile.ultimo_informe
+    }
+
+
+@router.post("/pallets/reconcile", response_model=dict)
+async def reconcile_pallets(
+    fix: bool = Query(False, description="Corregir los contadores desviados"),
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Recalcula los contadores de todos los pallets con una agregación sobre
+    devices e informa de las desviaciones (carton_ids, carton_count, device_count)
+
+    Requiere permisos de administrador
+    """
+    informe = await pallet_reconcile.reconciliar(corregir=fix)
+    await pallet_reconcile.registrar_metricas(informe)
+
+    return {
+        "success": True,
+        "report": informe
+    }
+
+
+@router.get("/pdf-cache", response_model=dict)
+async def get_pdf_cache_stats(
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Estado de la caché de PDFs de facturas (ocupación y aciertos de este worker)
+
+    Requiere permisos de administrador
+    """
+    return {
+        "pdf_cache": await pdf_cache.stats()
+    }
+
+
+@router.post("/pdf-cache/purge", response_model=dict)
+async def purge_pdf_cache(
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Aplica ya la política de expulsión de la caché de PDFs (antigüedad y tamaño)
+
+    Requiere permisos de administrador
+    """
+    return {
+        "success": True,
+        "result": await pdf_cache.purgar()
+    }
+
+
+@router.get("/mongo/slow", response_model=dict)
+async def get_slow_mongo_commands(
+    limit: int = Query(100, ge=1, le=1000, description="Máximo de comandos a devolver"),
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Comandos de MongoDB más lentos que MONGO_SLOW_COMMAND_MS en este worker
+
+    Cada entrada lleva el comando, la colección, la forma del filtro (sin
+    valores), la duración y la ruta que lo originó. Incluye también los
+    totales por comando y colección.
+
+    Requiere permisos de administrador
+    """
+    return {
+        "enabled": settings.MONGO_COMMAND_MONITORING,
+        "threshold_ms": settings.MONGO_SLOW_COMMAND_MS,
+        "slow_commands": mongo_monitor.lentos(limit),
+        "totals": mongo_monitor.totales()
+    }
+
+
+@router.post("/mongo/slow/clear", response_model=dict)
+async def clear_slow_mongo_commands(
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Vacía el registro de comandos lentos de este worker
+
+    Requiere permisos de administrador
+    """
+    mongo_monitor.limpiar()
+
+    return {
+        "success": True,
+        "message": "Registro de comandos lentos vaciado"
+    }
+
+
+@router.get("/indexes", response_model=dict)
+async def get_index_report(
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Estado de los índices de MongoDB (mismo análisis que python -m app.db.indexes)
+
+    - plan: índices declarados que faltan, en conflicto o no declarados
+    - report: índices sin uso según $indexStats, índices redundantes y
+      consultas sin índice adecuado; además del catálogo de consultas de
+      los routers se analizan los filtros de los comandos lentos de este
+      worker (/mongo/slow)
+
+    Requiere permisos de administrador
+    """
+    from app.database import Database
+    from app.db import indexes
+
+    try:
+        modelos = Database._get_document_models()
+        lentas = {
+            indexes.consulta_desde_filtro(c["collection"], c["filter"], f"lento: {c['method']} {c['route']}")
+            for c in mongo_monitor.lentos()
+            if c["command"] in ("find", "count", "aggregate", "findAndModify", "update", "delete")
+        }
+        return {
+            "plan": [indexes.sin_internos(plan) for plan in await indexes.planificar_todo(modelos)],
+            "report": await indexes.informe(modelos, [c for c in lentas if c is not None])
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error analizando los índices: {str(e)}"
+        )
+
+
+@router.get("/event-loop", response_model=dict)
+async def get_event_loop_stats(
+    limit: int = Query(20, ge=1, le=100, description="Máximo de bloqueos a devolver"),
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Lag del event loop de este worker y últimos bloqueos capturados
+
+    Cada bloqueo lleva la ruta de la petición en curso, el marco de nuestro
+    código más interno (culprit) y la pila del hilo del loop.
+
+    Requiere permisos de administrador
+    """
+    return {
+        "stats": loop_watchdog.stats(),
+        "blocks": loop_watchdog.bloqueos(limit)
+    }
+
+
+@router.post("/event-loop/clear", response_model=dict)
+async def clear_event_loop_blocks(
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Vacía el registro de bloqueos del event loop de este worker
+
+    Requiere permisos de administrador
+    """
+    loop_watchdog.limpiar()
+
+    return {
+        "success": True,
+        "message": "Registro de bloqueos vaciado"
+    }
+
+
+@router.post("/profiles/token", response_model=dict)
+async def create_profiling_token(
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Emite un token de perfilado de corta duración
+
+    Las peticiones que lo lleven en la cabecera X-Profile-Token (o en el
+    parámetro profile_token) se ejecutan bajo cProfile; la respuesta
+    incluye X-Profile-Id con el id del perfil.
+
+    Requiere permisos de administrador
+    """
+    if not settings.PROFILE_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="El perfilado está desactivado (PROFILE_ENABLED)"
+        )
+
+    return {
+        "token": create_profile_token({"sub": str(current_user.id)}),
+        "header": "X-Profile-Token",
+        "expires_in_minutes": settings.PROFILE_TOKEN_EXPIRE_MINUTES
+    }
+
+
+@router.get("/profiles", response_model=dict)
+async def list_profiles(
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Perfiles guardados en este host, más recientes primero
+
+    Requiere permisos de administrador
+    """
+    return {
+        "profiles": await profiler.listar()
+    }
+
+
+@router.get("/profiles/{profile_id}", response_model=dict)
+async def get_profile(
+    profile_id: str,
+    sort: str = Query("cumulative", description=f"Orden: {', '.join(ORDENES)}"),
+    limit: int = Query(50, ge=1, le=500, description="Funciones a listar"),
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Detalle de un perfil: resumen y listado de pstats
+
+    Requiere permisos de administrador
+    """
+    if sort not in ORDENES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Orden no válido. Use: {', '.join(ORDENES)}"
+        )
+
+    perfil = await profiler.detalle(profile_id, sort, limit)
+    if not perfil:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Perfil no encontrado"
+        )
+
+    return perfil
+
+
+@router.get("/profiles/{profile_id}/download")
+async def download_profile(
+    profile_id: str,
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Descarga el fichero .prof (pstats; se abre con snakeviz o pstats)
+
+    Requiere permisos de administrador
+    """
+    ruta = profiler.ruta(profile_id)
+    if ruta is None or not ruta.exists():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Perfil no encontrado"
+        )
+
+    return FileResponse(
+        path=str(ruta),
+        media_type="application/octet-stream",
+        filename=f"profile_{profile_id}.prof"
+    )
+
+
+@router.delete("/profiles/{profile_id}", response_model=dict)
+async def delete_profile(
+    profile_id: str,
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Borra un perfil
+
+    Requiere permisos de administrador
+    """
+    if not await profiler.borrar(profile_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Perfil no encontrado"
+        )
+
+    return {
+        "success": True,
+        "message": "Perfil borrado"
+    }
+
+
+@router.get("/traces", response_model=dict)
+async def list_traces(
+    route: Optional[str] = Query(None, description="Plantilla de ruta (ej: /api/v1/devices/{imei})"),
+    min_ms: float = Query(0, ge=0, description="Duración mínima"),
+    limit: int = Query(50, ge=1, le=500),
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Trazas guardadas (lentas o muestreadas), más recientes primero
+
+    Solo el resumen; el árbol de spans está en /traces/{trace_id}.
+
+    Requiere permisos de administrador
+    """
+    try:
+        trazas = await tracer.listar(route=route, min_ms=min_ms, limite=limit)
+        return {
+            "enabled": settings.TRACING_ENABLED,
+            "slow_ms": settings.TRACE_SLOW_MS,
+            "sample_rate": settings.TRACE_SAMPLE_RATE,
+            "total": len(trazas),
+            "traces": trazas
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error obteniendo trazas: {str(e)}"
+        )
+
+
+@router.get("/traces/{trace_id}", response_model=dict)
+async def get_trace(
+    trace_id: str,
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Cascada de una traza: spans en orden de inicio con su profundidad,
+    inicio y duración relativos a la petición (y en texto en "waterfall")
+
+    Requiere permisos de administrador
+    """
+    try:
+        traza = await tracer.obtener(trace_id)
+        if not traza:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Traza no encontrada"
+            )
+
+        filas = tracer.cascada(traza.pop("root"))
+        return {
+            **traza,
+            "spans": filas,
+            "waterfall": tracer.cascada_texto(filas)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error obteniendo la traza: {str(e)}"
+        )
+
+
+@router.get("/memory", response_model=dict)
+async def get_memory_stats(
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Estado del diagnóstico de memoria de este worker
+
+    - tracemalloc: si está activo, memoria trazada y comparaciones guardadas
+    - RSS: resumen por operación (pico medio/máximo y KB por fila importada)
+
+    Requiere permisos de administrador
+    """
+    return memoria.stats()
+
+
+@router.post("/memory/start", response_model=dict)
+async def start_memory_tracing(
+    frames: int = Query(settings.MEMORY_TRACE_FRAMES, ge=1, le=50, description="Profundidad de pila"),
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Activa tracemalloc y toma la instantánea de referencia
+
+    Mientras esté activo, las operaciones de importación y exportación
+    guardan la comparación de memoria antes/después por fichero:línea.
+    tracemalloc ralentiza el worker: conviene pararlo al terminar.
+
+    Requiere permisos de administrador
+    """
+    await memoria.iniciar_trazado(frames)
+    return {
+        "success": True,
+        "message": "tracemalloc activado",
+        **memoria.stats()
+    }
+
+
+@router.post("/memory/stop", response_model=dict)
+async def stop_memory_tracing(
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Para tracemalloc (las comparaciones guardadas se conservan)
+
+    Requiere permisos de administrador
+    """
+    memoria.detener_trazado()
+    return {
+        "success": True,
+        "message": "tracemalloc desactivado"
+    }
+
+
+@router.post("/memory/snapshot", response_model=dict)
+async def take_memory_snapshot(
+    name: str = Query("manual", max_length=100, description="Nombre de la instantánea"),
+    limit: int = Query(settings.MEMORY_TOP_LIMIT, ge=1, le=200),
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Toma una instantánea y la compara con la de referencia (/memory/start)
+
+    Requiere permisos de administrador
+    """
+    resultado = await memoria.instantanea(name, limit)
+    if resultado is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="tracemalloc no está activo. Use /memory/start"
+        )
+
+    return resultado
+
+
+@router.get("/memory/snapshots", response_model=dict)
+async def list_memory_snapshots(
+    limit: int = Query(20, ge=1, le=100),
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Comparaciones guardadas (operaciones e instantáneas manuales), más recientes primero
+
+    Requiere permisos de administrador
+    """
+    comparaciones = memoria.comparaciones(limit)
+    return {
+        "total": len(comparaciones),
+        "snapshots": comparaciones
+    }
+
+
+@router.get("/memory/snapshots/{snapshot_id}", response_model=dict)
+async def get_memory_snapshot(
+    snapshot_id: int,
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Detalle de una comparación: líneas que más memoria han reservado
+
+    Requiere permisos de administrador
+    """
+    comparacion = memoria.comparacion(snapshot_id)
+    if not comparacion:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Instantánea no encontrada"
+        )
+
+    return comparacion
+
+
+@router.get("/memory/rss", response_model=dict)
+async def get_rss_measurements(
+    operation: Optional[str] = Query(None, description="Operación (ej: app2.upload)"),
+    limit: int = Query(50, ge=1, le=500),
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Pico de RSS de las peticiones de subida, más recientes primero
+
+    Requiere permisos de administrador
+    """
+    mediciones = memoria.mediciones(operation, limit)
+    return {
+        "summary": memoria.resumen_mediciones(),
+        "total": len(mediciones),
+        "measurements": mediciones
+    }
+
+
+@router.post("/memory/clear", response_model=dict)
+async def clear_memory_diagnostics(
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Vacía las comparaciones y las mediciones de RSS guardadas
+
+    Requiere permisos de administrador
+    """
+    memoria.limpiar()
+    return {
+        "success": True,
+        "message": "Diagnóstico de memoria vaciado"
+    }
+
+
+@router.get("/startup", response_model=dict)
+async def get_startup_profile(
+    limit: int = Query(20, ge=1, le=100),
+    current_user: Employee = Depends(require_admin)
+):
+    """
+    Perfil de importación del arranque (python -X importtime en un proceso nuevo)
+
+    - worker: lo que tardó este worker en importar la aplicación y qué
+      dependencias pesadas ha cargado desde entonces (en el primer uso)
+    - cold_start: tiempo por paquete y por módulo de la aplicación de un
+      arranque en frío; tarda unos segundos
+
+    Requiere permisos de administrador
+    """
+    try:
+        return {
+            "worker": import_profile.estado_worker(),
+            "cold_start": await asyncio.to_thread(import_profile.perfilar, "main", limit)
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error perfilando el arranque: {str(e)}"
+        )
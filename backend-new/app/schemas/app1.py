@@ -353,3 +353,24 @@ class SendNotificationResponse(BaseModel):
                 "errors": None
             }
         }
+
+
+class BatchScanRequest(BaseModel):
+    """Schema para escaneo en lote de múltiples códigos (QR/Barcode)"""
+    codes: List[str] = Field(
+        ...,
+        description="Lista de códigos escaneados (IMEI, ICCID, cartón, palet, lote o EST912)",
+        min_items=1
+    )
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "codes": [
+                    "9912345678901234567890123",
+                    "9912345678901234567890124",
+                    "T1234567890123",
+                    "123456789012345"
+                ]
+            }
+        }
@@ -0,0 +1,60 @@
+"""
+OSE Platform - App 6 Schemas
+Schemas para App 6: Picking & Etiquetado
+"""
+
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+
+class RelocationSource(BaseModel):
+    """
+    Origen de una reubicación: exactamente uno de los tres campos
+    """
+    imeis: Optional[List[str]] = Field(
+        None,
+        description="Lista de IMEIs a mover"
+    )
+    carton_id: Optional[str] = Field(
+        None,
+        description="Cartón completo a mover"
+    )
+    pallet_id: Optional[str] = Field(
+        None,
+        description="Pallet completo a mover"
+    )
+
+
+class RelocationTarget(BaseModel):
+    """
+    Destino de una reubicación: cartón, pallet o ambos
+
+    Si solo se indica el cartón, el pallet se toma del cartón existente.
+    """
+    carton_id: Optional[str] = Field(
+        None,
+        description="Cartón destino"
+    )
+    pallet_id: Optional[str] = Field(
+        None,
+        description="Pallet destino"
+    )
+
+
+class RelocationRequest(BaseModel):
+    """Schema para reubicar dispositivos entre cartones y pallets"""
+    source: RelocationSource
+    target: RelocationTarget
+    notas: Optional[str] = Field(
+        None,
+        description="Observaciones del movimiento"
+    )
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "source": {"carton_id": "9912182510100007931700674"},
+                "target": {"pallet_id": "T9121800079317018"},
+                "notas": "Consolidación de envío"
+            }
+        }
@@ -0,0 +1,332 @@
+"""
+OSE Platform - Device Bulk Service
+Escrituras masivas de dispositivos con bulk_write
+
+Las escrituras con la colección cruda no pasan por los hooks de Beanie,
+así que este servicio mantiene también los índices auxiliares
+(scan_codes, filtro de existencia y caché de dispositivos).
+"""
+
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import logging
+
+from beanie.odm.utils.dump import get_dict
+from pymongo import UpdateOne
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Campos que se leen del estado previo de un dispositivo
+PROYECCION_ESTADO = {"_id": 1, "imei": 1, "ccid": 1, "carton_id": 1, "pallet_id": 1, "lote": 1}
+
+# Ubicación jerárquica de un dispositivo: (pallet_id, carton_id)
+Ubicacion = Tuple[Optional[str], Optional[str]]
+
+# Update de pipeline que deriva del propio documento del pallet carton_count
+# ($size de carton_ids) y devices_per_carton (device_count / carton_count)
+DERIVAR_CONTADORES_PALLET = [
+    {"$set": {"carton_count": {"$size": {"$ifNull": ["$carton_ids", []]}}}},
+    {"$set": {"devices_per_carton": {"$cond": [
+        {"$gt": ["$carton_count", 0]},
+        {"$toInt": {"$trunc": {"$divide": [{"$ifNull": ["$device_count", 0]}, "$carton_count"]}}},
+        0
+    ]}}}
+]
+
+
+def _trozos(items: List[Any], tamano: int) -> Iterable[List[Any]]:
+    for i in range(0, len(items), tamano):
+        yield items[i:i + tamano]
+
+
+class DeviceBulkService:
+    """Upserts masivos de dispositivos por IMEI"""
+
+    def valores_por_defecto(self, **valores) -> Dict[str, Any]:
+        """
+        Documento de un Device nuevo con los valores por defecto del modelo
+
+        Se usa como $setOnInsert para que los dispositivos creados por
+        bulk_write sean idénticos a los creados con Device.insert().
+        """
+        from app.models.device import Device
+
+        plantilla = Device(imei="0" * 15, **valores)
+        documento = get_dict(plantilla, to_db=True)
+        documento.pop("imei", None)
+        return documento
+
+    async def estado_previo(self, imeis: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Ubicación (palet/cartón) actual de los dispositivos, en una consulta"""
+        from app.models.device import Device
+
+        cursor = Device.get_motor_collection().find(
+            {"imei": {"$in": imeis}},
+            PROYECCION_ESTADO
+        )
+        return {doc["imei"]: doc async for doc in cursor}
+
+    async def upsert_por_imei(
+        self,
+        cambios: Dict[str, Dict[str, Any]],
+        valores_insercion: Dict[str, Any],
+        chunk_size: int = None
+    ) -> Tuple[int, int, Dict[str, Dict[str, Any]]]:
+        """
+        Upsert masivo de dispositivos en bloques de bulk_write
+
+        Args:
+            cambios: IMEI → campos a establecer ($set, con nombres de MongoDB)
+            valores_insercion: Valores por defecto solo para dispositivos nuevos
+            chunk_size: Operaciones por bulk_write
+
+        Returns:
+            (creados, actualizados, estado previo por IMEI de los existentes)
+        """
+        from app.models.device import Device
+
+        chunk_size = chunk_size or settings.IMPORT_BULK_CHUNK_SIZE
+        coleccion = Device.get_motor_collection()
+        ahora = datetime.utcnow()
+
+        creados = 0
+        actualizados = 0
+        previos: Dict[str, Dict[str, Any]] = {}
+
+        for imeis in _trozos(list(cambios.keys()), chunk_size):
+            previos.update(await self.estado_previo(imeis))
+
+            operaciones = []
+            for imei in imeis:
+                campos = dict(cambios[imei])
+                campos["fecha_actualizacion"] = ahora
+                en_insercion = {
+                    k: v for k, v in valores_insercion.items()
+                    if k not in campos
+                }
+                operaciones.append(UpdateOne(
+                    {"imei": imei},
+                    {"$set": campos, "$setOnInsert": en_insercion},
+                    upsert=True
+                ))
+
+            resultado = await coleccion.bulk_write(operaciones, ordered=False)
+            creados += resultado.upserted_count
+            actualizados += resultado.matched_count
+
+            await self.sincronizar_auxiliares(imeis, previos)
+
+        return creados, actualizados, previos
+
+    async def sincronizar_auxiliares(
+        self,
+        imeis: List[str],
+        previos: Dict[str, Dict[str, Any]] = None
+    ):
+        """
+        Equivalente masivo de los hooks after_event de Device
+
+        Registra los códigos en scan_codes (y poda los cartones/pallets que
+        se han quedado vacíos), añade IMEI/ICCID al filtro de existencia e
+        invalida la caché (cartón nuevo y anterior).
+        """
+        from app.models.device import Device
+        from app.models.scan_code import ScanCode
+        from app.services.device_cache_service import device_cache
+        from app.services.device_filter_service import device_filter
+
+        previos = previos or {}
+
+        cursor = Device.get_motor_collection().find(
+            {"imei": {"$in": imeis}},
+            PROYECCION_ESTADO
+        )
+        docs = [doc async for doc in cursor]
+
+        cartones = set()
+        cartones_anteriores = set()
+        pallets_anteriores = set()
+        for doc in docs:
+            device_filter.registrar(doc.get("imei"), doc.get("ccid"))
+            if doc.get("carton_id"):
+                cartones.add(doc["carton_id"])
+            previo = previos.get(doc["imei"], {})
+            if previo.get("carton_id") and previo["carton_id"] != doc.get("carton_id"):
+                cartones_anteriores.add(previo["carton_id"])
+            if previo.get("pallet_id") and previo["pallet_id"] != doc.get("pallet_id"):
+                pallets_anteriores.add(previo["pallet_id"])
+
+        try:
+            await ScanCode.registrar_dispositivos(docs)
+            await ScanCode.podar_agrupaciones(cartones_anteriores, pallets_anteriores)
+        except Exception as e:
+            logger.error(f"Error registrando códigos escaneables en bloque: {e}")
+
+        cartones |= cartones_anteriores
+
+        device_cache.invalidar_dispositivos(imeis=imeis, cartons=cartones)
+
+    # ════════════════════════════════════════════════════════════════════
+    # REUBICACIÓN Y CONTADORES DE PALLETS
+    # ════════════════════════════════════════════════════════════════════
+
+    async def reubicar(
+        self,
+        filtro: Dict[str, Any],
+        destino: Dict[str, Any]
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Mueve a un cartón/pallet todos los dispositivos que cumplen un filtro
+
+        Args:
+            filtro: Filtro MongoDB del origen (nombres de MongoDB)
+            destino: Campos destino: "carton_id" y/o "pallet_id"
+
+        Returns:
+            (estado previo de los dispositivos movidos, pallets actualizados)
+        """
+        from app.models.device import Device
+
+        coleccion = Device.get_motor_collection()
+
+        # Solo los que cambian realmente de ubicación
+        docs = [
+            doc async for doc in coleccion.find(filtro, PROYECCION_ESTADO)
+            if any(doc.get(campo) != valor for campo, valor in destino.items())
+        ]
+        if not docs:
+            return [], 0
+
+        await coleccion.update_many(
+            {"_id": {"$in": [doc["_id"] for doc in docs]}},
+            {"$set": {**destino, "fecha_actualizacion": datetime.utcnow()}}
+        )
+
+        traslados = [
+            (
+                (doc.get("pallet_id"), doc.get("carton_id")),
+                (destino.get("pallet_id", doc.get("pallet_id")), destino.get("carton_id", doc.get("carton_id")))
+            )
+            for doc in docs
+        ]
+        pallets_actualizados = await self.ajustar_contadores_pallets(traslados)
+
+        await self.sincronizar_auxiliares(
+            [doc["imei"] for doc in docs],
+            {doc["imei"]: doc for doc in docs}
+        )
+
+        return docs, pallets_actualizados
+
+    async def _contar_por_pallet_carton(self, pares: Set[Ubicacion]) -> Dict[Ubicacion, int]:
+        """Dispositivos actuales de cada par (pallet, cartón), en una agregación"""
+        from app.models.device import Device
+
+        if not pares:
+            return {}
+
+        cursor = Device.get_motor_collection().aggregate([
+            {"$match": {
+                "pallet_id": {"$in": list({pallet for pallet, _ in pares})},
+                "carton_id": {"$in": list({carton for _, carton in pares})}
+            }},
+            {"$group": {
+                "_id": {"pallet_id": "$pallet_id", "carton_id": "$carton_id"},
+                "n": {"$sum": 1}
+            }}
+        ])
+
+        return {
+            (doc["_id"]["pallet_id"], doc["_id"]["carton_id"]): doc["n"]
+            async for doc in cursor
+        }
+
+    async def ajustar_contadores_pallets(
+        self,
+        traslados: Iterable[Tuple[Ubicacion, Ubicacion]]
+    ) -> int:
+        """
+        Ajusta carton_ids, carton_count, device_count y devices_per_carton de
+        los pallets afectados por traslados de dispositivos ya escritos en MongoDB
+
+        Cada traslado es ((pallet, cartón) anterior, (pallet, cartón) nuevo);
+        la ubicación anterior de un dispositivo nuevo es (None, None).
+
+        - device_count: $inc con el delta (conmutativo entre escritores)
+        - carton_ids: $addToSet de todo cartón que recibe dispositivos
+          (idempotente, sin consultar el estado) y $pull de los cartones que
+          se han quedado sin dispositivos en el pallet
+        - carton_count: $size de carton_ids con un update de pipeline, después
+          de los cambios de carton_ids (nunca con $inc, que deriva si dos
+          escritores deciden lo mismo a la vez)
+        - devices_per_carton: en el mismo pipeline, device_count / carton_count
+          (entero; 0 sin cartones), como lo calcula la importación jerárquica
+
+        Returns:
+            Número de pallets actualizados
+        """
+        from app.models.pallet import Pallet
+
+        entradas: Counter = Counter()
+        salidas: Counter = Counter()
+        for antes, despues in traslados:
+            if antes != despues:
+                salidas[antes] += 1
+                entradas[despues] += 1
+
+        dispositivos: Dict[str, int] = defaultdict(int)
+        for (pallet, _), n in salidas.items():
+            if pallet:
+                dispositivos[pallet] -= n
+        for (pallet, _), n in entradas.items():
+            if pallet:
+                dispositivos[pallet] += n
+
+        altas: Dict[str, Set[str]] = defaultdict(set)
+        for pallet, carton in entradas:
+            if pallet and carton:
+                altas[pallet].add(carton)
+
+        # Un cartón sale del pallet si ya no le queda ningún dispositivo en él
+        pares_salida = {
+            par for par in salidas
+            if par[0] and par[1] and par[1] not in altas.get(par[0], ())
+        }
+        actuales = await self._contar_por_pallet_carton(pares_salida)
+        bajas: Dict[str, Set[str]] = defaultdict(set)
+        for pallet, carton in pares_salida:
+            if not actuales.get((pallet, carton)):
+                bajas[pallet].add(carton)
+
+        ahora = datetime.utcnow()
+        pallets = {p for p, n in dispositivos.items() if n} | set(altas) | set(bajas)
+        operaciones = []
+
+        for pallet in pallets:
+            actualizacion: Dict[str, Any] = {"$set": {"fecha_modificacion": ahora}}
+            if dispositivos.get(pallet):
+                actualizacion["$inc"] = {"device_count": dispositivos[pallet]}
+            if altas.get(pallet):
+                actualizacion["$addToSet"] = {"carton_ids": {"$each": sorted(altas[pallet])}}
+            operaciones.append(UpdateOne({"pallet_id": pallet}, actualizacion))
+
+            # $pull y $addToSet sobre el mismo campo no pueden ir en la misma operación
+            if bajas.get(pallet):
+                operaciones.append(UpdateOne(
+                    {"pallet_id": pallet},
+                    {"$pull": {"carton_ids": {"$in": sorted(bajas[pallet])}}}
+                ))
+
+            operaciones.append(UpdateOne({"pallet_id": pallet}, DERIVAR_CONTADORES_PALLET))
+
+        if operaciones:
+            await Pallet.get_motor_collection().bulk_write(operaciones, ordered=True)
+
+        return len(pallets)
+
+
+# Singleton instance
+device_bulk_service = DeviceBulkService()
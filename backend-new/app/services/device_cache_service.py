@@ -0,0 +1,192 @@
+"""
+OSE Platform - Device Cache Service
+Caché LRU con TTL (por worker) de dispositivos consultados repetidamente
+durante las sesiones de picking y notificación
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional
+import time
+import logging
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    Caché LRU acotada en tamaño y con caducidad por entrada
+
+    No es thread-safe: está pensada para usarse desde el event loop.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._datos: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, clave: Hashable) -> Optional[Any]:
+        entrada = self._datos.get(clave)
+
+        if entrada is None:
+            self.misses += 1
+            return None
+
+        expira, valor = entrada
+        if expira < time.monotonic():
+            del self._datos[clave]
+            self.misses += 1
+            return None
+
+        self._datos.move_to_end(clave)
+        self.hits += 1
+        return valor
+
+    def set(self, clave: Hashable, valor: Any):
+        self._datos[clave] = (time.monotonic() + self.ttl, valor)
+        self._datos.move_to_end(clave)
+
+        while len(self._datos) > self.maxsize:
+            self._datos.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, clave: Hashable) -> Optional[Any]:
+        entrada = self._datos.pop(clave, None)
+        return entrada[1] if entrada else None
+
+    def clear(self):
+        self._datos.clear()
+
+    def __len__(self) -> int:
+        return len(self._datos)
+
+    def __contains__(self, clave: Hashable) -> bool:
+        return clave in self._datos
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._datos),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+
+class DeviceCacheService:
+    """
+    Caché de dispositivos por IMEI y de vistas proyectadas por cartón
+
+    - Por IMEI: documento Device completo (se entrega siempre una copia)
+    - Por cartón: lista de DeviceScanView (solo los campos de escaneo)
+
+    La invalidación es write-through desde los hooks de Device y desde las
+    rutas de escritura masiva. Las escrituras de otros workers se reflejan
+    al caducar el TTL (DEVICE_CACHE_TTL).
+    """
+
+    def __init__(self):
+        self.por_imei = LRUCache(settings.DEVICE_CACHE_MAX_DEVICES, settings.DEVICE_CACHE_TTL)
+        self.por_carton = LRUCache(settings.DEVICE_CACHE_MAX_CARTONS, settings.DEVICE_CACHE_TTL)
+
+        # IMEI → cartón cacheado que lo contiene (para invalidar al moverlo)
+        self._carton_de_imei: Dict[str, str] = {}
+
+        # Se incrementa con cada invalidación: una lectura de MongoDB iniciada
+        # antes de una escritura no debe volver a poblar la caché con datos viejos
+        self.generacion = 0
+
+    @property
+    def activo(self) -> bool:
+        return settings.DEVICE_CACHE_ENABLED
+
+    # ════════════════════════════════════════════════════════════════════
+    # LECTURA / ESCRITURA
+    # ════════════════════════════════════════════════════════════════════
+
+    def obtener_dispositivo(self, imei: str):
+        """Device cacheado (copia) o None"""
+        if not self.activo:
+            return None
+
+        device = self.por_imei.get(imei)
+        return device.model_copy(deep=True) if device is not None else None
+
+    def guardar_dispositivo(self, device, generacion: int):
+        if not self.activo or device is None or generacion != self.generacion:
+            return
+
+        self.por_imei.set(device.imei, device.model_copy(deep=True))
+
+    def obtener_carton(self, carton_id: str) -> Optional[List[Any]]:
+        """Vistas cacheadas del cartón o None"""
+        if not self.activo:
+            return None
+
+        return self.por_carton.get(carton_id)
+
+    def guardar_carton(self, carton_id: str, vistas: List[Any], generacion: int):
+        if not self.activo or not vistas or generacion != self.generacion:
+            return
+
+        self.por_carton.set(carton_id, vistas)
+        for vista in vistas:
+            self._carton_de_imei[vista.imei] = carton_id
+
+        # Evitar que el índice inverso crezca sin límite con cartones expulsados
+        if len(self._carton_de_imei) > settings.DEVICE_CACHE_MAX_CARTONS * 100:
+            self._carton_de_imei = {
+                imei: carton for imei, carton in self._carton_de_imei.items()
+                if carton in self.por_carton
+            }
+
+    # ════════════════════════════════════════════════════════════════════
+    # INVALIDACIÓN
+    # ════════════════════════════════════════════════════════════════════
+
+    def invalidar(self, imei: Optional[str] = None, carton_id: Optional[str] = None):
+        """Invalida un dispositivo, su cartón actual y el cartón donde estaba cacheado"""
+        self.generacion += 1
+        if imei:
+            self.por_imei.pop(imei)
+            carton_anterior = self._carton_de_imei.pop(imei, None)
+            if carton_anterior:
+                self.por_carton.pop(carton_anterior)
+        if carton_id:
+            self.por_carton.pop(carton_id)
+
+    def invalidar_dispositivos(
+        self,
+        imeis: Iterable[str] = (),
+        cartons: Iterable[str] = ()
+    ):
+        """Invalidación para escrituras masivas (bulk_write / update_many)"""
+        for imei in imeis:
+            self.invalidar(imei=imei)
+        for carton_id in cartons:
+            self.invalidar(carton_id=carton_id)
+
+    def invalidar_todo(self):
+        """Vacía la caché (escrituras masivas sin lista de IMEIs)"""
+        self.generacion += 1
+        self.por_imei.clear()
+        self.por_carton.clear()
+        self._carton_de_imei.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.activo,
+            "by_imei": self.por_imei.stats(),
+            "by_carton": self.por_carton.stats()
+        }
+
+
+# Singleton instance
+device_cache = DeviceCacheService()
@@ -0,0 +1,325 @@
+"""
+OSE Platform - Device Filter Service
+Filtro de Bloom en memoria (por worker) con los IMEI/ICCID conocidos
+Permite responder "no existe" sin consultar MongoDB
+"""
+
+from datetime import datetime, timedelta, date
+from typing import Any, Dict, Optional
+import asyncio
+import hashlib
+import logging
+import math
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    Filtro de Bloom sobre un bytearray
+
+    Usa doble hashing (Kirsch-Mitzenmacher) a partir de un único blake2b
+    de 128 bits, así que cada alta/consulta calcula un solo hash.
+    """
+
+    def __init__(self, capacidad: int, tasa_fp: float):
+        capacidad = max(capacidad, 1)
+        self.capacidad = capacidad
+        self.tasa_fp = tasa_fp
+
+        # m = -n·ln(p) / ln(2)²   ·   k = (m/n)·ln(2)
+        self.num_bits = max(8, int(math.ceil(-capacidad * math.log(tasa_fp) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / capacidad * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.elementos = 0
+
+    def _posiciones(self, valor: str):
+        digest = hashlib.blake2b(valor.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, valor: str):
+        """Añade un valor; solo cuenta como elemento nuevo si cambia algún bit"""
+        nuevo = False
+        for pos in self._posiciones(valor):
+            mascara = 1 << (pos & 7)
+            if not self.bits[pos >> 3] & mascara:
+                self.bits[pos >> 3] |= mascara
+                nuevo = True
+        if nuevo:
+            self.elementos += 1
+
+    def __contains__(self, valor: str) -> bool:
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._posiciones(valor))
+
+    @property
+    def tasa_fp_estimada(self) -> float:
+        """Tasa de falsos positivos teórica según los elementos insertados"""
+        return (1 - math.exp(-self.num_hashes * self.elementos / self.num_bits)) ** self.num_hashes
+
+    @property
+    def saturado(self) -> bool:
+        return self.elementos > self.capacidad
+
+
+class DeviceFilterService:
+    """
+    Filtro de existencia de dispositivos por worker
+
+    - Se construye al arrancar desde un cursor proyectado sobre devices
+    - Se actualiza al instante con las escrituras de este worker (hook de Device)
+      y de forma incremental con las de otros workers a través de scan_codes
+    - Un "no" es definitivo; un "sí" requiere confirmar en MongoDB
+    - Solo para consultas de lectura: entre sincronizaciones un IMEI dado de
+      alta por otro worker aún no está en el filtro, así que las escrituras
+      (importaciones, notificaciones) consultan siempre MongoDB
+    """
+
+    PREFIJO_IMEI = "imei:"
+    PREFIJO_CCID = "ccid:"
+
+    # Margen para desfases de reloj entre workers en la sincronización incremental
+    MARGEN_SINCRONIZACION = timedelta(seconds=60)
+
+    def __init__(self):
+        self._filtro: Optional[BloomFilter] = None
+        self._filtro_en_construccion: Optional[BloomFilter] = None
+        self._ultima_sincronizacion: Optional[datetime] = None
+        self._ultima_comprobacion = 0.0
+        self._lock = asyncio.Lock()
+        self._tarea: Optional[asyncio.Task] = None
+        self._reconstruyendo = False
+
+        # Contadores para la tasa real de falsos positivos
+        self.consultas = 0
+        self.descartes = 0
+        self.positivos_confirmados = 0
+        self.falsos_positivos = 0
+
+    @property
+    def listo(self) -> bool:
+        return self._filtro is not None
+
+    # ════════════════════════════════════════════════════════════════════
+    # CONSTRUCCIÓN Y SINCRONIZACIÓN
+    # ════════════════════════════════════════════════════════════════════
+
+    async def construir(self):
+        """Construye el filtro completo desde la colección devices"""
+        from app.models.device import Device
+
+        inicio = datetime.utcnow()
+        coleccion = Device.get_motor_collection()
+
+        total = await coleccion.estimated_document_count()
+        capacidad = max(int(total * settings.DEVICE_FILTER_GROWTH) * 2, settings.DEVICE_FILTER_MIN_CAPACITY)
+        filtro = BloomFilter(capacidad, settings.DEVICE_FILTER_FP_RATE)
+
+        # Las altas locales durante la construcción van también al nuevo filtro
+        self._filtro_en_construccion = filtro
+
+        cursor = coleccion.find(
+            {},
+            {"_id": 0, "imei": 1, "ccid": 1},
+            batch_size=settings.EXPORT_CURSOR_BATCH_SIZE
+        )
+
+        try:
+            leidos = 0
+            async for doc in cursor:
+                self._agregar(filtro, doc.get("imei"), doc.get("ccid"))
+                leidos += 1
+                # Ceder el event loop periódicamente en colecciones grandes
+                if leidos % 10000 == 0:
+                    await asyncio.sleep(0)
+        finally:
+            self._filtro_en_construccion = None
+
+        await self._sincronizar_desde(filtro, inicio - self.MARGEN_SINCRONIZACION)
+
+        self._filtro = filtro
+        self._ultima_sincronizacion = inicio
+
+        logger.info(
+            f"✓ Filtro de dispositivos construido: {filtro.elementos} códigos, "
+            f"{len(filtro.bits) / 1024 / 1024:.2f} MB, "
+            f"FP estimado {filtro.tasa_fp_estimada:.4%}"
+        )
+
+    async def _sincronizar_desde(self, filtro: BloomFilter, desde: datetime):
+        """Añade los IMEI/ICCID registrados en scan_codes desde una fecha"""
+        from app.models.scan_code import ScanCode, ScanCodeType
+
+        cursor = ScanCode.get_motor_collection().find(
+            {
+                "code_type": {"$in": [ScanCodeType.IMEI.value, ScanCodeType.ICCID.value]},
+                "fecha_actualizacion": {"$gte": desde}
+            },
+            {"_id": 0, "code": 1, "code_type": 1}
+        )
+
+        async for doc in cursor:
+            prefijo = self.PREFIJO_IMEI if doc["code_type"] == ScanCodeType.IMEI.value else self.PREFIJO_CCID
+            filtro.add(prefijo + doc["code"])
+
+    async def sincronizar(self, forzar: bool = False):
+        """
+        Sincronización incremental con las escrituras de otros workers
+
+        Limitada a una cada DEVICE_FILTER_SYNC_INTERVAL segundos.
+        """
+        if not self.listo:
+            return
+
+        loop = asyncio.get_running_loop()
+        if not forzar and loop.time() - self._ultima_comprobacion < settings.DEVICE_FILTER_SYNC_INTERVAL:
+            return
+
+        async with self._lock:
+            if not forzar and loop.time() - self._ultima_comprobacion < settings.DEVICE_FILTER_SYNC_INTERVAL:
+                return
+
+            ahora = datetime.utcnow()
+            await self._sincronizar_desde(self._filtro, self._ultima_sincronizacion - self.MARGEN_SINCRONIZACION)
+            self._ultima_sincronizacion = ahora
+            self._ultima_comprobacion = loop.time()
+
+        # Reconstruir con más capacidad si se ha superado la prevista
+        if self._filtro.saturado and not self._reconstruyendo:
+            logger.info("Filtro de dispositivos saturado, reconstruyendo")
+            self._reconstruyendo = True
+            asyncio.create_task(self._reconstruir())
+
+    async def _reconstruir(self):
+        try:
+            await self.construir()
+        except Exception as e:
+            logger.error(f"Error reconstruyendo filtro de dispositivos: {e}")
+        finally:
+            self._reconstruyendo = False
+
+    def _agregar(self, filtro: BloomFilter, imei: Optional[str], ccid: Optional[str]):
+        if imei:
+            filtro.add(self.PREFIJO_IMEI + str(imei).strip())
+        if ccid:
+            filtro.add(self.PREFIJO_CCID + str(ccid).strip())
+
+    def registrar(self, imei: Optional[str] = None, ccid: Optional[str] = None):
+        """Registra un dispositivo escrito en este worker"""
+        for filtro in (self._filtro, self._filtro_en_construccion):
+            if filtro is not None:
+                self._agregar(filtro, imei, ccid)
+
+    # ════════════════════════════════════════════════════════════════════
+    # CONSULTAS
+    # ════════════════════════════════════════════════════════════════════
+
+    async def _puede_existir(self, valor: str) -> bool:
+        if not settings.DEVICE_FILTER_ENABLED or not self.listo:
+            return True
+
+        await self.sincronizar()
+
+        self.consultas += 1
+        if valor in self._filtro:
+            return True
+
+        self.descartes += 1
+        return False
+
+    async def puede_existir_imei(self, imei: str) -> bool:
+        """False si el IMEI seguro que no existe (sin consultar MongoDB)"""
+        return await self._puede_existir(self.PREFIJO_IMEI + imei.strip())
+
+    async def puede_existir_ccid(self, ccid: str) -> bool:
+        """False si el ICCID seguro que no existe (sin consultar MongoDB)"""
+        return await self._puede_existir(self.PREFIJO_CCID + ccid.strip())
+
+    def confirmar(self, existe: bool):
+        """Registra el resultado de MongoDB tras un positivo del filtro"""
+        if not self.listo:
+            return
+        if existe:
+            self.positivos_confirmados += 1
+        else:
+            self.falsos_positivos += 1
+
+    # ════════════════════════════════════════════════════════════════════
+    # MÉTRICAS
+    # ════════════════════════════════════════════════════════════════════
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado y contadores del filtro"""
+        positivos = self.positivos_confirmados + self.falsos_positivos
+        filtro = self._filtro
+
+        return {
+            "enabled": settings.DEVICE_FILTER_ENABLED,
+            "ready": self.listo,
+            "elements": filtro.elementos if filtro else 0,
+            "capacity": filtro.capacidad if filtro else 0,
+            "size_bytes": len(filtro.bits) if filtro else 0,
+            "hashes": filtro.num_hashes if filtro else 0,
+            "lookups": self.consultas,
+            "definite_misses": self.descartes,
+            "false_positives": self.falsos_positivos,
+            "false_positive_rate": self.falsos_positivos / positivos if positivos else 0.0,
+            "estimated_false_positive_rate": filtro.tasa_fp_estimada if filtro else 0.0
+        }
+
+    async def registrar_metricas(self):
+        """Guarda la tasa de falsos positivos observada en la colección metrics"""
+        from app.models.metric import Metric, MetricType, MetricPeriod
+
+        stats = self.stats()
+        await Metric.record_metric(
+            metric_type=MetricType.CUSTOM,
+            metric_name="device_filter_false_positive_rate",
+            value=stats["false_positive_rate"],
+            date_value=date.today(),
+            period=MetricPeriod.DAILY,
+            unit="ratio",
+            data=stats
+        )
+
+    # ════════════════════════════════════════════════════════════════════
+    # CICLO DE VIDA
+    # ════════════════════════════════════════════════════════════════════
+
+    async def _ejecutar(self):
+        try:
+            await self.construir()
+        except Exception as e:
+            logger.error(f"Error construyendo filtro de dispositivos: {e}")
+            return
+
+        while True:
+            await asyncio.sleep(settings.DEVICE_FILTER_METRIC_INTERVAL)
+            try:
+                await self.sincronizar(forzar=True)
+                await self.registrar_metricas()
+            except Exception as e:
+                logger.error(f"Error actualizando filtro de dispositivos: {e}")
+
+    def iniciar(self):
+        """Construye el filtro en segundo plano (las consultas van a MongoDB hasta que esté listo)"""
+        if settings.DEVICE_FILTER_ENABLED and self._tarea is None:
+            self._tarea = asyncio.create_task(self._ejecutar())
+
+    async def detener(self):
+        if self._tarea:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+
+# Singleton instance
+device_filter = DeviceFilterService()
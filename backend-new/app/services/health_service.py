@@ -0,0 +1,256 @@
+"""
+OSE Platform - Health Service
+Estado de salud del worker calculado en segundo plano
+
+Una tarea comprueba cada HEALTH_PROBE_INTERVAL segundos las dependencias
+y deja el resultado en caché; /health/ready y /health solo leen esa caché,
+así los balanceadores pueden consultarlos cada pocos segundos sin coste.
+
+Comprobaciones:
+- mongodb: ping y su latencia (crítica: sin ella el worker no está listo)
+- mongo_pool: saturación del pool de conexiones (app.services.mongo_pool_service)
+- smtp: el servidor SMTP acepta conexiones TCP (sin autenticarse)
+- disk: espacio libre en UPLOAD_DIR (crítica por debajo de HEALTH_MIN_FREE_DISK_MB)
+- queues: trabajos de importación pendientes y colas de impresión
+
+dbStats solo se ejecuta bajo demanda en /health/details (admin).
+"""
+
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+import shutil
+import time
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+OK = "ok"
+DEGRADADO = "degraded"
+FALLO = "fail"
+
+# Comprobaciones cuyo fallo deja al worker no listo
+CRITICAS = ("mongodb", "disk")
+
+
+def _resultado(estado: str, inicio: float, **detalle) -> Dict[str, Any]:
+    return {
+        "status": estado,
+        "latency_ms": round((time.perf_counter() - inicio) * 1000, 2),
+        "checked_at": datetime.utcnow().isoformat(),
+        **detalle
+    }
+
+
+class HealthService:
+    """Comprobaciones de salud periódicas con resultado en caché"""
+
+    def __init__(self):
+        self._tarea: Optional[asyncio.Task] = None
+        self._resultados: Dict[str, Dict[str, Any]] = {}
+        self._ultima: Optional[float] = None
+        self._arranque = time.time()
+
+    # ════════════════════════════════════════════════════════════════════
+    # COMPROBACIONES
+    # ════════════════════════════════════════════════════════════════════
+
+    async def _mongodb(self) -> Dict[str, Any]:
+        from app.database import Database
+
+        inicio = time.perf_counter()
+        if not Database.client:
+            return _resultado(FALLO, inicio, error="Sin conexión a MongoDB")
+        try:
+            await asyncio.wait_for(
+                Database.client.admin.command("ping"),
+                timeout=settings.HEALTH_CHECK_TIMEOUT
+            )
+        except Exception as e:
+            return _resultado(FALLO, inicio, error=str(e) or type(e).__name__)
+
+        resultado = _resultado(OK, inicio)
+        if resultado["latency_ms"] >= settings.HEALTH_SLOW_PING_MS:
+            resultado["status"] = DEGRADADO
+        return resultado
+
+    async def _mongo_pool(self) -> Dict[str, Any]:
+        inicio = time.perf_counter()
+        if not settings.MONGO_POOL_MONITORING:
+            return _resultado(OK, inicio, enabled=False)
+
+        from app.services.mongo_pool_service import mongo_pool
+
+        pool = mongo_pool.resumen()
+        return _resultado(DEGRADADO if pool["saturated"] else OK, inicio, **pool)
+
+    async def _smtp(self) -> Dict[str, Any]:
+        inicio = time.perf_counter()
+        if not settings.SMTP_ENABLED:
+            return _resultado(OK, inicio, enabled=False)
+        try:
+            _, escritor = await asyncio.wait_for(
+                asyncio.open_connection(settings.SMTP_HOST, settings.SMTP_PORT),
+                timeout=settings.HEALTH_CHECK_TIMEOUT
+            )
+            escritor.close()
+            await escritor.wait_closed()
+        except Exception as e:
+            # Sin SMTP solo fallan los emails: el worker sigue atendiendo
+            return _resultado(DEGRADADO, inicio, host=settings.SMTP_HOST, error=str(e) or type(e).__name__)
+        return _resultado(OK, inicio, host=settings.SMTP_HOST)
+
+    async def _disco(self) -> Dict[str, Any]:
+        inicio = time.perf_counter()
+        directorio = Path(settings.UPLOAD_DIR)
+        try:
+            await asyncio.to_thread(directorio.mkdir, parents=True, exist_ok=True)
+            uso = await asyncio.to_thread(shutil.disk_usage, directorio)
+        except OSError as e:
+            return _resultado(FALLO, inicio, path=str(directorio), error=str(e))
+
+        libre_mb = uso.free / 1024 / 1024
+        if libre_mb < settings.HEALTH_MIN_FREE_DISK_MB:
+            estado = FALLO
+        elif libre_mb < settings.HEALTH_MIN_FREE_DISK_MB * 4:
+            estado = DEGRADADO
+        else:
+            estado = OK
+        return _resultado(
+            estado, inicio,
+            path=str(directorio),
+            free_mb=round(libre_mb, 1),
+            used_percent=round(uso.used / uso.total * 100, 1) if uso.total else None
+        )
+
+    async def _colas(self) -> Dict[str, Any]:
+        from app.models.import_job import ImportJob, JobStatus
+        from app.services.print_spooler_service import print_spooler
+
+        inicio = time.perf_counter()
+        impresion = {
+            nombre: cola["queued"]
+            for nombre, cola in print_spooler.stats().items()
+        }
+        try:
+            importaciones = await asyncio.wait_for(
+                ImportJob.find({"status": {"$in": [JobStatus.PENDING.value, JobStatus.PROCESSING.value]}}).count(),
+                timeout=settings.HEALTH_CHECK_TIMEOUT
+            )
+        except Exception as e:
+            return _resultado(DEGRADADO, inicio, print_queues=impresion, error=str(e) or type(e).__name__)
+
+        return _resultado(OK, inicio, import_jobs_pending=importaciones, print_queues=impresion)
+
+    async def comprobar(self) -> Dict[str, Dict[str, Any]]:
+        """Ejecuta todas las comprobaciones a la vez y actualiza la caché"""
+        nombres = ("mongodb", "mongo_pool", "smtp", "disk", "queues")
+        resultados = await asyncio.gather(
+            self._mongodb(), self._mongo_pool(), self._smtp(), self._disco(), self._colas(),
+            return_exceptions=True
+        )
+        for nombre, resultado in zip(nombres, resultados):
+            if isinstance(resultado, BaseException):
+                resultado = {"status": FALLO, "error": str(resultado), "checked_at": datetime.utcnow().isoformat()}
+            anterior = self._resultados.get(nombre, {}).get("status")
+            if anterior and anterior != resultado["status"]:
+                logger.warning(f"Salud: {nombre} pasa de {anterior} a {resultado['status']}")
+            self._resultados[nombre] = resultado
+        self._ultima = time.time()
+        return self._resultados
+
+    # ════════════════════════════════════════════════════════════════════
+    # CONSULTA (solo caché)
+    # ════════════════════════════════════════════════════════════════════
+
+    def vivo(self) -> Dict[str, Any]:
+        """Liveness: el proceso responde (no depende de nada externo)"""
+        return {
+            "status": "alive",
+            "uptime_s": round(time.time() - self._arranque),
+            "version": settings.APP_VERSION
+        }
+
+    def listo(self) -> Dict[str, Any]:
+        """Readiness a partir de la última comprobación"""
+        edad = time.time() - self._ultima if self._ultima else None
+        obsoleto = edad is None or edad > settings.HEALTH_PROBE_INTERVAL * 3
+
+        fallos: List[str] = [
+            nombre for nombre in CRITICAS
+            if self._resultados.get(nombre, {}).get("status") == FALLO
+        ]
+        degradados = [
+            nombre for nombre, r in self._resultados.items()
+            if r.get("status") != OK and nombre not in fallos
+        ]
+
+        if obsoleto or fallos:
+            estado = "unhealthy"
+        elif degradados:
+            estado = "degraded"
+        else:
+            estado = "healthy"
+
+        return {
+            "status": estado,
+            "ready": not obsoleto and not fallos,
+            "checked_at": datetime.utcfromtimestamp(self._ultima).isoformat() if self._ultima else None,
+            "age_s": round(edad, 1) if edad is not None else None,
+            "failing": fallos,
+            "degraded": degradados,
+            "checks": self._resultados
+        }
+
+    def prometheus(self) -> List[str]:
+        """Colector para /metrics (1 = ok, 0.5 = degradado, 0 = fallo)"""
+        valores = {OK: 1, DEGRADADO: 0.5, FALLO: 0}
+        lineas = [
+            "# HELP health_check_status Resultado de la última comprobación de salud",
+            "# TYPE health_check_status gauge"
+        ]
+        for nombre, r in self._resultados.items():
+            lineas.append(f'health_check_status{{check="{nombre}"}} {valores.get(r.get("status"), 0)}')
+        lineas += [
+            "# HELP health_check_latency_seconds Duración de la última comprobación de salud",
+            "# TYPE health_check_latency_seconds gauge"
+        ]
+        for nombre, r in self._resultados.items():
+            if "latency_ms" in r:
+                lineas.append(f'health_check_latency_seconds{{check="{nombre}"}} {r["latency_ms"] / 1000}')
+        return lineas
+
+    # ════════════════════════════════════════════════════════════════════
+    # CICLO DE VIDA
+    # ════════════════════════════════════════════════════════════════════
+
+    async def _ejecutar(self):
+        while True:
+            await asyncio.sleep(settings.HEALTH_PROBE_INTERVAL)
+            try:
+                await self.comprobar()
+            except Exception as e:
+                logger.error(f"Error en las comprobaciones de salud: {e}")
+
+    async def iniciar(self):
+        """Primera comprobación (al arrancar) y tarea periódica"""
+        if self._tarea is not None:
+            return
+        await self.comprobar()
+        self._tarea = asyncio.create_task(self._ejecutar())
+
+    async def detener(self):
+        if self._tarea:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+
+# Singleton instance
+salud = HealthService()
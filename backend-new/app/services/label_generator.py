@@ -4,20 +4,50 @@ Genera etiquetas en PDF (folios A4) y ZPL (impresoras Zebra)
 """
 
 import io
-import barcode
-from barcode.writer import ImageWriter
-from typing import Dict, Any, List, Optional
+from functools import lru_cache
+from typing import Dict, Any, Iterable, Iterator, List, Optional
 from datetime import datetime
 import base64
 
-try:
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.units import mm
-    from reportlab.pdfgen import canvas
-    from reportlab.lib import colors
-    REPORTLAB_AVAILABLE = True
-except ImportError:
-    REPORTLAB_AVAILABLE = False
+# ReportLab y python-barcode se importan al generar el primer PDF o imagen:
+# las etiquetas ZPL no los necesitan. Unidades en puntos como en
+# reportlab.lib.units / reportlab.lib.pagesizes.
+mm = 72 / 25.4
+A4 = (210 * mm, 297 * mm)
+
+
+@lru_cache(maxsize=1024)
+def _code128_descompuesto(code: str) -> str:
+    """
+    Barras y espacios Code128 de ReportLab (atributo decomposed), cacheados por código
+
+    Se cachea solo la codificación, no el widget: un Flowable guarda el
+    canvas en self.canv mientras se dibuja, así que compartirlo entre
+    renders concurrentes del threadpool los rompe.
+    """
+    from reportlab.graphics.barcode.code128 import Code128
+
+    widget = Code128(code)
+    widget.validate()
+    widget.encode()
+    return widget.decompose()
+
+
+@lru_cache(maxsize=None)
+def _clase_code128():
+    """Code128 que toma la codificación de la caché (ReportLab se importa al primer uso)"""
+    from reportlab.graphics.barcode.code128 import Code128
+
+    class Code128Cacheado(Code128):
+        # Barcode._calculate codifica de nuevo en cada width, height y draw
+        def encode(self):
+            pass
+
+        def decompose(self):
+            self.decomposed = _code128_descompuesto(self.value)
+            return self.decomposed
+
+    return Code128Cacheado
 
 
 class LabelGenerator:
@@ -41,6 +71,9 @@ class LabelGenerator:
         Returns:
             bytes: Imagen PNG del código de barras
         """
+        import barcode
+        from barcode.writer import ImageWriter
+
         # Generar código de barras Code128
         code128 = barcode.get_barcode_class('code128')
         barcode_instance = code128(code, writer=ImageWriter())
@@ -60,37 +93,45 @@ class LabelGenerator:
         return buffer.read()
 
     @staticmethod
-    def generate_pdf_label(
-        delivery_note_data: Dict[str, Any],
-        labels_count: int = 1,
-        label_size: str = "A6"
-    ) -> bytes:
+    def draw_barcode(c, code: str, x: float, y: float, max_width: float, max_height: float):
         """
-        Genera etiquetas en PDF para impresión en folios A4
+        Dibuja un Code128 vectorial en el canvas, escalado para caber en la caja
 
         Args:
-            delivery_note_data: Datos del albarán
-            labels_count: Número de etiquetas a generar
-            label_size: Tamaño de etiqueta ("100x150", "100x100", "A6")
-
-        Returns:
-            bytes: PDF generado
+            c: Canvas de ReportLab
+            code: Código a codificar
+            x, y: Esquina inferior izquierda (puntos)
+            max_width, max_height: Caja disponible (puntos)
         """
-        if not REPORTLAB_AVAILABLE:
-            raise ImportError("reportlab no está instalado. Instalar con: pip install reportlab")
-
-        buffer = io.BytesIO()
-        c = canvas.Canvas(buffer, pagesize=A4)
-        page_width, page_height = A4
-
-        # Obtener tamaño de etiqueta
-        label_width, label_height = LabelGenerator.LABEL_SIZES.get(label_size, (105, 148))
-        label_width_pts = label_width * mm
-        label_height_pts = label_height * mm
+        # Widget nuevo por etiqueta: ReportLab dibuja barras y texto
+        widget = _clase_code128()(
+            code,
+            barWidth=0.3 * mm,
+            barHeight=15 * mm,
+            humanReadable=True,
+            fontSize=10
+        )
+        ancho, alto = widget.width, widget.height
+        escala = min(1.0, max_width / ancho) if ancho else 1.0
+
+        c.saveState()
+        c.translate(x + (max_width - ancho * escala) / 2, y)
+        c.scale(escala, min(1.0, max_height / alto) if alto else 1.0)
+        widget.drawOn(c, 0, 0)
+        c.restoreState()
 
-        # Calcular etiquetas por página (2x4 para A6 en A4)
-        labels_per_row = 2
-        labels_per_col = int(page_height / label_height_pts)
+    @staticmethod
+    def _draw_label(
+        c,
+        delivery_note_data: Dict[str, Any],
+        x: float,
+        y: float,
+        label_width_pts: float,
+        label_height_pts: float,
+        generado: str
+    ):
+        """Dibuja una etiqueta de albarán con su esquina inferior izquierda en (x, y)"""
+        from reportlab.lib import colors
 
         # Datos del albarán
         pallet_code = delivery_note_data.get("pallet_code", "")
@@ -102,90 +143,181 @@ class LabelGenerator:
         total_pallets = delivery_note_data.get("total_pallets_in_order", 1)
         order_number = delivery_note_data.get("order_number", "")
 
-        # Generar imagen de código de barras
-        barcode_img_data = LabelGenerator.generate_barcode_image(pallet_code)
+        c.saveState()
 
-        for label_idx in range(labels_count):
-            # Calcular posición de la etiqueta
-            col = label_idx % labels_per_row
-            row = (label_idx // labels_per_row) % labels_per_col
+        # Dibuja el título
+        c.setFont("Helvetica-Bold", 16)
+        c.drawString(x + 5*mm, y + label_height_pts - 10*mm, "OVERSUN ENERGY SL")
 
-            # Nueva página si es necesario
-            if label_idx > 0 and label_idx % (labels_per_row * labels_per_col) == 0:
-                c.showPage()
+        # Línea separadora
+        c.line(x + 5*mm, y + label_height_pts - 12*mm, x + label_width_pts - 5*mm, y + label_height_pts - 12*mm)
+
+        # Código de palet (grande y destacado)
+        c.setFont("Helvetica-Bold", 14)
+        c.drawString(x + 5*mm, y + label_height_pts - 20*mm, f"Código Palet:")
+        c.setFont("Helvetica", 12)
+        c.drawString(x + 5*mm, y + label_height_pts - 26*mm, pallet_code)
 
-            # Posición de la etiqueta
-            x = col * label_width_pts + 10 * mm
-            y = page_height - (row + 1) * label_height_pts
+        # Información del albarán
+        c.setFont("Helvetica", 9)
+        y_pos = y + label_height_pts - 35*mm
 
-            # Dibuja el título
-            c.setFont("Helvetica-Bold", 16)
-            c.drawString(x + 5*mm, y + label_height_pts - 10*mm, "OVERSUN ENERGY SL")
+        c.drawString(x + 5*mm, y_pos, f"Albarán: {delivery_note_number}")
+        y_pos -= 5*mm
 
-            # Línea separadora
-            c.line(x + 5*mm, y + label_height_pts - 12*mm, x + label_width_pts - 5*mm, y + label_height_pts - 12*mm)
+        if order_number:
+            c.drawString(x + 5*mm, y_pos, f"Pedido: {order_number}")
+            y_pos -= 5*mm
 
-            # Código de palet (grande y destacado)
-            c.setFont("Helvetica-Bold", 14)
-            c.drawString(x + 5*mm, y + label_height_pts - 20*mm, f"Código Palet:")
-            c.setFont("Helvetica", 12)
-            c.drawString(x + 5*mm, y + label_height_pts - 26*mm, pallet_code)
+        c.drawString(x + 5*mm, y_pos, f"Cliente: {customer_name[:40]}")
+        y_pos -= 5*mm
 
-            # Información del albarán
-            c.setFont("Helvetica", 9)
-            y_pos = y + label_height_pts - 35*mm
+        c.drawString(x + 5*mm, y_pos, f"Total Cajas: {total_boxes}")
+        y_pos -= 5*mm
 
-            c.drawString(x + 5*mm, y_pos, f"Albarán: {delivery_note_number}")
+        if product_description:
+            c.drawString(x + 5*mm, y_pos, f"Producto: {product_description[:35]}")
             y_pos -= 5*mm
 
-            if order_number:
-                c.drawString(x + 5*mm, y_pos, f"Pedido: {order_number}")
-                y_pos -= 5*mm
+        # Palet X/N
+        c.setFont("Helvetica-Bold", 11)
+        c.drawString(x + 5*mm, y_pos, f"Palet {pallet_number} de {total_pallets}")
+        y_pos -= 8*mm
 
-            c.drawString(x + 5*mm, y_pos, f"Cliente: {customer_name[:40]}")
-            y_pos -= 5*mm
+        # Código de barras (vectorial, codificación cacheada por código)
+        if pallet_code:
+            LabelGenerator.draw_barcode(c, pallet_code, x + 5*mm, y + 15*mm, label_width_pts - 10*mm, 20*mm)
 
-            c.drawString(x + 5*mm, y_pos, f"Total Cajas: {total_boxes}")
-            y_pos -= 5*mm
+        # Fecha de generación
+        c.setFont("Helvetica", 7)
+        c.drawString(x + 5*mm, y + 5*mm, f"Generado: {generado}")
+
+        # Borde de la etiqueta (para guía de corte)
+        c.setStrokeColor(colors.lightgrey)
+        c.setDash(2, 2)
+        c.rect(x, y, label_width_pts, label_height_pts)
+
+        c.restoreState()
+
+    @staticmethod
+    def _label_grid(label_size: str, layout: str):
+        """
+        Página y posiciones de las etiquetas según el formato
+
+        - "nup": etiquetas en rejilla sobre folios A4
+        - "page": una etiqueta por página, con la página del tamaño de la etiqueta
+
+        Returns:
+            (pagesize, ancho etiqueta, alto etiqueta, posiciones (x, y) en cada página)
+        """
+        label_width, label_height = LabelGenerator.LABEL_SIZES.get(label_size, (105, 148))
+        label_width_pts = label_width * mm
+        label_height_pts = label_height * mm
+
+        if layout == "page":
+            return (label_width_pts, label_height_pts), label_width_pts, label_height_pts, [(0, 0)]
+
+        page_width, page_height = A4
+        labels_per_row = max(1, int(page_width // label_width_pts))
+        labels_per_col = max(1, int(page_height // label_height_pts))
+        margin_x = max(0, (page_width - labels_per_row * label_width_pts) / 2)
+
+        posiciones = [
+            (margin_x + col * label_width_pts, page_height - (row + 1) * label_height_pts)
+            for row in range(labels_per_col)
+            for col in range(labels_per_row)
+        ]
+        return A4, label_width_pts, label_height_pts, posiciones
 
-            if product_description:
-                c.drawString(x + 5*mm, y_pos, f"Producto: {product_description[:35]}")
-                y_pos -= 5*mm
+    @staticmethod
+    def generate_pdf_labels_batch(
+        labels: Iterable[Dict[str, Any]],
+        label_size: str = "A6",
+        layout: str = "nup"
+    ) -> bytes:
+        """
+        Genera en un único PDF las etiquetas de varios albaranes
 
-            # Palet X/N
-            c.setFont("Helvetica-Bold", 11)
-            c.drawString(x + 5*mm, y_pos, f"Palet {pallet_number} de {total_pallets}")
-            y_pos -= 8*mm
+        Args:
+            labels: Datos de albarán por etiqueta (repetidos tantas veces como copias)
+            label_size: Tamaño de etiqueta ("100x150", "100x100", "A6")
+            layout: "nup" (rejilla en folios A4) o "page" (una etiqueta por página)
 
-            # Código de barras (guardamos y cargamos la imagen)
-            from PIL import Image as PILImage
-            barcode_img = PILImage.open(io.BytesIO(barcode_img_data))
+        Returns:
+            bytes: PDF generado
+        """
+        try:
+            from reportlab.pdfgen import canvas
+        except ImportError:
+            raise ImportError("reportlab no está instalado. Instalar con: pip install reportlab")
 
-            # Guardar temporalmente
-            temp_barcode = io.BytesIO()
-            barcode_img.save(temp_barcode, format='PNG')
-            temp_barcode.seek(0)
+        pagesize, label_width_pts, label_height_pts, posiciones = LabelGenerator._label_grid(label_size, layout)
+        generado = datetime.now().strftime('%d/%m/%Y %H:%M')
 
-            # Dibujar código de barras
-            barcode_width = label_width_pts - 10*mm
-            barcode_height = 20*mm
-            c.drawImage(temp_barcode, x + 5*mm, y + 15*mm,
-                       width=barcode_width, height=barcode_height,
-                       preserveAspectRatio=True, mask='auto')
+        buffer = io.BytesIO()
+        c = canvas.Canvas(buffer, pagesize=pagesize)
 
-            # Fecha de generación
-            c.setFont("Helvetica", 7)
-            c.drawString(x + 5*mm, y + 5*mm, f"Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}")
+        for label_idx, delivery_note_data in enumerate(labels):
+            # Nueva página si es necesario
+            if label_idx > 0 and label_idx % len(posiciones) == 0:
+                c.showPage()
 
-            # Borde de la etiqueta (para guía de corte)
-            c.setStrokeColor(colors.lightgrey)
-            c.setDash(2, 2)
-            c.rect(x, y, label_width_pts, label_height_pts)
+            x, y = posiciones[label_idx % len(posiciones)]
+            LabelGenerator._draw_label(
+                c, delivery_note_data, x, y, label_width_pts, label_height_pts, generado
+            )
 
         c.save()
         buffer.seek(0)
         return buffer.read()
 
+    @staticmethod
+    def generate_pdf_label(
+        delivery_note_data: Dict[str, Any],
+        labels_count: int = 1,
+        label_size: str = "A6"
+    ) -> bytes:
+        """
+        Genera etiquetas en PDF para impresión en folios A4
+
+        Args:
+            delivery_note_data: Datos del albarán
+            labels_count: Número de etiquetas a generar
+            label_size: Tamaño de etiqueta ("100x150", "100x100", "A6")
+
+        Returns:
+            bytes: PDF generado
+        """
+        return LabelGenerator.generate_pdf_labels_batch(
+            [delivery_note_data] * labels_count,
+            label_size=label_size
+        )
+
+    @staticmethod
+    def iter_zpl_labels(
+        labels: Iterable[Dict[str, Any]],
+        dpi: int = 203,
+        label_width: int = 100,
+        label_height: int = 150
+    ) -> Iterator[str]:
+        """
+        Genera el ZPL de varias etiquetas de una en una (para respuestas en streaming)
+
+        Args:
+            labels: Datos de albarán por etiqueta
+            dpi, label_width, label_height: Como en generate_zpl_label
+
+        Yields:
+            str: Código ZPL de cada etiqueta (^XA ... ^XZ)
+        """
+        for delivery_note_data in labels:
+            yield LabelGenerator.generate_zpl_label(
+                delivery_note_data,
+                dpi=dpi,
+                label_width=label_width,
+                label_height=label_height
+            ) + "\n"
+
     @staticmethod
     def generate_zpl_label(
         delivery_note_data: Dict[str, Any],
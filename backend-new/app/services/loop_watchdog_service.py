@@ -0,0 +1,257 @@
+"""
+OSE Platform - Loop Watchdog Service
+Vigilancia del retraso del event loop y captura de llamadas bloqueantes
+
+Una tarea duerme LOOP_WATCHDOG_INTERVAL y mide cuánto tarda de más en
+despertar (lag). Si el loop se queda bloqueado más de
+LOOP_WATCHDOG_THRESHOLD_MS, un hilo auxiliar lo detecta mientras sigue
+bloqueado y captura la pila del hilo del loop (sys._current_frames) junto
+con la ruta de la petición en curso. Así se ve qué código concreto
+(WeasyPrint, Tesseract, pandas, smtplib, bcrypt...) bloquea el loop.
+"""
+
+from collections import deque
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from app.config import settings
+from app.services.metrics_service import Histograma, WORKER
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_LAG = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Muestras recientes para los percentiles
+VENTANA_MUESTRAS = 3000
+
+RAIZ_APP = str(Path(__file__).resolve().parents[2])
+
+
+def _ruta_corta(filename: str) -> str:
+    return filename[len(RAIZ_APP) + 1:] if filename.startswith(RAIZ_APP) else filename
+
+
+def _es_codigo_app(filename: str) -> bool:
+    return filename.startswith(RAIZ_APP) and "site-packages" not in filename
+
+
+class LoopWatchdogService:
+    """Vigilante del event loop de este worker"""
+
+    def __init__(self):
+        self._tarea: Optional[asyncio.Task] = None
+        self._hilo: Optional[threading.Thread] = None
+        self._parar = threading.Event()
+        self._ident_loop: Optional[int] = None
+        self._latido = 0.0
+        self._capturado = False
+        self._histograma = Histograma(BUCKETS_LAG)
+        self._muestras: deque = deque(maxlen=VENTANA_MUESTRAS)
+        self._bloqueos: deque = deque(maxlen=settings.LOOP_WATCHDOG_BUFFER)
+        self._total_bloqueos = 0
+        self._ultimo_volcado = 0.0
+
+    # ════════════════════════════════════════════════════════════════════
+    # CAPTURA (hilo auxiliar)
+    # ════════════════════════════════════════════════════════════════════
+
+    @staticmethod
+    def _contexto_en_pila(frame) -> Optional[Any]:
+        """Contexto de la petición: variable local del middleware de métricas en la pila"""
+        from app.middleware.metrics import MetricsMiddleware
+
+        codigo = MetricsMiddleware.__call__.__code__
+        while frame is not None:
+            if frame.f_code is codigo:
+                return frame.f_locals.get("contexto")
+            frame = frame.f_back
+        return None
+
+    def _capturar(self, bloqueado: float):
+        frame = sys._current_frames().get(self._ident_loop)
+        if frame is None:
+            return
+
+        pila = traceback.extract_stack(frame, limit=60)
+        contexto = self._contexto_en_pila(frame)
+        del frame
+
+        # El marco más interno de nuestro código: normalmente quien llama a lo que bloquea
+        origen = next((f for f in reversed(pila) if _es_codigo_app(f.filename)), None)
+
+        self._total_bloqueos += 1
+        self._bloqueos.append({
+            "timestamp": datetime.utcnow(),
+            "blocked_ms": round(bloqueado * 1000, 1),
+            "lag_ms": None,
+            "method": contexto.metodo if contexto else None,
+            "route": contexto.ruta if contexto else None,
+            "request_id": contexto.request_id if contexto else None,
+            "culprit": f"{_ruta_corta(origen.filename)}:{origen.lineno} in {origen.name}" if origen else None,
+            "stack": [f"{_ruta_corta(f.filename)}:{f.lineno} in {f.name}" for f in pila[-25:]]
+        })
+        logger.warning(
+            f"Event loop bloqueado {bloqueado * 1000:.0f}ms "
+            f"({contexto.metodo + ' ' + contexto.ruta if contexto else 'sin petición'}): "
+            f"{self._bloqueos[-1]['culprit']}"
+        )
+
+    def _vigilar(self):
+        umbral = settings.LOOP_WATCHDOG_THRESHOLD_MS / 1000
+        paso = min(settings.LOOP_WATCHDOG_INTERVAL, umbral) / 2
+        while not self._parar.wait(paso):
+            bloqueado = time.perf_counter() - self._latido - settings.LOOP_WATCHDOG_INTERVAL
+            if bloqueado > umbral and not self._capturado:
+                self._capturado = True
+                try:
+                    self._capturar(bloqueado)
+                except Exception as e:
+                    logger.error(f"Error capturando la pila del event loop: {e}")
+
+    # ════════════════════════════════════════════════════════════════════
+    # MEDICIÓN (event loop)
+    # ════════════════════════════════════════════════════════════════════
+
+    async def _ejecutar(self):
+        intervalo = settings.LOOP_WATCHDOG_INTERVAL
+        while True:
+            inicio = time.perf_counter()
+            await asyncio.sleep(intervalo)
+            ahora = time.perf_counter()
+            lag = max(0.0, ahora - inicio - intervalo)
+
+            self._latido = ahora
+            if self._capturado:
+                # Fin del bloqueo capturado: se anota cuánto duró en total
+                if self._bloqueos:
+                    self._bloqueos[-1]["lag_ms"] = round(lag * 1000, 1)
+                self._capturado = False
+
+            self._histograma.observar(lag)
+            self._muestras.append(lag)
+
+            if settings.METRICS_ROLLUP_INTERVAL > 0 and ahora - self._ultimo_volcado >= settings.METRICS_ROLLUP_INTERVAL:
+                self._ultimo_volcado = ahora
+                try:
+                    await self.registrar_metricas()
+                except Exception as e:
+                    logger.error(f"Error registrando métricas del event loop: {e}")
+
+    # ════════════════════════════════════════════════════════════════════
+    # CONSULTA
+    # ════════════════════════════════════════════════════════════════════
+
+    def percentiles(self) -> Dict[str, float]:
+        """Percentiles del lag (ms) sobre las muestras recientes"""
+        muestras = sorted(self._muestras)
+        if not muestras:
+            return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+
+        def p(q: float) -> float:
+            return round(muestras[min(len(muestras) - 1, int(q * len(muestras)))] * 1000, 2)
+
+        return {"p50_ms": p(0.5), "p95_ms": p(0.95), "p99_ms": p(0.99), "max_ms": round(muestras[-1] * 1000, 2)}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self._tarea is not None,
+            "interval_s": settings.LOOP_WATCHDOG_INTERVAL,
+            "threshold_ms": settings.LOOP_WATCHDOG_THRESHOLD_MS,
+            "samples": self._histograma.total,
+            "blocked_total": self._total_bloqueos,
+            **self.percentiles()
+        }
+
+    def bloqueos(self, limite: int = 50) -> List[Dict[str, Any]]:
+        """Bloqueos capturados, más recientes primero"""
+        return list(reversed(self._bloqueos))[:limite]
+
+    def limpiar(self):
+        self._bloqueos.clear()
+
+    def prometheus(self) -> List[str]:
+        """Colector para /metrics"""
+        h = self._histograma
+        lineas = [
+            "# HELP event_loop_lag_seconds Retraso del event loop al despertar",
+            "# TYPE event_loop_lag_seconds histogram"
+        ]
+        acumulado = 0
+        for limite, n in zip(h.limites, h.cuentas):
+            acumulado += n
+            lineas.append(f'event_loop_lag_seconds_bucket{{le="{limite}"}} {acumulado}')
+        lineas.append(f'event_loop_lag_seconds_bucket{{le="+Inf"}} {h.total}')
+        lineas.append(f"event_loop_lag_seconds_sum {h.suma}")
+        lineas.append(f"event_loop_lag_seconds_count {h.total}")
+
+        lineas += [
+            "# HELP event_loop_lag_recent_seconds Percentiles del lag en las muestras recientes",
+            "# TYPE event_loop_lag_recent_seconds gauge"
+        ]
+        for clave, valor in self.percentiles().items():
+            cuantil = {"p50_ms": "0.5", "p95_ms": "0.95", "p99_ms": "0.99", "max_ms": "1"}[clave]
+            lineas.append(f'event_loop_lag_recent_seconds{{quantile="{cuantil}"}} {valor / 1000}')
+
+        lineas += [
+            "# HELP event_loop_blocked_total Bloqueos del event loop por encima del umbral",
+            "# TYPE event_loop_blocked_total counter",
+            f"event_loop_blocked_total {self._total_bloqueos}"
+        ]
+        return lineas
+
+    async def registrar_metricas(self):
+        """Guarda los percentiles del lag del día en la colección metrics"""
+        from app.models.metric import Metric, MetricType, MetricPeriod
+
+        stats = self.stats()
+        await Metric.record_metric(
+            metric_type=MetricType.CUSTOM,
+            metric_name="event_loop_lag_p99",
+            value=stats["p99_ms"],
+            date_value=date.today(),
+            period=MetricPeriod.DAILY,
+            unit="ms",
+            dimensions={"worker": WORKER},
+            data=stats
+        )
+
+    # ════════════════════════════════════════════════════════════════════
+    # CICLO DE VIDA
+    # ════════════════════════════════════════════════════════════════════
+
+    def iniciar(self):
+        """Arranca la medición en el loop actual y el hilo que captura los bloqueos"""
+        if not settings.LOOP_WATCHDOG_ENABLED or self._tarea is not None:
+            return
+
+        self._ident_loop = threading.get_ident()
+        self._latido = time.perf_counter()
+        self._ultimo_volcado = self._latido
+        self._parar.clear()
+        self._tarea = asyncio.create_task(self._ejecutar())
+        self._hilo = threading.Thread(target=self._vigilar, name="loop-watchdog", daemon=True)
+        self._hilo.start()
+
+    async def detener(self):
+        self._parar.set()
+        if self._tarea:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+        if self._hilo:
+            await asyncio.to_thread(self._hilo.join, 1)
+            self._hilo = None
+
+
+# Singleton instance
+loop_watchdog = LoopWatchdogService()
@@ -15,6 +15,7 @@ import logging
 from jinja2 import Environment, FileSystemLoader, Template
 
 from app.config import settings
+from app.services.tracing_service import trazado
 
 logger = logging.getLogger(__name__)
 
@@ -46,6 +47,7 @@ class MailService:
             self.jinja_env = None
             logger.warning(f"Email templates directory not found: {template_path}")
 
+    @trazado("smtp.send_email", "smtp")
     async def send_email(
         self,
         to: List[str],
@@ -0,0 +1,401 @@
+"""
+OSE Platform - Memory Service
+Diagnóstico de memoria: instantáneas de tracemalloc y pico de RSS por petición
+
+- tracemalloc solo está activo cuando un admin lo arranca
+  (/system/performance/memory/start): mientras tanto, cada operación
+  marcada con @medir_memoria toma una instantánea antes y otra después y
+  guarda las líneas (fichero:línea) que más memoria han reservado.
+  También se puede pedir una instantánea manual, comparada con la de
+  arranque.
+- El pico de RSS se mide siempre en las operaciones marcadas con
+  rss=True (endpoints de subida y exportaciones): un único hilo muestrea
+  el RSS del proceso para todas las peticiones medidas en curso, incluido
+  el cuerpo de una respuesta en streaming. Con las filas procesadas se obtiene la memoria
+  por fila.
+
+Ambas medidas son del proceso entero: si el worker atiende otras
+peticiones a la vez, lo que reservan también cuenta.
+"""
+
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import asyncio
+import functools
+import itertools
+import logging
+import os
+import threading
+import time
+import tracemalloc
+import weakref
+
+from app.config import settings
+from app.utils.request_context import contexto_actual
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+RAIZ_APP = str(Path(__file__).resolve().parents[2])
+
+# Reservas del propio diagnóstico que no interesan en las comparaciones
+FILTROS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+try:
+    _PAGINA = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGINA = 4096
+
+
+def rss_bytes() -> int:
+    """RSS actual del proceso (Linux: /proc/self/statm; si no, el pico de getrusage)"""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGINA
+    except (OSError, IndexError, ValueError):
+        import resource
+        # ru_maxrss está en KB en Linux y en bytes en macOS
+        maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maximo if os.uname().sysname == "Darwin" else maximo * 1024
+
+
+def _ruta_corta(filename: str) -> str:
+    return filename[len(RAIZ_APP) + 1:] if filename.startswith(RAIZ_APP) else filename
+
+
+class _Muestreador:
+    """
+    Hilo único que muestrea el RSS para todas las mediciones en curso
+
+    Las mediciones se guardan por referencia débil: una que nunca llega a
+    terminar (cuerpo en streaming abandonado) deja de muestrearse al
+    recogerse. Sin mediciones activas el hilo espera sin muestrear.
+    """
+
+    def __init__(self):
+        self._activas: "weakref.WeakSet[MedicionMemoria]" = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._hay_activas = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def alta(self, medicion: "MedicionMemoria"):
+        with self._lock:
+            self._activas.add(medicion)
+            self._hay_activas.set()
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._muestrear, name="rss-sampler", daemon=True)
+                self._hilo.start()
+
+    def baja(self, medicion: "MedicionMemoria"):
+        with self._lock:
+            self._activas.discard(medicion)
+            if not self._activas:
+                self._hay_activas.clear()
+
+    def _muestrear(self):
+        while True:
+            self._hay_activas.wait()
+            time.sleep(settings.MEMORY_RSS_SAMPLE_INTERVAL)
+            rss = rss_bytes()
+            with self._lock:
+                activas = list(self._activas)
+                if not activas:
+                    self._hay_activas.clear()
+            for medicion in activas:
+                medicion.rss_pico = max(medicion.rss_pico, rss)
+
+
+_muestreador = _Muestreador()
+
+
+class MedicionMemoria:
+    """Pico de RSS de una operación (muestreado por el hilo compartido)"""
+
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+        self.inicio = time.perf_counter()
+        self.rss_inicial = rss_bytes()
+        self.rss_pico = self.rss_inicial
+        self.filas: Optional[int] = None
+        _muestreador.alta(self)
+
+    @property
+    def pico_mb(self) -> float:
+        """Pico de RSS por encima del inicial (MB)"""
+        self.rss_pico = max(self.rss_pico, rss_bytes())
+        return round((self.rss_pico - self.rss_inicial) / MB, 2)
+
+    def terminar(self) -> Dict[str, Any]:
+        _muestreador.baja(self)
+        pico = self.pico_mb
+        contexto = contexto_actual()
+        return {
+            "timestamp": datetime.utcnow(),
+            "operation": self.nombre,
+            "route": contexto.ruta if contexto else None,
+            "request_id": contexto.request_id if contexto else None,
+            "duration_ms": round((time.perf_counter() - self.inicio) * 1000, 1),
+            "rss_start_mb": round(self.rss_inicial / MB, 2),
+            "rss_peak_mb": round(self.rss_pico / MB, 2),
+            "peak_delta_mb": pico,
+            "rows": self.filas,
+            "kb_per_row": round(pico * 1024 / self.filas, 3) if self.filas else None
+        }
+
+
+medicion_actual: ContextVar[Optional[MedicionMemoria]] = ContextVar("medicion_actual", default=None)
+
+
+class MemoryService:
+    """Instantáneas de tracemalloc y mediciones de RSS del worker"""
+
+    def __init__(self):
+        self._base: Optional[tracemalloc.Snapshot] = None
+        self._iniciado: Optional[datetime] = None
+        self._ids = itertools.count(1)
+        self._comparaciones: deque = deque(maxlen=settings.MEMORY_SNAPSHOT_BUFFER)
+        self._mediciones: deque = deque(maxlen=settings.MEMORY_RSS_BUFFER)
+
+    # ════════════════════════════════════════════════════════════════════
+    # TRACEMALLOC
+    # ════════════════════════════════════════════════════════════════════
+
+    @property
+    def activo(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    @staticmethod
+    def _instantanea() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(FILTROS)
+
+    async def iniciar_trazado(self, frames: Optional[int] = None):
+        """Arranca tracemalloc y toma la instantánea de referencia"""
+        if not self.activo:
+            tracemalloc.start(frames or settings.MEMORY_TRACE_FRAMES)
+        self._iniciado = datetime.utcnow()
+        self._base = await asyncio.to_thread(self._instantanea)
+        logger.info("tracemalloc activado")
+
+    def detener_trazado(self):
+        """Para tracemalloc (libera la memoria de las trazas)"""
+        if self.activo:
+            tracemalloc.stop()
+            logger.info("tracemalloc desactivado")
+        self._base = None
+        self._iniciado = None
+
+    @staticmethod
+    def _comparar(antes: tracemalloc.Snapshot, despues: tracemalloc.Snapshot, limite: int) -> Dict[str, Any]:
+        diferencias = despues.compare_to(antes, "lineno")
+        top = []
+        for d in diferencias[:limite]:
+            marco = d.traceback[0]
+            top.append({
+                "location": f"{_ruta_corta(marco.filename)}:{marco.lineno}",
+                "size_diff_kb": round(d.size_diff / 1024, 1),
+                "count_diff": d.count_diff,
+                "size_kb": round(d.size / 1024, 1),
+                "count": d.count
+            })
+        return {
+            "size_diff_mb": round(sum(d.size_diff for d in diferencias) / MB, 2),
+            "top": top
+        }
+
+    def _guardar_comparacion(self, nombre: str, resultado: Dict[str, Any], **extra) -> Dict[str, Any]:
+        resultado = {
+            "id": next(self._ids),
+            "name": nombre,
+            "timestamp": datetime.utcnow(),
+            **extra,
+            **resultado
+        }
+        self._comparaciones.append(resultado)
+        return resultado
+
+    async def instantanea(self, nombre: str, limite: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Instantánea manual comparada con la de referencia (None si no está activo)"""
+        if not self.activo or self._base is None:
+            return None
+        despues = await asyncio.to_thread(self._instantanea)
+        resultado = await asyncio.to_thread(
+            self._comparar, self._base, despues, limite or settings.MEMORY_TOP_LIMIT
+        )
+        return self._guardar_comparacion(nombre, resultado, since=self._iniciado)
+
+    def comparaciones(self, limite: int = 20) -> List[Dict[str, Any]]:
+        """Comparaciones guardadas, más recientes primero (sin el detalle)"""
+        return [
+            {k: v for k, v in c.items() if k != "top"}
+            for c in reversed(self._comparaciones)
+        ][:limite]
+
+    def comparacion(self, comparacion_id: int) -> Optional[Dict[str, Any]]:
+        return next((c for c in self._comparaciones if c["id"] == comparacion_id), None)
+
+    # ════════════════════════════════════════════════════════════════════
+    # OPERACIONES MEDIDAS
+    # ════════════════════════════════════════════════════════════════════
+
+    async def medir(self, nombre: str, rss: bool, funcion, *args, **kwargs):
+        """
+        Ejecuta la corrutina de la operación con las medidas activas
+
+        Si devuelve una respuesta en streaming (body_iterator), las medidas
+        siguen activas mientras se genera el cuerpo y terminan con él: el
+        endpoint solo prepara la respuesta y el trabajo se hace después.
+        """
+        antes = await asyncio.to_thread(self._instantanea) if self.activo else None
+        if antes is not None:
+            # El pico trazado cuenta desde aquí (lo que se libera antes de acabar no sale en la comparación)
+            tracemalloc.reset_peak()
+        medicion = MedicionMemoria(nombre) if rss else None
+        token = medicion_actual.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            resultado = await funcion(*args, **kwargs)
+        except BaseException:
+            medicion_actual.reset(token)
+            await self._terminar(nombre, medicion, antes, inicio)
+            raise
+
+        medicion_actual.reset(token)
+        if hasattr(resultado, "body_iterator"):
+            resultado.body_iterator = self._medir_cuerpo(
+                resultado.body_iterator, nombre, medicion, antes, inicio
+            )
+        else:
+            await self._terminar(nombre, medicion, antes, inicio)
+        return resultado
+
+    async def _medir_cuerpo(self, cuerpo, nombre: str, medicion, antes, inicio: float):
+        """Cuerpo de una respuesta en streaming; cierra las medidas al agotarse o cortarse"""
+        # Starlette itera el cuerpo en otra tarea: la medición se vuelve a fijar aquí
+        token = medicion_actual.set(medicion)
+        try:
+            async for trozo in cuerpo:
+                yield trozo
+        finally:
+            try:
+                medicion_actual.reset(token)
+            except ValueError:
+                # Cliente desconectado: el finalizador de asyncgen cierra el
+                # cuerpo desde otro contexto, donde el token no es válido
+                pass
+            await self._terminar(nombre, medicion, antes, inicio)
+
+    async def _terminar(self, nombre: str, medicion, antes, inicio: float):
+        """Guarda el pico de RSS y la comparación de instantáneas de la operación"""
+        if medicion is not None:
+            self._mediciones.append(medicion.terminar())
+        if antes is not None and self.activo:
+            try:
+                pico = tracemalloc.get_traced_memory()[1]
+                despues = await asyncio.to_thread(self._instantanea)
+                resultado = await asyncio.to_thread(
+                    self._comparar, antes, despues, settings.MEMORY_TOP_LIMIT
+                )
+                contexto = contexto_actual()
+                self._guardar_comparacion(
+                    nombre, resultado,
+                    route=contexto.ruta if contexto else None,
+                    request_id=contexto.request_id if contexto else None,
+                    duration_ms=round((time.perf_counter() - inicio) * 1000, 1),
+                    traced_peak_mb=round(pico / MB, 2)
+                )
+            except Exception as e:
+                logger.error(f"Error comparando instantáneas de {nombre}: {e}")
+
+    @staticmethod
+    def registrar_filas(filas: int) -> Optional[float]:
+        """
+        Anota las filas procesadas por la operación en curso
+
+        Devuelve el pico de RSS hasta ahora (MB por encima del inicial), o
+        None si la operación no mide RSS.
+        """
+        medicion = medicion_actual.get()
+        if medicion is None:
+            return None
+        medicion.filas = filas
+        return medicion.pico_mb
+
+    def mediciones(self, operacion: Optional[str] = None, limite: int = 50) -> List[Dict[str, Any]]:
+        """Picos de RSS de las operaciones medidas, más recientes primero"""
+        return [
+            m for m in reversed(self._mediciones)
+            if operacion is None or m["operation"] == operacion
+        ][:limite]
+
+    def resumen_mediciones(self) -> Dict[str, Dict[str, Any]]:
+        """Por operación: nº de mediciones, pico medio/máximo y KB por fila medios"""
+        resumen: Dict[str, Dict[str, Any]] = {}
+        for m in self._mediciones:
+            r = resumen.setdefault(m["operation"], {"count": 0, "peak_sum": 0.0, "peak_max_mb": 0.0, "kb_por_fila": []})
+            r["count"] += 1
+            r["peak_sum"] += m["peak_delta_mb"]
+            r["peak_max_mb"] = max(r["peak_max_mb"], m["peak_delta_mb"])
+            if m["kb_per_row"] is not None:
+                r["kb_por_fila"].append(m["kb_per_row"])
+
+        return {
+            operacion: {
+                "count": r["count"],
+                "peak_avg_mb": round(r["peak_sum"] / r["count"], 2),
+                "peak_max_mb": r["peak_max_mb"],
+                "kb_per_row_avg": round(sum(r["kb_por_fila"]) / len(r["kb_por_fila"]), 3) if r["kb_por_fila"] else None
+            }
+            for operacion, r in resumen.items()
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        actual, pico = tracemalloc.get_traced_memory() if self.activo else (0, 0)
+        return {
+            "tracing": self.activo,
+            "tracing_since": self._iniciado,
+            "frames": tracemalloc.get_traceback_limit() if self.activo else None,
+            "traced_current_mb": round(actual / MB, 2),
+            "traced_peak_mb": round(pico / MB, 2),
+            "rss_mb": round(rss_bytes() / MB, 2),
+            "comparisons": len(self._comparaciones),
+            "rss_measurements": self.resumen_mediciones()
+        }
+
+    def limpiar(self):
+        self._comparaciones.clear()
+        self._mediciones.clear()
+
+
+# Singleton instance
+memoria = MemoryService()
+
+
+def medir_memoria(nombre: str, rss: bool = False):
+    """
+    Decorador de endpoints/operaciones asíncronas con diagnóstico de memoria
+
+    Con tracemalloc activo compara instantáneas antes/después; con rss=True
+    mide además el pico de RSS (y la memoria por fila si la operación llama
+    a memoria.registrar_filas).
+
+    Uso:
+        @router.post("/upload")
+        @medir_memoria("app2.upload", rss=True)
+        async def upload_file(...)
+    """
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        async def envoltura(*args, **kwargs):
+            return await memoria.medir(nombre, rss, funcion, *args, **kwargs)
+        return envoltura
+
+    return decorador
@@ -0,0 +1,330 @@
+"""
+OSE Platform - Metrics Service
+Métricas HTTP por ruta (latencia, códigos de estado, tamaños, en curso)
+
+Cada worker agrega en memoria sin locks: el middleware actualiza los
+contadores desde el event loop, que es un único hilo, así que no hay
+escrituras concurrentes. Se exponen en formato Prometheus (/metrics) y se
+vuelcan periódicamente a la colección metrics (Metric.record_metric),
+agrupadas por aplicación (tag del router: App 1, App2, ...).
+"""
+
+from bisect import bisect_left
+from collections import Counter
+from datetime import date
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import socket
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Límites superiores de los buckets (el último bucket es +Inf)
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+BUCKETS_CONSULTAS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+WORKER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Histograma:
+    """Histograma de buckets fijos (cuentas no acumuladas, la última es +Inf)"""
+
+    __slots__ = ("limites", "cuentas", "suma", "total")
+
+    def __init__(self, limites: Tuple[float, ...]):
+        self.limites = limites
+        self.cuentas = [0] * (len(limites) + 1)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float):
+        self.cuentas[bisect_left(self.limites, valor)] += 1
+        self.suma += valor
+        self.total += 1
+
+    def copia(self) -> "Histograma":
+        h = Histograma(self.limites)
+        h.cuentas = list(self.cuentas)
+        h.suma = self.suma
+        h.total = self.total
+        return h
+
+    def sumar(self, otro: "Histograma", signo: int = 1):
+        for i, n in enumerate(otro.cuentas):
+            self.cuentas[i] += signo * n
+        self.suma += signo * otro.suma
+        self.total += signo * otro.total
+
+    def cuantil(self, q: float) -> float:
+        """Estimación del cuantil q interpolando dentro del bucket"""
+        if self.total <= 0:
+            return 0.0
+        objetivo = q * self.total
+        acumulado = 0
+        for i, n in enumerate(self.cuentas):
+            if n and acumulado + n >= objetivo:
+                inferior = self.limites[i - 1] if i > 0 else 0.0
+                if i >= len(self.limites):
+                    # Bucket +Inf: no hay cota superior, se da la inferior
+                    return inferior
+                return inferior + (self.limites[i] - inferior) * (objetivo - acumulado) / n
+            acumulado += n
+        return self.limites[-1]
+
+    @property
+    def media(self) -> float:
+        return self.suma / self.total if self.total else 0.0
+
+
+class MetricasRuta:
+    """Métricas de un método + plantilla de ruta"""
+
+    __slots__ = ("grupo", "latencia", "bytes_entrada", "bytes_salida", "consultas", "estados")
+
+    def __init__(self, grupo: str):
+        self.grupo = grupo
+        self.latencia = Histograma(BUCKETS_LATENCIA)
+        self.bytes_entrada = Histograma(BUCKETS_BYTES)
+        self.bytes_salida = Histograma(BUCKETS_BYTES)
+        self.consultas = Histograma(BUCKETS_CONSULTAS)
+        self.estados: Counter = Counter()
+
+    def copia(self) -> "MetricasRuta":
+        m = MetricasRuta(self.grupo)
+        m.latencia = self.latencia.copia()
+        m.bytes_entrada = self.bytes_entrada.copia()
+        m.bytes_salida = self.bytes_salida.copia()
+        m.consultas = self.consultas.copia()
+        m.estados = Counter(self.estados)
+        return m
+
+
+def _etiqueta(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _etiquetas(**kwargs) -> str:
+    return ",".join(f'{k}="{_etiqueta(v)}"' for k, v in kwargs.items())
+
+
+def _numero(valor: float) -> str:
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class MetricsService:
+    """Agregación de métricas HTTP del worker"""
+
+    def __init__(self):
+        self._rutas: Dict[Tuple[str, str], MetricasRuta] = {}
+        self.en_curso = 0
+        self._colectores: List[Callable[[], List[str]]] = []
+        self._base_dia: Dict[Tuple[str, str], MetricasRuta] = {}
+        self._dia: Optional[date] = None
+        self._tarea: Optional[asyncio.Task] = None
+
+    # ════════════════════════════════════════════════════════════════════
+    # REGISTRO (desde el middleware)
+    # ════════════════════════════════════════════════════════════════════
+
+    def observar(
+        self,
+        metodo: str,
+        ruta: str,
+        grupo: str,
+        estado: int,
+        duracion: float,
+        bytes_entrada: int,
+        bytes_salida: int,
+        consultas: int = 0
+    ):
+        clave = (metodo, ruta)
+        metricas = self._rutas.get(clave)
+        if metricas is None:
+            metricas = self._rutas[clave] = MetricasRuta(grupo)
+        metricas.latencia.observar(duracion)
+        metricas.bytes_entrada.observar(bytes_entrada)
+        metricas.bytes_salida.observar(bytes_salida)
+        metricas.consultas.observar(consultas)
+        metricas.estados[estado] += 1
+
+    def registrar_colector(self, colector: Callable[[], List[str]]):
+        """
+        Añade líneas propias a /metrics (ej: estado del pool de MongoDB)
+
+        El colector devuelve líneas en formato de texto de Prometheus.
+        """
+        self._colectores.append(colector)
+
+    # ════════════════════════════════════════════════════════════════════
+    # EXPOSICIÓN
+    # ════════════════════════════════════════════════════════════════════
+
+    def _histograma_prometheus(self, nombre: str, ayuda: str, atributo: str) -> List[str]:
+        lineas = [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} histogram"]
+        for (metodo, ruta), metricas in self._rutas.items():
+            h: Histograma = getattr(metricas, atributo)
+            base = _etiquetas(method=metodo, route=ruta, app=metricas.grupo)
+            acumulado = 0
+            for limite, n in zip(h.limites, h.cuentas):
+                acumulado += n
+                lineas.append(f'{nombre}_bucket{{{base},le="{_numero(limite)}"}} {acumulado}')
+            lineas.append(f'{nombre}_bucket{{{base},le="+Inf"}} {h.total}')
+            lineas.append(f"{nombre}_sum{{{base}}} {_numero(h.suma)}")
+            lineas.append(f"{nombre}_count{{{base}}} {h.total}")
+        return lineas
+
+    def prometheus(self) -> str:
+        """Métricas del worker en formato de texto de Prometheus"""
+        lineas = [
+            "# HELP http_requests_in_flight Peticiones HTTP en curso en este worker",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.en_curso}",
+            "# HELP http_requests_total Peticiones HTTP por ruta y código de estado",
+            "# TYPE http_requests_total counter"
+        ]
+        for (metodo, ruta), metricas in self._rutas.items():
+            for estado, n in sorted(metricas.estados.items()):
+                etiquetas = _etiquetas(method=metodo, route=ruta, app=metricas.grupo, status=estado)
+                lineas.append(f"http_requests_total{{{etiquetas}}} {n}")
+
+        lineas += self._histograma_prometheus(
+            "http_request_duration_seconds", "Latencia de las peticiones HTTP por ruta", "latencia"
+        )
+        lineas += self._histograma_prometheus(
+            "http_request_size_bytes", "Tamaño del cuerpo de las peticiones", "bytes_entrada"
+        )
+        lineas += self._histograma_prometheus(
+            "http_response_size_bytes", "Tamaño del cuerpo de las respuestas", "bytes_salida"
+        )
+        lineas += self._histograma_prometheus(
+            "http_request_db_queries", "Comandos de MongoDB por petición (detecta N+1)", "consultas"
+        )
+
+        for colector in self._colectores:
+            try:
+                lineas += colector()
+            except Exception as e:
+                logger.warning(f"Error en colector de métricas {colector}: {e}")
+
+        return "\n".join(lineas) + "\n"
+
+    # ════════════════════════════════════════════════════════════════════
+    # VOLCADO A LA COLECCIÓN METRICS
+    # ════════════════════════════════════════════════════════════════════
+
+    def _resumen_dia(self) -> Dict[str, Dict]:
+        """Métricas del día por grupo (lo acumulado menos la base del día)"""
+        grupos: Dict[str, Dict] = {}
+        for clave, metricas in self._rutas.items():
+            delta = metricas.copia()
+            base = self._base_dia.get(clave)
+            if base:
+                delta.latencia.sumar(base.latencia, -1)
+                delta.bytes_entrada.sumar(base.bytes_entrada, -1)
+                delta.bytes_salida.sumar(base.bytes_salida, -1)
+                delta.consultas.sumar(base.consultas, -1)
+                delta.estados.subtract(base.estados)
+            if delta.latencia.total <= 0:
+                continue
+
+            grupo = grupos.setdefault(metricas.grupo, {
+                "latencia": Histograma(BUCKETS_LATENCIA),
+                "estados": Counter(),
+                "bytes_in": 0.0,
+                "bytes_out": 0.0,
+                "rutas": {}
+            })
+            grupo["latencia"].sumar(delta.latencia)
+            grupo["estados"].update(delta.estados)
+            grupo["bytes_in"] += delta.bytes_entrada.suma
+            grupo["bytes_out"] += delta.bytes_salida.suma
+            grupo["rutas"][f"{clave[0]} {clave[1]}"] = {
+                "requests": delta.latencia.total,
+                "p95_ms": round(delta.latencia.cuantil(0.95) * 1000, 1),
+                "avg_queries": round(delta.consultas.media, 1)
+            }
+        return grupos
+
+    async def _volcar(self, dia: date):
+        from app.models.metric import Metric, MetricType, MetricPeriod
+
+        for nombre, grupo in self._resumen_dia().items():
+            latencia: Histograma = grupo["latencia"]
+            estados: Counter = grupo["estados"]
+            await Metric.record_metric(
+                metric_type=MetricType.CUSTOM,
+                metric_name="http_latency_p95",
+                value=round(latencia.cuantil(0.95) * 1000, 1),
+                date_value=dia,
+                period=MetricPeriod.DAILY,
+                unit="ms",
+                dimensions={"app": nombre, "worker": WORKER},
+                data={
+                    "requests": latencia.total,
+                    "errors_4xx": sum(n for e, n in estados.items() if 400 <= e < 500),
+                    "errors_5xx": sum(n for e, n in estados.items() if e >= 500),
+                    "avg_ms": round(latencia.media * 1000, 1),
+                    "p50_ms": round(latencia.cuantil(0.5) * 1000, 1),
+                    "p99_ms": round(latencia.cuantil(0.99) * 1000, 1),
+                    "bytes_in": int(grupo["bytes_in"]),
+                    "bytes_out": int(grupo["bytes_out"]),
+                    "routes": grupo["rutas"]
+                }
+            )
+
+    async def registrar_metricas(self):
+        """
+        Vuelca las métricas del día a la colección metrics
+
+        Un documento por día, aplicación y worker. Al cambiar de día se
+        cierra el anterior y se toma la base para el nuevo.
+        """
+        hoy = date.today()
+        if self._dia is None:
+            self._dia = hoy
+
+        if hoy != self._dia:
+            await self._volcar(self._dia)
+            self._base_dia = {clave: m.copia() for clave, m in self._rutas.items()}
+            self._dia = hoy
+
+        await self._volcar(hoy)
+
+    # ════════════════════════════════════════════════════════════════════
+    # CICLO DE VIDA
+    # ════════════════════════════════════════════════════════════════════
+
+    async def _ejecutar(self):
+        while True:
+            await asyncio.sleep(settings.METRICS_ROLLUP_INTERVAL)
+            try:
+                await self.registrar_metricas()
+            except Exception as e:
+                logger.error(f"Error registrando métricas HTTP: {e}")
+
+    def iniciar(self):
+        """Programa el volcado periódico (METRICS_ROLLUP_INTERVAL)"""
+        self._dia = date.today()
+        if settings.METRICS_ENABLED and settings.METRICS_ROLLUP_INTERVAL > 0 and self._tarea is None:
+            self._tarea = asyncio.create_task(self._ejecutar())
+
+    async def detener(self):
+        if self._tarea:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+            try:
+                await self.registrar_metricas()
+            except Exception as e:
+                logger.error(f"Error registrando métricas HTTP: {e}")
+
+
+# Singleton instance
+http_metrics = MetricsService()
@@ -0,0 +1,224 @@
+"""
+OSE Platform - Mongo Monitor Service
+Monitorización de comandos de MongoDB (pymongo.monitoring)
+
+Un CommandListener registrado en el cliente de Database.connect anota cada
+comando: nombre, colección, forma del filtro con los valores ocultos
+({"imei": "?"}) y duración. El comando se atribuye a la ruta que lo originó
+con el contexto de la petición (app.utils.request_context).
+
+- Comandos por encima de MONGO_SLOW_COMMAND_MS: buffer circular por worker
+  consultable desde /system/performance/mongo/slow
+- Comandos por ruta: se cuentan en el contexto de la petición y el
+  middleware de métricas los publica junto a la latencia (N+1)
+- Span por comando en la traza de la petición (app.services.tracing_service)
+"""
+
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+import threading
+import time
+
+from pymongo import monitoring
+
+from app.config import settings
+from app.services.tracing_service import tracer
+from app.utils.request_context import contexto_actual, SIN_RUTA
+
+logger = logging.getLogger(__name__)
+
+# Comandos que no se registran (autenticación y mantenimiento de la conexión)
+COMANDOS_IGNORADOS = {
+    "hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue",
+    "authenticate", "getnonce", "endSessions", "killCursors"
+}
+
+# Dónde lleva el filtro cada comando
+CAMPOS_FILTRO = {
+    "find": "filter",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+    "aggregate": "pipeline"
+}
+
+MAX_PROFUNDIDAD = 6
+
+
+def forma(valor: Any, profundidad: int = 0) -> Any:
+    """
+    Forma del filtro con los valores ocultos
+
+    Se conservan claves y operadores ($in, $regex, ...); los valores se
+    sustituyen por "?" y las listas por su primer elemento.
+    """
+    if profundidad > MAX_PROFUNDIDAD:
+        return "..."
+    if isinstance(valor, dict):
+        return {str(k): forma(v, profundidad + 1) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        if not valor:
+            return []
+        return [forma(valor[0], profundidad + 1)] + (["..."] if len(valor) > 1 else [])
+    return "?"
+
+
+def _coleccion(comando: str, documento: Dict[str, Any]) -> Optional[str]:
+    if comando == "getMore":
+        return documento.get("collection")
+    coleccion = documento.get(comando)
+    return coleccion if isinstance(coleccion, str) else None
+
+
+def _filtro(comando: str, documento: Dict[str, Any]) -> Any:
+    campo = CAMPOS_FILTRO.get(comando)
+    if campo:
+        return forma(documento.get(campo, {}))
+    if comando in ("update", "delete"):
+        operaciones = documento.get("updates" if comando == "update" else "deletes") or []
+        return forma(operaciones[0].get("q", {})) if operaciones else {}
+    return None
+
+
+class _ListenerComandos(monitoring.CommandListener):
+    """Adaptador de pymongo: delega en MongoMonitorService"""
+
+    def __init__(self, servicio: "MongoMonitorService"):
+        self.servicio = servicio
+
+    def started(self, event):
+        self.servicio._inicio(event)
+
+    def succeeded(self, event):
+        self.servicio._fin(event, error=None)
+
+    def failed(self, event):
+        self.servicio._fin(event, error=str(event.failure.get("errmsg", "")) or "failed")
+
+
+class MongoMonitorService:
+    """Registro de comandos de MongoDB del worker"""
+
+    def __init__(self):
+        self.listener = _ListenerComandos(self)
+        self._pendientes: Dict[Tuple, Dict[str, Any]] = {}
+        self._lentos: deque = deque(maxlen=settings.MONGO_SLOW_COMMAND_BUFFER)
+        # (comando, colección) -> [nº comandos, segundos, lentos]
+        self._totales: Dict[Tuple[str, str], List[float]] = {}
+        self._lock = threading.Lock()
+
+    # ════════════════════════════════════════════════════════════════════
+    # LISTENER (hilos de Motor)
+    # ════════════════════════════════════════════════════════════════════
+
+    @staticmethod
+    def _clave(event) -> Tuple:
+        return (event.connection_id, event.request_id, event.operation_id)
+
+    def _inicio(self, event):
+        if event.command_name in COMANDOS_IGNORADOS:
+            return
+        documento = event.command
+        self._pendientes[self._clave(event)] = {
+            "coleccion": _coleccion(event.command_name, documento),
+            "filtro": _filtro(event.command_name, documento)
+        }
+
+    def _fin(self, event, error: Optional[str]):
+        if event.command_name in COMANDOS_IGNORADOS:
+            return
+        inicio = self._pendientes.pop(self._clave(event), None) or {}
+        segundos = event.duration_micros / 1_000_000
+        coleccion = inicio.get("coleccion") or ""
+        lento = segundos * 1000 >= settings.MONGO_SLOW_COMMAND_MS
+
+        contexto = contexto_actual()
+        if contexto is not None:
+            contexto.contar_consulta(segundos)
+
+        # Span del comando en la traza de la petición (si se está trazando)
+        fin = time.perf_counter()
+        tracer.span_completo(
+            f"mongo.{event.command_name}", "mongo", fin - segundos, fin,
+            collection=coleccion, filter=inicio.get("filtro"), error=error
+        )
+
+        with self._lock:
+            totales = self._totales.setdefault((event.command_name, coleccion), [0, 0.0, 0])
+            totales[0] += 1
+            totales[1] += segundos
+            if lento:
+                totales[2] += 1
+
+        if lento:
+            self._lentos.append({
+                "timestamp": datetime.utcnow(),
+                "command": event.command_name,
+                "collection": coleccion,
+                "filter": inicio.get("filtro"),
+                "duration_ms": round(segundos * 1000, 2),
+                "method": contexto.metodo if contexto else None,
+                "route": contexto.ruta if contexto else SIN_RUTA,
+                "request_id": contexto.request_id if contexto else None,
+                "error": error
+            })
+
+    # ════════════════════════════════════════════════════════════════════
+    # CONSULTA
+    # ════════════════════════════════════════════════════════════════════
+
+    def lentos(self, limite: int = 100) -> List[Dict[str, Any]]:
+        """Comandos lentos más recientes primero"""
+        return list(reversed(self._lentos))[:limite]
+
+    def limpiar(self):
+        self._lentos.clear()
+
+    def totales(self) -> List[Dict[str, Any]]:
+        """Comandos por tipo y colección, de más a menos tiempo total"""
+        with self._lock:
+            filas = [
+                {
+                    "command": comando,
+                    "collection": coleccion,
+                    "count": int(n),
+                    "total_ms": round(segundos * 1000, 1),
+                    "avg_ms": round(segundos * 1000 / n, 2) if n else 0.0,
+                    "slow": int(lentos)
+                }
+                for (comando, coleccion), (n, segundos, lentos) in self._totales.items()
+            ]
+        return sorted(filas, key=lambda f: f["total_ms"], reverse=True)
+
+    def prometheus(self) -> List[str]:
+        """Colector para /metrics"""
+        lineas = [
+            "# HELP mongo_commands_total Comandos de MongoDB por tipo y colección",
+            "# TYPE mongo_commands_total counter"
+        ]
+        filas = self.totales()
+        for f in filas:
+            lineas.append(f'mongo_commands_total{{command="{f["command"]}",collection="{f["collection"]}"}} {f["count"]}')
+        lineas += [
+            "# HELP mongo_command_duration_seconds_total Tiempo acumulado en comandos de MongoDB",
+            "# TYPE mongo_command_duration_seconds_total counter"
+        ]
+        for f in filas:
+            lineas.append(
+                f'mongo_command_duration_seconds_total{{command="{f["command"]}",collection="{f["collection"]}"}} '
+                f'{f["total_ms"] / 1000}'
+            )
+        lineas += [
+            "# HELP mongo_slow_commands_total Comandos por encima de MONGO_SLOW_COMMAND_MS",
+            "# TYPE mongo_slow_commands_total counter"
+        ]
+        for f in filas:
+            if f["slow"]:
+                lineas.append(f'mongo_slow_commands_total{{command="{f["command"]}",collection="{f["collection"]}"}} {f["slow"]}')
+        return lineas
+
+
+# Singleton instance
+mongo_monitor = MongoMonitorService()
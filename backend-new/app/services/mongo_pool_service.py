@@ -0,0 +1,289 @@
+"""
+OSE Platform - Mongo Pool Service
+Telemetría del pool de conexiones de MongoDB (eventos CMAP de pymongo)
+
+Un ConnectionPoolListener registrado en el cliente de Database.connect
+sigue, por servidor:
+
+- Conexiones en uso (checked out) frente a MONGODB_MAX_POOL_SIZE
+- Peticiones esperando conexión y tiempo de espera del checkout
+- Conexiones creadas y cerradas (ritmo de creación en el último minuto)
+- Vaciados del pool (pool cleared: caída o cambio del primario)
+
+Se publica en /metrics y en /health. Si el pool se satura (uso por encima
+de MONGO_POOL_SATURATION_RATIO o esperas de más de
+MONGO_POOL_WAIT_ALERT_MS) se avisa en el log, como mucho una vez por
+minuto.
+"""
+
+from collections import Counter, deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+import threading
+import time
+
+from pymongo import monitoring
+
+from app.config import settings
+from app.services.metrics_service import Histograma
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_ESPERA = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Tamaño por defecto de pymongo cuando no se indica maxPoolSize
+MAX_POOL_POR_DEFECTO = 100
+
+# Segundos entre avisos de saturación en el log
+INTERVALO_AVISOS = 60
+
+# Ventana para el ritmo de creación de conexiones
+VENTANA_CREACION = 60
+
+
+def _direccion(address: Tuple[str, int]) -> str:
+    return f"{address[0]}:{address[1]}"
+
+
+class EstadoPool:
+    """Contadores del pool de un servidor"""
+
+    def __init__(self, maximo: int):
+        self.maximo = maximo
+        self.en_uso = 0
+        self.esperando = 0
+        self.abiertas = 0
+        self.creadas = 0
+        self.cerradas: Counter = Counter()
+        self.fallos_checkout: Counter = Counter()
+        self.vaciados = 0
+        self.ultimo_vaciado: Optional[datetime] = None
+        self.pico_en_uso = 0
+        self.espera = Histograma(BUCKETS_ESPERA)
+        self.creaciones: deque = deque()
+
+    def creadas_por_minuto(self, ahora: float) -> int:
+        while self.creaciones and ahora - self.creaciones[0] > VENTANA_CREACION:
+            self.creaciones.popleft()
+        return len(self.creaciones)
+
+
+class _ListenerPool(monitoring.ConnectionPoolListener):
+    """Adaptador pymongo -> MongoPoolService (se ejecuta en los hilos de Motor)"""
+
+    def __init__(self, servicio: "MongoPoolService"):
+        self.servicio = servicio
+
+    def pool_created(self, event):
+        self.servicio._creado(event.address, event.options)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self.servicio._vaciado(event.address)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.servicio._conexion_creada(event.address)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.servicio._conexion_cerrada(event.address, event.reason)
+
+    def connection_check_out_started(self, event):
+        self.servicio._espera_iniciada(event.address)
+
+    def connection_check_out_failed(self, event):
+        self.servicio._espera_terminada(event.address, fallo=event.reason)
+
+    def connection_checked_out(self, event):
+        self.servicio._espera_terminada(event.address)
+
+    def connection_checked_in(self, event):
+        self.servicio._devuelta(event.address)
+
+
+class MongoPoolService:
+    """Estado del pool de conexiones de MongoDB del worker"""
+
+    def __init__(self):
+        self.listener = _ListenerPool(self)
+        self._pools: Dict[str, EstadoPool] = {}
+        self._lock = threading.Lock()
+        # Inicio del checkout pendiente de cada hilo (el checkout es síncrono en su hilo)
+        self._esperas: Dict[int, float] = {}
+        self._ultimo_aviso = 0.0
+
+    def _pool(self, address) -> EstadoPool:
+        clave = _direccion(address)
+        estado = self._pools.get(clave)
+        if estado is None:
+            estado = self._pools[clave] = EstadoPool(settings.MONGODB_MAX_POOL_SIZE)
+        return estado
+
+    # ════════════════════════════════════════════════════════════════════
+    # LISTENER (hilos de Motor)
+    # ════════════════════════════════════════════════════════════════════
+
+    def _creado(self, address, opciones: Dict[str, Any]):
+        with self._lock:
+            self._pool(address).maximo = opciones.get("maxPoolSize", MAX_POOL_POR_DEFECTO)
+
+    def _vaciado(self, address):
+        with self._lock:
+            estado = self._pool(address)
+            estado.vaciados += 1
+            estado.ultimo_vaciado = datetime.utcnow()
+        logger.warning(f"Pool de MongoDB vaciado ({_direccion(address)}): se recrean las conexiones")
+
+    def _conexion_creada(self, address):
+        with self._lock:
+            estado = self._pool(address)
+            estado.creadas += 1
+            estado.abiertas += 1
+            estado.creaciones.append(time.monotonic())
+
+    def _conexion_cerrada(self, address, motivo: str):
+        with self._lock:
+            estado = self._pool(address)
+            estado.cerradas[motivo] += 1
+            estado.abiertas = max(0, estado.abiertas - 1)
+
+    def _espera_iniciada(self, address):
+        self._esperas[threading.get_ident()] = time.perf_counter()
+        with self._lock:
+            self._pool(address).esperando += 1
+
+    def _espera_terminada(self, address, fallo: Optional[str] = None):
+        inicio = self._esperas.pop(threading.get_ident(), None)
+        espera = time.perf_counter() - inicio if inicio is not None else 0.0
+        with self._lock:
+            estado = self._pool(address)
+            estado.esperando = max(0, estado.esperando - 1)
+            estado.espera.observar(espera)
+            if fallo:
+                estado.fallos_checkout[fallo] += 1
+            else:
+                estado.en_uso += 1
+                estado.pico_en_uso = max(estado.pico_en_uso, estado.en_uso)
+            saturado = self._saturado(estado, espera)
+        if saturado:
+            self._avisar(address, estado, espera)
+
+    def _devuelta(self, address):
+        with self._lock:
+            estado = self._pool(address)
+            estado.en_uso = max(0, estado.en_uso - 1)
+
+    @staticmethod
+    def _saturado(estado: EstadoPool, espera: float = 0.0) -> bool:
+        return (
+            estado.en_uso >= estado.maximo * settings.MONGO_POOL_SATURATION_RATIO
+            or espera * 1000 >= settings.MONGO_POOL_WAIT_ALERT_MS
+        )
+
+    def _avisar(self, address, estado: EstadoPool, espera: float):
+        ahora = time.monotonic()
+        if ahora - self._ultimo_aviso < INTERVALO_AVISOS:
+            return
+        self._ultimo_aviso = ahora
+        logger.warning(
+            f"Pool de MongoDB saturado ({_direccion(address)}): "
+            f"{estado.en_uso}/{estado.maximo} en uso, {estado.esperando} esperando, "
+            f"última espera {espera * 1000:.0f}ms"
+        )
+
+    # ════════════════════════════════════════════════════════════════════
+    # CONSULTA
+    # ════════════════════════════════════════════════════════════════════
+
+    def resumen(self) -> Dict[str, Any]:
+        """Estado por servidor (para /health)"""
+        ahora = time.monotonic()
+        servidores = {}
+        with self._lock:
+            for direccion, e in self._pools.items():
+                servidores[direccion] = {
+                    "checked_out": e.en_uso,
+                    "max_size": e.maximo,
+                    "utilization": round(e.en_uso / e.maximo, 3) if e.maximo else 0.0,
+                    "peak_checked_out": e.pico_en_uso,
+                    "waiting": e.esperando,
+                    "open_connections": e.abiertas,
+                    "created_total": e.creadas,
+                    "created_last_minute": e.creadas_por_minuto(ahora),
+                    "checkout_wait_p95_ms": round(e.espera.cuantil(0.95) * 1000, 2),
+                    "checkout_wait_avg_ms": round(e.espera.media * 1000, 2),
+                    "checkout_failed": dict(e.fallos_checkout),
+                    "cleared_total": e.vaciados,
+                    "last_cleared": e.ultimo_vaciado.isoformat() if e.ultimo_vaciado else None,
+                    "saturated": self._saturado(e)
+                }
+        return {
+            "saturated": any(s["saturated"] for s in servidores.values()),
+            "servers": servidores
+        }
+
+    def prometheus(self) -> List[str]:
+        """Colector para /metrics"""
+        with self._lock:
+            pools = {
+                direccion: (e.en_uso, e.maximo, e.esperando, e.abiertas, e.creadas, dict(e.cerradas),
+                            dict(e.fallos_checkout), e.vaciados, e.espera.copia())
+                for direccion, e in self._pools.items()
+            }
+
+        def serie(nombre: str, ayuda: str, tipo: str, indice: int) -> List[str]:
+            lineas = [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"]
+            for direccion, valores in pools.items():
+                lineas.append(f'{nombre}{{address="{direccion}"}} {valores[indice]}')
+            return lineas
+
+        lineas = []
+        lineas += serie("mongo_pool_checked_out", "Conexiones del pool en uso", "gauge", 0)
+        lineas += serie("mongo_pool_max_size", "Tamaño máximo del pool", "gauge", 1)
+        lineas += serie("mongo_pool_waiting", "Peticiones esperando una conexión", "gauge", 2)
+        lineas += serie("mongo_pool_open_connections", "Conexiones abiertas", "gauge", 3)
+        lineas += serie("mongo_pool_connections_created_total", "Conexiones creadas", "counter", 4)
+        lineas += serie("mongo_pool_cleared_total", "Vaciados del pool", "counter", 7)
+
+        lineas += [
+            "# HELP mongo_pool_connections_closed_total Conexiones cerradas por motivo",
+            "# TYPE mongo_pool_connections_closed_total counter"
+        ]
+        for direccion, valores in pools.items():
+            for motivo, n in valores[5].items():
+                lineas.append(f'mongo_pool_connections_closed_total{{address="{direccion}",reason="{motivo}"}} {n}')
+
+        lineas += [
+            "# HELP mongo_pool_checkout_failed_total Checkouts fallidos por motivo",
+            "# TYPE mongo_pool_checkout_failed_total counter"
+        ]
+        for direccion, valores in pools.items():
+            for motivo, n in valores[6].items():
+                lineas.append(f'mongo_pool_checkout_failed_total{{address="{direccion}",reason="{motivo}"}} {n}')
+
+        lineas += [
+            "# HELP mongo_pool_checkout_wait_seconds Espera hasta obtener una conexión del pool",
+            "# TYPE mongo_pool_checkout_wait_seconds histogram"
+        ]
+        for direccion, valores in pools.items():
+            h = valores[8]
+            acumulado = 0
+            for limite, n in zip(h.limites, h.cuentas):
+                acumulado += n
+                lineas.append(f'mongo_pool_checkout_wait_seconds_bucket{{address="{direccion}",le="{limite}"}} {acumulado}')
+            lineas.append(f'mongo_pool_checkout_wait_seconds_bucket{{address="{direccion}",le="+Inf"}} {h.total}')
+            lineas.append(f'mongo_pool_checkout_wait_seconds_sum{{address="{direccion}"}} {h.suma}')
+            lineas.append(f'mongo_pool_checkout_wait_seconds_count{{address="{direccion}"}} {h.total}')
+        return lineas
+
+
+# Singleton instance
+mongo_pool = MongoPoolService()
@@ -5,25 +5,52 @@ Servicio para procesamiento OCR de tickets de venta
 
 import re
 import logging
+from functools import lru_cache
 from typing import Dict, Any, Optional, List
 from datetime import datetime
 import os
 
-# Intentar importar pytesseract
-try:
-    import pytesseract
-    from PIL import Image
-    import cv2
-    import numpy as np
-    PYTESSERACT_AVAILABLE = True
-except ImportError:
-    PYTESSERACT_AVAILABLE = False
-    print("WARNING: pytesseract, PIL, or cv2 not available. OCR will use MOCK mode.")
-    print("Install with: pip install pytesseract pillow opencv-python")
+from app.services.tracing_service import trazado
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=1)
+def _motor_ocr():
+    """
+    Importa pytesseract y OpenCV la primera vez que se procesa un ticket
+
+    Cargan numpy y las librerías nativas de OpenCV, así que no se importan
+    al arrancar. Devuelve (pytesseract, cv2) o None si no están instalados
+    (modo MOCK).
+    """
+    try:
+        import pytesseract
+        import cv2
+    except ImportError:
+        logger.warning(
+            "pytesseract u OpenCV no disponibles: el OCR usa modo MOCK "
+            "(pip install pytesseract pillow opencv-python)"
+        )
+        return None
+
+    if os.name == 'nt':  # Windows
+        # Intentar encontrar tesseract en las rutas comunes de Windows
+        # En Linux/Docker generalmente no es necesario
+        possible_paths = [
+            r'C:\Program Files\Tesseract-OCR\tesseract.exe',
+            r'C:\Program Files (x86)\Tesseract-OCR\tesseract.exe',
+        ]
+        for path in possible_paths:
+            if os.path.exists(path):
+                pytesseract.pytesseract.tesseract_cmd = path
+                logger.info(f"Tesseract found at: {path}")
+                break
+
+    logger.info("OCR Service: modo REAL con pytesseract")
+    return pytesseract, cv2
+
+
 class OCRService:
     """
     Servicio para extraer información de tickets usando OCR
@@ -33,32 +60,20 @@ class OCRService:
 
     def __init__(self):
         self.confidence_threshold = 0.6
-        self.use_real_ocr = PYTESSERACT_AVAILABLE
-
-        if self.use_real_ocr:
-            logger.info("OCR Service initialized (REAL mode with pytesseract)")
-            # Configurar pytesseract si está en Windows
-            # En Linux/Docker generalmente no es necesario
-            if os.name == 'nt':  # Windows
-                # Intentar encontrar tesseract en las rutas comunes de Windows
-                possible_paths = [
-                    r'C:\Program Files\Tesseract-OCR\tesseract.exe',
-                    r'C:\Program Files (x86)\Tesseract-OCR\tesseract.exe',
-                ]
-                for path in possible_paths:
-                    if os.path.exists(path):
-                        pytesseract.pytesseract.tesseract_cmd = path
-                        logger.info(f"Tesseract found at: {path}")
-                        break
-        else:
-            logger.warning("OCR Service initialized (MOCK mode - pytesseract not available)")
+
+    @property
+    def use_real_ocr(self) -> bool:
+        """pytesseract disponible (se comprueba en el primer uso)"""
+        return _motor_ocr() is not None
 
     def _preprocess_image(self, image_path: str):
         """
         Preprocesa la imagen para mejorar el OCR
         """
-        if not PYTESSERACT_AVAILABLE:
+        motor = _motor_ocr()
+        if motor is None:
             return None
+        _, cv2 = motor
 
         # Leer imagen
         img = cv2.imread(image_path)
@@ -74,6 +89,7 @@ class OCRService:
 
         return denoised
 
+    @trazado("ocr.process_ticket_image", "ocr")
     async def process_ticket_image(self, image_path: str) -> Dict[str, Any]:
         """
         Procesa una imagen de ticket y extrae información
@@ -94,6 +110,7 @@ class OCRService:
 
                 # Extraer texto con pytesseract
                 # Usar idioma español si está disponible
+                pytesseract, _ = _motor_ocr()
                 try:
                     text = pytesseract.image_to_string(processed_img, lang='spa')
                 except Exception:
@@ -0,0 +1,283 @@
+"""
+OSE Platform - Pallet Reconcile Service
+Reconciliación de baja prioridad de los contadores de pallets
+
+Los contadores (carton_ids, carton_count, device_count, devices_per_carton)
+se mantienen desde las rutas de escritura de dispositivos ($inc,
+$addToSet/$pull y un update de pipeline para los derivados).
+Este servicio los recalcula periódicamente con una agregación sobre devices
+e informa (y opcionalmente corrige) las desviaciones.
+
+La ejecución periódica se reparte entre workers con un turno en MongoDB
+(colección job_locks): en cada intervalo solo la lanza un worker.
+"""
+
+from datetime import datetime, date, timedelta
+from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+import time
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Desviaciones que se incluyen en el informe
+MAX_DESVIACIONES_INFORME = 100
+
+# Campos de los pallets que se comparan con el contenido real
+PROYECCION_CONTADORES = {
+    "_id": 1, "pallet_id": 1, "carton_ids": 1, "carton_count": 1,
+    "device_count": 1, "devices_per_carton": 1
+}
+
+# Turno de la reconciliación periódica en la colección job_locks
+COLECCION_TURNOS = "job_locks"
+TURNO_RECONCILIACION = "pallet_reconcile"
+
+
+class PalletReconcileService:
+    """Recalcula los contadores de pallets por lotes y detecta desviaciones"""
+
+    def __init__(self):
+        self._tarea: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.ultimo_informe: Optional[Dict[str, Any]] = None
+
+    async def _contenido_real(self, pallet_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Dispositivos y cartones reales de cada pallet, en una agregación"""
+        from app.models.device import Device
+
+        cursor = Device.get_motor_collection().aggregate([
+            {"$match": {"pallet_id": {"$in": pallet_ids}}},
+            {"$group": {
+                "_id": "$pallet_id",
+                "device_count": {"$sum": 1},
+                "carton_ids": {"$addToSet": "$carton_id"}
+            }}
+        ])
+
+        return {
+            doc["_id"]: {
+                "device_count": doc["device_count"],
+                "carton_ids": {c for c in doc["carton_ids"] if c}
+            }
+            async for doc in cursor
+        }
+
+    async def _reconciliar_lote(
+        self,
+        pallets: List[Dict[str, Any]],
+        corregir: bool
+    ) -> List[Dict[str, Any]]:
+        from app.models.pallet import Pallet
+
+        reales = await self._contenido_real([p["pallet_id"] for p in pallets])
+        ahora = datetime.utcnow()
+
+        desviaciones = []
+        operaciones = []
+
+        for pallet in pallets:
+            real = reales.get(pallet["pallet_id"], {"device_count": 0, "carton_ids": set()})
+            guardados = set(pallet.get("carton_ids") or [])
+            cartones = len(real["carton_ids"])
+            por_carton = real["device_count"] // cartones if cartones else 0
+
+            if (
+                pallet.get("device_count", 0) == real["device_count"]
+                and pallet.get("carton_count", 0) == cartones
+                and pallet.get("devices_per_carton") == por_carton
+                and guardados == real["carton_ids"]
+            ):
+                continue
+
+            desviaciones.append({
+                "pallet_id": pallet["pallet_id"],
+                "device_count": {"stored": pallet.get("device_count", 0), "actual": real["device_count"]},
+                "carton_count": {"stored": pallet.get("carton_count", 0), "actual": cartones},
+                "devices_per_carton": {"stored": pallet.get("devices_per_carton"), "actual": por_carton},
+                "missing_cartons": len(real["carton_ids"] - guardados),
+                "extra_cartons": len(guardados - real["carton_ids"])
+            })
+
+            if corregir:
+                operaciones.append(UpdateOne(
+                    {"_id": pallet["_id"]},
+                    {"$set": {
+                        "device_count": real["device_count"],
+                        "carton_count": cartones,
+                        "carton_ids": sorted(real["carton_ids"]),
+                        "devices_per_carton": por_carton,
+                        "fecha_modificacion": ahora
+                    }}
+                ))
+
+        if operaciones:
+            await Pallet.get_motor_collection().bulk_write(operaciones, ordered=False)
+
+        return desviaciones
+
+    async def recalcular(self, pallet_ids: List[str]) -> int:
+        """
+        Recalcula en el momento los contadores de unos pallets concretos
+
+        Para pallets recién creados, cuyos contadores no tienen un estado
+        previo al que aplicar deltas. Returns: pallets corregidos.
+        """
+        from app.models.pallet import Pallet
+
+        pallets = await Pallet.get_motor_collection().find(
+            {"pallet_id": {"$in": pallet_ids}},
+            PROYECCION_CONTADORES
+        ).to_list(length=None)
+
+        return len(await self._reconciliar_lote(pallets, corregir=True)) if pallets else 0
+
+    async def reconciliar(
+        self,
+        corregir: bool = False,
+        pallet_ids: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Recalcula los contadores de los pallets y devuelve un informe de desviaciones
+
+        Args:
+            corregir: Sobrescribir los contadores desviados con los valores reales
+            pallet_ids: Limitar a estos pallets (por defecto, todos)
+        """
+        from app.models.pallet import Pallet
+
+        async with self._lock:
+            inicio = time.perf_counter()
+            filtro = {"pallet_id": {"$in": pallet_ids}} if pallet_ids else {}
+
+            cursor = Pallet.get_motor_collection().find(
+                filtro,
+                PROYECCION_CONTADORES,
+                batch_size=settings.PALLET_RECONCILE_BATCH_SIZE
+            )
+
+            revisados = 0
+            desviaciones: List[Dict[str, Any]] = []
+            lote: List[Dict[str, Any]] = []
+
+            async for pallet in cursor:
+                lote.append(pallet)
+                if len(lote) >= settings.PALLET_RECONCILE_BATCH_SIZE:
+                    desviaciones.extend(await self._reconciliar_lote(lote, corregir))
+                    revisados += len(lote)
+                    lote = []
+                    # Baja prioridad: ceder tiempo a las peticiones entre lotes
+                    await asyncio.sleep(settings.PALLET_RECONCILE_PAUSE)
+
+            if lote:
+                desviaciones.extend(await self._reconciliar_lote(lote, corregir))
+                revisados += len(lote)
+
+            informe = {
+                "checked": revisados,
+                "with_drift": len(desviaciones),
+                "fixed": len(desviaciones) if corregir else 0,
+                "device_drift": sum(
+                    abs(d["device_count"]["stored"] - d["device_count"]["actual"])
+                    for d in desviaciones
+                ),
+                "duration_seconds": round(time.perf_counter() - inicio, 3),
+                "fecha": datetime.utcnow(),
+                "drift": desviaciones[:MAX_DESVIACIONES_INFORME]
+            }
+
+        self.ultimo_informe = informe
+
+        if desviaciones:
+            logger.warning(
+                f"Contadores de pallets desviados: {len(desviaciones)} de {revisados}"
+                f"{' (corregidos)' if corregir else ''}"
+            )
+
+        return informe
+
+    async def registrar_metricas(self, informe: Dict[str, Any]):
+        """Guarda el número de pallets con desviación en la colección metrics"""
+        from app.models.metric import Metric, MetricType, MetricPeriod
+
+        await Metric.record_metric(
+            metric_type=MetricType.CUSTOM,
+            metric_name="pallet_counter_drift",
+            value=informe["with_drift"],
+            date_value=date.today(),
+            period=MetricPeriod.DAILY,
+            unit="pallets",
+            data={k: v for k, v in informe.items() if k != "drift"}
+        )
+
+    # ════════════════════════════════════════════════════════════════════
+    # CICLO DE VIDA
+    # ════════════════════════════════════════════════════════════════════
+
+    async def _tomar_turno(self) -> bool:
+        """
+        Reserva la reconciliación de este intervalo para el worker actual
+
+        El turno dura el 90% del intervalo y no se libera al terminar: los
+        workers que despiertan en el mismo intervalo lo encuentran ocupado.
+        Si el worker que lo tiene muere, caduca antes del siguiente intervalo.
+        """
+        from app.models.pallet import Pallet
+        from app.services.metrics_service import WORKER
+
+        ahora = datetime.utcnow()
+        turnos = Pallet.get_motor_collection().database[COLECCION_TURNOS]
+        try:
+            await turnos.update_one(
+                {"_id": TURNO_RECONCILIACION, "expira": {"$lt": ahora}},
+                {"$set": {
+                    "worker": WORKER,
+                    "desde": ahora,
+                    "expira": ahora + timedelta(seconds=settings.PALLET_RECONCILE_INTERVAL * 0.9)
+                }},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # El turno existe y no ha caducado: lo tiene otro worker
+            return False
+        return True
+
+    async def _ejecutar(self):
+        while True:
+            await asyncio.sleep(settings.PALLET_RECONCILE_INTERVAL)
+            try:
+                if not await self._tomar_turno():
+                    logger.debug("Reconciliación de pallets: turno de otro worker")
+                    continue
+                informe = await self.reconciliar(corregir=settings.PALLET_RECONCILE_FIX)
+                await self.registrar_metricas(informe)
+            except Exception as e:
+                logger.error(f"Error reconciliando contadores de pallets: {e}")
+
+    def iniciar(self):
+        """
+        Programa la reconciliación periódica (PALLET_RECONCILE_INTERVAL)
+
+        Se inicia en todos los workers, pero cada intervalo la ejecuta solo
+        el que toma el turno (_tomar_turno).
+        """
+        if settings.PALLET_RECONCILE_INTERVAL > 0 and self._tarea is None:
+            self._tarea = asyncio.create_task(self._ejecutar())
+
+    async def detener(self):
+        if self._tarea:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+
+# Singleton instance
+pallet_reconcile = PalletReconcileService()
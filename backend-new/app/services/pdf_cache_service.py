@@ -0,0 +1,262 @@
+"""
+OSE Platform - PDF Cache Service
+Caché de PDFs de facturas direccionada por contenido
+
+La clave es un SHA-256 de la plantilla, su versión, la versión de la
+configuración de facturación y los datos normalizados de la factura: si
+nada de eso cambia, el PDF es el mismo y se sirve sin volver a maquetar.
+Los PDFs se guardan en disco o en GridFS (storage_service) y el índice
+(pdf_cache) permite expulsar las entradas antiguas o menos usadas.
+"""
+
+from datetime import datetime, timedelta
+from hashlib import sha256
+from typing import Any, Dict, Optional
+import asyncio
+import json
+import logging
+
+from pymongo.errors import DuplicateKeyError
+
+from app.config import settings
+from app.services.storage_service import crear_almacen
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("disk", "gridfs")
+
+
+class PdfCacheService:
+    """Caché de PDFs renderizados (disco o GridFS)"""
+
+    def __init__(self):
+        self._tarea: Optional[asyncio.Task] = None
+        self._almacenes: Dict[str, Any] = {}
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evicted": 0}
+
+    @property
+    def activo(self) -> bool:
+        return settings.INVOICE_PDF_CACHE_BACKEND in BACKENDS
+
+    @staticmethod
+    def clave(
+        template_name: str,
+        template_version: str,
+        config_version: int,
+        datos: Dict[str, Any]
+    ) -> str:
+        """
+        Hash del contenido que determina el PDF
+
+        Los datos se serializan con claves ordenadas para que dos dicts
+        equivalentes den la misma clave.
+        """
+        contenido = json.dumps(
+            {
+                "template": template_name,
+                "template_version": template_version,
+                "config_version": config_version,
+                "data": datos
+            },
+            sort_keys=True,
+            default=str,
+            ensure_ascii=False,
+            separators=(",", ":")
+        )
+        return sha256(contenido.encode("utf-8")).hexdigest()
+
+    # ════════════════════════════════════════════════════════════════════
+    # ALMACENAMIENTO
+    # ════════════════════════════════════════════════════════════════════
+
+    def almacen(self, backend: Optional[str] = None):
+        """Almacén de los PDFs (por defecto, el configurado)"""
+        backend = backend or settings.INVOICE_PDF_CACHE_BACKEND
+        if backend not in self._almacenes:
+            self._almacenes[backend] = crear_almacen(
+                backend,
+                "pdf_cache" if backend == "gridfs" else settings.INVOICE_PDF_CACHE_DIR
+            )
+        return self._almacenes[backend]
+
+    @staticmethod
+    def ruta(clave: str) -> str:
+        """Clave del PDF dentro del almacén"""
+        return f"{clave[:2]}/{clave}.pdf"
+
+    async def _leer_blob(self, entrada) -> Optional[bytes]:
+        almacen = self.almacen(entrada.backend)
+        try:
+            return b"".join([trozo async for trozo in almacen.iter_range(self.ruta(entrada.key))])
+        except FileNotFoundError:
+            return None
+
+    async def _borrar_blob(self, entrada: Dict[str, Any]):
+        try:
+            await self.almacen(entrada["backend"]).delete(self.ruta(entrada["key"]))
+        except Exception as e:
+            logger.warning(f"No se pudo borrar el PDF cacheado {entrada['key']}: {e}")
+
+    # ════════════════════════════════════════════════════════════════════
+    # LECTURA / ESCRITURA
+    # ════════════════════════════════════════════════════════════════════
+
+    async def obtener(self, clave: str) -> Optional[bytes]:
+        """PDF cacheado para la clave, o None si no está"""
+        from app.models.pdf_cache_entry import PdfCacheEntry
+
+        if not self.activo:
+            return None
+
+        entrada = await PdfCacheEntry.find_one(PdfCacheEntry.key == clave)
+        datos = await self._leer_blob(entrada) if entrada else None
+
+        if datos is None:
+            if entrada:
+                # El índice apunta a un PDF que ya no existe
+                await entrada.delete()
+            self._stats["misses"] += 1
+            return None
+
+        await PdfCacheEntry.get_motor_collection().update_one(
+            {"_id": entrada.id},
+            {"$set": {"last_access": datetime.utcnow()}, "$inc": {"hits": 1}}
+        )
+        self._stats["hits"] += 1
+        return datos
+
+    async def guardar(
+        self,
+        clave: str,
+        datos: bytes,
+        template_name: Optional[str] = None,
+        invoice_number: Optional[str] = None
+    ):
+        """Guarda un PDF recién renderizado"""
+        from app.models.pdf_cache_entry import PdfCacheEntry
+
+        if not self.activo:
+            return
+
+        backend = settings.INVOICE_PDF_CACHE_BACKEND
+        # Misma clave, mismo contenido: escribirlo dos veces a la vez es inocuo
+        await self.almacen(backend).save(self.ruta(clave), datos, "application/pdf")
+
+        ahora = datetime.utcnow()
+        try:
+            resultado = await PdfCacheEntry.get_motor_collection().update_one(
+                {"key": clave},
+                {"$setOnInsert": {
+                    "key": clave,
+                    "backend": backend,
+                    "size": len(datos),
+                    "template_name": template_name,
+                    "invoice_number": invoice_number,
+                    "hits": 0,
+                    "created_at": ahora,
+                    "last_access": ahora
+                }},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Otro worker insertó la misma clave a la vez (índice único)
+            return
+
+        if resultado.upserted_id is not None:
+            self._stats["stores"] += 1
+
+    # ════════════════════════════════════════════════════════════════════
+    # EXPULSIÓN
+    # ════════════════════════════════════════════════════════════════════
+
+    async def purgar(self) -> Dict[str, Any]:
+        """
+        Aplica la política de expulsión
+
+        - Entradas sin acceso en INVOICE_PDF_CACHE_MAX_AGE_DAYS
+        - Si el total supera INVOICE_PDF_CACHE_MAX_MB, las de acceso más antiguo
+        """
+        from app.models.pdf_cache_entry import PdfCacheEntry
+
+        coleccion = PdfCacheEntry.get_motor_collection()
+        proyeccion = {"_id": 1, "key": 1, "backend": 1, "size": 1}
+
+        limite_fecha = datetime.utcnow() - timedelta(days=settings.INVOICE_PDF_CACHE_MAX_AGE_DAYS)
+        expulsar = await coleccion.find(
+            {"last_access": {"$lt": limite_fecha}}, proyeccion
+        ).to_list(length=None)
+
+        ids_caducadas = {e["_id"] for e in expulsar}
+        total = await coleccion.aggregate([
+            {"$match": {"_id": {"$nin": list(ids_caducadas)}}},
+            {"$group": {"_id": None, "bytes": {"$sum": "$size"}}}
+        ]).to_list(length=1)
+        ocupado = total[0]["bytes"] if total else 0
+        limite_bytes = settings.INVOICE_PDF_CACHE_MAX_MB * 1024 * 1024
+
+        if ocupado > limite_bytes:
+            async for entrada in coleccion.find(
+                {"_id": {"$nin": list(ids_caducadas)}}, proyeccion
+            ).sort("last_access", 1):
+                if ocupado <= limite_bytes:
+                    break
+                expulsar.append(entrada)
+                ocupado -= entrada.get("size", 0)
+
+        for entrada in expulsar:
+            await self._borrar_blob(entrada)
+        if expulsar:
+            await coleccion.delete_many({"_id": {"$in": [e["_id"] for e in expulsar]}})
+            self._stats["evicted"] += len(expulsar)
+            logger.info(f"Caché de PDFs: {len(expulsar)} entradas expulsadas")
+
+        return {
+            "evicted": len(expulsar),
+            "bytes": ocupado,
+            "limit_bytes": limite_bytes
+        }
+
+    async def stats(self) -> Dict[str, Any]:
+        """Aciertos/fallos de este worker y ocupación de la caché"""
+        from app.models.pdf_cache_entry import PdfCacheEntry
+
+        total = await PdfCacheEntry.get_motor_collection().aggregate([
+            {"$group": {"_id": None, "entries": {"$sum": 1}, "bytes": {"$sum": "$size"}}}
+        ]).to_list(length=1)
+
+        return {
+            "backend": settings.INVOICE_PDF_CACHE_BACKEND,
+            "entries": total[0]["entries"] if total else 0,
+            "bytes": total[0]["bytes"] if total else 0,
+            **self._stats
+        }
+
+    # ════════════════════════════════════════════════════════════════════
+    # CICLO DE VIDA
+    # ════════════════════════════════════════════════════════════════════
+
+    async def _ejecutar(self):
+        while True:
+            await asyncio.sleep(settings.INVOICE_PDF_CACHE_PURGE_INTERVAL)
+            try:
+                await self.purgar()
+            except Exception as e:
+                logger.error(f"Error purgando la caché de PDFs: {e}")
+
+    def iniciar(self):
+        """Programa la expulsión periódica (INVOICE_PDF_CACHE_PURGE_INTERVAL)"""
+        if self.activo and settings.INVOICE_PDF_CACHE_PURGE_INTERVAL > 0 and self._tarea is None:
+            self._tarea = asyncio.create_task(self._ejecutar())
+
+    async def detener(self):
+        if self._tarea:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+
+# Singleton instance
+pdf_cache = PdfCacheService()
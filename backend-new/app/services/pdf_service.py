@@ -1,27 +1,51 @@
 """
 OSE Platform - PDF Service
 Servicio para generación de PDFs usando WeasyPrint y Jinja2
+Los informes largos se generan en streaming con ReportLab (report_service)
+Ambos se importan en el primer uso, no al arrancar
 """
 
-# Try to import WeasyPrint, fallback to simple PDF if not available
-try:
-    from weasyprint import HTML, CSS
-    WEASYPRINT_AVAILABLE = True
-except (ImportError, OSError):
-    WEASYPRINT_AVAILABLE = False
-    print("WARNING: WeasyPrint not available. Using simple PDF generation.")
-
 from jinja2 import Environment, FileSystemLoader, Template
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple, BinaryIO
+from collections import Counter
 from datetime import datetime
+from functools import lru_cache
+from hashlib import sha256
 import logging
 
+from fastapi.concurrency import run_in_threadpool
+
 from app.config import settings
 from app.services.qr_service import qr_service
+from app.services.pdf_cache_service import pdf_cache
+from app.services.tracing_service import trazado
 
 logger = logging.getLogger(__name__)
 
+# Subir al cambiar el CSS o el HTML inline de las facturas (invalida la caché de PDFs)
+INVOICE_RENDER_VERSION = 1
+
+
+@lru_cache(maxsize=1)
+def _weasyprint():
+    """
+    Importa WeasyPrint al generar el primer PDF desde HTML
+
+    Carga cairo/pango y sus dependencias, así que no se importa al
+    arrancar. Devuelve el módulo o None si no está disponible.
+    """
+    try:
+        import weasyprint
+    except (ImportError, OSError):
+        logger.warning("WeasyPrint not available. Using simple PDF generation.")
+        return None
+    return weasyprint
+
+
+def weasyprint_disponible() -> bool:
+    return _weasyprint() is not None
+
 
 class PDFService:
     """
@@ -66,6 +90,7 @@ class PDFService:
             self.jinja_invoices = None
             logger.warning(f"Invoices templates directory not found: {invoices_path}")
 
+    @trazado("pdf.render_html", "pdf")
     def generate_pdf_from_html(
         self,
         html_content: str,
@@ -82,8 +107,16 @@ class PDFService:
             bytes: PDF generado
         """
         try:
+            # Verificar si WeasyPrint está disponible
+            weasyprint = _weasyprint()
+            if weasyprint is None:
+                # Fallback: crear un PDF simple con texto plano
+                logger.warning("WeasyPrint not available, generating simple PDF")
+                simple_pdf = f"PDF Content (WeasyPrint not available)\n\n{html_content[:500]}...".encode('utf-8')
+                return simple_pdf
+
             # Crear CSS por defecto
-            default_css = CSS(string=f"""
+            default_css = weasyprint.CSS(string=f"""
                 @page {{
                     size: {settings.PDF_PAGE_SIZE};
                     margin: {settings.PDF_MARGIN};
@@ -94,20 +127,13 @@ class PDFService:
                 }}
             """)
 
-            # Verificar si WeasyPrint está disponible
-            if not WEASYPRINT_AVAILABLE:
-                # Fallback: crear un PDF simple con texto plano
-                logger.warning("WeasyPrint not available, generating simple PDF")
-                simple_pdf = f"PDF Content (WeasyPrint not available)\n\n{html_content[:500]}...".encode('utf-8')
-                return simple_pdf
-
             # Si hay CSS adicional, agregarlo
             stylesheets = [default_css]
             if css_content:
-                stylesheets.append(CSS(string=css_content))
+                stylesheets.append(weasyprint.CSS(string=css_content))
 
             # Generar PDF
-            html = HTML(string=html_content)
+            html = weasyprint.HTML(string=html_content)
             pdf = html.write_pdf(stylesheets=stylesheets)
 
             logger.info("PDF generated successfully from HTML")
@@ -149,6 +175,7 @@ class PDFService:
             logger.error(f"Error generating PDF from template: {e}")
             raise
 
+    @trazado("pdf.device_label", "pdf")
     def generate_device_label(
         self,
         imei: str,
@@ -227,6 +254,7 @@ class PDFService:
             logger.error(f"Error generating device label: {e}")
             raise
 
+    @trazado("pdf.package_label", "pdf")
     def generate_package_label(
         self,
         package_no: str,
@@ -294,119 +322,236 @@ class PDFService:
             logger.error(f"Error generating package label: {e}")
             raise
 
-    def generate_production_report(
+    # ════════════════════════════════════════════════════════════════════════
+    # INFORMES (ReportLab en streaming)
+    # ════════════════════════════════════════════════════════════════════════
+
+    @trazado("pdf.production_report", "pdf")
+    async def generate_production_report(
         self,
         order_number: str,
-        order_data: Dict[str, Any],
-        devices: List[Dict[str, Any]],
-        stats: Dict[str, Any]
-    ) -> bytes:
+        destino: BinaryIO,
+        order: Optional[Any] = None
+    ) -> Dict[str, Any]:
         """
-        Genera un reporte de producción
+        Genera el reporte de producción de una orden
+
+        Los dispositivos se leen por lotes de un cursor proyectado y se
+        maquetan según llegan (report_service), sin cargar la orden entera.
 
         Args:
-            order_number: Número de orden de producción
-            order_data: Datos de la orden
-            devices: Lista de dispositivos producidos
-            stats: Estadísticas de la orden
+            order_number: Número de orden de producción (Device.nro_orden)
+            destino: Fichero binario donde escribir el PDF
+            order: ProductionOrder, si existe
 
         Returns:
-            bytes: PDF del reporte
+            Dict con filas, páginas y tiempos del informe
         """
-        if not self.jinja_env:
-            raise RuntimeError("Jinja environment not initialized")
-
-        try:
-            data = {
-                "order_number": order_number,
-                "order": order_data,
-                "devices": devices,
-                "stats": stats,
-                "fecha_generacion": datetime.now().strftime("%Y-%m-%d %H:%M"),
-                "company_name": settings.COMPANY_NAME
-            }
-
-            return self.generate_pdf_from_template(
-                template_name="reporte_produccion.html",
-                data=data
-            )
-
-        except Exception as e:
-            logger.error(f"Error generating production report: {e}")
-            raise
-
-    def generate_customer_report(
+        from app.models.device import Device
+        from app.services.report_service import report_service
+
+        info = [("Orden", order_number)]
+        if order:
+            info += [
+                ("Producto", order.product_name),
+                ("Marca", order.brand),
+                ("Referencia", order.reference_number),
+                ("Cantidad", order.quantity),
+                ("Producidos / aprobados / rechazados", f"{order.produced} / {order.approved} / {order.rejected}"),
+                ("Estado", order.status.value),
+                ("Línea", order.production_line),
+            ]
+
+        por_estado: Counter = Counter()
+        por_lote: Counter = Counter()
+
+        def fila(doc: Dict[str, Any]) -> List[Any]:
+            por_estado[doc.get("estado")] += 1
+            por_lote[doc.get("lote")] += 1
+            return [
+                doc.get("imei"), doc.get("ccid"), doc.get("lote"), doc.get("carton_id"),
+                doc.get("pallet_id"), doc.get("estado"), doc.get("fecha_creacion")
+            ]
+
+        def resumen() -> List[Tuple[str, Any]]:
+            return [
+                ("Dispositivos", sum(por_estado.values())),
+                ("Lotes", len(por_lote)),
+                *((f"Estado: {estado}", n) for estado, n in por_estado.most_common()),
+            ]
+
+        # El índice (nro_orden, lote) sirve el orden: Mongo no ordena en memoria
+        cursor = Device.get_motor_collection().find(
+            {"nro_orden": order_number},
+            {"_id": 0, "imei": 1, "ccid": 1, "lote": 1, "carton_id": 1,
+             "pallet_id": 1, "estado": 1, "fecha_creacion": 1},
+            batch_size=settings.REPORT_CURSOR_BATCH_SIZE
+        ).sort([("nro_orden", 1), ("lote", 1)])
+
+        return await report_service.generar(
+            destino,
+            titulo=f"Reporte de producción - Orden {order_number}",
+            columnas=[
+                ("IMEI", 3), ("ICCID", 4), ("Lote", 1), ("Cartón", 3),
+                ("Pallet", 3), ("Estado", 2), ("Fecha", 2.5)
+            ],
+            cursor=cursor,
+            fila=fila,
+            info=info,
+            resumen=resumen
+        )
+
+    @trazado("pdf.customer_report", "pdf")
+    async def generate_customer_report(
         self,
-        customer_data: Dict[str, Any],
-        devices: List[Dict[str, Any]],
-        summary: Dict[str, Any]
-    ) -> bytes:
+        customer: Any,
+        destino: BinaryIO
+    ) -> Dict[str, Any]:
         """
-        Genera un reporte de cliente (App 1)
+        Genera un reporte de cliente (App 1) con sus dispositivos
 
         Args:
-            customer_data: Datos del cliente
-            devices: Lista de dispositivos del cliente
-            summary: Resumen/estadísticas
+            customer: Customer
+            destino: Fichero binario donde escribir el PDF
 
         Returns:
-            bytes: PDF del reporte
+            Dict con filas, páginas y tiempos del informe
         """
-        if not self.jinja_env:
-            raise RuntimeError("Jinja environment not initialized")
-
-        try:
-            data = {
-                "customer": customer_data,
-                "devices": devices,
-                "summary": summary,
-                "fecha_generacion": datetime.now().strftime("%Y-%m-%d %H:%M"),
-                "company_name": settings.COMPANY_NAME
-            }
-
-            return self.generate_pdf_from_template(
-                template_name="reporte_cliente.html",
-                data=data
-            )
-
-        except Exception as e:
-            logger.error(f"Error generating customer report: {e}")
-            raise
-
-    def generate_quality_report(
+        from app.models.device import Device
+        from app.services.report_service import report_service
+
+        info = [
+            ("Cliente", customer.full_name),
+            ("Código", customer.customer_code),
+            ("Email", customer.email),
+            ("Dispositivos (ficha)", customer.devices_count),
+        ]
+
+        por_estado: Counter = Counter()
+        notificados = 0
+
+        def fila(doc: Dict[str, Any]) -> List[Any]:
+            nonlocal notificados
+            por_estado[doc.get("estado")] += 1
+            notificados += bool(doc.get("notificado"))
+            return [
+                doc.get("imei"), doc.get("ccid"), doc.get("nro_orden"), doc.get("marca"),
+                doc.get("estado"), bool(doc.get("notificado")), doc.get("fecha_notificacion")
+            ]
+
+        def resumen() -> List[Tuple[str, Any]]:
+            return [
+                ("Dispositivos", sum(por_estado.values())),
+                ("Notificados", notificados),
+                *((f"Estado: {estado}", n) for estado, n in por_estado.most_common()),
+            ]
+
+        # Índice (cliente, estado)
+        cursor = Device.get_motor_collection().find(
+            {"cliente": str(customer.id)},
+            {"_id": 0, "imei": 1, "ccid": 1, "nro_orden": 1, "marca": 1,
+             "estado": 1, "notificado": 1, "fecha_notificacion": 1},
+            batch_size=settings.REPORT_CURSOR_BATCH_SIZE
+        ).sort([("cliente", 1), ("estado", 1)])
+
+        return await report_service.generar(
+            destino,
+            titulo=f"Reporte de cliente - {customer.full_name}",
+            columnas=[
+                ("IMEI", 3), ("ICCID", 4), ("Orden", 2.5), ("Marca", 2),
+                ("Estado", 2), ("Notificado", 1.5), ("Fecha notificación", 2.5)
+            ],
+            cursor=cursor,
+            fila=fila,
+            info=info,
+            resumen=resumen
+        )
+
+    @trazado("pdf.quality_report", "pdf")
+    async def generate_quality_report(
         self,
-        inspection_data: Dict[str, Any],
-        defects: List[Dict[str, Any]]
-    ) -> bytes:
+        destino: BinaryIO,
+        production_order: Optional[str] = None,
+        production_line: Optional[int] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None
+    ) -> Dict[str, Any]:
         """
-        Genera un reporte de control de calidad
+        Genera un reporte de control de calidad (una fila por inspección)
 
         Args:
-            inspection_data: Datos de la inspección
-            defects: Lista de defectos encontrados
+            destino: Fichero binario donde escribir el PDF
+            production_order: Filtrar por orden de producción
+            production_line: Filtrar por línea
+            date_from: Inspecciones desde esta fecha
+            date_to: Inspecciones hasta esta fecha
 
         Returns:
-            bytes: PDF del reporte
+            Dict con filas, páginas y tiempos del informe
         """
-        if not self.jinja_env:
-            raise RuntimeError("Jinja environment not initialized")
-
-        try:
-            data = {
-                "inspection": inspection_data,
-                "defects": defects,
-                "fecha_generacion": datetime.now().strftime("%Y-%m-%d %H:%M"),
-                "company_name": settings.COMPANY_NAME
-            }
-
-            return self.generate_pdf_from_template(
-                template_name="reporte_calidad.html",
-                data=data
-            )
-
-        except Exception as e:
-            logger.error(f"Error generating quality report: {e}")
-            raise
+        from app.models.quality_control import QualityControl
+        from app.services.report_service import report_service, formatear
+
+        filtro: Dict[str, Any] = {}
+        info: List[Tuple[str, Any]] = []
+        if production_order:
+            filtro["production_order"] = production_order
+            info.append(("Orden", production_order))
+        if production_line is not None:
+            filtro["production_line"] = production_line
+            info.append(("Línea", production_line))
+        if date_from or date_to:
+            filtro["inspection_date"] = {}
+            if date_from:
+                filtro["inspection_date"]["$gte"] = date_from
+            if date_to:
+                filtro["inspection_date"]["$lte"] = date_to
+            info.append(("Periodo", f"{formatear(date_from) or '...'} - {formatear(date_to) or '...'}"))
+
+        por_resultado: Counter = Counter()
+        por_severidad: Counter = Counter()
+
+        def fila(doc: Dict[str, Any]) -> List[Any]:
+            defectos = doc.get("defects_found") or []
+            por_resultado[doc.get("result")] += 1
+            por_severidad.update(d.get("severity") or "sin severidad" for d in defectos)
+            return [
+                doc.get("inspection_date"), doc.get("imei"), doc.get("production_order"),
+                doc.get("production_line"), doc.get("inspector_name") or doc.get("inspector"),
+                doc.get("result"), doc.get("score"),
+                f"{len(defectos)}: {defectos[0].get('description', '')}" if defectos else ""
+            ]
+
+        def resumen() -> List[Tuple[str, Any]]:
+            total = sum(por_resultado.values())
+            aprobadas = por_resultado.get("passed", 0)
+            return [
+                ("Inspecciones", total),
+                ("Tasa de aprobación", f"{aprobadas / total * 100:.1f}%" if total else "-"),
+                *((f"Resultado: {resultado}", n) for resultado, n in por_resultado.most_common()),
+                *((f"Defectos {severidad}", n) for severidad, n in por_severidad.most_common()),
+            ]
+
+        cursor = QualityControl.get_motor_collection().find(
+            filtro,
+            {"_id": 0, "inspection_date": 1, "imei": 1, "production_order": 1,
+             "production_line": 1, "inspector": 1, "inspector_name": 1,
+             "result": 1, "score": 1, "defects_found": 1},
+            batch_size=settings.REPORT_CURSOR_BATCH_SIZE
+        ).sort("inspection_date", -1)
+
+        return await report_service.generar(
+            destino,
+            titulo="Reporte de control de calidad",
+            columnas=[
+                ("Fecha", 2.5), ("IMEI", 3), ("Orden", 2), ("Línea", 1), ("Inspector", 2.5),
+                ("Resultado", 1.8), ("Puntuación", 1.5), ("Defectos", 4)
+            ],
+            cursor=cursor,
+            fila=fila,
+            info=info,
+            resumen=resumen
+        )
 
     # ════════════════════════════════════════════════════════════════════════
     # UTILITY METHODS
@@ -512,6 +657,7 @@ class PDFService:
     # APP 5: GENERACIÓN DE FACTURAS
     # ════════════════════════════════════════════════════════════════════════
 
+    @trazado("pdf.invoice_render", "pdf")
     def generate_invoice_pdf(
         self,
         invoice_data: Dict[str, Any],
@@ -648,6 +794,71 @@ class PDFService:
             logger.error(f"Error generating invoice PDF: {e}")
             raise
 
+    def _invoice_template_version(self, template_name: str) -> str:
+        """
+        Versión de la plantilla de factura para la clave de la caché
+
+        Hash del fuente de la plantilla más INVOICE_RENDER_VERSION, que cubre
+        el CSS y el HTML inline de este módulo.
+        """
+        fuente = "inline"
+        if self.jinja_invoices:
+            fuente, _, _ = self.jinja_invoices.loader.get_source(self.jinja_invoices, template_name)
+
+        return f"{INVOICE_RENDER_VERSION}:{sha256(fuente.encode('utf-8')).hexdigest()[:16]}"
+
+    @trazado("pdf.invoice", "pdf")
+    async def get_invoice_pdf(
+        self,
+        invoice_data: Dict[str, Any],
+        config_version: int,
+        logo_base64: Optional[str] = None,
+        template_name: str = "invoice_default.html"
+    ) -> bytes:
+        """
+        PDF de factura a través de la caché por contenido
+
+        Si la plantilla, la configuración de facturación y los datos que se
+        pintan no han cambiado, devuelve el PDF guardado sin volver a maquetar.
+
+        Args:
+            invoice_data: Datos completos de la factura
+            config_version: InvoiceConfig.config_version
+            logo_base64: Logo de la empresa en base64 (opcional)
+            template_name: Nombre de la plantilla
+
+        Returns:
+            bytes: PDF de la factura
+        """
+        # Solo los campos que llegan a la plantilla: estado, fechas de envío,
+        # pdf_url, etc. no cambian el PDF y no deben invalidar la caché
+        datos = self._prepare_invoice_template_data(invoice_data, logo_base64)
+        clave = pdf_cache.clave(
+            template_name,
+            self._invoice_template_version(template_name),
+            config_version,
+            datos
+        )
+
+        pdf_bytes = await pdf_cache.obtener(clave)
+        if pdf_bytes is not None:
+            return pdf_bytes
+
+        pdf_bytes = await run_in_threadpool(
+            self.generate_invoice_pdf, invoice_data, logo_base64, template_name
+        )
+
+        # Sin WeasyPrint el "PDF" es un texto de aviso: no se cachea
+        if weasyprint_disponible():
+            await pdf_cache.guardar(
+                clave,
+                pdf_bytes,
+                template_name=template_name,
+                invoice_number=invoice_data.get("invoice_number")
+            )
+
+        return pdf_bytes
+
     def _generate_invoice_html(
         self,
         invoice_data: Dict[str, Any],
@@ -0,0 +1,417 @@
+"""
+OSE Platform - Print Spooler Service
+Cola de impresión ZPL para impresoras Zebra por TCP directo (puerto 9100)
+
+- Una cola por impresora, con un número acotado de conexiones simultáneas
+- Los trabajos en cola se agrupan y se envían por una única conexión
+- El estado de cada trabajo se guarda en print_jobs (visible desde cualquier worker)
+- Los envíos fallidos se reintentan con espera creciente
+- Un barrido periódico adopta los trabajos de workers caídos (las colas
+  solo viven en la memoria de cada worker)
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+import uuid
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+PUERTO_ZEBRA = 9100
+
+
+def parsear_impresoras(valor: str) -> Dict[str, Tuple[str, int]]:
+    """
+    Convierte "nombre=host:puerto,nombre2=host" en {nombre: (host, puerto)}
+
+    El puerto por defecto es el 9100 (raw TCP de Zebra).
+    """
+    impresoras = {}
+    for entrada in (valor or "").split(","):
+        if "=" not in entrada:
+            continue
+        nombre, destino = (parte.strip() for parte in entrada.split("=", 1))
+        host, _, puerto = destino.partition(":")
+        if nombre and host:
+            impresoras[nombre] = (host, int(puerto) if puerto else PUERTO_ZEBRA)
+    return impresoras
+
+
+class PrintSpoolerService:
+    """Spooler de trabajos ZPL por impresora"""
+
+    def __init__(self):
+        self._colas: Dict[str, asyncio.Queue] = {}
+        self._trabajadores: Dict[str, List[asyncio.Task]] = {}
+        self._reintentos: Set[asyncio.Task] = set()
+        self._barrido: Optional[asyncio.Task] = None
+
+        # Contadores por impresora
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    @property
+    def impresoras(self) -> Dict[str, Tuple[str, int]]:
+        return parsear_impresoras(settings.PRINT_SPOOLER_PRINTERS)
+
+    # ════════════════════════════════════════════════════════════════════
+    # ENCOLADO
+    # ════════════════════════════════════════════════════════════════════
+
+    def _cola(self, printer: str) -> asyncio.Queue:
+        """Cola de la impresora; arranca sus trabajadores la primera vez"""
+        if printer not in self._colas:
+            self._colas[printer] = asyncio.Queue()
+            self._stats[printer] = {"batches": 0, "jobs_sent": 0, "labels_sent": 0, "send_errors": 0}
+            self._trabajadores[printer] = [
+                asyncio.create_task(self._trabajador(printer))
+                for _ in range(max(1, settings.PRINT_SPOOLER_CONCURRENCY))
+            ]
+        return self._colas[printer]
+
+    def _validar_impresora(self, printer: str):
+        if printer not in self.impresoras:
+            raise ValueError(f"Impresora '{printer}' no configurada")
+
+    async def encolar(
+        self,
+        printer: str,
+        trabajos: List[Tuple[str, Optional[str]]],
+        created_by: Optional[str] = None
+    ) -> List[Any]:
+        """
+        Crea y encola trabajos de impresión
+
+        Args:
+            printer: Nombre de la impresora
+            trabajos: Lista de (zpl, documento_referencia)
+            created_by: Usuario que lanza la impresión
+
+        Returns:
+            Lista de PrintJob creados
+        """
+        from app.models.print_job import PrintJob
+
+        self._validar_impresora(printer)
+        if not trabajos:
+            return []
+
+        jobs = [
+            PrintJob(
+                printer=printer,
+                zpl=zpl,
+                labels=max(1, zpl.count("^XA")),
+                documento_referencia=referencia,
+                created_by=created_by
+            )
+            for zpl, referencia in trabajos
+        ]
+
+        resultado = await PrintJob.insert_many(jobs)
+        for job, job_id in zip(jobs, resultado.inserted_ids):
+            job.id = job_id
+
+        cola = self._cola(printer)
+        for job in jobs:
+            cola.put_nowait(job.id)
+
+        return jobs
+
+    async def reintentar(self, job) -> bool:
+        """Vuelve a encolar un trabajo fallido o cancelado"""
+        from app.models.print_job import PrintJobStatus
+
+        self._validar_impresora(job.printer)
+        if job.status not in (PrintJobStatus.FAILED, PrintJobStatus.CANCELLED):
+            return False
+
+        job.status = PrintJobStatus.QUEUED
+        job.attempts = 0
+        job.updated_at = datetime.utcnow()
+        await job.save()
+
+        self._cola(job.printer).put_nowait(job.id)
+        return True
+
+    async def cancelar(self, job) -> bool:
+        """Cancela un trabajo que aún no se ha enviado"""
+        from app.models.print_job import PrintJob, PrintJobStatus
+
+        resultado = await PrintJob.get_motor_collection().update_one(
+            {
+                "_id": job.id,
+                "status": {"$in": [PrintJobStatus.QUEUED.value, PrintJobStatus.RETRYING.value]}
+            },
+            {"$set": {"status": PrintJobStatus.CANCELLED.value, "updated_at": datetime.utcnow()}}
+        )
+        return resultado.modified_count == 1
+
+    # ════════════════════════════════════════════════════════════════════
+    # ENVÍO
+    # ════════════════════════════════════════════════════════════════════
+
+    async def _trabajador(self, printer: str):
+        cola = self._colas[printer]
+
+        while True:
+            lote = [await cola.get()]
+
+            # Agrupar lo que ya esté en cola en la misma conexión
+            while not cola.empty() and len(lote) < settings.PRINT_SPOOLER_BATCH_MAX_JOBS:
+                lote.append(cola.get_nowait())
+
+            try:
+                await self._enviar_lote(printer, lote)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error en el spooler de la impresora {printer}: {e}")
+            finally:
+                for _ in lote:
+                    cola.task_done()
+
+    async def _enviar_tcp(self, host: str, port: int, datos: bytes):
+        """Envía los datos en bruto a la impresora y cierra la conexión"""
+        _, writer = await asyncio.open_connection(host, port)
+        try:
+            writer.write(datos)
+            await writer.drain()
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    async def _enviar_lote(self, printer: str, job_ids: List[Any]):
+        from app.models.print_job import PrintJob, PrintJobStatus
+
+        batch_id = uuid.uuid4().hex[:12]
+
+        # Reclamar los trabajos de forma atómica: uno cancelado o ya reclamado
+        # por otro worker (tras una recuperación) no se envía dos veces
+        await PrintJob.get_motor_collection().update_many(
+            {
+                "_id": {"$in": job_ids},
+                "status": {"$in": [PrintJobStatus.QUEUED.value, PrintJobStatus.RETRYING.value]}
+            },
+            {"$set": {
+                "status": PrintJobStatus.SENDING.value,
+                "batch_id": batch_id,
+                "updated_at": datetime.utcnow()
+            }}
+        )
+
+        try:
+            await self._enviar_reclamados(printer, batch_id)
+        except asyncio.CancelledError:
+            # Parada del worker: el barrido los recupera de SENDING
+            raise
+        except Exception as e:
+            # Cualquier fallo (red, impresora o base de datos) deja el lote
+            # para reintento: nunca se queda en SENDING
+            error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+            self._stats[printer]["send_errors"] += 1
+            jobs = await PrintJob.find(
+                PrintJob.batch_id == batch_id,
+                PrintJob.status == PrintJobStatus.SENDING
+            ).to_list()
+            logger.warning(f"Envío a la impresora {printer} fallido ({len(jobs)} trabajos): {error}")
+            await self._registrar_fallo(printer, jobs, error)
+
+    async def _enviar_reclamados(self, printer: str, batch_id: str):
+        """Envía por una conexión los trabajos reclamados con batch_id y los completa"""
+        from app.models.print_job import PrintJob, PrintJobStatus
+
+        jobs = await PrintJob.find(PrintJob.batch_id == batch_id).sort("+created_at").to_list()
+        if not jobs:
+            return
+
+        host, port = self.impresoras.get(printer, (None, None))
+        if host is None:
+            raise ValueError(f"Impresora '{printer}' no configurada")
+
+        datos = "".join(job.zpl if job.zpl.endswith("\n") else job.zpl + "\n" for job in jobs).encode("utf-8")
+        await asyncio.wait_for(
+            self._enviar_tcp(host, port, datos),
+            timeout=settings.PRINT_SPOOLER_TIMEOUT
+        )
+
+        ahora = datetime.utcnow()
+        await PrintJob.get_motor_collection().update_many(
+            {"batch_id": batch_id},
+            {
+                "$set": {"status": PrintJobStatus.COMPLETED.value, "sent_at": ahora, "updated_at": ahora},
+                "$inc": {"attempts": 1}
+            }
+        )
+
+        stats = self._stats[printer]
+        stats["batches"] += 1
+        stats["jobs_sent"] += len(jobs)
+        stats["labels_sent"] += sum(job.labels for job in jobs)
+
+    async def _registrar_fallo(self, printer: str, jobs: List[Any], error: str):
+        """Marca los trabajos para reintento o como fallidos si se agotaron los intentos"""
+        from app.models.print_job import PrintJobStatus
+
+        ahora = datetime.utcnow()
+        reintentar = []
+
+        for job in jobs:
+            job.attempts += 1
+            job.errors.append(f"{ahora.isoformat()} {error}")
+            job.updated_at = ahora
+
+            if job.attempts >= settings.PRINT_SPOOLER_MAX_ATTEMPTS:
+                job.status = PrintJobStatus.FAILED
+            else:
+                job.status = PrintJobStatus.RETRYING
+                reintentar.append(job.id)
+
+            await job.save()
+
+        if reintentar:
+            espera = settings.PRINT_SPOOLER_RETRY_DELAY * jobs[0].attempts
+            tarea = asyncio.create_task(self._reencolar(printer, reintentar, espera))
+            self._reintentos.add(tarea)
+            tarea.add_done_callback(self._reintentos.discard)
+
+    async def _reencolar(self, printer: str, job_ids: List[Any], espera: float):
+        await asyncio.sleep(espera)
+        cola = self._cola(printer)
+        for job_id in job_ids:
+            cola.put_nowait(job_id)
+
+    # ════════════════════════════════════════════════════════════════════
+    # ESTADO
+    # ════════════════════════════════════════════════════════════════════
+
+    def stats(self) -> Dict[str, Any]:
+        """Impresoras configuradas y estado de sus colas en este worker"""
+        resultado = {}
+        for nombre, (host, port) in self.impresoras.items():
+            cola = self._colas.get(nombre)
+            resultado[nombre] = {
+                "host": host,
+                "port": port,
+                "queued": cola.qsize() if cola else 0,
+                "workers": len(self._trabajadores.get(nombre, [])),
+                **self._stats.get(nombre, {"batches": 0, "jobs_sent": 0, "labels_sent": 0, "send_errors": 0})
+            }
+        return resultado
+
+    # ════════════════════════════════════════════════════════════════════
+    # CICLO DE VIDA
+    # ════════════════════════════════════════════════════════════════════
+
+    async def _adoptar_huerfanos(self, impresoras: List[str], todos_en_cola: bool = False) -> int:
+        """
+        Encola en este worker los trabajos que ningún worker vivo va a enviar
+
+        - SENDING de hace más de dos timeouts de envío: el worker murió a
+          mitad de envío (los más recientes pueden ser un envío en curso).
+          Pasan a RETRYING.
+        - QUEUED/RETRYING sin cambios en PRINT_SPOOLER_ORPHAN_AFTER: estaban
+          en la cola en memoria de un worker caído (todos_en_cola: todos,
+          al arrancar).
+
+        Cada trabajo se adopta con un update condicionado a su updated_at,
+        así dos workers que barren a la vez no adoptan el mismo. Si aun así
+        un trabajo acaba en dos colas, el reclamo atómico de _enviar_lote
+        evita que se envíe dos veces.
+        """
+        from app.models.print_job import PrintJob, PrintJobStatus
+
+        coleccion = PrintJob.get_motor_collection()
+        ahora = datetime.utcnow()
+        en_cola = {"status": {"$in": [PrintJobStatus.QUEUED.value, PrintJobStatus.RETRYING.value]}}
+        if not todos_en_cola:
+            en_cola["updated_at"] = {"$lt": ahora - timedelta(seconds=settings.PRINT_SPOOLER_ORPHAN_AFTER)}
+
+        candidatos = await coleccion.find(
+            {
+                "printer": {"$in": impresoras},
+                "$or": [
+                    {
+                        "status": PrintJobStatus.SENDING.value,
+                        "updated_at": {"$lt": ahora - timedelta(seconds=settings.PRINT_SPOOLER_TIMEOUT * 2)}
+                    },
+                    en_cola
+                ]
+            },
+            {"_id": 1, "printer": 1, "status": 1, "updated_at": 1}
+        ).sort("created_at", 1).to_list(length=None)
+
+        interrumpidos = 0
+        adoptados = 0
+        for doc in candidatos:
+            actualizacion: Dict[str, Any] = {"$set": {"updated_at": ahora}}
+            if doc["status"] == PrintJobStatus.SENDING.value:
+                actualizacion["$set"]["status"] = PrintJobStatus.RETRYING.value
+                actualizacion["$push"] = {"errors": f"{ahora.isoformat()} Envío interrumpido (worker detenido)"}
+
+            resultado = await coleccion.update_one(
+                {"_id": doc["_id"], "status": doc["status"], "updated_at": doc.get("updated_at")},
+                actualizacion
+            )
+            if resultado.modified_count:
+                self._cola(doc["printer"]).put_nowait(doc["_id"])
+                adoptados += 1
+                if doc["status"] == PrintJobStatus.SENDING.value:
+                    interrumpidos += 1
+
+        if interrumpidos:
+            logger.warning(
+                f"Spooler de impresión: {interrumpidos} trabajos interrumpidos en SENDING pasan a reintento"
+            )
+        if adoptados:
+            logger.info(f"✓ Spooler de impresión: {adoptados} trabajos pendientes reencolados")
+        return adoptados
+
+    async def _barrer(self):
+        while True:
+            await asyncio.sleep(settings.PRINT_SPOOLER_SWEEP_INTERVAL)
+            try:
+                await self._adoptar_huerfanos(list(self.impresoras.keys()))
+            except Exception as e:
+                logger.error(f"Error en el barrido del spooler de impresión: {e}")
+
+    async def iniciar(self):
+        """
+        Vuelve a encolar los trabajos pendientes de una ejecución anterior
+
+        Incluye los que quedaron en SENDING al morir un worker a mitad de
+        envío. Después, cada PRINT_SPOOLER_SWEEP_INTERVAL, adopta los que
+        dejan los workers que caen mientras este sigue vivo.
+        """
+        impresoras = self.impresoras
+        if not impresoras:
+            return
+
+        await self._adoptar_huerfanos(list(impresoras.keys()), todos_en_cola=True)
+
+        if settings.PRINT_SPOOLER_SWEEP_INTERVAL > 0 and self._barrido is None:
+            self._barrido = asyncio.create_task(self._barrer())
+
+    async def detener(self):
+        tareas = [t for trabajadores in self._trabajadores.values() for t in trabajadores]
+        tareas.extend(self._reintentos)
+        if self._barrido:
+            tareas.append(self._barrido)
+
+        for tarea in tareas:
+            tarea.cancel()
+        for tarea in tareas:
+            try:
+                await tarea
+            except asyncio.CancelledError:
+                pass
+
+        self._colas.clear()
+        self._trabajadores.clear()
+        self._reintentos.clear()
+        self._barrido = None
+
+
+# Singleton instance
+print_spooler = PrintSpoolerService()
@@ -0,0 +1,158 @@
+"""
+OSE Platform - Profiling Service
+Perfilado de peticiones concretas bajo demanda (cProfile)
+
+Un admin pide un token de perfilado y lo envía en la cabecera
+X-Profile-Token (o en el parámetro profile_token) de la petición que quiere
+analizar. Esa petición se ejecuta bajo cProfile y el resultado se guarda en
+PROFILE_DIR con su request id; se conservan los PROFILE_MAX_FILES últimos.
+Sin token no se hace nada más que mirar la cabecera.
+
+cProfile mide el hilo del event loop: si mientras tanto se atienden otras
+peticiones en el mismo worker, sus funciones también aparecen en el perfil.
+Solo se perfila una petición a la vez por worker.
+"""
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import asyncio
+import cProfile
+import io
+import json
+import logging
+import pstats
+import re
+
+from app.config import settings
+from app.utils.security import decode_token
+
+logger = logging.getLogger(__name__)
+
+ORDENES = ("cumulative", "tottime", "calls", "ncalls", "time")
+
+_ID_VALIDO = re.compile(r"^[0-9a-f]{8,32}$")
+
+
+class ProfilingService:
+    """Perfiles cProfile de peticiones individuales"""
+
+    def __init__(self):
+        self._ocupado = False
+
+    @property
+    def directorio(self) -> Path:
+        return Path(settings.PROFILE_DIR)
+
+    def ruta(self, profile_id: str) -> Optional[Path]:
+        """Fichero .prof del perfil (None si el id no es válido)"""
+        if not _ID_VALIDO.match(profile_id):
+            return None
+        return self.directorio / f"{profile_id}.prof"
+
+    @staticmethod
+    def token_valido(token: str) -> Optional[Dict[str, Any]]:
+        """Payload del token si es un token de perfilado vigente"""
+        payload = decode_token(token)
+        if not payload or payload.get("type") != "profile":
+            return None
+        return payload
+
+    # ════════════════════════════════════════════════════════════════════
+    # PERFILADO
+    # ════════════════════════════════════════════════════════════════════
+
+    def empezar(self) -> Optional[cProfile.Profile]:
+        """Activa cProfile (None si ya hay una petición perfilándose)"""
+        if self._ocupado:
+            return None
+        self._ocupado = True
+        perfil = cProfile.Profile()
+        perfil.enable()
+        return perfil
+
+    def _escribir(self, perfil: cProfile.Profile, meta: Dict[str, Any]):
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        ruta = self.ruta(meta["request_id"])
+        perfil.dump_stats(str(ruta))
+
+        stats = pstats.Stats(perfil)
+        meta["total_calls"] = stats.total_calls
+        meta["top"] = [
+            {
+                "function": f"{Path(archivo).name}:{linea}({funcion})",
+                "calls": llamadas,
+                "tottime_ms": round(tottime * 1000, 2),
+                "cumtime_ms": round(cumtime * 1000, 2)
+            }
+            for (archivo, linea, funcion), (_, llamadas, tottime, cumtime, _) in sorted(
+                stats.stats.items(), key=lambda item: item[1][3], reverse=True
+            )[:15]
+        ]
+        ruta.with_suffix(".json").write_text(json.dumps(meta, default=str))
+
+        # Solo los PROFILE_MAX_FILES más recientes
+        perfiles = sorted(self.directorio.glob("*.prof"), key=lambda p: p.stat().st_mtime, reverse=True)
+        for antiguo in perfiles[settings.PROFILE_MAX_FILES:]:
+            antiguo.unlink(missing_ok=True)
+            antiguo.with_suffix(".json").unlink(missing_ok=True)
+
+    async def terminar(self, perfil: cProfile.Profile, meta: Dict[str, Any]):
+        """Detiene cProfile y guarda el perfil con su resumen"""
+        perfil.disable()
+        self._ocupado = False
+        try:
+            await asyncio.to_thread(self._escribir, perfil, meta)
+            logger.info(f"Perfil guardado: {meta['request_id']} ({meta['method']} {meta['path']})")
+        except Exception as e:
+            logger.error(f"Error guardando el perfil {meta['request_id']}: {e}")
+
+    # ════════════════════════════════════════════════════════════════════
+    # CONSULTA
+    # ════════════════════════════════════════════════════════════════════
+
+    def _listar(self) -> List[Dict[str, Any]]:
+        if not self.directorio.exists():
+            return []
+        metas = []
+        for fichero in self.directorio.glob("*.json"):
+            try:
+                meta = json.loads(fichero.read_text())
+            except (OSError, ValueError):
+                continue
+            meta.pop("top", None)
+            metas.append(meta)
+        return sorted(metas, key=lambda m: m.get("timestamp", ""), reverse=True)
+
+    async def listar(self) -> List[Dict[str, Any]]:
+        """Perfiles guardados, más recientes primero (sin el detalle)"""
+        return await asyncio.to_thread(self._listar)
+
+    def _detalle(self, profile_id: str, orden: str, limite: int) -> Optional[Dict[str, Any]]:
+        ruta = self.ruta(profile_id)
+        if ruta is None or not ruta.exists():
+            return None
+
+        salida = io.StringIO()
+        stats = pstats.Stats(str(ruta), stream=salida)
+        stats.strip_dirs().sort_stats(orden).print_stats(limite)
+
+        meta_ruta = ruta.with_suffix(".json")
+        meta = json.loads(meta_ruta.read_text()) if meta_ruta.exists() else {"request_id": profile_id}
+        meta["report"] = salida.getvalue()
+        return meta
+
+    async def detalle(self, profile_id: str, orden: str = "cumulative", limite: int = 50) -> Optional[Dict[str, Any]]:
+        """Metadatos y listado de pstats del perfil"""
+        return await asyncio.to_thread(self._detalle, profile_id, orden, limite)
+
+    async def borrar(self, profile_id: str) -> bool:
+        ruta = self.ruta(profile_id)
+        if ruta is None or not ruta.exists():
+            return False
+        await asyncio.to_thread(ruta.unlink, True)
+        await asyncio.to_thread(ruta.with_suffix(".json").unlink, True)
+        return True
+
+
+# Singleton instance
+profiler = ProfilingService()
@@ -3,14 +3,19 @@ OSE Platform - QR Code Service
 Servicio para generación de códigos QR
 """
 
-import qrcode
-from qrcode.image.pil import PilImage
 from io import BytesIO
 from typing import Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Niveles de corrección de errores (mismos valores que qrcode.constants):
+# qrcode y PIL solo se importan al generar el primer QR
+ERROR_CORRECT_L = 1
+ERROR_CORRECT_M = 0
+ERROR_CORRECT_Q = 3
+ERROR_CORRECT_H = 2
+
 
 class QRService:
     """
@@ -20,7 +25,7 @@ class QRService:
 
     def __init__(self):
         self.default_version = 1  # Tamaño del QR (1 = más pequeño, 40 = más grande)
-        self.default_error_correction = qrcode.constants.ERROR_CORRECT_L
+        self.default_error_correction = ERROR_CORRECT_L
         self.default_box_size = 10  # Tamaño de cada "caja" del QR en pixels
         self.default_border = 4  # Grosor del borde en cajas
 
@@ -51,6 +56,9 @@ class QRService:
             bytes: Imagen PNG del código QR
         """
         try:
+            import qrcode
+            from qrcode.image.pil import PilImage
+
             # Crear objeto QR
             qr = qrcode.QRCode(
                 version=version or self.default_version,
@@ -114,7 +122,7 @@ class QRService:
 
         return self.generate_qr(
             data=data,
-            error_correction=qrcode.constants.ERROR_CORRECT_M
+            error_correction=ERROR_CORRECT_M
         )
 
     def generate_package_qr(self, package_no: str) -> bytes:
@@ -132,7 +140,7 @@ class QRService:
 
         return self.generate_qr(
             data=data,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,
+            error_correction=ERROR_CORRECT_H,
             box_size=12
         )
 
@@ -161,7 +169,7 @@ class QRService:
 
         return self.generate_qr(
             data=data,
-            error_correction=qrcode.constants.ERROR_CORRECT_M
+            error_correction=ERROR_CORRECT_M
         )
 
     def generate_url_qr(self, url: str, size: Optional[int] = None) -> bytes:
@@ -177,7 +185,7 @@ class QRService:
         """
         return self.generate_qr(
             data=url,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
+            error_correction=ERROR_CORRECT_L,
             box_size=size or 10
         )
 
@@ -227,7 +235,7 @@ class QRService:
 
         return self.generate_qr(
             data=data,
-            error_correction=qrcode.constants.ERROR_CORRECT_M
+            error_correction=ERROR_CORRECT_M
         )
 
     def generate_wifi_qr(
@@ -252,7 +260,7 @@ class QRService:
 
         return self.generate_qr(
             data=data,
-            error_correction=qrcode.constants.ERROR_CORRECT_H
+            error_correction=ERROR_CORRECT_H
         )
 
 
@@ -0,0 +1,444 @@
+"""
+OSE Platform - Report Service
+Informes PDF largos generados en streaming con ReportLab (platypus)
+
+- Las filas se leen de un cursor de Mongo proyectado, por lotes
+- El maquetado corre en un hilo propio (no en el executor por defecto
+  del loop, que comparten storage, uploads y /health) y consume lotes de
+  una asyncio.Queue acotada, así la primera página se maqueta mientras la
+  consulta sigue leyendo
+- Cada página es una tabla con la cabecera repetida y filas de alto fijo:
+  la memoria no depende del número de filas del informe
+"""
+
+from datetime import datetime
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import mm
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import (
+    BaseDocTemplate, Flowable, Frame, PageTemplate, Paragraph, Spacer, Table, TableStyle
+)
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Columnas: (título, ancho relativo)
+Columna = Tuple[str, float]
+
+# Pares (etiqueta, valor) de los bloques de datos y resumen
+Datos = List[Tuple[str, Any]]
+
+FUENTE = "Helvetica"
+FUENTE_NEGRITA = "Helvetica-Bold"
+TAM_FILA = 7.5
+ALTO_FILA = 11
+ALTO_CABECERA = 14
+
+MARGEN_LATERAL = 15 * mm
+MARGEN_SUPERIOR = 22 * mm
+MARGEN_INFERIOR = 15 * mm
+
+ESTILO_TITULO = ParagraphStyle(
+    "informe_titulo", fontName=FUENTE_NEGRITA, fontSize=14, leading=18, spaceAfter=6
+)
+ESTILO_SECCION = ParagraphStyle(
+    "informe_seccion", fontName=FUENTE_NEGRITA, fontSize=10, leading=13, spaceBefore=8, spaceAfter=4
+)
+ESTILO_TEXTO = ParagraphStyle(
+    "informe_texto", fontName=FUENTE, fontSize=9, leading=12
+)
+
+
+def recortar(texto: str, ancho: float, fuente: str = FUENTE, tam: float = TAM_FILA) -> str:
+    """Recorta el texto con puntos suspensivos para que quepa en una celda de alto fijo"""
+    if stringWidth(texto, fuente, tam) <= ancho:
+        return texto
+    while texto and stringWidth(texto + "…", fuente, tam) > ancho:
+        texto = texto[:-1]
+    return texto + "…"
+
+
+def formatear(valor: Any) -> str:
+    """Representación de un valor en una celda del informe"""
+    if valor is None:
+        return ""
+    if isinstance(valor, datetime):
+        return valor.strftime("%Y-%m-%d %H:%M")
+    if isinstance(valor, bool):
+        return "Sí" if valor else "No"
+    if isinstance(valor, float):
+        return f"{valor:.2f}"
+    return str(valor)
+
+
+class _HistoriaPerezosa(list):
+    """
+    Lista de flowables que se rellena desde un generador al vaciarse
+
+    BaseDocTemplate.build consume la historia con len()/[0]/del, así que
+    basta con pedir el siguiente flowable cuando se queda vacía para que
+    platypus maquete página a página sin tener la historia entera en memoria.
+    """
+
+    def __init__(self, generador: Iterator[Flowable]):
+        super().__init__()
+        self._generador = generador
+
+    def __len__(self):
+        if not list.__len__(self):
+            siguiente = next(self._generador, None)
+            if siguiente is not None:
+                self.append(siguiente)
+        return list.__len__(self)
+
+
+class ReportService:
+    """Motor de informes tabulares en streaming"""
+
+    def __init__(self):
+        # Informes maquetándose a la vez (cada uno ocupa un hilo de render)
+        self._turnos = asyncio.Semaphore(settings.REPORT_MAX_CONCURRENT)
+
+    # ════════════════════════════════════════════════════════════════════
+    # MAQUETADO (hilo de render)
+    # ════════════════════════════════════════════════════════════════════
+
+    def _estilo_tabla(self) -> TableStyle:
+        return TableStyle([
+            ("FONT", (0, 0), (-1, 0), FUENTE_NEGRITA, TAM_FILA),
+            ("FONT", (0, 1), (-1, -1), FUENTE, TAM_FILA),
+            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#d9e1ea")),
+            ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#f4f6f8")]),
+            ("LINEBELOW", (0, 0), (-1, 0), 0.6, colors.HexColor("#5b6b7c")),
+            ("LINEBELOW", (0, -1), (-1, -1), 0.3, colors.HexColor("#b0bac4")),
+            ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+            ("TOPPADDING", (0, 0), (-1, -1), 1),
+            ("BOTTOMPADDING", (0, 0), (-1, -1), 1),
+            ("LEFTPADDING", (0, 0), (-1, -1), 3),
+            ("RIGHTPADDING", (0, 0), (-1, -1), 3),
+        ])
+
+    def _bloque_datos(self, datos: Datos, ancho: float) -> Table:
+        """Tabla de dos columnas etiqueta/valor (datos de cabecera y resumen)"""
+        tabla = Table(
+            [[etiqueta, formatear(valor)] for etiqueta, valor in datos],
+            colWidths=[ancho * 0.3, ancho * 0.7],
+            hAlign="LEFT"
+        )
+        tabla.setStyle(TableStyle([
+            ("FONT", (0, 0), (0, -1), FUENTE_NEGRITA, 8.5),
+            ("FONT", (1, 0), (1, -1), FUENTE, 8.5),
+            ("TOPPADDING", (0, 0), (-1, -1), 1),
+            ("BOTTOMPADDING", (0, 0), (-1, -1), 1),
+            ("LEFTPADDING", (0, 0), (-1, -1), 0),
+        ]))
+        return tabla
+
+    def _historia(
+        self,
+        titulo: str,
+        info: Datos,
+        columnas: List[Columna],
+        ancho: float,
+        alto: float,
+        cola: asyncio.Queue,
+        loop: asyncio.AbstractEventLoop,
+        cancelado: threading.Event,
+        estado: Dict[str, Any]
+    ) -> Iterator[Flowable]:
+        """Genera los flowables del informe a medida que llegan las filas"""
+        total_relativo = sum(relativo for _, relativo in columnas)
+        anchos = [ancho * relativo / total_relativo for _, relativo in columnas]
+        cabecera = [titulo_columna for titulo_columna, _ in columnas]
+        estilo = self._estilo_tabla()
+
+        inicio = [Paragraph(escape(titulo), ESTILO_TITULO)]
+        if info:
+            inicio += [self._bloque_datos(info, ancho), Spacer(1, 4 * mm)]
+
+        # Alto que ocupa la cabecera del informe en la primera página
+        usado = sum(
+            f.wrap(ancho, alto)[1] + f.getSpaceBefore() + f.getSpaceAfter()
+            for f in inicio
+        )
+        yield from inicio
+
+        capacidad = max(1, int((alto - usado - ALTO_CABECERA) // ALTO_FILA))
+        capacidad_resto = int((alto - ALTO_CABECERA) // ALTO_FILA)
+
+        pendientes: List[List[str]] = []
+        resumen: Optional[Datos] = None
+        terminado = False
+
+        while True:
+            while len(pendientes) < capacidad and not terminado:
+                tipo, dato = self._tomar(cola, loop, cancelado)
+                if tipo == "filas":
+                    pendientes.extend(
+                        [recortar(formatear(valor), w - 6) for valor, w in zip(fila, anchos)]
+                        for fila in dato
+                    )
+                elif tipo == "error":
+                    raise dato
+                else:
+                    resumen = dato
+                    terminado = True
+
+            if pendientes:
+                pagina = pendientes[:capacidad]
+                del pendientes[:capacidad]
+                estado["filas"] += len(pagina)
+
+                tabla = Table(
+                    [cabecera] + pagina,
+                    colWidths=anchos,
+                    rowHeights=[ALTO_CABECERA] + [ALTO_FILA] * len(pagina),
+                    repeatRows=1
+                )
+                tabla.setStyle(estilo)
+                yield tabla
+                capacidad = capacidad_resto
+
+            if terminado and not pendientes:
+                break
+
+        if not estado["filas"]:
+            yield Paragraph("No hay registros que cumplan el filtro.", ESTILO_TEXTO)
+
+        if resumen:
+            yield Paragraph("Resumen", ESTILO_SECCION)
+            yield self._bloque_datos(resumen, ancho)
+
+    def _tomar(
+        self,
+        cola: asyncio.Queue,
+        loop: asyncio.AbstractEventLoop,
+        cancelado: threading.Event
+    ) -> Tuple[str, Any]:
+        """Espera el siguiente lote de la cola del loop sin ocupar hilos del loop"""
+        pendiente = asyncio.run_coroutine_threadsafe(cola.get(), loop)
+        while True:
+            try:
+                return pendiente.result(timeout=0.5)
+            except concurrent.futures.TimeoutError:
+                if cancelado.is_set():
+                    pendiente.cancel()
+                    raise RuntimeError("Informe cancelado")
+
+    def _maquetar(
+        self,
+        destino: BinaryIO,
+        titulo: str,
+        info: Datos,
+        columnas: List[Columna],
+        cola: asyncio.Queue,
+        loop: asyncio.AbstractEventLoop,
+        cancelado: threading.Event,
+        estado: Dict[str, Any]
+    ):
+        generado = datetime.now().strftime("%Y-%m-%d %H:%M")
+        ancho_pagina, alto_pagina = A4
+
+        def cabecera_pie(canv, doc):
+            canv.saveState()
+            canv.setFont(FUENTE_NEGRITA, 9)
+            canv.drawString(MARGEN_LATERAL, alto_pagina - 12 * mm, titulo)
+            canv.setFont(FUENTE, 8)
+            canv.drawRightString(ancho_pagina - MARGEN_LATERAL, alto_pagina - 12 * mm, settings.COMPANY_NAME)
+            canv.setStrokeColor(colors.HexColor("#5b6b7c"))
+            canv.line(MARGEN_LATERAL, alto_pagina - 14 * mm, ancho_pagina - MARGEN_LATERAL, alto_pagina - 14 * mm)
+            canv.drawString(MARGEN_LATERAL, 9 * mm, f"Generado: {generado}")
+            canv.drawRightString(ancho_pagina - MARGEN_LATERAL, 9 * mm, f"Página {doc.page}")
+            canv.restoreState()
+
+        def fin_pagina(canv, doc):
+            if doc.page == 1:
+                estado["primera_pagina"] = time.perf_counter()
+
+        doc = BaseDocTemplate(
+            destino,
+            pagesize=A4,
+            leftMargin=MARGEN_LATERAL,
+            rightMargin=MARGEN_LATERAL,
+            topMargin=MARGEN_SUPERIOR,
+            bottomMargin=MARGEN_INFERIOR,
+            title=titulo,
+            author=settings.COMPANY_NAME
+        )
+        marco = Frame(
+            doc.leftMargin, doc.bottomMargin, doc.width, doc.height,
+            leftPadding=0, rightPadding=0, topPadding=0, bottomPadding=0,
+            id="cuerpo"
+        )
+        doc.addPageTemplates([
+            PageTemplate(id="informe", frames=[marco], onPage=cabecera_pie, onPageEnd=fin_pagina)
+        ])
+
+        try:
+            doc.build(_HistoriaPerezosa(self._historia(
+                titulo, info, columnas, doc.width, doc.height, cola, loop, cancelado, estado
+            )))
+        except BaseException:
+            cancelado.set()
+            raise
+
+        estado["paginas"] = doc.page
+
+    def _hilo_render(self, render: asyncio.Future, loop: asyncio.AbstractEventLoop, *args):
+        """Cuerpo del hilo de render: maqueta y entrega el resultado al loop"""
+        def entregar(error: Optional[BaseException]):
+            if render.done():
+                return
+            if error is None:
+                render.set_result(None)
+            else:
+                render.set_exception(error)
+
+        error = None
+        try:
+            self._maquetar(*args)
+        except BaseException as e:
+            error = e
+        try:
+            loop.call_soon_threadsafe(entregar, error)
+        except RuntimeError:
+            # El loop ya se cerró: nadie espera el informe
+            pass
+
+    # ════════════════════════════════════════════════════════════════════
+    # LECTURA (event loop)
+    # ════════════════════════════════════════════════════════════════════
+
+    async def _poner(self, cola: asyncio.Queue, item: Tuple[str, Any], render: asyncio.Future):
+        """Encola con espera (contrapresión) mientras el hilo de render siga vivo"""
+        if render.done():
+            raise RuntimeError("Informe cancelado")
+        if not cola.full():
+            cola.put_nowait(item)
+            return
+
+        poner = asyncio.ensure_future(cola.put(item))
+        await asyncio.wait({poner, render}, return_when=asyncio.FIRST_COMPLETED)
+        if not poner.done():
+            poner.cancel()
+            raise RuntimeError("Informe cancelado")
+
+    async def _leer(
+        self,
+        cursor,
+        fila: Callable[[Dict[str, Any]], List[Any]],
+        resumen: Optional[Callable[[], Datos]],
+        cola: asyncio.Queue,
+        render: asyncio.Future,
+        cancelado: threading.Event
+    ):
+        lote: List[List[Any]] = []
+        try:
+            async for doc in cursor:
+                lote.append(fila(doc))
+                if len(lote) >= settings.REPORT_CHUNK_ROWS:
+                    await self._poner(cola, ("filas", lote), render)
+                    lote = []
+
+            if lote:
+                await self._poner(cola, ("filas", lote), render)
+            await self._poner(cola, ("fin", resumen() if resumen else None), render)
+
+        except RuntimeError:
+            if cancelado.is_set():
+                return
+            raise
+        except BaseException as e:
+            # Despertar al hilo de render para que aborte el documento
+            cancelado.set()
+            if isinstance(e, Exception):
+                try:
+                    cola.put_nowait(("error", e))
+                except asyncio.QueueFull:
+                    pass
+            raise
+
+    async def generar(
+        self,
+        destino: BinaryIO,
+        titulo: str,
+        columnas: List[Columna],
+        cursor,
+        fila: Callable[[Dict[str, Any]], List[Any]],
+        info: Optional[Datos] = None,
+        resumen: Optional[Callable[[], Datos]] = None
+    ) -> Dict[str, Any]:
+        """
+        Genera un informe tabular leyendo las filas de un cursor
+
+        Args:
+            destino: Fichero (binario) donde escribir el PDF
+            titulo: Título del informe
+            columnas: Lista de (título, ancho relativo)
+            cursor: Cursor asíncrono de Motor (mejor proyectado y con batch_size)
+            fila: Convierte un documento del cursor en los valores de sus columnas
+            info: Datos de cabecera (etiqueta, valor) de la primera página
+            resumen: Se llama al agotar el cursor; devuelve los datos del resumen final
+
+        Returns:
+            Dict con filas, páginas y tiempos del informe
+        """
+        async with self._turnos:
+            inicio = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            cola: asyncio.Queue = asyncio.Queue(maxsize=settings.REPORT_QUEUE_CHUNKS)
+            cancelado = threading.Event()
+            estado: Dict[str, Any] = {"filas": 0, "paginas": 0, "primera_pagina": None}
+
+            # Hilo propio: con el executor por defecto, tantos informes como
+            # hilos tenga lo dejaban lleno de renders esperando filas
+            render = loop.create_future()
+            threading.Thread(
+                target=self._hilo_render,
+                args=(render, loop, destino, titulo, info or [], columnas, cola, loop, cancelado, estado),
+                name="report-render",
+                daemon=True
+            ).start()
+
+            try:
+                error_lectura, error_render = await asyncio.gather(
+                    self._leer(cursor, fila, resumen, cola, render, cancelado),
+                    render,
+                    return_exceptions=True
+                )
+            finally:
+                # Si se cancela la petición, el hilo de render aborta el documento
+                cancelado.set()
+
+        # Con return_exceptions gather no propaga nada: se relanza primero el
+        # fallo de la lectura (el render solo ve "Informe cancelado" si la cola
+        # estaba llena) y después el del render, que corta la lectura sin error
+        for error in (error_lectura, error_render):
+            if isinstance(error, BaseException):
+                raise error
+
+        resultado = {
+            "rows": estado["filas"],
+            "pages": estado["paginas"],
+            "first_page_seconds": (
+                round(estado["primera_pagina"] - inicio, 3) if estado["primera_pagina"] else None
+            ),
+            "duration_seconds": round(time.perf_counter() - inicio, 3)
+        }
+        logger.info(f"Informe '{titulo}' generado: {resultado}")
+        return resultado
+
+
+# Singleton instance
+report_service = ReportService()
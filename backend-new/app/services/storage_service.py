@@ -0,0 +1,439 @@
+"""
+OSE Platform - Storage Service
+Almacenamiento de ficheros (imágenes de tickets, facturas, logos) con
+backend en disco local o en GridFS
+
+- Lecturas y escrituras asíncronas por trozos, sin cargar el fichero entero
+- SHA-256 calculado al escribir (ETag fuerte)
+- Descargas con HTTP Range (206) y GET condicional (304)
+
+Las claves son rutas relativas ("tickets/ticket_x.jpg"). En disco cuelgan
+de STORAGE_LOCAL_ROOT ("uploads"), así que los ficheros ya existentes
+siguen siendo accesibles con su clave.
+"""
+
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from hashlib import sha256
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Tuple, Union
+import asyncio
+import json
+import logging
+import mimetypes
+import os
+import tempfile
+import uuid
+
+import aiofiles
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StoredObject:
+    """Metadatos de un fichero almacenado"""
+    key: str
+    size: int
+    modified: datetime
+    content_type: str
+    sha256: Optional[str] = None
+
+    @property
+    def etag(self) -> str:
+        if self.sha256:
+            return f'"{self.sha256}"'
+        # Ficheros anteriores al almacén, sin hash: ETag débil por tamaño y fecha
+        return f'W/"{self.size:x}-{int(self.modified.timestamp()):x}"'
+
+
+Contenido = Union[bytes, AsyncIterator[bytes], Iterable[bytes]]
+
+
+async def _trozos(contenido: Contenido) -> AsyncIterator[bytes]:
+    """Normaliza bytes, iterables e iterables asíncronos a trozos de STORAGE_CHUNK_SIZE"""
+    if isinstance(contenido, (bytes, bytearray)):
+        for i in range(0, len(contenido), settings.STORAGE_CHUNK_SIZE):
+            yield bytes(contenido[i:i + settings.STORAGE_CHUNK_SIZE])
+    elif hasattr(contenido, "__aiter__"):
+        async for trozo in contenido:
+            yield trozo
+    else:
+        for trozo in contenido:
+            yield trozo
+
+
+def _tipo(key: str, content_type: Optional[str]) -> str:
+    return content_type or mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+
+class LocalStorage:
+    """Ficheros en disco bajo un directorio raíz"""
+
+    backend = "local"
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def _ruta(self, key: str) -> Path:
+        ruta = (self.root / key).resolve()
+        if not ruta.is_relative_to(self.root.resolve()):
+            raise ValueError(f"Clave de almacenamiento inválida: {key}")
+        return ruta
+
+    def _ruta_meta(self, ruta: Path) -> Path:
+        return ruta.with_name(f".{ruta.name}.meta")
+
+    async def save(
+        self,
+        key: str,
+        contenido: Contenido,
+        content_type: Optional[str] = None
+    ) -> StoredObject:
+        """Escribe el fichero por trozos (atómico: temporal + rename)"""
+        ruta = self._ruta(key)
+        await asyncio.to_thread(ruta.parent.mkdir, parents=True, exist_ok=True)
+        temporal = ruta.with_name(f".{ruta.name}.{uuid.uuid4().hex[:8]}.tmp")
+
+        hasher = sha256()
+        size = 0
+        try:
+            async with aiofiles.open(temporal, "wb") as f:
+                async for trozo in _trozos(contenido):
+                    hasher.update(trozo)
+                    size += len(trozo)
+                    await f.write(trozo)
+            await asyncio.to_thread(os.replace, temporal, ruta)
+        except BaseException:
+            await asyncio.to_thread(temporal.unlink, True)
+            raise
+
+        meta = {"sha256": hasher.hexdigest(), "content_type": _tipo(key, content_type), "size": size}
+        async with aiofiles.open(self._ruta_meta(ruta), "w") as f:
+            await f.write(json.dumps(meta))
+
+        return await self.stat(key)
+
+    async def stat(self, key: str) -> Optional[StoredObject]:
+        ruta = self._ruta(key)
+        try:
+            info = await asyncio.to_thread(ruta.stat)
+        except FileNotFoundError:
+            return None
+
+        meta: Dict[str, Any] = {}
+        try:
+            async with aiofiles.open(self._ruta_meta(ruta), "r") as f:
+                meta = json.loads(await f.read())
+        except (FileNotFoundError, ValueError):
+            pass
+
+        return StoredObject(
+            key=key,
+            size=info.st_size,
+            modified=datetime.fromtimestamp(info.st_mtime, tz=timezone.utc),
+            content_type=meta.get("content_type") or _tipo(key, None),
+            # Un hash de otro tamaño es de una versión anterior del fichero
+            sha256=meta.get("sha256") if meta.get("size") == info.st_size else None
+        )
+
+    async def iter_range(self, key: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Lee los bytes [start, end] (ambos incluidos) por trozos"""
+        async with aiofiles.open(self._ruta(key), "rb") as f:
+            await f.seek(start)
+            restante = None if end is None else end - start + 1
+            while restante is None or restante > 0:
+                tam = settings.STORAGE_CHUNK_SIZE if restante is None else min(settings.STORAGE_CHUNK_SIZE, restante)
+                trozo = await f.read(tam)
+                if not trozo:
+                    break
+                if restante is not None:
+                    restante -= len(trozo)
+                yield trozo
+
+    async def delete(self, key: str):
+        ruta = self._ruta(key)
+        await asyncio.to_thread(ruta.unlink, True)
+        await asyncio.to_thread(self._ruta_meta(ruta).unlink, True)
+
+    @asynccontextmanager
+    async def local_path(self, key: str):
+        """Ruta en disco del fichero (para librerías que necesitan un path, como el OCR)"""
+        yield str(self._ruta(key))
+
+
+class GridFSStorage:
+    """Ficheros en un bucket de GridFS (compartido entre workers y hosts)"""
+
+    backend = "gridfs"
+
+    def __init__(self, bucket_name: str):
+        self.bucket_name = bucket_name
+        self._bucket = None
+
+    def _gridfs(self):
+        if self._bucket is None:
+            from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+            from app.database import Database
+
+            self._bucket = AsyncIOMotorGridFSBucket(
+                Database.get_database(),
+                bucket_name=self.bucket_name,
+                chunk_size_bytes=settings.STORAGE_CHUNK_SIZE
+            )
+        return self._bucket
+
+    def _ficheros(self):
+        from app.database import Database
+        return Database.get_database()[f"{self.bucket_name}.files"]
+
+    async def _ultima_version(self, key: str) -> Optional[Dict[str, Any]]:
+        return await self._ficheros().find_one({"filename": key}, sort=[("uploadDate", -1)])
+
+    async def save(
+        self,
+        key: str,
+        contenido: Contenido,
+        content_type: Optional[str] = None
+    ) -> StoredObject:
+        """Sube una nueva versión por trozos y borra las anteriores"""
+        grid_in = self._gridfs().open_upload_stream(
+            key,
+            metadata={"contentType": _tipo(key, content_type)}
+        )
+
+        hasher = sha256()
+        try:
+            async for trozo in _trozos(contenido):
+                hasher.update(trozo)
+                await grid_in.write(trozo)
+            await grid_in.close()
+        except BaseException:
+            await grid_in.abort()
+            raise
+
+        nuevo_id = grid_in._id
+        await self._ficheros().update_one(
+            {"_id": nuevo_id},
+            {"$set": {"metadata.sha256": hasher.hexdigest()}}
+        )
+
+        # Solo versiones anteriores: dos subidas simultáneas no se borran entre sí
+        async for anterior in self._ficheros().find({"filename": key, "_id": {"$lt": nuevo_id}}, {"_id": 1}):
+            await self._gridfs().delete(anterior["_id"])
+
+        return await self.stat(key)
+
+    async def stat(self, key: str) -> Optional[StoredObject]:
+        doc = await self._ultima_version(key)
+        if not doc:
+            return None
+
+        metadata = doc.get("metadata") or {}
+        return StoredObject(
+            key=key,
+            size=doc["length"],
+            modified=doc["uploadDate"].replace(tzinfo=timezone.utc),
+            content_type=metadata.get("contentType") or _tipo(key, None),
+            sha256=metadata.get("sha256")
+        )
+
+    async def iter_range(self, key: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        doc = await self._ultima_version(key)
+        if not doc:
+            raise FileNotFoundError(key)
+
+        grid_out = await self._gridfs().open_download_stream(doc["_id"])
+        grid_out.seek(start)
+        restante = (doc["length"] if end is None else end + 1) - start
+        while restante > 0:
+            trozo = await grid_out.read(min(settings.STORAGE_CHUNK_SIZE, restante))
+            if not trozo:
+                break
+            restante -= len(trozo)
+            yield trozo
+
+    async def delete(self, key: str):
+        async for doc in self._ficheros().find({"filename": key}, {"_id": 1}):
+            await self._gridfs().delete(doc["_id"])
+
+    @asynccontextmanager
+    async def local_path(self, key: str):
+        """Copia temporal en disco del fichero, borrada al salir"""
+        sufijo = Path(key).suffix
+        fd, ruta = tempfile.mkstemp(suffix=sufijo)
+        os.close(fd)
+        try:
+            async with aiofiles.open(ruta, "wb") as f:
+                async for trozo in self.iter_range(key):
+                    await f.write(trozo)
+            yield ruta
+        finally:
+            await asyncio.to_thread(os.unlink, ruta)
+
+
+Storage = Union[LocalStorage, GridFSStorage]
+
+
+def crear_almacen(backend: str, ubicacion: str) -> Storage:
+    """
+    Crea un almacén
+
+    Args:
+        backend: "local" (o "disk") o "gridfs"
+        ubicacion: Directorio raíz (local) o nombre del bucket (GridFS)
+    """
+    if backend == "gridfs":
+        return GridFSStorage(ubicacion)
+    if backend in ("local", "disk"):
+        return LocalStorage(ubicacion)
+    raise ValueError(f"Backend de almacenamiento desconocido: {backend}")
+
+
+# ════════════════════════════════════════════════════════════════════════
+# DESCARGAS HTTP (Range / GET condicional)
+# ════════════════════════════════════════════════════════════════════════
+
+def parsear_range(cabecera: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Interpreta una cabecera Range de un único rango de bytes
+
+    Returns:
+        (inicio, fin) incluidos; None si hay que servir el fichero entero
+        (cabecera de varios rangos, de otra unidad o mal formada: RFC 9110
+        indica ignorarla y responder 200)
+
+    Raises:
+        ValueError: Rango bien formado pero no satisfacible (416)
+    """
+    unidad, _, rangos = cabecera.partition("=")
+    if unidad.strip().lower() != "bytes" or "," in rangos:
+        return None
+
+    inicio_txt, _, fin_txt = (parte.strip() for parte in rangos.partition("-"))
+    if not (inicio_txt or fin_txt) or not all(p.isdigit() for p in (inicio_txt, fin_txt) if p):
+        return None
+
+    if not inicio_txt:
+        # Sufijo: los últimos N bytes
+        sufijo = int(fin_txt)
+        if sufijo == 0:
+            raise ValueError("Rango vacío")
+        return max(0, size - sufijo), size - 1
+
+    inicio = int(inicio_txt)
+    if fin_txt and int(fin_txt) < inicio:
+        # last-pos < first-pos: rango inválido, se ignora
+        return None
+    fin = int(fin_txt) if fin_txt else size - 1
+
+    if inicio >= size:
+        raise ValueError("Rango no satisfacible")
+    return inicio, min(fin, size - 1)
+
+
+def _no_modificado(request: Request, obj: StoredObject) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        etiquetas = [e.strip() for e in if_none_match.split(",")]
+        # Comparación débil (RFC 9110): W/"x" y "x" coinciden
+        return "*" in etiquetas or obj.etag.removeprefix("W/") in [e.removeprefix("W/") for e in etiquetas]
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return obj.modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _if_range_valido(request: Request, obj: StoredObject) -> bool:
+    if_range = request.headers.get("if-range")
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        # Solo un ETag fuerte permite servir un rango
+        return obj.sha256 is not None and if_range == obj.etag
+    try:
+        return obj.modified.replace(microsecond=0) <= parsedate_to_datetime(if_range)
+    except (TypeError, ValueError):
+        return False
+
+
+async def respuesta_descarga(
+    request: Request,
+    almacen: Storage,
+    key: str,
+    filename: Optional[str] = None,
+    attachment: bool = False,
+    obj: Optional[StoredObject] = None
+) -> Optional[Response]:
+    """
+    Respuesta HTTP para descargar un fichero del almacén
+
+    Soporta GET condicional (If-None-Match / If-Modified-Since → 304) y
+    Range de un rango (If-Range incluido → 206 / 416). El cuerpo se envía
+    por trozos desde el backend.
+
+    Returns:
+        Response, o None si el fichero no existe (el router decide el 404)
+    """
+    obj = obj or await almacen.stat(key)
+    if obj is None:
+        return None
+
+    cabeceras = {
+        "ETag": obj.etag,
+        "Last-Modified": format_datetime(obj.modified, usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=0, must-revalidate",
+    }
+    if filename:
+        tipo = "attachment" if attachment else "inline"
+        cabeceras["Content-Disposition"] = f'{tipo}; filename="{filename}"'
+
+    if _no_modificado(request, obj):
+        return Response(status_code=304, headers=cabeceras)
+
+    rango = None
+    cabecera_range = request.headers.get("range")
+    if cabecera_range and obj.size and _if_range_valido(request, obj):
+        try:
+            rango = parsear_range(cabecera_range, obj.size)
+        except ValueError:
+            return Response(
+                status_code=416,
+                headers={**cabeceras, "Content-Range": f"bytes */{obj.size}"}
+            )
+
+    if rango:
+        inicio, fin = rango
+        cabeceras["Content-Range"] = f"bytes {inicio}-{fin}/{obj.size}"
+        cabeceras["Content-Length"] = str(fin - inicio + 1)
+        return StreamingResponse(
+            almacen.iter_range(key, inicio, fin),
+            status_code=206,
+            media_type=obj.content_type,
+            headers=cabeceras
+        )
+
+    cabeceras["Content-Length"] = str(obj.size)
+    return StreamingResponse(
+        almacen.iter_range(key),
+        media_type=obj.content_type,
+        headers=cabeceras
+    )
+
+
+# Singleton instance: almacén general de ficheros subidos
+storage = crear_almacen(
+    settings.STORAGE_BACKEND,
+    settings.STORAGE_GRIDFS_BUCKET if settings.STORAGE_BACKEND == "gridfs" else settings.STORAGE_LOCAL_ROOT
+)
@@ -0,0 +1,295 @@
+"""
+OSE Platform - Tracing Service
+Trazas por petición con árbol de spans (sin colector externo)
+
+El middleware de trazas abre un span raíz por petición y lo deja en un
+contextvar; los servicios abren spans hijos con tracer.span() o con el
+decorador @trazado, y la monitorización de MongoDB añade un span por
+comando. El contexto lo heredan las tareas y los hilos de Motor y de
+asyncio.to_thread, así que los spans cuelgan del padre correcto.
+
+Las trazas que superan TRACE_SLOW_MS (y una muestra TRACE_SAMPLE_RATE del
+resto) se guardan en la colección limitada (capped) traces, que se
+consulta como cascada desde /system/performance/traces.
+"""
+
+from contextlib import contextmanager
+from contextvars import Context, ContextVar
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+import asyncio
+import functools
+import logging
+import random
+import threading
+import time
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+COLECCION = "traces"
+
+
+class Traza:
+    """Datos comunes a todos los spans de una petición"""
+
+    __slots__ = ("trace_id", "inicio", "spans", "descartados", "_lock")
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.inicio = time.perf_counter()
+        self.spans = 0
+        self.descartados = 0
+        self._lock = threading.Lock()
+
+    def admitir(self) -> bool:
+        """Limita los spans por traza (TRACE_MAX_SPANS)"""
+        with self._lock:
+            if self.spans >= settings.TRACE_MAX_SPANS:
+                self.descartados += 1
+                return False
+            self.spans += 1
+            return True
+
+
+class Span:
+    """Tramo de una traza (los tiempos son perf_counter)"""
+
+    __slots__ = ("traza", "nombre", "tipo", "inicio", "fin", "atributos", "hijos", "error")
+
+    def __init__(self, traza: Traza, nombre: str, tipo: str, atributos: Optional[Dict[str, Any]] = None, inicio: Optional[float] = None):
+        self.traza = traza
+        self.nombre = nombre
+        self.tipo = tipo
+        self.inicio = time.perf_counter() if inicio is None else inicio
+        self.fin: Optional[float] = None
+        self.atributos = atributos or {}
+        self.hijos: List["Span"] = []
+        self.error: Optional[str] = None
+
+    def terminar(self, fin: Optional[float] = None):
+        self.fin = time.perf_counter() if fin is None else fin
+
+    @property
+    def duracion(self) -> float:
+        return (self.fin if self.fin is not None else time.perf_counter()) - self.inicio
+
+    def a_dict(self) -> Dict[str, Any]:
+        origen = self.traza.inicio
+        return {
+            "name": self.nombre,
+            "kind": self.tipo,
+            "start_ms": round((self.inicio - origen) * 1000, 2),
+            "duration_ms": round(self.duracion * 1000, 2),
+            "attributes": self.atributos,
+            "error": self.error,
+            "children": [h.a_dict() for h in sorted(self.hijos, key=lambda h: h.inicio)]
+        }
+
+
+span_actual: ContextVar[Optional[Span]] = ContextVar("span_actual", default=None)
+
+
+class TracingService:
+    """Creación de spans y guardado de trazas"""
+
+    def __init__(self):
+        self._pendientes: Set[asyncio.Task] = set()
+
+    # ════════════════════════════════════════════════════════════════════
+    # SPANS
+    # ════════════════════════════════════════════════════════════════════
+
+    @staticmethod
+    def raiz(trace_id: str, nombre: str, **atributos) -> Span:
+        """Span raíz de una petición (lo abre el middleware)"""
+        traza = Traza(trace_id)
+        traza.spans = 1
+        return Span(traza, nombre, "http", atributos, inicio=traza.inicio)
+
+    @contextmanager
+    def span(self, nombre: str, tipo: str = "internal", **atributos):
+        """
+        Span hijo del span actual
+
+        Fuera de una petición trazada no hace nada (devuelve None).
+        """
+        padre = span_actual.get()
+        if padre is None or not padre.traza.admitir():
+            yield None
+            return
+
+        hijo = Span(padre.traza, nombre, tipo, atributos)
+        padre.hijos.append(hijo)
+        token = span_actual.set(hijo)
+        try:
+            yield hijo
+        except BaseException as e:
+            hijo.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            hijo.terminar()
+            span_actual.reset(token)
+
+    @staticmethod
+    def span_completo(nombre: str, tipo: str, inicio: float, fin: float, **atributos):
+        """Añade al span actual un span ya terminado (ej: comando de MongoDB)"""
+        padre = span_actual.get()
+        if padre is None or not padre.traza.admitir():
+            return
+        hijo = Span(padre.traza, nombre, tipo, atributos, inicio=max(inicio, padre.inicio))
+        hijo.terminar(fin)
+        padre.hijos.append(hijo)
+
+    # ════════════════════════════════════════════════════════════════════
+    # GUARDADO
+    # ════════════════════════════════════════════════════════════════════
+
+    @staticmethod
+    def debe_guardar(raiz: Span) -> bool:
+        if raiz.duracion * 1000 >= settings.TRACE_SLOW_MS:
+            return True
+        return settings.TRACE_SAMPLE_RATE > 0 and random.random() < settings.TRACE_SAMPLE_RATE
+
+    async def guardar(self, raiz: Span):
+        """Inserta la traza en la colección traces"""
+        from app.database import Database
+
+        documento = {
+            "trace_id": raiz.traza.trace_id,
+            "name": raiz.nombre,
+            "route": raiz.atributos.get("route"),
+            "method": raiz.atributos.get("method"),
+            "status": raiz.atributos.get("status"),
+            "duration_ms": round(raiz.duracion * 1000, 2),
+            "span_count": raiz.traza.spans,
+            "dropped_spans": raiz.traza.descartados,
+            "created_at": datetime.utcnow(),
+            "root": raiz.a_dict()
+        }
+        try:
+            await Database.get_database()[COLECCION].insert_one(documento)
+        except Exception as e:
+            logger.warning(f"No se pudo guardar la traza {raiz.traza.trace_id}: {e}")
+
+    def guardar_en_segundo_plano(self, raiz: Span):
+        """
+        Guarda la traza sin retrasar la respuesta
+
+        La tarea corre con un contexto vacío: el insert no cuenta como
+        consulta de la petición ni se añade como span a la propia traza.
+        """
+        tarea = asyncio.get_running_loop().create_task(self.guardar(raiz), context=Context())
+        self._pendientes.add(tarea)
+        tarea.add_done_callback(self._pendientes.discard)
+
+    async def asegurar_coleccion(self, database):
+        """
+        Crea la colección limitada traces si no existe
+
+        Un fallo aquí no impide arrancar: las trazas simplemente no se guardan.
+        """
+        try:
+            if COLECCION in await database.list_collection_names():
+                return
+            await database.create_collection(
+                COLECCION,
+                capped=True,
+                size=settings.TRACE_COLLECTION_MB * 1024 * 1024
+            )
+            await database[COLECCION].create_index("trace_id")
+            await database[COLECCION].create_index([("route", 1), ("duration_ms", -1)])
+            logger.info(f"Colección {COLECCION} creada (capped, {settings.TRACE_COLLECTION_MB}MB)")
+        except Exception as e:
+            logger.warning(f"No se pudo crear la colección {COLECCION}: {e}")
+
+    # ════════════════════════════════════════════════════════════════════
+    # CONSULTA
+    # ════════════════════════════════════════════════════════════════════
+
+    async def listar(self, route: Optional[str] = None, min_ms: float = 0, limite: int = 50) -> List[Dict[str, Any]]:
+        from app.database import Database
+
+        filtro: Dict[str, Any] = {}
+        if route:
+            filtro["route"] = route
+        if min_ms:
+            filtro["duration_ms"] = {"$gte": min_ms}
+
+        cursor = Database.get_database()[COLECCION].find(
+            filtro, {"_id": 0, "root": 0}
+        ).sort("$natural", -1).limit(limite)
+        return await cursor.to_list(length=limite)
+
+    async def obtener(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        from app.database import Database
+
+        return await Database.get_database()[COLECCION].find_one({"trace_id": trace_id}, {"_id": 0})
+
+    @staticmethod
+    def cascada(raiz: Dict[str, Any], ancho: int = 60) -> List[Dict[str, Any]]:
+        """
+        Aplana el árbol en filas de cascada (orden de inicio, con profundidad)
+
+        Cada fila lleva una barra de texto proporcional a su inicio y duración
+        respecto a la petición completa.
+        """
+        total = raiz["duration_ms"] or 1.0
+        filas: List[Dict[str, Any]] = []
+
+        def recorrer(span: Dict[str, Any], profundidad: int):
+            desde = int(span["start_ms"] / total * ancho)
+            largo = max(1, int(span["duration_ms"] / total * ancho))
+            filas.append({
+                "depth": profundidad,
+                "name": span["name"],
+                "kind": span["kind"],
+                "start_ms": span["start_ms"],
+                "duration_ms": span["duration_ms"],
+                "attributes": span["attributes"],
+                "error": span["error"],
+                "bar": " " * desde + "█" * min(largo, ancho - desde)
+            })
+            for hijo in span["children"]:
+                recorrer(hijo, profundidad + 1)
+
+        recorrer(raiz, 0)
+        return filas
+
+    @staticmethod
+    def cascada_texto(filas: List[Dict[str, Any]]) -> str:
+        """Cascada en texto plano (una línea por span)"""
+        return "\n".join(
+            f"{'  ' * f['depth'] + f['name']:<48.48} {f['start_ms']:>9.1f} {f['duration_ms']:>9.1f}ms |{f['bar']}"
+            for f in filas
+        )
+
+
+def trazado(nombre: str, tipo: str = "internal"):
+    """
+    Decorador: ejecuta la función (síncrona o asíncrona) dentro de un span
+
+    Uso:
+        @trazado("pdf.invoice", "pdf")
+        def generate_invoice_pdf(...)
+    """
+    def decorador(funcion):
+        if asyncio.iscoroutinefunction(funcion):
+            @functools.wraps(funcion)
+            async def envoltura_async(*args, **kwargs):
+                with tracer.span(nombre, tipo):
+                    return await funcion(*args, **kwargs)
+            return envoltura_async
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with tracer.span(nombre, tipo):
+                return funcion(*args, **kwargs)
+        return envoltura
+
+    return decorador
+
+
+# Singleton instance
+tracer = TracingService()
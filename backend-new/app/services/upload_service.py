@@ -0,0 +1,140 @@
+"""
+OSE Platform - Upload Service
+Ingesta de ficheros subidos (importaciones, tickets, logos)
+
+- El fichero se lee por trozos y se vuelca a disco con aiofiles
+- MAX_UPLOAD_SIZE_MB se comprueba según se lee: se corta en el primer
+  trozo que lo supera, sin leer el resto
+- El SHA-256 se calcula al vuelo
+
+Los parsers reciben una ruta en disco (pandas) o un iterador de trozos
+(almacén), nunca el fichero entero en memoria.
+"""
+
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from hashlib import sha256
+from pathlib import Path
+from typing import AsyncIterator, Optional
+import asyncio
+import logging
+import uuid
+
+import aiofiles
+from fastapi import HTTPException, UploadFile, status
+
+from app.config import settings
+from app.services.tracing_service import tracer
+
+logger = logging.getLogger(__name__)
+
+
+def limite_bytes() -> int:
+    """Tamaño máximo de un fichero subido (MAX_UPLOAD_SIZE_MB)"""
+    return settings.MAX_UPLOAD_SIZE_MB * 1024 * 1024
+
+
+def _demasiado_grande() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"El archivo excede el tamaño máximo de {settings.MAX_UPLOAD_SIZE_MB}MB"
+    )
+
+
+async def trozos_upload(
+    file: UploadFile,
+    limite: Optional[int] = None,
+    hasher=None
+) -> AsyncIterator[bytes]:
+    """
+    Lee un UploadFile por trozos de STORAGE_CHUNK_SIZE
+
+    Lanza 413 en cuanto lo leído supera el límite (por defecto
+    MAX_UPLOAD_SIZE_MB). Si se pasa un hasher, se actualiza con cada trozo.
+    """
+    limite = limite_bytes() if limite is None else limite
+    leido = 0
+    while True:
+        trozo = await file.read(settings.STORAGE_CHUNK_SIZE)
+        if not trozo:
+            break
+        leido += len(trozo)
+        if leido > limite:
+            logger.warning(f"Upload rechazado por tamaño: {file.filename} (> {limite} bytes)")
+            raise _demasiado_grande()
+        if hasher is not None:
+            hasher.update(trozo)
+        yield trozo
+
+
+@dataclass
+class UploadRecibido:
+    """Fichero subido ya volcado a disco"""
+    path: Path
+    filename: str
+    content_type: Optional[str]
+    size: int
+    sha256: str
+
+    @property
+    def extension(self) -> str:
+        return Path(self.filename).suffix.lstrip(".").lower()
+
+    async def lineas(self, encoding: str = "utf-8") -> AsyncIterator[str]:
+        """Recorre el fichero línea a línea"""
+        async with aiofiles.open(self.path, "r", encoding=encoding) as f:
+            async for linea in f:
+                yield linea
+
+
+@asynccontextmanager
+async def recibir_upload(file: UploadFile, limite: Optional[int] = None):
+    """
+    Vuelca el UploadFile a un temporal en UPLOAD_DIR/tmp
+
+    Uso:
+        async with recibir_upload(file) as subida:
+            df = await leer_dataframe(subida.path, subida.extension)
+
+    El temporal se borra al salir del bloque.
+    """
+    directorio = Path(settings.UPLOAD_DIR) / "tmp"
+    await asyncio.to_thread(directorio.mkdir, parents=True, exist_ok=True)
+
+    nombre = file.filename or "upload"
+    ruta = directorio / f"{uuid.uuid4().hex}{Path(nombre).suffix.lower()}"
+    hasher = sha256()
+    size = 0
+
+    try:
+        async with aiofiles.open(ruta, "wb") as f:
+            async for trozo in trozos_upload(file, limite, hasher):
+                size += len(trozo)
+                await f.write(trozo)
+
+        yield UploadRecibido(
+            path=ruta,
+            filename=nombre,
+            content_type=file.content_type,
+            size=size,
+            sha256=hasher.hexdigest()
+        )
+    finally:
+        await asyncio.to_thread(ruta.unlink, True)
+
+
+async def leer_dataframe(path: Path, extension: str, **opciones):
+    """
+    Parsea con pandas un fichero recibido (csv o Excel) en un hilo
+
+    Las opciones se pasan tal cual a read_csv / read_excel. El parseo queda
+    como span "pandas.read_*" en la traza de la petición.
+    """
+    import pandas as pd
+
+    lector = pd.read_csv if extension == "csv" else pd.read_excel
+    with tracer.span(f"pandas.{lector.__name__}", "pandas", extension=extension) as span:
+        df = await asyncio.to_thread(lector, path, **opciones)
+        if span is not None:
+            span.atributos["rows"] = len(df)
+        return df
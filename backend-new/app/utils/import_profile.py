@@ -0,0 +1,150 @@
+"""
+OSE Platform - Import Profile
+Resumen del tiempo de importación al arrancar (python -X importtime)
+
+Ejecuta `python -X importtime -c "import main"` en un proceso aparte y
+agrupa su salida (stderr) por paquete y por módulo de la aplicación, para
+ver qué alarga el arranque de cada worker. Además indica qué dependencias
+pesadas (pandas, WeasyPrint, ReportLab...) se han cargado: tras el
+arranque no debería aparecer ninguna, se importan en el primer uso.
+
+Uso:
+    python scripts/import_profile.py
+    GET /api/v1/system/performance/startup
+"""
+
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+import re
+import subprocess
+import sys
+import time
+
+RAIZ_BACKEND = Path(__file__).resolve().parents[2]
+
+# Paquetes que solo deben cargarse cuando se usan (PDF, OCR, QR, Excel/CSV)
+PAQUETES_PESADOS = (
+    "pandas", "numpy", "openpyxl", "weasyprint", "reportlab",
+    "qrcode", "PIL", "barcode", "pytesseract", "cv2",
+)
+
+_LINEA = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)\s*$")
+
+# Duración de la importación de main.py en el worker actual (la fija main.py)
+_arranque: Dict[str, Any] = {}
+
+
+def registrar_arranque(segundos: float):
+    """Guarda lo que ha tardado el worker en importar main.py"""
+    _arranque["import_ms"] = round(segundos * 1000, 1)
+    _arranque["registered_at"] = time.time()
+
+
+def pesados_cargados(modulos: Optional[Iterable[str]] = None) -> List[str]:
+    """Paquetes pesados presentes (por defecto, en sys.modules del proceso actual)"""
+    nombres = set(sys.modules if modulos is None else modulos)
+    return [p for p in PAQUETES_PESADOS if p in nombres]
+
+
+def analizar(salida: str, objetivo: str = "main", limite: int = 20) -> Dict[str, Any]:
+    """
+    Resume la salida de -X importtime
+
+    Args:
+        salida: stderr del proceso (líneas "import time: self | cumulative | módulo")
+        objetivo: módulo importado (su tiempo acumulado es el total)
+        limite: filas de cada ranking
+
+    Returns:
+        Dict con el total, el tiempo propio por paquete, los módulos de la
+        aplicación más lentos (acumulado) y los paquetes pesados importados
+    """
+    modulos = []
+    for linea in salida.splitlines():
+        m = _LINEA.match(linea)
+        if m:
+            propio, acumulado, sangria, nombre = m.groups()
+            modulos.append((nombre, int(propio), int(acumulado), len(sangria) // 2))
+
+    total_us = next((acumulado for nombre, _, acumulado, _ in modulos if nombre == objetivo), None)
+    if total_us is None:
+        total_us = sum(propio for _, propio, _, _ in modulos)
+
+    por_paquete: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+    for nombre, propio, _, _ in modulos:
+        paquete = por_paquete[nombre.split(".")[0]]
+        paquete[0] += propio
+        paquete[1] += 1
+
+    def ms(us: int) -> float:
+        return round(us / 1000, 1)
+
+    return {
+        "module": objetivo,
+        "total_ms": ms(total_us),
+        "modules_imported": len(modulos),
+        "heavy_loaded": pesados_cargados(nombre for nombre, _, _, _ in modulos),
+        "packages": [
+            {"package": paquete, "self_ms": ms(propio), "modules": n}
+            for paquete, (propio, n) in sorted(por_paquete.items(), key=lambda p: -p[1][0])[:limite]
+        ],
+        "app_modules": [
+            {"module": nombre, "cumulative_ms": ms(acumulado), "self_ms": ms(propio)}
+            for nombre, propio, acumulado, _ in sorted(modulos, key=lambda m: -m[2])
+            if nombre == objetivo or nombre.startswith("app.")
+        ][:limite]
+    }
+
+
+def perfilar(objetivo: str = "main", limite: int = 20, timeout: float = 120) -> Dict[str, Any]:
+    """
+    Importa el módulo en un proceso nuevo con -X importtime y resume el resultado
+
+    El proceso hijo usa el mismo intérprete y el mismo entorno, así que el
+    resultado corresponde a un arranque en frío del worker.
+    """
+    inicio = time.perf_counter()
+    proceso = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {objetivo}"],
+        cwd=RAIZ_BACKEND,
+        capture_output=True,
+        text=True,
+        timeout=timeout
+    )
+    if proceso.returncode != 0:
+        error = [l for l in proceso.stderr.splitlines() if not l.startswith("import time:")]
+        raise RuntimeError(f"Error importando {objetivo}: {' '.join(error[-3:])}")
+
+    resumen = analizar(proceso.stderr, objetivo, limite)
+    resumen["wall_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+    return resumen
+
+
+def estado_worker() -> Dict[str, Any]:
+    """Arranque del worker actual y dependencias pesadas cargadas desde entonces"""
+    return {
+        **_arranque,
+        "heavy_loaded": pesados_cargados()
+    }
+
+
+def formatear_informe(resumen: Dict[str, Any]) -> str:
+    """Informe en texto plano (para la consola)"""
+    lineas = [
+        f"Importación de {resumen['module']}: {resumen['total_ms']:.1f} ms "
+        f"({resumen['modules_imported']} módulos)",
+        f"Dependencias pesadas cargadas: {', '.join(resumen['heavy_loaded']) or 'ninguna'}",
+        "",
+        f"{'Paquete':<32} {'propio ms':>10} {'módulos':>8}",
+    ]
+    lineas += [
+        f"{p['package']:<32} {p['self_ms']:>10.1f} {p['modules']:>8}"
+        for p in resumen["packages"]
+    ]
+    lineas += ["", f"{'Módulo de la aplicación':<48} {'acumulado ms':>12} {'propio ms':>10}"]
+    lineas += [
+        f"{m['module']:<48} {m['cumulative_ms']:>12.1f} {m['self_ms']:>10.1f}"
+        for m in resumen["app_modules"]
+    ]
+    return "\n".join(lineas)
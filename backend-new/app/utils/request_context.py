@@ -0,0 +1,58 @@
+"""
+OSE Platform - Request Context
+Contexto de la petición HTTP en curso (contextvar)
+
+El middleware de métricas lo fija al empezar cada petición. Lo heredan las
+tareas y los hilos que arrancan desde ella (Motor copia el contexto al
+ejecutar pymongo en su pool de hilos), así que la monitorización de
+MongoDB puede atribuir cada comando a la ruta que lo originó.
+"""
+
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+import threading
+import time
+import uuid
+
+SIN_RUTA = "<unmatched>"
+
+
+@dataclass
+class ContextoPeticion:
+    """Datos de la petición en curso compartidos entre middleware y servicios"""
+    scope: Dict[str, Any]
+    request_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    inicio: float = field(default_factory=time.perf_counter)
+    consultas: int = 0
+    tiempo_db: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def metodo(self) -> str:
+        return self.scope.get("method", "")
+
+    @property
+    def ruta(self) -> str:
+        """
+        Plantilla de la ruta (/devices/{imei})
+
+        FastAPI la deja en scope["route"] al resolver el endpoint, que es
+        antes de que se ejecute ningún comando de la petición.
+        """
+        ruta = self.scope.get("route")
+        return getattr(ruta, "path", None) or SIN_RUTA
+
+    def contar_consulta(self, segundos: float):
+        # Los comandos llegan desde los hilos de Motor: puede haber varios a la vez
+        with self._lock:
+            self.consultas += 1
+            self.tiempo_db += segundos
+
+
+peticion_actual: ContextVar[Optional[ContextoPeticion]] = ContextVar("peticion_actual", default=None)
+
+
+def contexto_actual() -> Optional[ContextoPeticion]:
+    """Contexto de la petición en curso (None fuera de una petición)"""
+    return peticion_actual.get()
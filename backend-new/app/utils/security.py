@@ -81,6 +81,27 @@ def create_refresh_token(data: dict) -> str:
     return encoded_jwt
 
 
+def create_profile_token(data: dict) -> str:
+    """
+    Crea un JWT de perfilado (corta duración)
+
+    Lo emite un admin y activa el perfilado de las peticiones que lo llevan
+    en la cabecera X-Profile-Token, sin consultar la BD en el middleware.
+    """
+    to_encode = data.copy()
+    expire = datetime.utcnow() + timedelta(minutes=settings.PROFILE_TOKEN_EXPIRE_MINUTES)
+
+    to_encode.update({"exp": expire, "type": "profile"})
+
+    encoded_jwt = jwt.encode(
+        to_encode,
+        settings.SECRET_KEY,
+        algorithm=settings.JWT_ALGORITHM
+    )
+
+    return encoded_jwt
+
+
 def decode_token(token: str) -> Optional[dict]:
     """
     Decodifica y valida un JWT token
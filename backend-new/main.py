@@ -3,16 +3,38 @@ OSE Platform - Main Application
 FastAPI application principal
 """
 
-from fastapi import FastAPI, Request
+import time
+
+# Tiempo de importación de la aplicación (ver app.utils.import_profile)
+_inicio_importacion = time.perf_counter()
+
+from fastapi import FastAPI, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from contextlib import asynccontextmanager
 import logging
 
 from app.config import settings
-from app.database import init_db, close_db, check_database_health
-from app.routers import auth, app1_notify, app2_import, app3_rma, app4_transform, public_auth, public_tickets
-from app.routers import app5_invoice, app6_picking, app8_iccid_calculator, system_logs, brand_update, employees, client_users, brands, delivery_notes
+from app.database import Database, init_db, close_db, check_database_health
+from app.middleware.upload_limit import UploadLimitMiddleware
+from app.middleware.metrics import MetricsMiddleware
+from app.middleware.profiling import ProfilingMiddleware
+from app.middleware.tracing import TracingMiddleware
+from app.services.device_filter_service import device_filter
+from app.services.pallet_reconcile_service import pallet_reconcile
+from app.services.print_spooler_service import print_spooler
+from app.services.pdf_cache_service import pdf_cache
+from app.services.metrics_service import http_metrics
+from app.services.mongo_monitor_service import mongo_monitor
+from app.services.mongo_pool_service import mongo_pool
+from app.services.loop_watchdog_service import loop_watchdog
+from app.services.health_service import salud, OK, DEGRADADO
+from app.dependencies.auth import require_admin
+from app.utils.import_profile import registrar_arranque, pesados_cargados
+from app.routers import auth, public_auth, public_tickets
+from app.routers import app8_iccid_calculator, system_logs, brand_update, employees, client_users, brands, delivery_notes
+from app.routers import system_performance, printing, reports
+# Los routers de las apps 1-6 se importan solo si su FEATURE_APPn_ENABLED está activo
 
 # Configurar logging
 logging.basicConfig(
@@ -38,10 +60,36 @@ async def lifespan(app: FastAPI):
         await init_db()
         logger.info("✓ MongoDB connected successfully")
 
-        # Verificar salud de la BD
-        health = await check_database_health()
-        logger.info(f"✓ Database: {health.get('database')}")
-        logger.info(f"✓ Collections: {health.get('collections')}")
+        # Filtro de existencia de IMEI/ICCID (se construye en segundo plano)
+        device_filter.iniciar()
+
+        # Reconciliación periódica de contadores de pallets
+        pallet_reconcile.iniciar()
+
+        # Cola de impresión ZPL: reencolar trabajos pendientes
+        await print_spooler.iniciar()
+
+        # Expulsión periódica de la caché de PDFs de facturas
+        pdf_cache.iniciar()
+
+        # Volcado periódico de las métricas HTTP a la colección metrics
+        # (con los comandos de MongoDB por tipo y colección y el pool de conexiones en /metrics)
+        if settings.MONGO_COMMAND_MONITORING:
+            http_metrics.registrar_colector(mongo_monitor.prometheus)
+        if settings.MONGO_POOL_MONITORING:
+            http_metrics.registrar_colector(mongo_pool.prometheus)
+        http_metrics.iniciar()
+
+        # Vigilancia del event loop (lag y llamadas bloqueantes)
+        if settings.LOOP_WATCHDOG_ENABLED:
+            http_metrics.registrar_colector(loop_watchdog.prometheus)
+        loop_watchdog.iniciar()
+
+        # Comprobaciones de salud en segundo plano (readiness en caché, sin dbStats)
+        await salud.iniciar()
+        http_metrics.registrar_colector(salud.prometheus)
+        mongo_check = salud.listo()["checks"].get("mongodb", {})
+        logger.info(f"✓ Database: {settings.MONGODB_DB_NAME} (ping {mongo_check.get('latency_ms')}ms)")
 
     except Exception as e:
         logger.error(f"✗ Error during startup: {e}")
@@ -56,6 +104,13 @@ async def lifespan(app: FastAPI):
 
     # Shutdown
     logger.info("Shutting down application...")
+    await device_filter.detener()
+    await pallet_reconcile.detener()
+    await print_spooler.detener()
+    await pdf_cache.detener()
+    await http_metrics.detener()
+    await loop_watchdog.detener()
+    await salud.detener()
     await close_db()
     logger.info("✓ Database connections closed")
 
@@ -74,6 +129,10 @@ app = FastAPI(
 # MIDDLEWARE
 # ════════════════════════════════════════════════════════════════════════
 
+# Límite de subidas: 413 sin leer el cuerpo (se añade antes que CORS para
+# que la respuesta lleve las cabeceras CORS)
+app.add_middleware(UploadLimitMiddleware)
+
 # CORS - Configuración para desarrollo
 # NOTA: No se puede usar allow_origins=["*"] con allow_credentials=True
 # Debe usar orígenes explícitos cuando credentials están habilitadas
@@ -87,6 +146,15 @@ app.add_middleware(
     max_age=3600,  # Cache preflight requests for 1 hour
 )
 
+# Trazas por petición (span raíz; id de traza = id de la petición)
+app.add_middleware(TracingMiddleware)
+
+# Perfilado bajo demanda (dentro de métricas: usa el id de la petición)
+app.add_middleware(ProfilingMiddleware)
+
+# Métricas por ruta (la más externa: mide también lo que resuelven los demás middlewares)
+app.add_middleware(MetricsMiddleware)
+
 
 # ════════════════════════════════════════════════════════════════════════
 # ROUTERS
@@ -104,32 +172,44 @@ logger.info("✓ Client Users Management enabled")
 
 # App 1: Notificación de Series
 if settings.FEATURE_APP1_ENABLED:
+    from app.routers import app1_notify
+
     app.include_router(app1_notify.router, prefix=settings.API_V1_PREFIX)
     logger.info("✓ App 1 (Notificación de Series) enabled")
 
 # App 2: Importación de Datos
 if settings.FEATURE_APP2_ENABLED:
+    from app.routers import app2_import
+
     app.include_router(app2_import.router, prefix="/api")
     logger.info("✓ App 2 (Importación de Datos) enabled")
 
 # App 3: RMA & Tickets
 if settings.FEATURE_APP3_ENABLED:
+    from app.routers import app3_rma
+
     app.include_router(app3_rma.router, prefix=settings.API_V1_PREFIX)
     logger.info("✓ App 3 (RMA & Tickets) enabled")
 
 # App 4: Transform & Import
 if settings.FEATURE_APP4_ENABLED:
+    from app.routers import app4_transform
+
     app.include_router(app4_transform.router, prefix="/api")
     logger.info("✓ App 4 (Transform & Import) enabled")
 
 # App 5: Sistema de Facturación de Tickets
 if settings.FEATURE_APP5_ENABLED:
+    from app.routers import app5_invoice
+
     app.include_router(app5_invoice.router_public)  # No API prefix for public routes
     app.include_router(app5_invoice.router_admin, prefix=settings.API_V1_PREFIX)
     logger.info("✓ App 5 (Facturación de Tickets) enabled")
 
 # App 6: Sistema de Picking y Etiquetado
 if settings.FEATURE_APP6_ENABLED:
+    from app.routers import app6_picking
+
     app.include_router(app6_picking.router, prefix=settings.API_V1_PREFIX)
     logger.info("✓ App 6 (Picking & Etiquetado) enabled")
 
@@ -158,6 +238,10 @@ logger.info("✓ Portal Público (RMA/Tickets) enabled")
 app.include_router(system_logs.router, prefix=settings.API_V1_PREFIX)
 logger.info("✓ System Logs (Monitoreo) enabled")
 
+# System Performance - Diagnóstico de rendimiento (cachés, filtros)
+app.include_router(system_performance.router, prefix=settings.API_V1_PREFIX)
+logger.info("✓ System Performance (Diagnóstico) enabled")
+
 # Brand Update - Actualización masiva de marcas
 app.include_router(brand_update.router, prefix=settings.API_V1_PREFIX, tags=["Brand Update"])
 logger.info("✓ Brand Update (Actualización de Marcas) enabled")
@@ -170,6 +254,21 @@ logger.info("✓ Brands Management (Gestión de Marcas) enabled")
 app.include_router(delivery_notes.router, prefix=settings.API_V1_PREFIX)
 logger.info("✓ Delivery Notes (Albaranes EST912) enabled")
 
+# Printing - Cola de impresión ZPL (Zebra)
+app.include_router(printing.router, prefix=settings.API_V1_PREFIX)
+logger.info("✓ Printing (Cola ZPL) enabled")
+
+# Reports - Informes PDF en streaming
+app.include_router(reports.router, prefix=settings.API_V1_PREFIX)
+logger.info("✓ Reports (Informes PDF) enabled")
+
+_duracion_importacion = time.perf_counter() - _inicio_importacion
+registrar_arranque(_duracion_importacion)
+logger.info(
+    f"Aplicación importada en {_duracion_importacion * 1000:.0f}ms "
+    f"(dependencias pesadas cargadas: {', '.join(pesados_cargados()) or 'ninguna'})"
+)
+
 
 # ════════════════════════════════════════════════════════════════════════
 # ENDPOINTS BÁSICOS
@@ -195,28 +294,79 @@ async def root():
 async def health_check():
     """
     Health check endpoint - Verifica el estado del servidor y la BD
+
+    Lee la última comprobación en segundo plano (no consulta la BD).
+    Mantiene el contrato anterior (siempre 200, database healthy /
+    unhealthy / disconnected): los orquestadores deben usar /health/ready.
     """
-    try:
-        db_health = await check_database_health()
+    mongodb = salud.listo()["checks"].get("mongodb", {})
+    if not Database.client:
+        database = "disconnected"
+    elif mongodb.get("status") in (OK, DEGRADADO):
+        database = "healthy"
+    else:
+        database = "unhealthy"
+
+    respuesta = {
+        "status": "healthy",
+        "api": "online",
+        "database": database,
+        "version": settings.APP_VERSION,
+        "checked_at": mongodb.get("checked_at")
+    }
+    if settings.MONGO_POOL_MONITORING:
+        respuesta["mongo_pool"] = mongo_pool.resumen()
 
-        return {
-            "status": "healthy",
-            "api": "online",
-            "database": db_health.get("status"),
-            "version": settings.APP_VERSION
-        }
+    return respuesta
 
-    except Exception as e:
-        logger.error(f"Health check failed: {e}")
-        return JSONResponse(
-            status_code=503,
-            content={
-                "status": "unhealthy",
-                "api": "online",
-                "database": "error",
-                "error": str(e)
-            }
-        )
+
+@app.get("/health/live")
+async def liveness_check():
+    """
+    Liveness - El proceso responde (no comprueba dependencias)
+    """
+    return salud.vivo()
+
+
+@app.get("/health/ready")
+async def readiness_check():
+    """
+    Readiness - Resultado en caché de las comprobaciones en segundo plano
+
+    503 si falla una comprobación crítica (MongoDB, disco) o si la última
+    comprobación es demasiado antigua.
+    """
+    estado = salud.listo()
+    return JSONResponse(status_code=200 if estado["ready"] else 503, content=estado)
+
+
+@app.get("/health/details")
+async def health_details(current_user=Depends(require_admin)):
+    """
+    Detalle de salud (admin): comprobaciones en caché más dbStats de la BD
+
+    dbStats no es barato en una BD grande: solo se ejecuta aquí.
+    Requiere permisos de administrador
+    """
+    return {
+        **salud.listo(),
+        "database": await check_database_health(),
+        "event_loop": loop_watchdog.stats()
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Métricas de este worker en formato Prometheus
+    """
+    if not settings.METRICS_ENABLED:
+        return JSONResponse(status_code=404, content={"detail": "Métricas desactivadas"})
+
+    return PlainTextResponse(
+        http_metrics.prometheus(),
+        media_type="text/plain; version=0.0.4"
+    )
 
 
 @app.get(f"{settings.API_V1_PREFIX}/info")
@@ -0,0 +1,120 @@
+"""
+OSE Platform - Backfill Script
+Construye el registro scan_codes a partir de los dispositivos y albaranes existentes
+
+Uso:
+    python scripts/build_scan_codes.py
+
+Tras completarse puede activarse SCAN_REGISTRY_AUTHORITATIVE=true
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# Agregar path del proyecto
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.models.device import Device
+from app.models.delivery_note import DeliveryNote
+from app.models.scan_code import ScanCode, ScanCodeType
+from app.database import Database
+import logging
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Dispositivos por operación bulk_write
+BATCH_SIZE = 2000
+
+PROYECCION_DISPOSITIVO = {
+    "_id": 1,
+    "imei": 1,
+    "ccid": 1,
+    "carton_id": 1,
+    "pallet_id": 1,
+    "lote": 1
+}
+
+
+async def build_scan_codes():
+    """Registra en scan_codes todos los códigos escaneables existentes"""
+
+    logger.info("=" * 70)
+    logger.info("BACKFILL: Registro de códigos escaneables (scan_codes)")
+    logger.info("=" * 70)
+
+    try:
+        logger.info("Conectando a MongoDB...")
+        await Database.connect()
+        logger.info("✓ Conectado a MongoDB")
+
+        # Dispositivos: cursor crudo proyectado, sin instanciar documentos Beanie
+        cursor = Device.get_motor_collection().find(
+            {},
+            PROYECCION_DISPOSITIVO,
+            batch_size=BATCH_SIZE
+        )
+
+        lote_actual = []
+        dispositivos = 0
+        entradas = 0
+
+        async for doc in cursor:
+            lote_actual.append(doc)
+            if len(lote_actual) >= BATCH_SIZE:
+                entradas += await ScanCode.registrar_dispositivos(lote_actual)
+                dispositivos += len(lote_actual)
+                lote_actual = []
+                logger.info(f"  {dispositivos} dispositivos procesados...")
+
+        if lote_actual:
+            entradas += await ScanCode.registrar_dispositivos(lote_actual)
+            dispositivos += len(lote_actual)
+
+        logger.info(f"✓ Dispositivos procesados: {dispositivos} ({entradas} entradas)")
+
+        # Albaranes EST912
+        albaranes = 0
+        cursor = DeliveryNote.get_motor_collection().find({}, {"_id": 1, "pallet_code": 1})
+        entradas_albaranes = []
+
+        async for doc in cursor:
+            if doc.get("pallet_code"):
+                entradas_albaranes.append(
+                    (doc["pallet_code"].strip(), ScanCodeType.DELIVERY_NOTE, str(doc["_id"]))
+                )
+                albaranes += 1
+
+        await ScanCode.registrar(entradas_albaranes)
+        logger.info(f"✓ Albaranes procesados: {albaranes}")
+
+        total = await ScanCode.find_all().count()
+
+        logger.info("=" * 70)
+        logger.info("RESUMEN")
+        logger.info("=" * 70)
+        logger.info(f"Dispositivos:            {dispositivos}")
+        logger.info(f"Albaranes:               {albaranes}")
+        logger.info(f"Códigos registrados:     {total}")
+        logger.info("=" * 70)
+
+    except Exception as e:
+        logger.error(f"✗ Error durante el backfill: {e}")
+        raise
+
+    finally:
+        await Database.close()
+        logger.info("Conexión cerrada")
+
+
+async def main():
+    """Función principal"""
+    await build_scan_codes()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
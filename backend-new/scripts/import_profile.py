@@ -0,0 +1,36 @@
+"""
+OSE Platform - Import Profile
+Informe del tiempo de importación del arranque (python -X importtime)
+
+Uso:
+    python scripts/import_profile.py [--module main] [--limit 20] [--json]
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Agregar path del proyecto
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.utils.import_profile import perfilar, formatear_informe
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Tiempo de importación del arranque")
+    parser.add_argument("--module", default="main", help="Módulo a importar (por defecto main)")
+    parser.add_argument("--limit", type=int, default=20, help="Filas de cada ranking")
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    args = parser.parse_args()
+
+    resumen = perfilar(args.module, args.limit)
+    if args.json:
+        print(json.dumps(resumen, indent=2, ensure_ascii=False))
+    else:
+        print(formatear_informe(resumen))
+
+
+if __name__ == "__main__":
+    main()
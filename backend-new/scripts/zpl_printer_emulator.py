@@ -0,0 +1,77 @@
+"""
+OSE Platform - Emulador de impresora Zebra
+Escucha en TCP (por defecto 9100) como una impresora ZPL y muestra/guarda
+las etiquetas recibidas. Sirve para probar el spooler de impresión sin impresora.
+
+Uso:
+    python scripts/zpl_printer_emulator.py [--host 127.0.0.1] [--port 9100] [--output etiquetas.zpl]
+
+Y en el backend:
+    PRINT_SPOOLER_PRINTERS="pruebas=127.0.0.1:9100"
+
+Para probar los reintentos basta con detener el emulador: el puerto 9100 no
+confirma la recepción, así que solo se detectan conexiones rechazadas o timeouts.
+"""
+
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class ZebraEmulator:
+    """Servidor TCP que acepta ZPL en bruto, como el puerto 9100 de una Zebra"""
+
+    def __init__(self, output: str = None):
+        self.output = output
+        self.conexiones = 0
+        self.etiquetas = 0
+
+    async def atender(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.conexiones += 1
+        peer = writer.get_extra_info("peername")
+
+        datos = await reader.read()
+        writer.close()
+
+        zpl = datos.decode("utf-8", errors="replace")
+        etiquetas = zpl.count("^XA")
+        self.etiquetas += etiquetas
+
+        logger.info(
+            f"Conexión {self.conexiones} de {peer}: {len(datos)} bytes, "
+            f"{etiquetas} etiquetas (total {self.etiquetas})"
+        )
+
+        if self.output:
+            with open(self.output, "a", encoding="utf-8") as f:
+                f.write(f"; {datetime.now().isoformat()} conexión {self.conexiones}\n")
+                f.write(zpl)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Emulador de impresora Zebra (ZPL por TCP)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--output", default=None, help="Fichero donde añadir el ZPL recibido")
+    args = parser.parse_args()
+
+    emulador = ZebraEmulator(args.output)
+    server = await asyncio.start_server(emulador.atender, args.host, args.port)
+
+    logger.info(f"Emulador Zebra escuchando en {args.host}:{args.port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
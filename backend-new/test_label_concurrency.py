@@ -0,0 +1,79 @@
+"""
+Script de prueba para etiquetas de albaranes - renders concurrentes
+Verifica que varios PDFs de etiquetas generados a la vez en el threadpool
+(como hacen los endpoints de etiquetas en lote) no se interfieren
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+# Fix para encoding en Windows
+if sys.platform == "win32":
+    sys.stdout.reconfigure(encoding='utf-8')
+
+from app.services.label_generator import LabelGenerator
+
+RENDERS_CONCURRENTES = 40
+
+
+def _albaranes(n: int):
+    """Datos de etiqueta de n albaranes (comparten códigos para usar la caché)"""
+    return [
+        {
+            "pallet_code": f"EST91200000000{i % 5:02d}",
+            "delivery_note_number": f"ALB-{i:04d}",
+            "customer_name": "Cliente Test",
+            "total_boxes": 10,
+            "product_description": "Producto Test",
+            "pallet_number_in_order": i + 1,
+            "total_pallets_in_order": n,
+            "order_number": "PED-0001"
+        }
+        for i in range(n)
+    ]
+
+
+def test_render_concurrente():
+    """40 renders en paralelo de un lote de etiquetas: todos deben terminar"""
+    print("\n" + "=" * 60)
+    print("TESTING ETIQUETAS - RENDER CONCURRENTE")
+    print("=" * 60)
+
+    albaranes = _albaranes(12)
+
+    with ThreadPoolExecutor(max_workers=RENDERS_CONCURRENTES) as pool:
+        futuros = [
+            pool.submit(LabelGenerator.generate_pdf_labels_batch, albaranes, "A6", "nup")
+            for _ in range(RENDERS_CONCURRENTES)
+        ]
+        errores = [f.exception() for f in futuros if f.exception() is not None]
+        pdfs = [f.result() for f in futuros if f.exception() is None]
+
+    assert not errores, f"{len(errores)} renders fallaron: {errores[0]!r}"
+    assert all(pdf.startswith(b"%PDF") for pdf in pdfs)
+    print(f"✓ {len(pdfs)} PDFs generados en paralelo sin errores")
+
+
+def test_render_secuencial_identico():
+    """El mismo lote produce el mismo número de páginas con y sin caché caliente"""
+    albaranes = _albaranes(8)
+
+    primero = LabelGenerator.generate_pdf_labels_batch(albaranes, "100x150", "page")
+    segundo = LabelGenerator.generate_pdf_labels_batch(albaranes, "100x150", "page")
+
+    assert primero.count(b"/Type /Page\n") == segundo.count(b"/Type /Page\n") == len(albaranes)
+    print(f"✓ {len(albaranes)} páginas, una etiqueta por página")
+
+
+def main():
+    """Ejecuta las pruebas"""
+    test_render_concurrente()
+    test_render_secuencial_identico()
+    print("\n🎉 ¡TODAS LAS PRUEBAS PASARON!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Script de prueba para informes PDF en streaming - informes concurrentes
+Verifica que más informes a la vez que hilos tiene el executor por defecto
+del loop terminan, y que el executor sigue libre mientras se maquetan
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+import asyncio
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+# Fix para encoding en Windows
+if sys.platform == "win32":
+    sys.stdout.reconfigure(encoding='utf-8')
+
+from app.services.report_service import ReportService
+
+HILOS_EXECUTOR = 2
+INFORMES_CONCURRENTES = 5
+FILAS = 6000
+
+COLUMNAS = [("IMEI", 3), ("Lote", 1), ("Estado", 2)]
+
+
+class CursorFalso:
+    """Cursor asíncrono que entrega n documentos cediendo el loop de vez en cuando"""
+
+    def __init__(self, n: int, fallo_en: int = None):
+        self.n = n
+        self.fallo_en = fallo_en
+
+    def __aiter__(self):
+        return self._documentos()
+
+    async def _documentos(self):
+        for i in range(self.n):
+            if i == self.fallo_en:
+                raise ValueError("Cursor roto")
+            if i % 100 == 0:
+                await asyncio.sleep(0)
+            yield {"imei": f"35{i:013d}", "lote": i // 500, "estado": "OK"}
+
+
+def _fila(doc):
+    return [doc["imei"], doc["lote"], doc["estado"]]
+
+
+def test_informes_concurrentes():
+    """5 informes a la vez con un executor de 2 hilos: todos terminan"""
+    async def prueba():
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=HILOS_EXECUTOR))
+        servicio = ReportService()
+        destinos = [BytesIO() for _ in range(INFORMES_CONCURRENTES)]
+
+        informes = asyncio.gather(*(
+            servicio.generar(destino, f"Informe {i}", COLUMNAS, CursorFalso(FILAS), _fila)
+            for i, destino in enumerate(destinos)
+        ))
+
+        # Mientras se maquetan, asyncio.to_thread (storage, /health...) responde
+        inicio = time.perf_counter()
+        await asyncio.wait_for(asyncio.to_thread(lambda: None), timeout=5)
+        espera = time.perf_counter() - inicio
+
+        resultados = await asyncio.wait_for(informes, timeout=120)
+        return resultados, destinos, espera
+
+    resultados, destinos, espera = asyncio.run(prueba())
+
+    assert all(r["rows"] == FILAS for r in resultados)
+    assert all(r["pages"] > 1 for r in resultados)
+    assert all(d.getvalue().startswith(b"%PDF") for d in destinos)
+    assert espera < 1, f"El executor tardó {espera:.2f}s en atender"
+    print(f"✓ {len(resultados)} informes de {resultados[0]['pages']} páginas con {HILOS_EXECUTOR} hilos en el executor")
+    print(f"✓ asyncio.to_thread atendido en {espera * 1000:.0f}ms durante el maquetado")
+
+
+def test_error_del_cursor():
+    """El error del cursor llega al llamante, no un 'Informe cancelado'"""
+    async def prueba():
+        await ReportService().generar(BytesIO(), "Roto", COLUMNAS, CursorFalso(FILAS, fallo_en=4000), _fila)
+
+    try:
+        asyncio.run(prueba())
+    except ValueError as e:
+        assert str(e) == "Cursor roto"
+    else:
+        raise AssertionError("El informe debía fallar")
+    print("✓ Error del cursor propagado")
+
+
+def main():
+    """Ejecuta las pruebas"""
+    print("\n" + "=" * 60)
+    print("TESTING INFORMES PDF - CONCURRENCIA")
+    print("=" * 60)
+
+    test_informes_concurrentes()
+    test_error_del_cursor()
+    print("\n🎉 ¡TODAS LAS PRUEBAS PASARON!")
+
+
+if __name__ == "__main__":
+    main()